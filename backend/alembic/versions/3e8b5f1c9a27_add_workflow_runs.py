@@ -0,0 +1,44 @@
+"""Add workflow runs
+
+Revision ID: 3e8b5f1c9a27
+Revises: 7c1e2a9d4b51
+Create Date: 2026-10-17 14:03:18.220947
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b5f1c9a27'
+down_revision = '7c1e2a9d4b51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('workflow_runs',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('user_tier', sa.String(), nullable=False),
+    sa.Column('workflow_type', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('steps_json', sa.Text(), nullable=True),
+    sa.Column('critical_path', sa.String(), nullable=True),
+    sa.Column('total_execution_time_ms', sa.Integer(), nullable=True),
+    sa.Column('tokens_in', sa.Integer(), nullable=True),
+    sa.Column('tokens_out', sa.Integer(), nullable=True),
+    sa.Column('cost_usd', sa.Float(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_workflow_runs_started_at_id', 'workflow_runs', ['started_at', 'id'], unique=False)
+    op.create_index('ix_workflow_runs_user_started_at', 'workflow_runs', ['user_id', 'started_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_workflow_runs_user_started_at', table_name='workflow_runs')
+    op.drop_index('ix_workflow_runs_started_at_id', table_name='workflow_runs')
+    op.drop_table('workflow_runs')
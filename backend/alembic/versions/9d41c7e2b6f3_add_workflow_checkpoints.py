@@ -0,0 +1,37 @@
+"""Add workflow checkpoints
+
+Revision ID: 9d41c7e2b6f3
+Revises: 3e8b5f1c9a27
+Create Date: 2026-10-17 15:26:51.904113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41c7e2b6f3'
+down_revision = '3e8b5f1c9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('workflow_checkpoints',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('workflow_id', sa.String(), nullable=False),
+    sa.Column('step', sa.String(), nullable=False),
+    sa.Column('payload_json', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('workflow_id', 'step', name='uq_workflow_checkpoints_workflow_step')
+    )
+    op.create_index(op.f('ix_workflow_checkpoints_workflow_id'), 'workflow_checkpoints', ['workflow_id'], unique=False)
+    op.create_index(op.f('ix_workflow_checkpoints_expires_at'), 'workflow_checkpoints', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_workflow_checkpoints_expires_at'), table_name='workflow_checkpoints')
+    op.drop_index(op.f('ix_workflow_checkpoints_workflow_id'), table_name='workflow_checkpoints')
+    op.drop_table('workflow_checkpoints')
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from schemas.batch import BatchJobRequest, BatchJobResponse
+from services.batch.jobs import batch_manager, BatchLimitExceeded
+from services.providers.tokens import TokenBudgetExceeded
+from services.limits.rate_limiter import aallow
+from auth.dependencies import get_current_user, UserContext
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+async def _get_own_job(job_id: str, user: UserContext) -> dict:
+    job = await batch_manager.get_job(job_id)
+    if job is None or (job.pop("user_id") != user.user_id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@router.post("/jobs", response_model=BatchJobResponse)
+async def create_batch_job(request: BatchJobRequest, user: UserContext = Depends(get_current_user)):
+    """Submit a list of idea or story requests to run in the background"""
+    try:
+        await aallow(user.user_id, user.tier, route_key="batch:create")
+        if not request.items:
+            raise HTTPException(status_code=400, detail="Batch has no items")
+        job = await batch_manager.create_job(user.user_id, user.tier, request.task, request.items, request.provider)
+        logger.info(f"Created batch job {job['job_id']}: {job['total_items']} {request.task} items on {job['provider']}")
+        return job
+    except (ValidationError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch item: {str(e)}")
+    except BatchLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in create_batch_job endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/jobs")
+async def list_batch_jobs(limit: int = 50, user: UserContext = Depends(get_current_user)):
+    return {"jobs": await batch_manager.list_jobs(user.user_id, min(limit, 200))}
+
+@router.get("/jobs/{job_id}", response_model=BatchJobResponse)
+async def get_batch_job(job_id: str, user: UserContext = Depends(get_current_user)):
+    """Job status and progress"""
+    return await _get_own_job(job_id, user)
+
+@router.get("/jobs/{job_id}/results")
+async def download_batch_results(job_id: str, user: UserContext = Depends(get_current_user)):
+    """Finished items as JSONL, streamed; can be downloaded while the job is still running"""
+    await _get_own_job(job_id, user)
+    return StreamingResponse(
+        batch_manager.iter_results(job_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="batch-{job_id}.jsonl"'}
+    )
+
+@router.post("/jobs/{job_id}/cancel", response_model=BatchJobResponse)
+async def cancel_batch_job(job_id: str, user: UserContext = Depends(get_current_user)):
+    await _get_own_job(job_id, user)
+    try:
+        await batch_manager.cancel(job_id)
+    except Exception as e:
+        logger.error(f"Error cancelling batch job {job_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Could not cancel batch: {str(e)}")
+    return await _get_own_job(job_id, user)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
 from schemas.idea import IdeaRequest, IdeaResponse
-from services.idea_generator import generate_idea
+from services.idea_generator import agenerate_idea, generate_idea_streaming
 import logging
+import math
+import json
 from auth.dependencies import get_current_user, UserContext
-from services.limits.rate_limiter import allow
+from services.limits.rate_limiter import aallow, aallow_tokens
+from services.providers.tokens import TokenBudgetExceeded, enforce_input_budget, estimate_total_tokens
+from services.providers.deadline import DeadlineExceeded, deadline_for
+from services.providers.quota import QuotaExhausted
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,17 +18,71 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/generate-idea", response_model=IdeaResponse)
-def generate_story_idea(request: IdeaRequest, user: UserContext = Depends(get_current_user)):
+async def generate_story_idea(request: IdeaRequest, user: UserContext = Depends(get_current_user),
+                              x_request_timeout: Optional[str] = Header(default=None)):
     try:
-        allow(user.user_id, user.tier, route_key="idea:generate")
+        await aallow(user.user_id, user.tier, route_key="idea:generate")
+        request = enforce_input_budget("idea", user.tier, request)
+        await aallow_tokens(user.user_id, user.tier, "idea:generate", estimate_total_tokens("idea", user.tier, request))
         logger.info(f"Received idea generation request: prompt='{request.prompt[:50]}...', genre={request.genre}")
-        result = generate_idea(request, tier=user.tier)
+        deadline = deadline_for("idea:generate", user.tier, x_request_timeout)
+        result = await agenerate_idea(request, tier=user.tier, deadline=deadline)
         logger.info("Story idea generated successfully")
         return result
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except QuotaExhausted as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_story_idea endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.post("/generate-idea-stream")
+async def generate_story_idea_streaming(request: IdeaRequest, user: UserContext = Depends(get_current_user),
+                                        x_request_timeout: Optional[str] = Header(default=None)):
+    """Stream idea generation with Server-Sent Events (SSE), one event per completed field"""
+    try:
+        await aallow(user.user_id, user.tier, route_key="idea:generate")
+        request = enforce_input_budget("idea", user.tier, request)
+        await aallow_tokens(user.user_id, user.tier, "idea:generate", estimate_total_tokens("idea", user.tier, request))
+        deadline = deadline_for("idea:generate", user.tier, x_request_timeout)
+        logger.info(f"Received streaming idea request: prompt='{request.prompt[:50]}...', genre={request.genre}")
+        
+        async def generate():
+            try:
+                async for chunk in generate_idea_streaming(request, tier=user.tier, deadline=deadline):
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+            except Exception as e:
+                logger.error(f"Error in streaming idea generation: {str(e)}")
+                yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        
+        return StreamingResponse(
+            generate(),
+            media_type="text/plain",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Headers": "*",
+            }
+        )
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in generate_story_idea_streaming endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @router.get("/idea-examples")
 def get_idea_examples():
     examples = [
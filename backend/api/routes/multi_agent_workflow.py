@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import datetime
+import json
+import uuid
 from db.database import get_db
 from auth.dependencies import get_current_user, UserContext
-from services.limits.rate_limiter import allow
+from services.limits.rate_limiter import aallow
 from services.orchestrator import multi_agent_system
-from schemas.workflow import WorkflowRequest, WorkflowResponse, FullStoryRequest
+from services.orchestrator.history import workflow_history
+from services.orchestrator.checkpoints import CheckpointNotFound, ResumeInProgress
+from services.orchestrator.jobs import FINISHED_STATUSES, JobQueueFull, TooManyJobs, workflow_jobs
+from services.providers.deadline import DeadlineExceeded, deadline_for
+from schemas.workflow import (
+    WorkflowRequest, WorkflowResponse, FullStoryRequest, WorkflowJobRequest, WorkflowJobResponse
+)
 from metrics.usage import log_usage
 import logging
 
@@ -19,12 +29,16 @@ router = APIRouter()
 async def execute_orchestrated_workflow(
     request: WorkflowRequest,
     current_user: UserContext = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(default=None)
 ):
     """Execute a multi-agent workflow using the orchestrator"""
+    # Returned on failure so the client can resume from the last checkpoint
+    workflow_id = str(uuid.uuid4())
     try:
         # Rate limiting
-        allow(current_user.user_id, current_user.tier, route_key="orchestrated_workflow")
+        await aallow(current_user.user_id, current_user.tier, route_key="orchestrated_workflow")
+        deadline = deadline_for("orchestrated_workflow", current_user.tier, x_request_timeout)
         
         logger.info(f"Executing orchestrated workflow: {request.workflow_type} for user {current_user.user_id}")
         
@@ -33,7 +47,9 @@ async def execute_orchestrated_workflow(
             workflow_type=request.workflow_type,
             input_data=request.input_data,
             user_id=current_user.user_id,
-            user_tier=current_user.tier
+            user_tier=current_user.tier,
+            deadline=deadline,
+            workflow_id=workflow_id
         )
         
         # Log usage for each step using real agent metrics
@@ -58,20 +74,28 @@ async def execute_orchestrated_workflow(
         logger.info(f"Orchestrated workflow completed successfully: {result['workflow_id']}")
         return result
         
+    except DeadlineExceeded as e:
+        logger.error(f"Deadline exceeded: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e), headers={"X-Workflow-Id": workflow_id})
     except Exception as e:
         logger.error(f"Error in orchestrated workflow: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Workflow execution failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Workflow execution failed: {str(e)}",
+                            headers={"X-Workflow-Id": workflow_id})
 
 @router.post("/full-story-orchestrated")
 async def generate_full_story_orchestrated(
     request: FullStoryRequest,
     current_user: UserContext = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(default=None)
 ):
     """Generate full story using orchestrated multi-agent workflow"""
+    # Returned on failure so the client can resume from the last checkpoint
+    workflow_id = str(uuid.uuid4())
     try:
         # Rate limiting
-        allow(current_user.user_id, current_user.tier, route_key="full_story_orchestrated")
+        await aallow(current_user.user_id, current_user.tier, route_key="full_story_orchestrated")
+        deadline = deadline_for("full_story_orchestrated", current_user.tier, x_request_timeout)
         
         # Create workflow request
         workflow_request = WorkflowRequest(
@@ -90,7 +114,9 @@ async def generate_full_story_orchestrated(
             workflow_type="full_story_generation",
             input_data=workflow_request.input_data,
             user_id=current_user.user_id,
-            user_tier=current_user.tier
+            user_tier=current_user.tier,
+            deadline=deadline,
+            workflow_id=workflow_id
         )
         
         # Log usage for each step using real agent metrics
@@ -115,20 +141,26 @@ async def generate_full_story_orchestrated(
         logger.info(f"Full story generation completed: {result['workflow_id']}")
         return result
         
+    except DeadlineExceeded as e:
+        logger.error(f"Deadline exceeded: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e), headers={"X-Workflow-Id": workflow_id})
     except Exception as e:
         logger.error(f"Error in full story generation: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Story generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Story generation failed: {str(e)}",
+                            headers={"X-Workflow-Id": workflow_id})
 
 @router.post("/idea-only-orchestrated")
 async def generate_idea_only_orchestrated(
     request: FullStoryRequest,
     current_user: UserContext = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(default=None)
 ):
     """Generate idea only using orchestrated multi-agent workflow"""
     try:
         # Rate limiting
-        allow(current_user.user_id, current_user.tier, route_key="idea_only_orchestrated")
+        await aallow(current_user.user_id, current_user.tier, route_key="idea_only_orchestrated")
+        deadline = deadline_for("idea_only_orchestrated", current_user.tier, x_request_timeout)
         
         # Execute workflow
         result = await multi_agent_system.orchestrate_workflow(
@@ -139,7 +171,8 @@ async def generate_idea_only_orchestrated(
                 "tone": request.tone
             },
             user_id=current_user.user_id,
-            user_tier=current_user.tier
+            user_tier=current_user.tier,
+            deadline=deadline
         )
         
         # Log usage for each step using real agent metrics
@@ -164,10 +197,156 @@ async def generate_idea_only_orchestrated(
         logger.info(f"Idea generation completed: {result['workflow_id']}")
         return result
         
+    except DeadlineExceeded as e:
+        logger.error(f"Deadline exceeded: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in idea generation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Idea generation failed: {str(e)}")
 
+@router.post("/workflows/{workflow_id}/resume")
+async def resume_workflow(
+    workflow_id: str,
+    current_user: UserContext = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(default=None)
+):
+    """Resume a failed orchestrated workflow, re-running only the steps without a checkpoint"""
+    try:
+        # Rate limiting
+        await aallow(current_user.user_id, current_user.tier, route_key="workflow_resume")
+        deadline = deadline_for("workflow_resume", current_user.tier, x_request_timeout)
+        
+        result = await multi_agent_system.resume_workflow(
+            workflow_id,
+            user_id=current_user.user_id,
+            user_tier=current_user.tier,
+            deadline=deadline,
+            any_user=current_user.tier == "admin"
+        )
+        
+        # Log usage only for the steps that actually ran; restored ones were paid for already
+        for step in result.get("workflow_steps", []):
+            if step.get("from_checkpoint"):
+                continue
+            agent_response = step.get("agent_response")
+            metadata = agent_response.metadata if agent_response else {}
+            
+            log_usage(
+                user_id=current_user.user_id,
+                feature=step["agent_type"],
+                provider=metadata.get("provider", "unknown"),
+                model=metadata.get("model", "unknown"),
+                tokens_in=metadata.get("tokens_in", 0),
+                tokens_out=metadata.get("tokens_out", 0),
+                latency_ms=step["execution_time_ms"],
+                cost_usd=metadata.get("cost_usd", 0.0),
+                db=db,
+                user_tier=current_user.tier
+            )
+        
+        logger.info(f"Workflow resumed: {workflow_id} (restored {result['restored_steps']})")
+        return result
+        
+    except CheckpointNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ResumeInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except DeadlineExceeded as e:
+        logger.error(f"Deadline exceeded: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e), headers={"X-Workflow-Id": workflow_id})
+    except Exception as e:
+        logger.error(f"Error resuming workflow {workflow_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Workflow resume failed: {str(e)}",
+                            headers={"X-Workflow-Id": workflow_id})
+
+async def _submit_job(workflow_type: str, input_data: dict, current_user: UserContext) -> dict:
+    try:
+        await aallow(current_user.user_id, current_user.tier, route_key="workflow_job")
+        job = await workflow_jobs.submit(workflow_type, input_data, current_user.user_id, current_user.tier)
+        logger.info(f"Queued workflow job {job['job_id']}: {workflow_type} for user {current_user.user_id}")
+        return job
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TooManyJobs as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting workflow job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Could not submit workflow job: {str(e)}")
+
+async def _get_own_job(job_id: str, user: UserContext) -> dict:
+    job = await workflow_jobs.get_job(job_id)
+    if job is None or (job["user_id"] != user.user_id and user.tier != "admin"):
+        raise HTTPException(status_code=404, detail="Workflow job not found")
+    return job
+
+@router.post("/jobs", response_model=WorkflowJobResponse, status_code=202)
+async def submit_workflow_job(
+    request: WorkflowJobRequest,
+    current_user: UserContext = Depends(get_current_user)
+):
+    """Queue a workflow to run in the background; poll /jobs/{job_id} or follow /jobs/{job_id}/events"""
+    return await _submit_job(request.workflow_type, request.input_data, current_user)
+
+@router.post("/full-story-orchestrated/jobs", response_model=WorkflowJobResponse, status_code=202)
+async def submit_full_story_job(
+    request: FullStoryRequest,
+    current_user: UserContext = Depends(get_current_user)
+):
+    """Job submission mode of /full-story-orchestrated: returns a job id instead of holding the request open"""
+    input_data = {"prompt": request.prompt, "genre": request.genre, "tone": request.tone}
+    return await _submit_job("full_story_generation", input_data, current_user)
+
+@router.get("/jobs/{job_id}", response_model=WorkflowJobResponse)
+async def get_workflow_job(
+    job_id: str,
+    current_user: UserContext = Depends(get_current_user)
+):
+    """Job status, with the workflow result once it completes"""
+    return await _get_own_job(job_id, current_user)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_workflow_job_events(
+    job_id: str,
+    current_user: UserContext = Depends(get_current_user),
+    last_event_id: Optional[str] = Header(default=None)
+):
+    """Job progress as Server-Sent Events (queued, started, step_*, then completed or failed).
+    Reconnecting with Last-Event-ID picks up after the last event received."""
+    await _get_own_job(job_id, current_user)
+    heartbeat = workflow_jobs.settings["heartbeat_seconds"]
+    
+    async def generate():
+        after = last_event_id
+        while True:
+            events = await workflow_jobs.read_events(job_id, after, timeout=heartbeat)
+            if not events:
+                job = await workflow_jobs.get_job(job_id)
+                if job is None or job["status"] in FINISHED_STATUSES:
+                    return
+                # Keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event in events:
+                after = event_id
+                yield f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] in FINISHED_STATUSES:
+                    return
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @router.get("/system-status")
 async def get_system_status(
     current_user: UserContext = Depends(get_current_user)
@@ -176,17 +355,29 @@ async def get_system_status(
     if current_user.tier not in ["admin", "pro"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return multi_agent_system.get_system_status()
+    return {**multi_agent_system.get_system_status(), "jobs": workflow_jobs.get_stats()}
 
 @router.get("/workflow-history")
 async def get_workflow_history(
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    user_id: Optional[str] = Query(None, description="Admins only; others always see their own runs"),
+    workflow_type: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="completed or failed"),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
     current_user: UserContext = Depends(get_current_user)
 ):
-    """Get recent workflow execution history"""
+    """Get workflow execution history, newest first, one keyset-paginated page at a time"""
     if current_user.tier not in ["admin", "pro"]:
         raise HTTPException(status_code=403, detail="Access denied")
+    if current_user.tier != "admin":
+        user_id = current_user.user_id
     
-    return {
-        "workflow_history": multi_agent_system.get_workflow_history(limit=limit)
-    }
+    # Make runs that finished moments ago visible
+    await workflow_history.flush()
+    try:
+        return await workflow_history.query(limit=limit, cursor=cursor, user_id=user_id, workflow_type=workflow_type,
+                                            status=status, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
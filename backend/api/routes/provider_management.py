@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from auth.dependencies import get_current_user, UserContext
 from services.providers.router import router as provider_router
-from services.providers.config import get_available_providers, PROVIDER_CHARACTERISTICS
+from services.providers.config import get_available_providers, api_keys_configured, PROVIDER_CHARACTERISTICS, ProviderType
+from services.cache.semantic_cache import semantic_cache
 from typing import Optional
 import os
 
@@ -32,7 +33,7 @@ async def get_available_providers_list(
             provider_info[provider] = {
                 "available": False,
                 "characteristics": characteristics,
-                "api_key_configured": bool(os.getenv(f"{provider.upper()}_API_KEY"))
+                "api_key_configured": api_keys_configured(provider)
             }
     
     return {
@@ -72,12 +73,16 @@ async def get_provider_selection_info(
             models[provider_name] = None
     
     info["models"] = models
+    info["live_stats"] = {
+        key: stats for key, stats in provider_router.routing_stats.snapshot().items()
+        if key.endswith(f":{task}")
+    }
     
     return info
 
 @router.post("/providers/test")
 async def test_provider(
-    provider: str = Query(..., description="Provider to test: gemini, openai, or anthropic"),
+    provider: str = Query(..., description="Provider to test: gemini, openai, anthropic, or stub"),
     task: str = Query("idea", description="Task type: idea or story"),
     current_user: UserContext = Depends(get_current_user)
 ):
@@ -85,7 +90,7 @@ async def test_provider(
     if current_user.tier not in ["admin", "pro"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    if provider not in ["gemini", "openai", "anthropic"]:
+    if provider not in ["gemini", "openai", "anthropic", "stub"]:
         raise HTTPException(status_code=400, detail="Invalid provider")
     
     if task not in ["idea", "story"]:
@@ -94,7 +99,7 @@ async def test_provider(
     try:
         # Create a test provider
         test_provider = provider_router._create_provider(
-            provider, task, current_user.tier
+            ProviderType(provider), task, current_user.tier
         )
         
         # Test with simple input
@@ -105,7 +110,7 @@ async def test_provider(
                 genre="Test",
                 tone="Neutral"
             )
-            result = test_provider.generate(test_request)
+            result = await test_provider.agenerate(test_request)
         else:  # story
             from schemas.story import StoryRequest
             test_request = StoryRequest(
@@ -113,7 +118,7 @@ async def test_provider(
                 genre="Test",
                 outline="A simple test story outline"
             )
-            result = test_provider.generate(test_request)
+            result = await test_provider.agenerate(test_request)
         
         return {
             "provider": provider,
@@ -152,7 +157,7 @@ async def get_providers_health(
         try:
             if provider in available_providers:
                 # Quick test
-                test_provider = provider_router._create_provider(provider, "idea", "free")
+                test_provider = provider_router._create_provider(ProviderType(provider), "idea", "free")
                 health_status[provider] = {
                     "status": "healthy",
                     "available": True,
@@ -162,18 +167,20 @@ async def get_providers_health(
                 health_status[provider] = {
                     "status": "unavailable",
                     "available": False,
-                    "api_key_configured": bool(os.getenv(f"{provider.upper()}_API_KEY")),
+                    "api_key_configured": api_keys_configured(provider),
                     "reason": "API key not configured"
                 }
         except Exception as e:
             health_status[provider] = {
                 "status": "error",
                 "available": False,
-                "api_key_configured": bool(os.getenv(f"{provider.upper()}_API_KEY")),
+                "api_key_configured": api_keys_configured(provider),
                 "error": str(e)
             }
     
     return {
         "providers_health": health_status,
-        "overall_status": "healthy" if all(p["status"] == "healthy" for p in health_status.values()) else "degraded"
+        "overall_status": "healthy" if all(p["status"] == "healthy" for p in health_status.values()) else "degraded",
+        "pool": provider_router.get_pool_stats(),
+        "semantic_cache": semantic_cache.get_stats()
     }
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from fastapi.responses import StreamingResponse
 from schemas.story import StoryRequest, StoryResponse
-from services.story_writer import generate_story, generate_story_streaming
+from services.story_writer import agenerate_story, generate_story_streaming
 import logging
+import math
 from auth.dependencies import get_current_user, UserContext
-from services.limits.rate_limiter import allow
+from services.limits.rate_limiter import aallow, aallow_tokens
+from services.providers.tokens import TokenBudgetExceeded, enforce_input_budget, estimate_total_tokens
+from services.providers.deadline import DeadlineExceeded, deadline_for
+from services.providers.quota import QuotaExhausted
+from typing import Optional
 import json
 import asyncio
 
@@ -14,13 +19,26 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/write-story", response_model=StoryResponse)
-def write_story(request: StoryRequest, user: UserContext = Depends(get_current_user)):
+async def write_story(request: StoryRequest, user: UserContext = Depends(get_current_user),
+                      x_request_timeout: Optional[str] = Header(default=None)):
     try:
-        allow(user.user_id, user.tier, route_key="story:write")
+        await aallow(user.user_id, user.tier, route_key="story:write")
+        request = enforce_input_budget("story", user.tier, request)
+        await aallow_tokens(user.user_id, user.tier, "story:write", estimate_total_tokens("story", user.tier, request))
         logger.info(f"Received story request: title={request.title}, genre={request.genre}")
-        result = generate_story(request, tier=user.tier)
+        deadline = deadline_for("story:write", user.tier, x_request_timeout)
+        result = await agenerate_story(request, tier=user.tier, deadline=deadline)
         logger.info("Story generated successfully")
         return result
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except QuotaExhausted as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in write_story endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -29,16 +47,20 @@ def write_story(request: StoryRequest, user: UserContext = Depends(get_current_u
 async def write_story_streaming(
     request: StoryRequest, 
     user: UserContext = Depends(get_current_user),
-    streaming_speed: str = "normal"
+    streaming_speed: str = "normal",
+    x_request_timeout: Optional[str] = Header(default=None)
 ):
     """Stream story generation with Server-Sent Events (SSE)"""
     try:
-        allow(user.user_id, user.tier, route_key="story:write")
+        await aallow(user.user_id, user.tier, route_key="story:write")
+        request = enforce_input_budget("story", user.tier, request)
+        await aallow_tokens(user.user_id, user.tier, "story:write", estimate_total_tokens("story", user.tier, request))
+        deadline = deadline_for("story:write", user.tier, x_request_timeout)
         logger.info(f"Received streaming story request: title={request.title}, genre={request.genre}, speed={streaming_speed}")
         
         async def generate():
             try:
-                async for chunk in generate_story_streaming(request, tier=user.tier, streaming_speed=streaming_speed):
+                async for chunk in generate_story_streaming(request, tier=user.tier, streaming_speed=streaming_speed, deadline=deadline):
                     # Format as Server-Sent Events
                     yield f"data: {json.dumps(chunk)}\n\n"
                 # Send completion signal
@@ -57,10 +79,17 @@ async def write_story_streaming(
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Headers": "*",
             }
         )
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in write_story_streaming endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Header
+from typing import Dict, Any, Optional
 from pydantic import BaseModel
 from services.agents.story_editor_agent import StoryEditorAgent
 from services.agents.base_agent import AgentContext
 from auth.dependencies import get_current_user
+from services.limits.rate_limiter import aallow_tokens
+from services.providers.tokens import estimate_total_tokens
+from services.providers.deadline import deadline_for
 from db.models import User
 from datetime import datetime
 import uuid
@@ -28,11 +31,15 @@ class StoryEditResponse(BaseModel):
 @router.post("/edit", response_model=StoryEditResponse)
 async def edit_story(
     request: StoryEditRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    x_request_timeout: Optional[str] = Header(default=None)
 ):
     """Edit a story using the story editor agent"""
     
     try:
+        await aallow_tokens(str(current_user.user_id), current_user.role, "story:edit",
+                           estimate_total_tokens("story", current_user.role, request))
+        
         # Create agent context
         context = AgentContext(
             request_id=str(uuid.uuid4()),
@@ -40,7 +47,8 @@ async def edit_story(
             user_tier=current_user.role,
             workflow_id=str(uuid.uuid4()),
             shared_data={},
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            deadline=deadline_for("story:edit", current_user.role, x_request_timeout)
         )
         
         # Create story editor agent
@@ -58,8 +66,9 @@ async def edit_story(
         response = await editor_agent.process(input_data, context)
         
         if not response.success:
+            error_type = response.metadata.get("error_type")
             raise HTTPException(
-                status_code=400,
+                status_code={"token_budget_exceeded": 413, "deadline_exceeded": 504}.get(error_type, 400),
                 detail=f"Story editing failed: {response.data.get('error', 'Unknown error')}"
             )
         
@@ -73,6 +82,8 @@ async def edit_story(
             metadata=response.metadata
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from schemas.workflow import FullStoryRequest, FullStoryResponse
-from services.full_story_workflow import generate_full_story, generate_idea_only
+from services.full_story_workflow import agenerate_full_story, generate_idea_only
 import logging
 from auth.dependencies import get_current_user, UserContext
-from services.limits.rate_limiter import allow
+from services.limits.rate_limiter import allow, aallow
+from services.providers.deadline import DeadlineExceeded, deadline_for
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,14 +13,18 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/generate-full-story", response_model=FullStoryResponse)
-def create_full_story(request: FullStoryRequest, user: UserContext = Depends(get_current_user)):
+async def create_full_story(request: FullStoryRequest, user: UserContext = Depends(get_current_user),
+                            x_request_timeout: Optional[str] = Header(default=None)):
     try:
-        allow(user.user_id, user.tier, route_key="workflow:full")
+        await aallow(user.user_id, user.tier, route_key="workflow:full")
         logger.info(f"Received full story request: prompt='{request.prompt[:50]}...'")
-        # pass tier via environment to underlying services through dependency? simplest: set in services to free for now
-        result = generate_full_story(request)
+        # The story step starts as soon as the streamed idea has its title, genre and outline
+        deadline = deadline_for("workflow:full", user.tier, x_request_timeout)
+        result = await agenerate_full_story(request, tier=user.tier, deadline=deadline)
         logger.info("Full story workflow completed successfully")
         return result
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in full story workflow endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
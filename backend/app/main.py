@@ -14,9 +14,15 @@ from api.routes import admin as admin_routes
 from api.routes import user as user_routes
 from api.routes import moderation_metrics as moderation_metrics_routes
 from api.routes import story_editor as story_editor_routes
+from api.routes import batch as batch_routes
 from auth.routes import router as auth_routes
 from metrics.usage import UsageLoggingMiddleware
 from metrics.prom import create_metrics_response
+from services.providers.router import router as provider_router
+from services.cache.semantic_cache import semantic_cache
+from services.batch.jobs import batch_manager
+from services.orchestrator.history import workflow_history
+from services.orchestrator.jobs import workflow_jobs
 
 # Load environment variables from .env file
 load_dotenv()
@@ -60,6 +66,27 @@ app.include_router(user_routes.router, prefix="/user", tags=["User"])
 app.include_router(admin_routes.router, prefix="/admin", tags=["Admin"])
 app.include_router(moderation_metrics_routes.router, prefix="/moderation", tags=["Content Moderation Metrics"])
 app.include_router(story_editor_routes.router, prefix="/story-editor", tags=["Story Editor"])
+app.include_router(batch_routes.router, prefix="/batch", tags=["Batch Generation"])
+
+@app.on_event("startup")
+async def resume_batch_jobs():
+    """Pick up batch jobs that were still running when the server stopped"""
+    batch_manager.resume()
+
+@app.on_event("startup")
+async def start_workflow_workers():
+    """Start the worker pool for background workflow jobs"""
+    await workflow_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_providers():
+    """Stop batch job runners, drain workflow jobs, write queued workflow history, close pooled
+    provider HTTP connections and persist the semantic cache"""
+    await batch_manager.shutdown()
+    await workflow_jobs.shutdown()
+    await workflow_history.flush()
+    await provider_router.shutdown()
+    await semantic_cache.persist()
 
 @app.get("/")
 async def root():
@@ -74,7 +101,9 @@ async def root():
             "multi_agent_workflow": "/multi-agent/orchestrated-workflow",
             "system_status": "/multi-agent/system-status",
             "provider_management": "/providers/available",
-            "moderation_metrics": "/moderation/metrics"
+            "moderation_metrics": "/moderation/metrics",
+            "batch_jobs": "/batch/jobs",
+            "workflow_jobs": "/multi-agent/jobs"
         }
     }
 
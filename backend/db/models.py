@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -81,3 +81,89 @@ class DailyAggregate(Base):
     __table_args__ = (
         {"extend_existing": True}
     )
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    task = Column(String, nullable=False)  # idea, story
+    tier = Column(String, nullable=False)
+    provider = Column(String, nullable=False)  # openai, anthropic, gemini
+    model = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, submitted, running, completed, failed, cancelled
+    external_id = Column(String, nullable=True)  # Provider batch id (OpenAI / Anthropic)
+    total_items = Column(Integer, default=0)
+    completed_items = Column(Integer, default=0)
+    failed_items = Column(Integer, default=0)
+    tokens_in = Column(Integer, default=0)
+    tokens_out = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    items = relationship("BatchItem", back_populates="job", order_by="BatchItem.index")
+
+class BatchItem(Base):
+    __tablename__ = "batch_items"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_id = Column(String, ForeignKey("batch_jobs.id"), nullable=False)
+    index = Column(Integer, nullable=False)  # Position in the submitted list, also the provider custom_id
+    request_json = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, succeeded, failed
+    output_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    tokens_in = Column(Integer, default=0)
+    tokens_out = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    completed_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    job = relationship("BatchJob", back_populates="items")
+    
+    __table_args__ = (
+        UniqueConstraint("job_id", "index", name="uq_batch_items_job_index"),
+    )
+
+class WorkflowRun(Base):
+    __tablename__ = "workflow_runs"
+    
+    id = Column(String, primary_key=True)  # The orchestrator's workflow_id
+    # No foreign key: orchestrated workflows also run for header-authenticated dev users
+    user_id = Column(String, nullable=False)
+    user_tier = Column(String, nullable=False)
+    workflow_type = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # completed, failed
+    error = Column(Text, nullable=True)
+    steps_json = Column(Text, nullable=True)  # Per-step timing summaries, no outputs
+    critical_path = Column(String, nullable=True)  # Comma-separated step names
+    total_execution_time_ms = Column(Integer, default=0)
+    tokens_in = Column(Integer, default=0)
+    tokens_out = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Keyset pagination walks (started_at, id) newest first, optionally per user
+    __table_args__ = (
+        Index("ix_workflow_runs_started_at_id", "started_at", "id"),
+        Index("ix_workflow_runs_user_started_at", "user_id", "started_at"),
+    )
+
+class WorkflowCheckpoint(Base):
+    __tablename__ = "workflow_checkpoints"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    workflow_id = Column(String, nullable=False, index=True)
+    step = Column(String, nullable=False)  # Step name, or "_workflow" for the run's type, user and input
+    payload_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        UniqueConstraint("workflow_id", "step", name="uq_workflow_checkpoints_workflow_step"),
+    )
@@ -33,6 +33,172 @@ COST_USD = Counter(
     ['provider', 'model', 'feature', 'user_tier']
 )
 
+STREAM_TTFT = Histogram(
+    'taelio_stream_time_to_first_token_seconds',
+    'Time from request to first streamed token in seconds',
+    ['provider', 'model'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
+
+HEDGE_FIRED = Counter(
+    'taelio_hedge_fired_total',
+    'Hedged provider requests fired',
+    ['task', 'primary_provider', 'hedge_provider']
+)
+
+HEDGE_WON = Counter(
+    'taelio_hedge_won_total',
+    'Hedged provider requests by winning side',
+    ['task', 'winner']
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    'taelio_circuit_breaker_state',
+    'Provider circuit breaker state (0=closed, 1=half_open, 2=open)',
+    ['provider', 'model']
+)
+
+PROVIDER_FAILOVER = Counter(
+    'taelio_provider_failover_total',
+    'Provider calls retried on another provider within the same request',
+    ['task', 'from_provider', 'to_provider']
+)
+
+GENERATION_CACHE_HITS = Counter(
+    'taelio_generation_cache_hits_total',
+    'Generation cache hits',
+    ['task', 'tier', 'layer']
+)
+
+GENERATION_CACHE_MISSES = Counter(
+    'taelio_generation_cache_misses_total',
+    'Generation cache misses',
+    ['task', 'tier', 'layer']
+)
+
+SINGLE_FLIGHT_COALESCED = Counter(
+    'taelio_single_flight_coalesced_total',
+    'Generations served by joining an identical in-flight upstream call',
+    ['task', 'scope']
+)
+
+USAGE_ESTIMATED = Counter(
+    'taelio_usage_estimated_total',
+    'Provider responses without reported token usage (counts were estimated)',
+    ['provider']
+)
+
+PROMPT_CACHE_TOKENS = Counter(
+    'taelio_prompt_cache_tokens_total',
+    'Input tokens read from or written to provider prompt caches',
+    ['provider', 'kind']
+)
+
+BATCH_ITEMS = Counter(
+    'taelio_batch_items_total',
+    'Batch job items finished',
+    ['task', 'provider', 'status']
+)
+
+IDEA_PARSE = Counter(
+    'taelio_idea_parse_total',
+    'Idea outputs parsed, by how they were parsed ("json" or the "text" fallback)',
+    ['provider', 'outcome']
+)
+
+DEADLINE_EXCEEDED = Counter(
+    'taelio_deadline_exceeded_total',
+    'Requests that ran out of their deadline, by where the time ran out',
+    ['task', 'stage']
+)
+
+PROVIDERS_SKIPPED_FOR_DEADLINE = Counter(
+    'taelio_providers_skipped_for_deadline_total',
+    'Providers skipped because their recent p50 latency exceeded the remaining deadline',
+    ['task', 'provider']
+)
+
+UPSTREAM_QUOTA_WAIT = Histogram(
+    'taelio_upstream_quota_wait_seconds',
+    'Time provider calls waited for upstream quota before being sent',
+    ['provider'],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
+UPSTREAM_QUOTA_SHED = Counter(
+    'taelio_upstream_quota_shed_total',
+    'Provider calls shed because upstream quota would not free up in time',
+    ['provider']
+)
+
+UPSTREAM_RETRIES = Counter(
+    'taelio_upstream_retries_total',
+    'Provider calls retried after a transient upstream failure',
+    ['provider', 'key_alias', 'reason']
+)
+
+API_KEY_REQUESTS = Counter(
+    'taelio_api_key_requests_total',
+    'Provider calls per pooled API key, by outcome',
+    ['provider', 'key_alias', 'outcome']
+)
+
+API_KEY_IN_FLIGHT = Gauge(
+    'taelio_api_key_in_flight',
+    'Provider calls currently in flight per pooled API key',
+    ['provider', 'key_alias']
+)
+
+API_KEY_EJECTIONS = Counter(
+    'taelio_api_key_ejections_total',
+    'Pooled API keys taken out of rotation, by reason ("auth" or "quota")',
+    ['provider', 'key_alias', 'reason']
+)
+
+WORKFLOW_RESUMES = Counter(
+    'taelio_workflow_resumes_total',
+    'Orchestrated workflows resumed from checkpoints',
+    ['workflow_type', 'outcome']
+)
+
+WORKFLOW_STEPS_RESTORED = Counter(
+    'taelio_workflow_steps_restored_total',
+    'Workflow steps skipped on resume because a checkpoint held their output',
+    ['workflow_type', 'step']
+)
+
+WORKFLOW_JOBS = Counter(
+    'taelio_workflow_jobs_total',
+    'Background workflow jobs by final status',
+    ['workflow_type', 'status']
+)
+
+WORKFLOW_JOB_QUEUE_WAIT = Histogram(
+    'taelio_workflow_job_queue_wait_seconds',
+    'Time workflow jobs spent queued before a worker picked them up',
+    ['tier'],
+    buckets=[0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0]
+)
+
+WORKFLOW_JOBS_RUNNING = Gauge(
+    'taelio_workflow_jobs_running',
+    'Workflow jobs currently running on this node',
+    ['tier']
+)
+
+AGENT_IN_FLIGHT = Gauge(
+    'taelio_agent_in_flight',
+    'Calls currently running on each pooled agent instance',
+    ['agent_type', 'agent_id']
+)
+
+AGENT_POOL_WAIT = Histogram(
+    'taelio_agent_pool_wait_seconds',
+    'Time workflow steps waited for a free agent instance',
+    ['agent_type'],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
 ACTIVE_USERS = Gauge(
     'taelio_active_users',
     'Number of active users',
@@ -78,6 +244,127 @@ def record_usage_metrics(provider: str, model: str, feature: str, user_tier: str
         user_tier=user_tier
     ).inc(cost_usd)
 
+def record_stream_ttft(provider: str, model: str, ttft_ms: int):
+    """Record time-to-first-token for a streamed generation"""
+    STREAM_TTFT.labels(
+        provider=provider,
+        model=model
+    ).observe(ttft_ms / 1000.0)
+
+def record_hedge_fired(task: str, primary_provider: str, hedge_provider: str):
+    """Record that a hedged request was fired"""
+    HEDGE_FIRED.labels(
+        task=task,
+        primary_provider=primary_provider,
+        hedge_provider=hedge_provider
+    ).inc()
+
+def record_hedge_won(task: str, winner: str):
+    """Record which side ("primary" or "hedge") won a hedged request"""
+    HEDGE_WON.labels(task=task, winner=winner).inc()
+
+def record_circuit_state(provider: str, model: str, state: str):
+    """Record the current circuit breaker state for a provider/model"""
+    value = {"closed": 0, "half_open": 1, "open": 2}.get(state, 0)
+    CIRCUIT_BREAKER_STATE.labels(provider=provider, model=model).set(value)
+
+def record_failover(task: str, from_provider: str, to_provider: str):
+    """Record a runtime failover from one provider to another"""
+    PROVIDER_FAILOVER.labels(
+        task=task,
+        from_provider=from_provider,
+        to_provider=to_provider
+    ).inc()
+
+def record_cache_hit(task: str, tier: str, layer: str):
+    """Record a generation cache hit in the given layer ("l1", "l2" or "semantic")"""
+    GENERATION_CACHE_HITS.labels(task=task, tier=tier, layer=layer).inc()
+
+def record_cache_miss(task: str, tier: str, layer: str):
+    """Record a generation cache miss in the given layer ("exact" or "semantic")"""
+    GENERATION_CACHE_MISSES.labels(task=task, tier=tier, layer=layer).inc()
+
+def record_coalesced(task: str, scope: str):
+    """Record a generation coalesced onto an in-flight call ("local" or "redis")"""
+    SINGLE_FLIGHT_COALESCED.labels(task=task, scope=scope).inc()
+
+def record_estimated_usage(provider: str):
+    """Record a response whose token usage had to be estimated"""
+    USAGE_ESTIMATED.labels(provider=provider).inc()
+
+def record_prompt_cache_tokens(provider: str, read_tokens: int, write_tokens: int):
+    """Record input tokens served from ("read") or added to ("write") a provider's prompt cache"""
+    if read_tokens:
+        PROMPT_CACHE_TOKENS.labels(provider=provider, kind="read").inc(read_tokens)
+    if write_tokens:
+        PROMPT_CACHE_TOKENS.labels(provider=provider, kind="write").inc(write_tokens)
+
+def record_batch_item(task: str, provider: str, status: str):
+    """Record a finished batch job item ("succeeded" or "failed")"""
+    BATCH_ITEMS.labels(task=task, provider=provider, status=status).inc()
+
+def record_idea_parse(provider: str, outcome: str):
+    """Record how an idea output was parsed ("json" or "text")"""
+    IDEA_PARSE.labels(provider=provider, outcome=outcome).inc()
+
+def record_deadline_exceeded(task: str, stage: str):
+    """Record a request whose deadline expired ("router", "provider", "stream" or "workflow")"""
+    DEADLINE_EXCEEDED.labels(task=task, stage=stage).inc()
+
+def record_provider_skipped_for_deadline(task: str, provider: str):
+    """Record a provider skipped because it is too slow for the remaining deadline"""
+    PROVIDERS_SKIPPED_FOR_DEADLINE.labels(task=task, provider=provider).inc()
+
+def record_quota_wait(provider: str, seconds: float):
+    """Record how long a call waited for upstream quota"""
+    UPSTREAM_QUOTA_WAIT.labels(provider=provider).observe(seconds)
+
+def record_quota_shed(provider: str):
+    """Record a call shed for lack of upstream quota"""
+    UPSTREAM_QUOTA_SHED.labels(provider=provider).inc()
+
+def record_upstream_retry(provider: str, key_alias: str, reason: str):
+    """Record a retried upstream call ("rate_limited", "server_error", "connection" or "key_ejected")"""
+    UPSTREAM_RETRIES.labels(provider=provider, key_alias=key_alias, reason=reason).inc()
+
+def record_api_key_request(provider: str, key_alias: str, outcome: str):
+    """Record a finished call on a pooled API key ("success" or "error")"""
+    API_KEY_REQUESTS.labels(provider=provider, key_alias=key_alias, outcome=outcome).inc()
+
+def record_api_key_in_flight(provider: str, key_alias: str, in_flight: int):
+    """Record how many calls are in flight on a pooled API key"""
+    API_KEY_IN_FLIGHT.labels(provider=provider, key_alias=key_alias).set(in_flight)
+
+def record_api_key_ejected(provider: str, key_alias: str, reason: str):
+    """Record a pooled API key taken out of rotation"""
+    API_KEY_EJECTIONS.labels(provider=provider, key_alias=key_alias, reason=reason).inc()
+
+def record_workflow_resume(workflow_type: str, outcome: str, restored_steps: list):
+    """Record a workflow resume ("completed" or "failed") and the steps its checkpoints saved"""
+    WORKFLOW_RESUMES.labels(workflow_type=workflow_type, outcome=outcome).inc()
+    for step in restored_steps:
+        WORKFLOW_STEPS_RESTORED.labels(workflow_type=workflow_type, step=step).inc()
+
+def record_workflow_job(workflow_type: str, status: str):
+    """Record a finished workflow job ("completed" or "failed")"""
+    WORKFLOW_JOBS.labels(workflow_type=workflow_type, status=status).inc()
+
+def record_workflow_job_wait(tier: str, seconds: float):
+    """Record how long a workflow job waited for a worker"""
+    WORKFLOW_JOB_QUEUE_WAIT.labels(tier=tier).observe(seconds)
+
+def record_workflow_jobs_running(tier: str, running: int):
+    """Record how many workflow jobs of a tier are running"""
+    WORKFLOW_JOBS_RUNNING.labels(tier=tier).set(running)
+
+def record_agent_in_flight(agent_type: str, agent_id: str, in_flight: int):
+    """Record how many calls a pooled agent instance is running"""
+    AGENT_IN_FLIGHT.labels(agent_type=agent_type, agent_id=agent_id).set(in_flight)
+
+def record_agent_pool_wait(agent_type: str, seconds: float):
+    """Record how long a step waited for a free agent instance"""
+    AGENT_POOL_WAIT.labels(agent_type=agent_type).observe(seconds)
+
 def update_active_users(tier: str, count: int):
     """Update active users gauge"""
     ACTIVE_USERS.labels(tier=tier).set(count)
@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any, Literal
+
+class BatchJobRequest(BaseModel):
+    task: Literal["idea", "story"]
+    # IdeaRequest or StoryRequest fields, matching `task`
+    items: List[Dict[str, Any]]
+    provider: Optional[str] = None
+
+class BatchJobResponse(BaseModel):
+    job_id: str
+    task: str
+    provider: str
+    model: str
+    status: str
+    total_items: int
+    completed_items: int
+    failed_items: int
+    progress: float
+    tokens_in: int
+    tokens_out: int
+    cost_usd: float
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    completed_at: Optional[str] = None
@@ -16,6 +16,11 @@ class WorkflowStep(BaseModel):
     agent_type: str
     success: bool
     execution_time_ms: int
+    name: Optional[str] = None
+    started_at_ms: Optional[int] = None   # offsets from the workflow's start
+    finished_at_ms: Optional[int] = None
+    depends_on: List[str] = []
+    from_checkpoint: bool = False
 
 class WorkflowResponse(BaseModel):
     """Response from multi-agent workflow execution"""
@@ -25,7 +30,27 @@ class WorkflowResponse(BaseModel):
     moderation: Optional[Dict[str, Any]] = None
     quality_assurance: Optional[Dict[str, Any]] = None
     workflow_steps: List[WorkflowStep]
-    total_execution_time_ms: int
+    total_execution_time_ms: int  # critical path through the workflow's steps
+    critical_path: List[str] = []
+
+class WorkflowJobRequest(BaseModel):
+    """Workflow to run as a background job"""
+    workflow_type: str = "full_story_generation"
+    input_data: Dict[str, Any]
+
+class WorkflowJobResponse(BaseModel):
+    """Status of a background workflow job; `result` is set once it completes"""
+    job_id: str
+    workflow_id: str  # resume a failed job with /multi-agent/workflows/{workflow_id}/resume
+    workflow_type: str
+    status: str  # queued, running, completed, failed
+    user_tier: str
+    attempts: int
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
 
 # Legacy schemas for backward compatibility
 class FullStoryRequest(BaseModel):
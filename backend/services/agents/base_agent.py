@@ -3,6 +3,7 @@ from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
 from datetime import datetime
 import uuid
+from services.providers.deadline import Deadline
 
 @dataclass
 class AgentContext:
@@ -13,6 +14,8 @@ class AgentContext:
     workflow_id: str
     shared_data: Dict[str, Any]
     created_at: datetime
+    # When the request must finish; provider calls get only the time left
+    deadline: Optional[Deadline] = None
 
 @dataclass
 class AgentResponse:
@@ -28,11 +31,14 @@ class AgentResponse:
 class BaseAgent(ABC):
     """Base class for all agents in the system"""
     
-    def __init__(self, agent_id: str, agent_type: str, name: str, description: str):
+    def __init__(self, agent_id: str, agent_type: str, name: str, description: str,
+                 preferred_provider: Optional[str] = None):
         self.agent_id = agent_id
         self.agent_type = agent_type
         self.name = name
         self.description = description
+        # Provider this instance sends its generations to first (None: the tier's configured order)
+        self.preferred_provider = preferred_provider
         self.status = "initialized"
         self.created_at = datetime.utcnow()
         self.last_used_at = None
@@ -64,6 +70,7 @@ class BaseAgent(ABC):
             "agent_type": self.agent_type,
             "name": self.name,
             "status": self.status,
+            "preferred_provider": self.preferred_provider,
             "created_at": self.created_at,
             "last_used_at": self.last_used_at,
             "usage_count": self.usage_count,
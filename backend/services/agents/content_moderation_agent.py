@@ -6,9 +6,9 @@ from .base_agent import BaseAgent, AgentContext, AgentResponse
 class ContentModerationAgent(BaseAgent):
     """Agent specialized in content moderation and safety checks"""
     
-    def __init__(self):
+    def __init__(self, instance: int = 1):
         super().__init__(
-            agent_id="content_mod_001",
+            agent_id=f"content_mod_{instance:03d}",
             agent_type="content_moderator",
             name="Content Moderator",
             description="Moderates content for safety, appropriateness, and policy compliance"
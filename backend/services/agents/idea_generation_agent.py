@@ -1,18 +1,21 @@
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base_agent import BaseAgent, AgentContext, AgentResponse
 from services.providers.router import router
+from services.providers.deadline import DeadlineExceeded
+from services.cache.semantic_cache import semantic_cache
 from schemas.idea import IdeaRequest, IdeaResponse
 
 class IdeaGenerationAgent(BaseAgent):
     """Agent specialized in generating creative story ideas"""
     
-    def __init__(self):
+    def __init__(self, instance: int = 1, preferred_provider: Optional[str] = None):
         super().__init__(
-            agent_id="idea_gen_001",
+            agent_id=f"idea_gen_{instance:03d}",
             agent_type="idea_generator",
             name="Creative Idea Generator",
-            description="Generates creative story ideas from simple prompts"
+            description="Generates creative story ideas from simple prompts",
+            preferred_provider=preferred_provider
         )
         self.status = "ready"
     
@@ -59,9 +62,18 @@ class IdeaGenerationAgent(BaseAgent):
                 tone=input_data.get("tone")
             )
             
-            # Generate idea using provider router
-            provider = router.select(task="idea", tier=context.user_tier)
-            result = provider.generate(idea_request)
+            # Serve a cached idea for a paraphrased prompt, otherwise generate one
+            result = None
+            use_semantic_cache = semantic_cache.enabled_for(context.user_tier)
+            if use_semantic_cache:
+                result = await semantic_cache.lookup(
+                    idea_request.prompt, idea_request.genre, idea_request.tone, context.user_tier
+                )
+            if result is None:
+                result = await router.agenerate(task="idea", tier=context.user_tier, request=idea_request,
+                                                preferred_provider=self.preferred_provider, deadline=context.deadline)
+                if use_semantic_cache and not result.cached:
+                    await semantic_cache.add(idea_request.prompt, idea_request.genre, idea_request.tone, result)
             
             # Update usage statistics
             self._update_usage()
@@ -85,6 +97,8 @@ class IdeaGenerationAgent(BaseAgent):
                 "tokens_in": result.tokens_in,
                 "tokens_out": result.tokens_out,
                 "cost_usd": result.cost_usd,
+                "cached": result.cached,
+                "coalesced": result.coalesced,
                 "user_tier": context.user_tier
             }
             
@@ -95,6 +109,16 @@ class IdeaGenerationAgent(BaseAgent):
                 execution_time_ms=execution_time_ms
             )
             
+        except DeadlineExceeded as e:
+            self._update_error()
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return self._create_response(
+                success=False,
+                data={"error": str(e)},
+                metadata={"error_type": "deadline_exceeded"},
+                execution_time_ms=execution_time_ms
+            )
+            
         except Exception as e:
             self._update_error()
             execution_time_ms = int((time.time() - start_time) * 1000)
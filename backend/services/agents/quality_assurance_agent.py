@@ -6,9 +6,9 @@ from .base_agent import BaseAgent, AgentContext, AgentResponse
 class QualityAssuranceAgent(BaseAgent):
     """Agent specialized in quality assurance and story validation"""
     
-    def __init__(self):
+    def __init__(self, instance: int = 1):
         super().__init__(
-            agent_id="qa_001",
+            agent_id=f"qa_{instance:03d}",
             agent_type="quality_assurance",
             name="Quality Assurance Agent",
             description="Ensures story quality, coherence, and completeness"
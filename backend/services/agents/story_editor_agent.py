@@ -2,6 +2,8 @@ import time
 from typing import Dict, Any
 from .base_agent import BaseAgent, AgentContext, AgentResponse
 from services.providers.router import router
+from services.providers.tokens import TokenBudgetExceeded
+from services.providers.deadline import DeadlineExceeded
 from schemas.story import StoryRequest, StoryResponse
 
 class StoryEditorAgent(BaseAgent):
@@ -73,9 +75,6 @@ class StoryEditorAgent(BaseAgent):
             Please edit the story according to the instructions above. Maintain the core narrative while implementing the requested changes.
             """
             
-            # Generate edited story using provider router
-            provider = router.select(task="story", tier=context.user_tier)
-            
             # Create a custom request for editing
             edit_request = StoryRequest(
                 title=input_data.get("title", "Edited Story"),
@@ -83,7 +82,8 @@ class StoryEditorAgent(BaseAgent):
                 outline=edit_prompt
             )
             
-            result = provider.generate(edit_request)
+            # Generate edited story using provider router
+            result = await router.agenerate(task="story", tier=context.user_tier, request=edit_request, deadline=context.deadline)
             
             # Update usage statistics
             self._update_usage()
@@ -107,6 +107,8 @@ class StoryEditorAgent(BaseAgent):
                 "tokens_in": result.tokens_in,
                 "tokens_out": result.tokens_out,
                 "cost_usd": result.cost_usd,
+                "cached": result.cached,
+                "coalesced": result.coalesced,
                 "user_tier": context.user_tier,
                 "story_length": len(result.output.story),
                 "word_count": len(result.output.story.split()),
@@ -120,6 +122,26 @@ class StoryEditorAgent(BaseAgent):
                 execution_time_ms=execution_time_ms
             )
             
+        except TokenBudgetExceeded as e:
+            self._update_error()
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return self._create_response(
+                success=False,
+                data={"error": str(e)},
+                metadata={"error_type": "token_budget_exceeded"},
+                execution_time_ms=execution_time_ms
+            )
+            
+        except DeadlineExceeded as e:
+            self._update_error()
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return self._create_response(
+                success=False,
+                data={"error": str(e)},
+                metadata={"error_type": "deadline_exceeded"},
+                execution_time_ms=execution_time_ms
+            )
+            
         except Exception as e:
             self._update_error()
             execution_time_ms = int((time.time() - start_time) * 1000)
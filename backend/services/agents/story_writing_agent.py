@@ -1,18 +1,20 @@
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base_agent import BaseAgent, AgentContext, AgentResponse
 from services.providers.router import router
+from services.providers.deadline import DeadlineExceeded
 from schemas.story import StoryRequest, StoryResponse
 
 class StoryWritingAgent(BaseAgent):
     """Agent specialized in writing full stories from ideas"""
     
-    def __init__(self):
+    def __init__(self, instance: int = 1, preferred_provider: Optional[str] = None):
         super().__init__(
-            agent_id="story_writer_001",
+            agent_id=f"story_writer_{instance:03d}",
             agent_type="story_writer",
             name="Story Writer",
-            description="Writes complete stories from story ideas and outlines"
+            description="Writes complete stories from story ideas and outlines",
+            preferred_provider=preferred_provider
         )
         self.status = "ready"
     
@@ -66,8 +68,8 @@ class StoryWritingAgent(BaseAgent):
             )
             
             # Generate story using provider router
-            provider = router.select(task="story", tier=context.user_tier)
-            result = provider.generate(story_request)
+            result = await router.agenerate(task="story", tier=context.user_tier, request=story_request,
+                                            preferred_provider=self.preferred_provider, deadline=context.deadline)
             
             # Update usage statistics
             self._update_usage()
@@ -89,6 +91,8 @@ class StoryWritingAgent(BaseAgent):
                 "tokens_in": result.tokens_in,
                 "tokens_out": result.tokens_out,
                 "cost_usd": result.cost_usd,
+                "cached": result.cached,
+                "coalesced": result.coalesced,
                 "user_tier": context.user_tier,
                 "story_length": len(result.output.story),
                 "word_count": len(result.output.story.split())
@@ -101,6 +105,16 @@ class StoryWritingAgent(BaseAgent):
                 execution_time_ms=execution_time_ms
             )
             
+        except DeadlineExceeded as e:
+            self._update_error()
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return self._create_response(
+                success=False,
+                data={"error": str(e)},
+                metadata={"error_type": "deadline_exceeded"},
+                execution_time_ms=execution_time_ms
+            )
+            
         except Exception as e:
             self._update_error()
             execution_time_ms = int((time.time() - start_time) * 1000)
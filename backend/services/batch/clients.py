@@ -0,0 +1,187 @@
+"""
+HTTP clients for provider batch APIs (OpenAI Batch, Anthropic Message Batches)
+
+Both talk to the REST endpoints directly so the base URL can point at the
+local stub server in test/batch_stub_server.py.
+"""
+import json
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from services.providers.prompts import prompt_for, openai_messages, anthropic_system, anthropic_messages
+from services.providers.structured import anthropic_output_text, anthropic_tool_options, openai_response_format
+from services.providers.usage import TokenUsage, from_openai, from_anthropic
+
+@dataclass
+class BatchStatus:
+    # "running", "ended" (results can be fetched) or "failed" (no results)
+    state: str
+    succeeded: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+
+@dataclass
+class BatchItemResult:
+    index: int
+    text: Optional[str] = None
+    usage: Optional[TokenUsage] = None
+    error: Optional[str] = None
+
+def _parse_line(line: str) -> SimpleNamespace:
+    """A JSONL result line with attribute access, so the usage extractors apply unchanged"""
+    return json.loads(line, object_hook=lambda d: SimpleNamespace(**d))
+
+def _error_message(error: Any) -> str:
+    message = getattr(error, "message", None)
+    if message:
+        return message
+    nested = getattr(error, "error", None)
+    return _error_message(nested) if nested is not None else str(error)
+
+class OpenAIBatchClient:
+    """Uploads a JSONL of chat completion requests and runs it as one OpenAI batch"""
+
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, api_key: str, base_url: str, completion_window: str = "24h", timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.completion_window = completion_window
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.timeout = timeout
+
+    def build_request(self, index: int, task: str, provider, request) -> Dict[str, Any]:
+        body = {
+            "model": provider.model_name,
+            "messages": openai_messages(prompt_for(task, request, "openai")),
+            "temperature": provider.temperature,
+            "max_tokens": provider.max_tokens_for(request)
+        }
+        response_format = openai_response_format(provider.model_name) if task == "idea" else None
+        if response_format:
+            body["response_format"] = response_format
+        return {"custom_id": str(index), "method": "POST", "url": self.endpoint, "body": body}
+
+    async def submit(self, requests: List[Dict[str, Any]]) -> str:
+        jsonl = "\n".join(json.dumps(r) for r in requests).encode()
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            upload = await client.post(
+                "/files", data={"purpose": "batch"}, files={"file": ("batch.jsonl", jsonl, "application/jsonl")}
+            )
+            upload.raise_for_status()
+            batch = await client.post("/batches", json={
+                "input_file_id": upload.json()["id"],
+                "endpoint": self.endpoint,
+                "completion_window": self.completion_window
+            })
+            batch.raise_for_status()
+            return batch.json()["id"]
+
+    async def _get_batch(self, client: httpx.AsyncClient, batch_id: str) -> Dict[str, Any]:
+        response = await client.get(f"/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+
+    async def status(self, batch_id: str) -> BatchStatus:
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            batch = await self._get_batch(client, batch_id)
+        counts = batch.get("request_counts") or {}
+        state = batch["status"]
+        if state == "failed":
+            errors = (batch.get("errors") or {}).get("data") or []
+            return BatchStatus("failed", error="; ".join(e.get("message", "") for e in errors) or "Batch failed")
+        # Expired and cancelled batches still return whatever finished
+        ended = state in ("completed", "expired", "cancelled")
+        return BatchStatus("ended" if ended else "running", counts.get("completed", 0), counts.get("failed", 0))
+
+    async def results(self, batch_id: str) -> AsyncIterator[BatchItemResult]:
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            batch = await self._get_batch(client, batch_id)
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if not file_id:
+                    continue
+                async with client.stream("GET", f"/files/{file_id}/content") as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            yield self._item_result(_parse_line(line))
+
+    def _item_result(self, line: SimpleNamespace) -> BatchItemResult:
+        index = int(line.custom_id)
+        response = getattr(line, "response", None)
+        if getattr(line, "error", None) or response is None or response.status_code != 200:
+            error = getattr(line, "error", None) or getattr(getattr(response, "body", None), "error", None)
+            return BatchItemResult(index, error=_error_message(error) if error else "Request failed")
+        body = response.body
+        return BatchItemResult(index, text=body.choices[0].message.content, usage=from_openai(getattr(body, "usage", None)))
+
+    async def cancel(self, batch_id: str):
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            response = await client.post(f"/batches/{batch_id}/cancel")
+            response.raise_for_status()
+
+class AnthropicBatchClient:
+    """Runs Messages API requests as one Anthropic message batch"""
+
+    def __init__(self, api_key: str, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+        self.timeout = timeout
+
+    def build_request(self, index: int, task: str, provider, request) -> Dict[str, Any]:
+        prompt = prompt_for(task, request, "anthropic")
+        return {
+            "custom_id": str(index),
+            "params": {
+                "model": provider.model_name,
+                "max_tokens": provider.max_tokens_for(request),
+                "temperature": provider.temperature,
+                "system": anthropic_system(prompt),
+                "messages": anthropic_messages(prompt),
+                **(anthropic_tool_options() if task == "idea" else {})
+            }
+        }
+
+    async def submit(self, requests: List[Dict[str, Any]]) -> str:
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            response = await client.post("/messages/batches", json={"requests": requests})
+            response.raise_for_status()
+            return response.json()["id"]
+
+    async def _get_batch(self, client: httpx.AsyncClient, batch_id: str) -> Dict[str, Any]:
+        response = await client.get(f"/messages/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+
+    async def status(self, batch_id: str) -> BatchStatus:
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            batch = await self._get_batch(client, batch_id)
+        counts = batch.get("request_counts") or {}
+        failed = counts.get("errored", 0) + counts.get("canceled", 0) + counts.get("expired", 0)
+        state = "ended" if batch["processing_status"] == "ended" else "running"
+        return BatchStatus(state, counts.get("succeeded", 0), failed)
+
+    async def results(self, batch_id: str) -> AsyncIterator[BatchItemResult]:
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            batch = await self._get_batch(client, batch_id)
+            if not batch.get("results_url"):
+                return
+            async with client.stream("GET", batch["results_url"]) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        yield self._item_result(_parse_line(line))
+
+    def _item_result(self, line: SimpleNamespace) -> BatchItemResult:
+        index = int(line.custom_id)
+        result = line.result
+        if result.type != "succeeded":
+            error = getattr(result, "error", None)
+            return BatchItemResult(index, error=_error_message(error) if error else f"Request {result.type}")
+        message = result.message
+        return BatchItemResult(index, text=anthropic_output_text(message.content), usage=from_anthropic(getattr(message, "usage", None)))
+
+    async def cancel(self, batch_id: str):
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout) as client:
+            response = await client.post(f"/messages/batches/{batch_id}/cancel")
+            response.raise_for_status()
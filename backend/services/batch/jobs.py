@@ -0,0 +1,444 @@
+"""
+Bulk generation jobs
+
+Jobs are persisted in batch_jobs / batch_items. OpenAI and Anthropic jobs run
+through the providers' batch APIs (half price, separate capacity from
+interactive traffic); other providers fall back to a bounded number of
+concurrent router calls. Unfinished jobs are resumed on startup. Database
+work from the event loop runs in worker threads.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from db.database import SessionLocal
+from db.models import BatchJob, BatchItem, Usage
+from schemas.idea import IdeaRequest
+from schemas.story import StoryRequest
+from services.providers.config import ProviderType
+from services.providers.keys import key_pools
+from services.providers.router import router
+from services.providers.pricing import usage_cost
+from services.providers.tokens import enforce_input_budget
+from metrics.prom import record_batch_item
+from .clients import AnthropicBatchClient, BatchItemResult, OpenAIBatchClient
+
+BATCH_SETTINGS = {
+    "poll_interval_seconds": float(os.getenv("BATCH_POLL_INTERVAL_SECONDS", "30")),
+    "completion_window": os.getenv("BATCH_COMPLETION_WINDOW", "24h"),
+    # Concurrent calls per job for providers without a batch API
+    "concurrency": int(os.getenv("BATCH_CONCURRENCY", "4")),
+    # How often concurrent jobs re-read their status to notice a cancel
+    "cancel_check_seconds": float(os.getenv("BATCH_CANCEL_CHECK_SECONDS", "1")),
+    "max_items": {"free": 50, "pro": 1000, "admin": 50000},
+    # Point these at test/batch_stub_server.py to run batches locally
+    "openai_base_url": os.getenv("OPENAI_BATCH_BASE_URL", "https://api.openai.com/v1"),
+    "anthropic_base_url": os.getenv("ANTHROPIC_BATCH_BASE_URL", "https://api.anthropic.com/v1"),
+    "results_page_size": 500
+}
+
+ACTIVE_STATUSES = ("pending", "submitted", "running", "cancelling")
+
+_REQUEST_SCHEMAS = {"idea": IdeaRequest, "story": StoryRequest}
+
+class BatchLimitExceeded(Exception):
+    """Raised when a job has more items than the tier allows"""
+
+def job_progress(job: BatchJob) -> Dict[str, Any]:
+    done = (job.completed_items or 0) + (job.failed_items or 0)
+    return {
+        "job_id": job.id,
+        "task": job.task,
+        "provider": job.provider,
+        "model": job.model,
+        "status": job.status,
+        "total_items": job.total_items,
+        "completed_items": job.completed_items,
+        "failed_items": job.failed_items,
+        "progress": round(done / job.total_items, 4) if job.total_items else 1.0,
+        "tokens_in": job.tokens_in,
+        "tokens_out": job.tokens_out,
+        "cost_usd": round(job.cost_usd or 0.0, 6),
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None
+    }
+
+class BatchManager:
+    """Creates, runs, resumes and cancels batch jobs"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or BATCH_SETTINGS
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Item writes run in worker threads and read-modify-write the job's
+        # counters, so they take turns
+        self._write_lock = threading.Lock()
+
+    def _client(self, provider: str):
+        # Batch ids only resolve under the key that created them, so jobs stay on the pool's first key
+        key = key_pools.get(provider).primary()
+        api_key = key.key if key else None
+        if provider == "openai":
+            return OpenAIBatchClient(api_key, self.settings["openai_base_url"],
+                                     self.settings["completion_window"])
+        if provider == "anthropic":
+            return AnthropicBatchClient(api_key, self.settings["anthropic_base_url"])
+        return None
+
+    async def create_job(self, user_id: str, tier: str, task: str, items: List[Dict[str, Any]],
+                         preferred_provider: Optional[str] = None) -> Dict[str, Any]:
+        """Validate and persist a job, then start it in the background"""
+        tier = (tier or "free").lower()
+        limit = self.settings["max_items"].get(tier, self.settings["max_items"]["free"])
+        if len(items) > limit:
+            raise BatchLimitExceeded(f"Batch of {len(items)} items exceeds the {limit} item limit for this tier")
+
+        schema = _REQUEST_SCHEMAS[task]
+        requests = [enforce_input_budget(task, tier, schema(**item)) for item in items]
+        provider_type, provider = router.select_with_type(task, tier, preferred_provider)
+        progress = await asyncio.to_thread(self._insert_job, user_id, tier, task, provider_type.value,
+                                           getattr(provider, "model_name", "unknown"), requests)
+        self._start(progress["job_id"])
+        return progress
+
+    def _insert_job(self, user_id: str, tier: str, task: str, provider: str, model: str,
+                    requests: List[Any]) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = BatchJob(
+                user_id=user_id, task=task, tier=tier, provider=provider, model=model, status="pending",
+                total_items=len(requests), completed_items=0, failed_items=0,
+                tokens_in=0, tokens_out=0, cost_usd=0.0
+            )
+            db.add(job)
+            db.flush()
+            db.bulk_save_objects([
+                BatchItem(job_id=job.id, index=i, request_json=request.model_dump_json(), status="pending")
+                for i, request in enumerate(requests)
+            ])
+            db.commit()
+            return job_progress(job)
+        finally:
+            db.close()
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_job, job_id)
+
+    def _get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.query(BatchJob).filter(BatchJob.id == job_id).first()
+            return dict(job_progress(job), user_id=job.user_id) if job else None
+        finally:
+            db.close()
+
+    async def list_jobs(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._list_jobs, user_id, limit)
+
+    def _list_jobs(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            jobs = (db.query(BatchJob).filter(BatchJob.user_id == user_id)
+                    .order_by(BatchJob.created_at.desc()).limit(limit).all())
+            return [job_progress(job) for job in jobs]
+        finally:
+            db.close()
+
+    def iter_results(self, job_id: str) -> Iterator[str]:
+        """Finished items as JSONL, read page by page so large jobs stream in constant memory
+        (a sync iterator, so StreamingResponse reads it in a worker thread)"""
+        last_index = -1
+        while True:
+            db = SessionLocal()
+            try:
+                page = (db.query(BatchItem)
+                        .filter(BatchItem.job_id == job_id, BatchItem.index > last_index, BatchItem.status != "pending")
+                        .order_by(BatchItem.index).limit(self.settings["results_page_size"]).all())
+                lines = [json.dumps({
+                    "index": item.index,
+                    "status": item.status,
+                    "output": json.loads(item.output_json) if item.output_json else None,
+                    "error": item.error,
+                    "tokens_in": item.tokens_in,
+                    "tokens_out": item.tokens_out,
+                    "cost_usd": item.cost_usd
+                }) + "\n" for item in page]
+            finally:
+                db.close()
+            if not page:
+                return
+            yield from lines
+            last_index = page[-1].index
+
+    async def cancel(self, job_id: str):
+        marked = await asyncio.to_thread(self._mark_cancelling, job_id)
+        if marked is None:
+            return
+        provider, external_id = marked
+
+        client = self._client(provider)
+        if client is not None and external_id:
+            # The provider returns whatever finished; the poll loop collects it
+            await client.cancel(external_id)
+        elif job_id not in self._tasks:
+            await asyncio.to_thread(self._finish, job_id)
+
+    def _mark_cancelling(self, job_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(provider, external batch id) of an active job after marking it cancelling, else None"""
+        db = SessionLocal()
+        try:
+            job = db.query(BatchJob).filter(BatchJob.id == job_id).first()
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return None
+            job.status = "cancelling"
+            db.commit()
+            return job.provider, job.external_id
+        finally:
+            db.close()
+
+    def resume(self):
+        """Restart jobs that were in progress when the process stopped"""
+        db = SessionLocal()
+        try:
+            job_ids = [job.id for job in db.query(BatchJob).filter(BatchJob.status.in_(ACTIVE_STATUSES)).all()]
+        except Exception as e:
+            print(f"Warning: could not resume batch jobs: {e}")
+            job_ids = []
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self._start(job_id)
+        if job_ids:
+            print(f"🔁 Resumed {len(job_ids)} batch job(s)")
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def _start(self, job_id: str):
+        if job_id in self._tasks:
+            return
+        task = asyncio.get_event_loop().create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        provider, task, tier = await asyncio.to_thread(_job_fields, job_id, "provider", "task", "tier")
+
+        try:
+            if self._client(provider) is not None:
+                await self._run_provider_batch(job_id, provider, task, tier)
+            else:
+                await self._run_concurrent(job_id, provider, task, tier)
+            await asyncio.to_thread(self._finish, job_id)
+        except asyncio.CancelledError:
+            # Shutdown: the job stays active and is resumed on the next start
+            raise
+        except Exception as e:
+            print(f"❌ Batch job {job_id} failed: {e}")
+            await asyncio.to_thread(self._finish, job_id, str(e))
+
+    def _pending_requests(self, job_id: str, task: str) -> List[tuple]:
+        db = SessionLocal()
+        try:
+            items = (db.query(BatchItem).filter(BatchItem.job_id == job_id, BatchItem.status == "pending")
+                     .order_by(BatchItem.index).all())
+            schema = _REQUEST_SCHEMAS[task]
+            return [(item.index, schema(**json.loads(item.request_json))) for item in items]
+        finally:
+            db.close()
+
+    def _set_job(self, job_id: str, status: str, **fields):
+        """Update the job, moving it to `status` unless it is being cancelled"""
+        db = SessionLocal()
+        try:
+            job = db.query(BatchJob).filter(BatchJob.id == job_id).one()
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if job.status != "cancelling":
+                job.status = status
+            db.commit()
+        finally:
+            db.close()
+
+    async def _run_provider_batch(self, job_id: str, provider_name: str, task: str, tier: str):
+        client = self._client(provider_name)
+        provider = router._create_provider(ProviderType(provider_name), task, tier)
+
+        external_id, status = await asyncio.to_thread(_job_fields, job_id, "external_id", "status")
+
+        if external_id is None:
+            if status == "cancelling":
+                return
+            pending = await asyncio.to_thread(self._pending_requests, job_id, task)
+            requests = [client.build_request(index, task, provider, request) for index, request in pending]
+            external_id = await client.submit(requests)
+            await asyncio.to_thread(self._set_job, job_id, "submitted", external_id=external_id)
+            print(f"📦 Submitted batch job {job_id} to {provider_name} as {external_id}")
+            if await asyncio.to_thread(_job_status, job_id) == "cancelling":
+                # Cancelled while the batch was being uploaded
+                await client.cancel(external_id)
+
+        while True:
+            status = await client.status(external_id)
+            if status.state == "failed":
+                raise Exception(status.error)
+            if status.state == "ended":
+                break
+            await asyncio.to_thread(self._set_job, job_id, "running")
+            await asyncio.sleep(self.settings["poll_interval_seconds"])
+
+        requests = dict(await asyncio.to_thread(self._pending_requests, job_id, task))
+        batch: List[BatchItemResult] = []
+        async for result in client.results(external_id):
+            if result.index in requests:
+                batch.append(result)
+            if len(batch) >= self.settings["results_page_size"]:
+                await asyncio.to_thread(self._store_results, job_id, task, provider, requests, batch)
+                batch = []
+        await asyncio.to_thread(self._store_results, job_id, task, provider, requests, batch)
+
+    async def _run_concurrent(self, job_id: str, provider_name: str, task: str, tier: str):
+        await asyncio.to_thread(self._set_job, job_id, "running")
+        semaphore = asyncio.Semaphore(self.settings["concurrency"])
+        # The cancel flag, re-read from the database at most every cancel_check_seconds
+        cancel_check = {"at": 0.0, "cancelling": False}
+
+        async def cancelling() -> bool:
+            now = time.monotonic()
+            if now - cancel_check["at"] >= self.settings["cancel_check_seconds"]:
+                cancel_check["at"] = now
+                cancel_check["cancelling"] = await asyncio.to_thread(_job_status, job_id) == "cancelling"
+            return cancel_check["cancelling"]
+
+        async def run_one(index: int, request):
+            async with semaphore:
+                if await cancelling():
+                    return
+                try:
+                    result = await router.agenerate(task, tier, request, preferred_provider=provider_name)
+                except Exception as e:
+                    await asyncio.to_thread(self._store_item, job_id, task, index, error=str(e))
+                    return
+                await asyncio.to_thread(self._store_item, job_id, task, index, output=result.output,
+                                        tokens_in=result.tokens_in, tokens_out=result.tokens_out,
+                                        cost_usd=result.cost_usd)
+
+        pending = await asyncio.to_thread(self._pending_requests, job_id, task)
+        await asyncio.gather(*(run_one(index, request) for index, request in pending))
+
+    def _store_results(self, job_id: str, task: str, provider, requests: Dict[int, Any],
+                       results: List[BatchItemResult]):
+        """Write one page of provider batch results in a single transaction"""
+        if not results:
+            return
+        with self._write_lock:
+            db = SessionLocal()
+            try:
+                job = db.query(BatchJob).filter(BatchJob.id == job_id).one()
+                items = {item.index: item for item in db.query(BatchItem).filter(
+                    BatchItem.job_id == job_id, BatchItem.index.in_([r.index for r in results])
+                )}
+                for result in results:
+                    item = items.get(result.index)
+                    if item is None or item.status != "pending":
+                        continue
+                    if result.error is not None:
+                        _apply_failure(job, item, task, result.error)
+                        continue
+                    cost = usage_cost(job.model, result.usage, batch=True) if result.usage else 0.0
+                    try:
+                        output = provider.parse_output(result.text, requests[result.index])
+                    except Exception as e:
+                        _apply_failure(job, item, task, f"Could not parse output: {e}")
+                        continue
+                    _apply_success(job, item, task, output, result.usage.tokens_in if result.usage else 0,
+                                   result.usage.tokens_out if result.usage else 0, cost)
+                db.commit()
+            finally:
+                db.close()
+
+    def _store_item(self, job_id: str, task: str, index: int, output=None, error: str = None,
+                    tokens_in: int = 0, tokens_out: int = 0, cost_usd: float = 0.0):
+        with self._write_lock:
+            db = SessionLocal()
+            try:
+                job = db.query(BatchJob).filter(BatchJob.id == job_id).one()
+                item = db.query(BatchItem).filter(BatchItem.job_id == job_id, BatchItem.index == index).one()
+                if error is not None:
+                    _apply_failure(job, item, task, error)
+                else:
+                    _apply_success(job, item, task, output, tokens_in, tokens_out, cost_usd)
+                db.commit()
+            finally:
+                db.close()
+
+    def _finish(self, job_id: str, error: str = None):
+        """Fail items the provider never returned, set the final status and log the job's usage"""
+        with self._write_lock:
+            db = SessionLocal()
+            try:
+                job = db.query(BatchJob).filter(BatchJob.id == job_id).one()
+                cancelled = job.status == "cancelling"
+                leftover = db.query(BatchItem).filter(BatchItem.job_id == job_id, BatchItem.status == "pending").all()
+                for item in leftover:
+                    _apply_failure(job, item, job.task, error or ("Cancelled" if cancelled else "No result returned by provider"))
+                job.status = "failed" if error else "cancelled" if cancelled else "completed"
+                job.error = error
+                job.completed_at = datetime.utcnow()
+                if job.completed_items:
+                    db.add(Usage(
+                        user_id=job.user_id, feature=f"batch_{job.task}", provider=job.provider, model=job.model,
+                        tokens_in=job.tokens_in, tokens_out=job.tokens_out, latency_ms=0, cost_usd=job.cost_usd
+                    ))
+                db.commit()
+                print(f"✅ Batch job {job_id} {job.status}: {job.completed_items} succeeded, {job.failed_items} failed")
+            finally:
+                db.close()
+
+def _apply_success(job: BatchJob, item: BatchItem, task: str, output, tokens_in: int, tokens_out: int, cost_usd: float):
+    item.status = "succeeded"
+    item.output_json = output.model_dump_json()
+    item.tokens_in, item.tokens_out, item.cost_usd = tokens_in, tokens_out, cost_usd
+    item.completed_at = datetime.utcnow()
+    job.completed_items = (job.completed_items or 0) + 1
+    job.tokens_in = (job.tokens_in or 0) + tokens_in
+    job.tokens_out = (job.tokens_out or 0) + tokens_out
+    job.cost_usd = (job.cost_usd or 0.0) + cost_usd
+    _record(task, job.provider, "succeeded")
+
+def _apply_failure(job: BatchJob, item: BatchItem, task: str, error: str):
+    item.status = "failed"
+    item.error = error
+    item.completed_at = datetime.utcnow()
+    job.failed_items = (job.failed_items or 0) + 1
+    _record(task, job.provider, "failed")
+
+def _record(task: str, provider: str, status: str):
+    try:
+        record_batch_item(task, provider, status)
+    except Exception as e:
+        print(f"Failed to record batch metric: {e}")
+
+def _job_status(job_id: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        job = db.query(BatchJob).filter(BatchJob.id == job_id).first()
+        return job.status if job else None
+    finally:
+        db.close()
+
+def _job_fields(job_id: str, *names: str) -> tuple:
+    db = SessionLocal()
+    try:
+        job = db.query(BatchJob).filter(BatchJob.id == job_id).one()
+        return tuple(getattr(job, name) for name in names)
+    finally:
+        db.close()
+
+# Global instance
+batch_manager = BatchManager()
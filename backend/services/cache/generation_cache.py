@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, Optional, Tuple
+import redis
+import redis.asyncio as aioredis
+from schemas.idea import IdeaResponse
+from schemas.story import StoryResponse
+from services.providers.base import GenerationResult
+from metrics.prom import record_cache_hit, record_cache_miss
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Exact-match response cache settings. Caching is opt-in per tier because a
+# hit returns the same generated text for the same request.
+CACHE_SETTINGS = {
+    "enabled_tiers": [t.strip() for t in os.getenv("GENERATION_CACHE_TIERS", "").split(",") if t.strip()],
+    "ttl_seconds": int(os.getenv("GENERATION_CACHE_TTL_SECONDS", "3600")),
+    "l1_max_entries": int(os.getenv("GENERATION_CACHE_L1_MAX_ENTRIES", "1024")),
+    "redis_enabled": os.getenv("GENERATION_CACHE_REDIS", "true").lower() == "true",
+    "key_prefix": "gen_cache:v1:"
+}
+
+_OUTPUT_TYPES = {"idea": IdeaResponse, "story": StoryResponse}
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def cache_key(task: str, tier: str, model: str, request, sampling: Dict[str, Any]) -> str:
+    """Hash of the normalized request fields plus task, tier, model and sampling params"""
+    fields = request.model_dump() if hasattr(request, "model_dump") else dict(request)
+    payload = json.dumps({
+        "task": task,
+        "tier": tier,
+        "model": model,
+        "sampling": sampling,
+        "request": _normalize(fields)
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def serialize_result(task: str, result: GenerationResult) -> str:
+    """JSON form of a GenerationResult, shared with the single-flight layer"""
+    output = result.output.model_dump() if hasattr(result.output, "model_dump") else result.output
+    return json.dumps({
+        "task": task,
+        "output": output,
+        "provider": result.provider,
+        "model": result.model,
+        "tokens_in": result.tokens_in,
+        "tokens_out": result.tokens_out,
+        "latency_ms": result.latency_ms,
+        "cost_usd": result.cost_usd
+    })
+
+def deserialize_result(raw: str) -> GenerationResult:
+    data = json.loads(raw)
+    output_type = _OUTPUT_TYPES[data["task"]]
+    return GenerationResult(
+        output=output_type(**data["output"]),
+        provider=data["provider"],
+        model=data["model"],
+        tokens_in=data.get("tokens_in", 0),
+        tokens_out=data.get("tokens_out", 0),
+        latency_ms=data.get("latency_ms", 0),
+        cost_usd=data.get("cost_usd", 0.0)
+    )
+
+class LRUCache:
+    """Size-bounded in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: int):
+        with self._lock:
+            self._data[key] = (time.time() + ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class GenerationCache:
+    """Two-tier exact-match cache: in-process LRU (L1) in front of shared Redis (L2)"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or CACHE_SETTINGS
+        self.l1 = LRUCache(self.settings["l1_max_entries"])
+        self._redis = aioredis.from_url(REDIS_URL, decode_responses=True) if self.settings["redis_enabled"] else None
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+
+    def enabled_for(self, tier: str) -> bool:
+        return (tier or "free").lower() in self.settings["enabled_tiers"]
+
+    async def get(self, key: str, task: str, tier: str) -> Optional[GenerationResult]:
+        start = time.time()
+        raw = self.l1.get(key)
+        layer = "l1"
+        if raw is None and self._redis is not None:
+            try:
+                raw = await self._redis.get(self.settings["key_prefix"] + key)
+                layer = "l2"
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for generation cache: {e}")
+            if raw is not None:
+                # Promote to L1 so the next hit on this worker skips the network
+                self.l1.set(key, raw, self.settings["ttl_seconds"])
+
+        if raw is None:
+            self.stats["misses"] += 1
+            self._record(record_cache_miss, task, tier, "exact")
+            return None
+
+        self.stats[f"{layer}_hits"] += 1
+        self._record(record_cache_hit, task, tier, layer)
+        # A cache hit makes no upstream call, so it costs no tokens or money
+        return replace(
+            deserialize_result(raw),
+            tokens_in=0,
+            tokens_out=0,
+            latency_ms=int((time.time() - start) * 1000),
+            cost_usd=0.0,
+            cached=True
+        )
+
+    async def set(self, key: str, task: str, result: GenerationResult):
+        raw = serialize_result(task, result)
+        ttl = self.settings["ttl_seconds"]
+        self.l1.set(key, raw, ttl)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.settings["key_prefix"] + key, raw, ex=ttl)
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for generation cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled_tiers": self.settings["enabled_tiers"],
+            "l1_entries": len(self.l1),
+            **self.stats
+        }
+
+    @staticmethod
+    def _record(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Failed to record cache metric: {e}")
+
+# Global instance
+generation_cache = GenerationCache()
@@ -0,0 +1,373 @@
+"""
+Semantic similarity cache for idea generation
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from schemas.idea import IdeaResponse
+from services.providers.base import GenerationResult
+from metrics.prom import record_cache_hit, record_cache_miss
+
+def _thresholds_from_env() -> Dict[str, float]:
+    raw = os.getenv("SEMANTIC_CACHE_THRESHOLDS", "")
+    return {k.lower(): float(v) for k, v in json.loads(raw).items()} if raw else {}
+
+# Paraphrase cache settings. Thresholds are cosine similarities; per-genre and
+# per-tone overrides use keys like "genre:horror" or "tone:humorous" and the
+# strictest matching threshold wins.
+SEMANTIC_CACHE_SETTINGS = {
+    "enabled": os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true",
+    "enabled_tiers": [t.strip() for t in os.getenv("SEMANTIC_CACHE_TIERS", "free").split(",") if t.strip()],
+    "dim": int(os.getenv("SEMANTIC_CACHE_DIM", "256")),
+    "max_entries": int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000")),
+    "ttl_seconds": int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    "default_threshold": float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.75")),
+    "thresholds": _thresholds_from_env(),
+    # Pick uniformly among the best `sample_top_k` matches above the threshold
+    "sample_top_k": int(os.getenv("SEMANTIC_CACHE_SAMPLE_TOP_K", "1")),
+    "path": os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.npz"),
+    "persist_every": int(os.getenv("SEMANTIC_CACHE_PERSIST_EVERY", "100"))
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the to was "
+    "were with about into story who whose which".split()
+)
+_SUFFIXES = ("ing", "ed", "ous", "es", "s", "y", "al", "ly")
+
+def _stem(word: str) -> str:
+    """Strip one common suffix so "learning"/"learns" and "mystery"/"mysterious" meet"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+class HashingVectorizer:
+    """CPU-only text embedding via the hashing trick.
+
+    Stemmed words and their character 4-grams are hashed (crc32, so vectors are stable
+    across processes and restarts) into a fixed number of signed buckets with
+    sublinear term weighting, then L2-normalised so a dot product is a cosine
+    similarity. Character n-grams let morphological variants such as
+    "mysterious" and "mystery" overlap.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def features(self, text: str) -> Dict[str, float]:
+        counts: Dict[str, float] = {}
+        for word in _TOKEN_RE.findall(text.casefold()):
+            if word in _STOPWORDS:
+                continue
+            word = _stem(word)
+            counts["w:" + word] = counts.get("w:" + word, 0.0) + 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 3):
+                gram = "c:" + padded[i:i + 4]
+                counts[gram] = counts.get(gram, 0.0) + 0.5
+        return counts
+
+    def transform(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self.features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            vector[h % self.dim] += sign * (1.0 + np.log(count))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+class _Partition:
+    """Rows of one genre/tone bucket in preallocated arrays that grow by doubling"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.payloads: List[str] = []
+        self.size = 0
+        # Bumped whenever rows move, so a lookup scoring outside the lock can tell
+        self.version = 0
+
+    def append(self, vector: np.ndarray, created_at: float, last_used: float, payload: str, limit: int):
+        if self.size == len(self.vectors):
+            capacity = min(max(1, self.size * 2), limit)
+            for name in ("vectors", "created_at", "last_used"):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        row = self.size
+        self.vectors[row] = vector
+        self.created_at[row] = created_at
+        self.last_used[row] = last_used
+        self.payloads.append(payload)
+        self.size += 1
+
+    def remove(self, row: int):
+        """Drop a row by moving the last row into its place"""
+        last = self.size - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.created_at[row] = self.created_at[last]
+            self.last_used[row] = self.last_used[last]
+            self.payloads[row] = self.payloads[last]
+        self.payloads.pop()
+        self.size -= 1
+        self.version += 1
+
+    def memory_bytes(self) -> int:
+        return self.vectors.nbytes + self.created_at.nbytes + self.last_used.nbytes
+
+class SemanticIndex:
+    """Bounded nearest-neighbour index over unit vectors, partitioned by bucket.
+
+    Each genre/tone bucket keeps its vectors in a contiguous float32 matrix, so
+    a lookup is one matrix-vector product over that bucket only (brute force,
+    exact). The total number of entries is capped at `max_entries`; inserting
+    into a full index evicts the least recently used entry across all buckets,
+    and entries older than the TTL are never served.
+    """
+
+    def __init__(self, dim: int, max_entries: int, ttl_seconds: int):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.partitions: Dict[str, _Partition] = {}
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, vector: np.ndarray, bucket: str, threshold: float,
+               top_k: int = 1, rng: random.Random = None) -> Optional[str]:
+        """Payload of a live entry in `bucket` scoring >= threshold, chosen among the best `top_k`.
+
+        The scan runs outside the lock on a view of the bucket's rows, so inserts
+        are not held up by it. Appends only write past the view and growth swaps
+        in new arrays, so the view stays valid unless an eviction moves rows
+        meanwhile; the lookup then misses rather than return a mismatched payload.
+        """
+        with self._lock:
+            partition = self.partitions.get(bucket)
+            if partition is None or partition.size == 0:
+                return None
+            n, version = partition.size, partition.version
+            vectors, created_at = partition.vectors[:n], partition.created_at[:n]
+        scores = vectors @ vector
+        hits = np.flatnonzero(scores >= threshold)
+        if hits.size == 0:
+            return None
+        hits = hits[created_at[hits] >= time.time() - self.ttl_seconds]
+        if hits.size == 0:
+            return None
+        best = hits[np.argsort(-scores[hits])[:top_k]]
+        row = int(rng.choice(best)) if rng is not None and best.size > 1 else int(best[0])
+        with self._lock:
+            if partition.version != version:
+                return None
+            partition.last_used[row] = time.time()
+            return partition.payloads[row]
+
+    def add(self, vector: np.ndarray, bucket: str, payload: str):
+        now = time.time()
+        self._insert(bucket, vector, now, now, payload)
+
+    def _insert(self, bucket: str, vector: np.ndarray, created_at: float, last_used: float, payload: str):
+        with self._lock:
+            if self.size >= self.max_entries:
+                self._evict_lru()
+            partition = self.partitions.get(bucket)
+            if partition is None:
+                partition = _Partition(self.dim, min(1024, self.max_entries))
+                self.partitions[bucket] = partition
+            partition.append(vector, created_at, last_used, payload, self.max_entries)
+            self.size += 1
+
+    def _evict_lru(self):
+        # Expired entries have the oldest timestamps once the TTL passes, so
+        # they are reclaimed first
+        victim, victim_row, oldest = None, -1, float("inf")
+        for partition in self.partitions.values():
+            if partition.size == 0:
+                continue
+            row = int(np.argmin(partition.last_used[:partition.size]))
+            if partition.last_used[row] < oldest:
+                victim, victim_row, oldest = partition, row, partition.last_used[row]
+        if victim is not None:
+            victim.remove(victim_row)
+            self.size -= 1
+
+    def save(self, path: str):
+        """Write the index atomically so a crash mid-save keeps the previous file"""
+        with self._lock:
+            buckets = [b for b, p in self.partitions.items() if p.size]
+            parts = [self.partitions[b] for b in buckets]
+            arrays = {
+                "vectors": np.concatenate([p.vectors[:p.size] for p in parts]) if parts
+                           else np.zeros((0, self.dim), dtype=np.float32),
+                "bucket_index": np.concatenate([np.full(p.size, i, dtype=np.int32) for i, p in enumerate(parts)])
+                                if parts else np.zeros(0, dtype=np.int32),
+                "created_at": np.concatenate([p.created_at[:p.size] for p in parts]) if parts else np.zeros(0),
+                "last_used": np.concatenate([p.last_used[:p.size] for p in parts]) if parts else np.zeros(0),
+                "payloads": np.array(json.dumps([payload for p in parts for payload in p.payloads])),
+                "buckets": np.array(json.dumps(buckets))
+            }
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Index at {path} has dim {vectors.shape[1]}, expected {self.dim}")
+            bucket_index = data["bucket_index"]
+            created_at = data["created_at"]
+            last_used = data["last_used"]
+            payloads = json.loads(str(data["payloads"]))
+            buckets = json.loads(str(data["buckets"]))
+        # Keep the most recently used entries if the capacity shrank
+        for row in np.argsort(-last_used)[:self.max_entries][::-1]:
+            self._insert(buckets[bucket_index[row]], vectors[row], created_at[row], last_used[row], payloads[row])
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(p.memory_bytes() for p in self.partitions.values())
+
+class SemanticCache:
+    """Serves cached ideas for prompts that paraphrase an earlier prompt.
+
+    Entries are bucketed by normalised genre and tone, so a paraphrased prompt
+    only matches ideas generated for the same genre/tone combination.
+    """
+
+    def __init__(self, settings: Dict[str, Any] = None, rng: random.Random = None):
+        self.settings = settings or SEMANTIC_CACHE_SETTINGS
+        self.vectorizer = HashingVectorizer(self.settings["dim"])
+        # Allocated on first use so a disabled cache costs no memory
+        self.index: Optional[SemanticIndex] = None
+        self.rng = rng or random.Random()
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0}
+        self._inserts_since_save = 0
+        self._init_lock = threading.Lock()
+
+    def enabled_for(self, tier: str) -> bool:
+        return self.settings["enabled"] and (tier or "free").lower() in self.settings["enabled_tiers"]
+
+    @staticmethod
+    def bucket(genre: Optional[str], tone: Optional[str]) -> str:
+        normalize = lambda value: " ".join((value or "").split()).casefold()
+        return f"{normalize(genre)}|{normalize(tone)}"
+
+    def threshold(self, genre: Optional[str], tone: Optional[str]) -> float:
+        thresholds = self.settings["thresholds"]
+        candidates = [self.settings["default_threshold"]]
+        for key in (f"genre:{(genre or '').strip().lower()}", f"tone:{(tone or '').strip().lower()}"):
+            if key in thresholds:
+                candidates.append(thresholds[key])
+        return max(candidates)
+
+    def _ensure_loaded(self) -> SemanticIndex:
+        with self._init_lock:
+            if self.index is not None:
+                return self.index
+            index = SemanticIndex(self.settings["dim"], self.settings["max_entries"],
+                                  self.settings["ttl_seconds"])
+            path = self.settings["path"]
+            if path and os.path.exists(path):
+                try:
+                    index.load(path)
+                    print(f"✅ Loaded {index.size} semantic cache entries from {path}")
+                except Exception as e:
+                    print(f"Warning: could not load semantic cache from {path}: {e}")
+            self.index = index
+            return index
+
+    def _lookup(self, prompt: str, genre: Optional[str], tone: Optional[str]) -> Optional[str]:
+        index = self._ensure_loaded()
+        vector = self.vectorizer.transform(prompt)
+        return index.lookup(vector, self.bucket(genre, tone), self.threshold(genre, tone),
+                            top_k=max(1, self.settings["sample_top_k"]), rng=self.rng)
+
+    async def lookup(self, prompt: str, genre: Optional[str], tone: Optional[str],
+                     tier: str) -> Optional[GenerationResult]:
+        """A cached idea for a similar prompt, or None"""
+        start = time.time()
+        # NumPy releases the GIL during the scan, so large indexes do not block the loop
+        raw = await asyncio.to_thread(self._lookup, prompt, genre, tone)
+        if raw is None:
+            self.stats["misses"] += 1
+            self._record(record_cache_miss, "idea", tier, "semantic")
+            return None
+
+        self.stats["hits"] += 1
+        self._record(record_cache_hit, "idea", tier, "semantic")
+        data = json.loads(raw)
+        return GenerationResult(
+            output=IdeaResponse(**data["output"]),
+            provider=data["provider"],
+            model=data["model"],
+            tokens_in=0,
+            tokens_out=0,
+            latency_ms=int((time.time() - start) * 1000),
+            cost_usd=0.0,
+            cached=True
+        )
+
+    async def add(self, prompt: str, genre: Optional[str], tone: Optional[str], result: GenerationResult):
+        """Remember a freshly generated idea for its prompt"""
+        payload = json.dumps({
+            "output": result.output.model_dump(),
+            "provider": result.provider,
+            "model": result.model
+        })
+        await asyncio.to_thread(self._add, prompt, genre, tone, payload)
+
+    def _add(self, prompt: str, genre: Optional[str], tone: Optional[str], payload: str):
+        self._ensure_loaded().add(self.vectorizer.transform(prompt), self.bucket(genre, tone), payload)
+        self.stats["inserts"] += 1
+        self._inserts_since_save += 1
+        if self.settings["persist_every"] and self._inserts_since_save >= self.settings["persist_every"]:
+            self._save()
+
+    def _save(self):
+        if not self.settings["path"] or self.index is None or self.index.size == 0:
+            return
+        try:
+            self.index.save(self.settings["path"])
+            self._inserts_since_save = 0
+        except Exception as e:
+            print(f"Warning: could not persist semantic cache: {e}")
+
+    async def persist(self):
+        """Flush the index to disk (called on shutdown)"""
+        if self.index is not None:
+            await asyncio.to_thread(self._save)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.settings["enabled"],
+            "entries": self.index.size if self.index else 0,
+            "max_entries": self.settings["max_entries"],
+            "memory_bytes": self.index.memory_bytes() if self.index else 0,
+            **self.stats
+        }
+
+    @staticmethod
+    def _record(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Failed to record cache metric: {e}")
+
+# Global instance
+semantic_cache = SemanticCache()
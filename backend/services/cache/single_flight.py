@@ -0,0 +1,184 @@
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import replace
+from typing import Any, Awaitable, Callable, Dict, Optional
+import redis
+import redis.asyncio as aioredis
+from services.providers.base import GenerationResult
+from services.providers.deadline import Deadline, DeadlineExceeded, within
+from services.cache.generation_cache import serialize_result, deserialize_result
+from metrics.prom import record_coalesced
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Single-flight settings. Identical generations that are in flight at the same
+# time share one upstream call; with `redis_enabled` this also spans workers.
+SINGLE_FLIGHT_SETTINGS = {
+    "enabled_tiers": [t.strip() for t in os.getenv("SINGLE_FLIGHT_TIERS", "free,pro,admin").split(",") if t.strip()],
+    "redis_enabled": os.getenv("SINGLE_FLIGHT_REDIS", "false").lower() == "true",
+    # How long a cross-worker leader may hold the lock before followers give up and call upstream themselves
+    "lock_ttl_ms": int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_MS", "60000")),
+    "result_ttl_ms": int(os.getenv("SINGLE_FLIGHT_RESULT_TTL_MS", "5000")),
+    "key_prefix": "single_flight:v1:"
+}
+
+# Failed leaders publish this so remote followers stop waiting and call upstream themselves
+_FAILED = "__failed__"
+
+# Delete the lock only if this worker still owns it
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def as_follower(result: GenerationResult, start: float) -> GenerationResult:
+    """The result as seen by a coalesced caller.
+
+    Tokens and cost stay with the caller whose request made the upstream call,
+    so per-user usage rows add up to exactly what the provider billed.
+    """
+    return replace(
+        result,
+        tokens_in=0,
+        tokens_out=0,
+        cost_usd=0.0,
+        latency_ms=int((time.time() - start) * 1000),
+        coalesced=True
+    )
+
+class SingleFlight:
+    """Coalesces concurrent identical generations into one upstream call.
+
+    The first caller for a key becomes the leader and runs the call in its own
+    task; callers arriving while it is in flight await that task instead, so a
+    cancelled leader request does not fail its followers. Errors propagate to
+    every caller. Each caller waits for no longer than its own deadline, and a
+    follower whose leader ran out of a shorter deadline makes the call itself. With Redis enabled, leaders also take a short-lived lock per
+    key and publish their result so followers on other workers can reuse it.
+    """
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or SINGLE_FLIGHT_SETTINGS
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._redis = aioredis.from_url(REDIS_URL, decode_responses=True) if self.settings["redis_enabled"] else None
+        self.stats = {"leaders": 0, "coalesced_local": 0, "coalesced_redis": 0}
+
+    def enabled_for(self, tier: str) -> bool:
+        return (tier or "free").lower() in self.settings["enabled_tiers"]
+
+    async def do(self, key: str, task: str, fn: Callable[[], Awaitable[GenerationResult]],
+                 deadline: Optional[Deadline] = None) -> GenerationResult:
+        flight = self._inflight.get(key)
+        if flight is not None:
+            start = time.time()
+            try:
+                result = await within(deadline, asyncio.shield(flight), task, "single_flight")
+            except DeadlineExceeded:
+                if deadline is not None and deadline.expired():
+                    raise
+                # The leader's deadline ran out first; this caller still has time of its own
+                return await self.do(key, task, fn, deadline)
+            self._coalesced(task, "local")
+            return result if result.coalesced else as_follower(result, start)
+
+        flight = asyncio.ensure_future(self._lead(key, task, fn))
+        self._inflight[key] = flight
+        flight.add_done_callback(lambda _: self._release(key, flight))
+        return await within(deadline, asyncio.shield(flight), task, "single_flight")
+
+    def _release(self, key: str, flight: asyncio.Future):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Every caller may have stopped waiting (e.g. on its deadline); mark the
+        # error retrieved so it is not logged as never retrieved
+        if not flight.cancelled():
+            flight.exception()
+
+    async def _lead(self, key: str, task: str, fn: Callable[[], Awaitable[GenerationResult]]) -> GenerationResult:
+        if self._redis is None:
+            self.stats["leaders"] += 1
+            return await fn()
+
+        prefix = self.settings["key_prefix"]
+        lock_key, result_key, channel = f"{prefix}lock:{key}", f"{prefix}result:{key}", f"{prefix}done:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self._redis.set(lock_key, token, nx=True, px=self.settings["lock_ttl_ms"])
+        except redis.RedisError as e:
+            print(f"Warning: Redis unavailable for single-flight: {e}")
+            self.stats["leaders"] += 1
+            return await fn()
+
+        if not acquired:
+            start = time.time()
+            raw = await self._await_remote(result_key, channel)
+            if raw is not None and raw != _FAILED:
+                self._coalesced(task, "redis")
+                return as_follower(deserialize_result(raw), start)
+            # The remote leader failed or timed out; make the call ourselves
+
+        self.stats["leaders"] += 1
+        published = _FAILED
+        try:
+            result = await fn()
+            published = serialize_result(task, result)
+            return result
+        finally:
+            if acquired:
+                await self._publish(lock_key, result_key, channel, token, published)
+
+    async def _await_remote(self, result_key: str, channel: str) -> Optional[str]:
+        """Wait for another worker's leader to publish, up to the lock TTL"""
+        pubsub = self._redis.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            # The leader may have finished between our lock attempt and subscribing
+            raw = await self._redis.get(result_key)
+            if raw is not None:
+                return raw
+            deadline = time.time() + self.settings["lock_ttl_ms"] / 1000.0
+            while time.time() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                   timeout=max(0.0, deadline - time.time()))
+                if message is not None and message.get("type") == "message":
+                    return message["data"]
+            return None
+        except redis.RedisError as e:
+            print(f"Warning: Redis unavailable for single-flight: {e}")
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe(channel)
+                await pubsub.close()
+            except redis.RedisError:
+                pass
+
+    async def _publish(self, lock_key: str, result_key: str, channel: str, token: str, raw: str):
+        try:
+            if raw != _FAILED:
+                await self._redis.set(result_key, raw, px=self.settings["result_ttl_ms"])
+            await self._redis.publish(channel, raw)
+            await self._redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+        except redis.RedisError as e:
+            print(f"Warning: Redis unavailable for single-flight: {e}")
+
+    def _coalesced(self, task: str, scope: str):
+        self.stats[f"coalesced_{scope}"] += 1
+        try:
+            record_coalesced(task, scope)
+        except Exception as e:
+            print(f"Failed to record single-flight metric: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "redis_enabled": self._redis is not None,
+            **self.stats
+        }
+
+# Global instance
+single_flight = SingleFlight()
@@ -1,8 +1,13 @@
 from schemas.workflow import FullStoryRequest, FullStoryResponse
-from schemas.idea import IdeaRequest
+from schemas.idea import IdeaRequest, IdeaResponse
 from schemas.story import StoryRequest
-from services.idea_generator import generate_idea
-from services.story_writer import generate_story
+from services.idea_generator import generate_idea, generate_idea_streaming
+from services.story_writer import generate_story, agenerate_story
+from services.providers.structured import STORY_FIELDS
+from services.providers.deadline import Deadline, DeadlineExceeded
+from typing import Optional
+from contextlib import suppress
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -50,6 +55,67 @@ def generate_full_story(request: FullStoryRequest) -> FullStoryResponse:
         logger.error(f"Error in full story workflow: {str(e)}")
         raise Exception(f"Error in full story generation workflow: {str(e)}")
 
+async def agenerate_full_story(request: FullStoryRequest, tier: str = "free",
+                               deadline: Optional[Deadline] = None) -> FullStoryResponse:
+    """
+    Async variant of generate_full_story that streams the idea and starts the
+    Story Writer as soon as the fields it needs (title, genre, outline) are
+    complete, while the rest of the idea is still being generated.
+    """
+    story_task = None
+    try:
+        logger.info(f"Starting full story workflow for prompt: '{request.prompt[:50]}...'")
+        idea_request = IdeaRequest(
+            prompt=request.prompt,
+            genre=request.genre,
+            tone=request.tone
+        )
+        
+        fields = {}
+        idea_response = None
+        async for event in generate_idea_streaming(idea_request, tier=tier, deadline=deadline):
+            if event.get('type') == 'error':
+                if event.get('error_type') == 'deadline_exceeded':
+                    raise DeadlineExceeded("stream", deadline.budget_ms)
+                raise Exception(event.get('error'))
+            if event.get('type') == 'field':
+                fields[event['field']] = event['value']
+            elif event.get('type') == 'idea':
+                idea_response = IdeaResponse(**event['idea'])
+            
+            if story_task is None and all(fields.get(name) for name in STORY_FIELDS):
+                logger.info(f"Story idea outline ready: '{fields['title']}', starting story")
+                story_request = StoryRequest(**{name: fields[name] for name in STORY_FIELDS})
+                story_task = asyncio.create_task(agenerate_story(story_request, tier=tier, deadline=deadline))
+        
+        if idea_response is None:
+            raise Exception("Idea stream ended without an idea")
+        logger.info(f"✅ Story idea generated: '{idea_response.title}'")
+        
+        if story_task is None:
+            story_task = asyncio.create_task(agenerate_story(StoryRequest(
+                title=idea_response.title,
+                genre=idea_response.genre,
+                outline=idea_response.outline
+            ), tier=tier, deadline=deadline))
+        story_response = await story_task
+        logger.info("✅ Full story generated successfully")
+        
+        return FullStoryResponse(
+            idea=idea_response,
+            story=story_response.story
+        )
+        
+    except Exception as e:
+        if story_task is not None and not story_task.done():
+            story_task.cancel()
+            with suppress(BaseException):
+                await story_task
+        logger.error(f"Error in full story workflow: {str(e)}")
+        if isinstance(e, DeadlineExceeded):
+            raise
+        raise Exception(f"Error in full story generation workflow: {str(e)}")
+
 def generate_idea_only(request: FullStoryRequest) -> FullStoryResponse:
     """
     Generate only the story idea (for testing or when user wants just the idea).
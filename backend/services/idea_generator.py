@@ -1,25 +1,17 @@
-import os
-import google.generativeai as genai
 from schemas.idea import IdeaRequest, IdeaResponse
 import json
+from typing import AsyncGenerator, Dict, Any, Optional
 from services.providers.router import router
+from services.providers.deadline import Deadline, DeadlineExceeded
+from services.providers.quota import QuotaExhausted
+from services.providers.streaming import relay
+from metrics.prom import record_stream_ttft
 
 def generate_idea(request: IdeaRequest, tier: str = "free") -> IdeaResponse:
     """
     Generate a story idea from a simple prompt using Gemini AI.
     This is the first agent in the multi-agent system.
     """
-    # Configure Gemini (moved here to avoid import-time errors)
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError(
-            "GEMINI_API_KEY environment variable is not set. "
-            "Please create a .env file in the backend directory with: "
-            "GEMINI_API_KEY=your_actual_api_key_here"
-        )
-
-    genai.configure(api_key=api_key)
-    
     try:
         provider = router.select(task="idea", tier=tier)
         result = provider.generate(request)
@@ -29,6 +21,36 @@ def generate_idea(request: IdeaRequest, tier: str = "free") -> IdeaResponse:
         print(f"Error in generate_idea: {str(e)}")
         raise Exception(f"Error generating story idea: {str(e)}")
 
+async def agenerate_idea(request: IdeaRequest, tier: str = "free", deadline: Optional[Deadline] = None) -> IdeaResponse:
+    """Async variant of generate_idea that does not block the event loop."""
+    try:
+        result = await router.agenerate(task="idea", tier=tier, request=request, deadline=deadline)
+        return result.output
+            
+    except (DeadlineExceeded, QuotaExhausted):
+        raise
+    except Exception as e:
+        print(f"Error in agenerate_idea: {str(e)}")
+        raise Exception(f"Error generating story idea: {str(e)}")
+
+async def generate_idea_streaming(request: IdeaRequest, tier: str = "free",
+                                  deadline: Optional[Deadline] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """Stream an idea: a "field" event as each field (title, genre, outline, ...)
+    is complete, then the full "idea" and the usual metadata event."""
+    try:
+        async for chunk in relay(router.stream("idea", tier, request, deadline=deadline)):
+            if chunk.get('type') == 'metadata' and chunk.get('time_to_first_token_ms') is not None:
+                try:
+                    record_stream_ttft(chunk['provider'], chunk['model'], chunk['time_to_first_token_ms'])
+                except Exception as e:
+                    print(f"Failed to record stream TTFT metric: {e}")
+            yield chunk
+    except Exception as e:
+        yield {
+            'type': 'error',
+            'error': str(e)
+        }
+
 def _parse_text_response(text: str, request: IdeaRequest) -> IdeaResponse:
     """
     Fallback method to parse text response when JSON parsing fails.
@@ -1,5 +1,6 @@
 import time
 import redis
+import redis.asyncio as aioredis
 import os
 from fastapi import HTTPException
 from typing import Dict, Tuple
@@ -8,6 +9,8 @@ import json
 # Redis connection
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+# For async routes, so checking a limit never blocks the event loop
+aredis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
 
 class RatePolicy:
     def __init__(self, capacity: int, refill_per_sec: float):
@@ -19,6 +22,11 @@ FREE_POLICY = RatePolicy(capacity=2, refill_per_sec=2/60)   # ~2 per minute
 PRO_POLICY = RatePolicy(capacity=10, refill_per_sec=10/60)  # ~10 per minute
 ADMIN_POLICY = RatePolicy(capacity=100, refill_per_sec=100/60)  # ~100 per minute
 
+# Tier-based token policies: LLM tokens (estimated input plus max output) per user per route
+FREE_TOKEN_POLICY = RatePolicy(capacity=20000, refill_per_sec=20000/3600)       # ~20K per hour
+PRO_TOKEN_POLICY = RatePolicy(capacity=200000, refill_per_sec=200000/3600)      # ~200K per hour
+ADMIN_TOKEN_POLICY = RatePolicy(capacity=2000000, refill_per_sec=2000000/3600)  # ~2M per hour
+
 def _policy_for_tier(tier: str) -> RatePolicy:
     if tier == "admin":
         return ADMIN_POLICY
@@ -26,66 +34,120 @@ def _policy_for_tier(tier: str) -> RatePolicy:
         return PRO_POLICY
     return FREE_POLICY
 
+def _token_policy_for_tier(tier: str) -> RatePolicy:
+    if tier == "admin":
+        return ADMIN_TOKEN_POLICY
+    elif tier == "pro":
+        return PRO_TOKEN_POLICY
+    return FREE_TOKEN_POLICY
+
+def _rate_limited(policy: RatePolicy, tokens: float, amount: float) -> HTTPException:
+    retry_after = max(1, int((amount - tokens) / policy.refill_per_sec) + 1)
+    return HTTPException(
+        status_code=429,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def _consume(bucket_key: str, policy: RatePolicy, amount: float):
+    """Take `amount` from a Redis-backed token bucket or raise 429"""
+    bucket_data = redis_client.get(bucket_key)
+    redis_client.setex(bucket_key, 3600, _take(bucket_data, policy, amount))  # 1 hour TTL
+
+async def _aconsume(bucket_key: str, policy: RatePolicy, amount: float):
+    """Async `_consume`"""
+    bucket_data = await aredis_client.get(bucket_key)
+    await aredis_client.setex(bucket_key, 3600, _take(bucket_data, policy, amount))
+
+def _take(bucket_data, policy: RatePolicy, amount: float) -> str:
+    """The bucket's new state after taking `amount`, or raise 429"""
+    # Get current bucket state
+    now = time.time()
+    
+    if bucket_data:
+        data = json.loads(bucket_data)
+        tokens = data["tokens"]
+        last_refill = data["last_refill"]
+    else:
+        tokens = policy.capacity
+        last_refill = now
+    
+    # Refill tokens based on elapsed time
+    elapsed = now - last_refill
+    tokens = min(policy.capacity, tokens + elapsed * policy.refill_per_sec)
+    
+    # Check if request is allowed
+    if tokens < amount:
+        raise _rate_limited(policy, tokens, amount)
+    
+    # Consume tokens
+    tokens -= amount
+    
+    # Update bucket state
+    bucket_data = {
+        "tokens": tokens,
+        "last_refill": now
+    }
+    return json.dumps(bucket_data)
+
 def allow(user_id: str, tier: str, route_key: str):
     """Redis-backed rate limiting with token bucket algorithm"""
     try:
-        policy = _policy_for_tier(tier)
-        bucket_key = f"rate_limit:{user_id}:{route_key}"
-        
-        # Get current bucket state
-        bucket_data = redis_client.get(bucket_key)
-        now = time.time()
-        
-        if bucket_data:
-            data = json.loads(bucket_data)
-            tokens = data["tokens"]
-            last_refill = data["last_refill"]
-        else:
-            tokens = policy.capacity
-            last_refill = now
-        
-        # Refill tokens based on elapsed time
-        elapsed = now - last_refill
-        tokens = min(policy.capacity, tokens + elapsed * policy.refill_per_sec)
-        
-        # Check if request is allowed
-        if tokens < 1.0:
-            raise HTTPException(
-                status_code=429, 
-                detail="Rate limit exceeded",
-                headers={"Retry-After": str(int(60 / policy.refill_per_sec))}
-            )
-        
-        # Consume token
-        tokens -= 1.0
-        
-        # Update bucket state
-        bucket_data = {
-            "tokens": tokens,
-            "last_refill": now
-        }
-        redis_client.setex(bucket_key, 3600, json.dumps(bucket_data))  # 1 hour TTL
-        
+        _consume(f"rate_limit:{user_id}:{route_key}", _policy_for_tier(tier), 1.0)
     except redis.RedisError:
         # Fallback to in-memory if Redis is unavailable
         print("Warning: Redis unavailable, falling back to in-memory rate limiting")
         _allow_in_memory(user_id, tier, route_key)
 
+async def aallow(user_id: str, tier: str, route_key: str):
+    """Async `allow`, for async routes"""
+    try:
+        await _aconsume(f"rate_limit:{user_id}:{route_key}", _policy_for_tier(tier), 1.0)
+    except redis.RedisError:
+        print("Warning: Redis unavailable, falling back to in-memory rate limiting")
+        _allow_in_memory(user_id, tier, route_key)
+
+def _token_amount(policy: RatePolicy, tokens: int) -> float:
+    # A single request larger than the bucket would otherwise never be allowed
+    return float(min(max(tokens, 1), policy.capacity))
+
+def allow_tokens(user_id: str, tier: str, route_key: str, tokens: int):
+    """Token-aware rate limiting: charge a request's estimated LLM tokens against
+    the tier's token bucket, so a few huge prompts cost as much as many small ones"""
+    policy = _token_policy_for_tier(tier)
+    amount = _token_amount(policy, tokens)
+    try:
+        _consume(f"rate_limit_tokens:{user_id}:{route_key}", policy, amount)
+    except redis.RedisError:
+        print("Warning: Redis unavailable, falling back to in-memory rate limiting")
+        _consume_in_memory((user_id, f"tokens:{route_key}"), policy, amount)
+
+async def aallow_tokens(user_id: str, tier: str, route_key: str, tokens: int):
+    """Async `allow_tokens`, for async routes"""
+    policy = _token_policy_for_tier(tier)
+    amount = _token_amount(policy, tokens)
+    try:
+        await _aconsume(f"rate_limit_tokens:{user_id}:{route_key}", policy, amount)
+    except redis.RedisError:
+        print("Warning: Redis unavailable, falling back to in-memory rate limiting")
+        _consume_in_memory((user_id, f"tokens:{route_key}"), policy, amount)
+
 # Fallback in-memory rate limiting
 _memory_buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
 
 def _allow_in_memory(user_id: str, tier: str, route_key: str):
     """Fallback in-memory rate limiting"""
+    _consume_in_memory((user_id, route_key), _policy_for_tier(tier), 1.0)
+
+def _consume_in_memory(key: Tuple[str, str], policy: RatePolicy, amount: float):
     now = time.time()
-    key = (user_id, route_key)
-    policy = _policy_for_tier(tier)
 
     tokens, last = _memory_buckets.get(key, (policy.capacity, now))
     elapsed = now - last
     tokens = min(policy.capacity, tokens + elapsed * policy.refill_per_sec)
 
-    if tokens < 1.0:
+    if tokens < amount:
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
-    tokens -= 1.0
+    tokens -= amount
     _memory_buckets[key] = (tokens, now)
@@ -1,4 +1,5 @@
 # Orchestrator package
 from .multi_agent_system import MultiAgentSystem, multi_agent_system
+from .workflow_engine import StepSpec, WorkflowDefinition, WorkflowStepFailed
 
-__all__ = ["MultiAgentSystem", "multi_agent_system"]
+__all__ = ["MultiAgentSystem", "multi_agent_system", "StepSpec", "WorkflowDefinition", "WorkflowStepFailed"]
@@ -0,0 +1,179 @@
+"""
+Agent pools
+
+Each agent type is served by a pool of instances, for example story writers
+bound to different providers. The pool itself is what workflow steps run: a
+call goes to the instance with the fewest requests in flight relative to its
+limit, or with AGENT_POOL_STRATEGY=latency_weighted to the one with the
+lowest expected wait (requests in flight times recent latency). Every instance takes at most
+max_in_flight calls at once; beyond that, callers queue in arrival order
+until an instance frees up, bounded by their step timeout.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+from services.agents.base_agent import AgentContext, AgentResponse, BaseAgent
+from metrics.prom import record_agent_in_flight, record_agent_pool_wait
+
+AGENT_POOL_SETTINGS = {
+    "strategy": os.getenv("AGENT_POOL_STRATEGY", "least_outstanding").lower(),  # or latency_weighted
+    "max_in_flight": int(os.getenv("AGENT_MAX_IN_FLIGHT", "32")),
+    # Instances per agent type: "story_writing=gemini:16,openai:8;idea_generation=2" gives two
+    # provider-bound story writers (with their own in-flight limits) and two unbound idea agents
+    "pools": os.getenv("AGENT_POOLS", ""),
+    # Weight of the newest sample in an instance's latency average
+    "latency_alpha": 0.2
+}
+
+def parse_pool_spec(spec: str, default_max_in_flight: int) -> Dict[str, List[Dict[str, Any]]]:
+    """AGENT_POOLS -> {agent type: [{"preferred_provider", "max_in_flight"}, ...]}"""
+    pools = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        agent_type, _, members = entry.partition("=")
+        instances = []
+        for member in filter(None, (m.strip() for m in members.split(","))):
+            if member.isdigit():
+                instances.extend({"preferred_provider": None, "max_in_flight": default_max_in_flight}
+                                 for _ in range(int(member)))
+                continue
+            provider, _, limit = member.partition(":")
+            instances.append({
+                "preferred_provider": None if provider in ("", "*") else provider.lower(),
+                "max_in_flight": int(limit) if limit else default_max_in_flight
+            })
+        if instances:
+            pools[agent_type.strip()] = instances
+    return pools
+
+class PoolMember:
+    """One agent instance and its live load"""
+
+    def __init__(self, agent: BaseAgent, max_in_flight: int):
+        self.agent = agent
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.latency_ms: Optional[float] = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "agent_id": self.agent.agent_id,
+            "preferred_provider": self.agent.preferred_provider,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None
+        }
+
+class AgentPool:
+    """Instances of one agent type behind least-loaded dispatch; runs steps like an agent"""
+
+    def __init__(self, agent_type: str, settings: Dict[str, Any] = None):
+        self.settings = settings or AGENT_POOL_SETTINGS
+        self.pool_type = agent_type
+        self.members: List[PoolMember] = []
+        self._waiters: deque = deque()
+        self.waiting = 0
+
+    @property
+    def agent_type(self) -> str:
+        return self.members[0].agent.agent_type if self.members else self.pool_type
+
+    @property
+    def agent_id(self) -> str:
+        return f"{self.pool_type}_pool"
+
+    def add(self, agent: BaseAgent, max_in_flight: Optional[int] = None):
+        self.members.append(PoolMember(agent, max_in_flight or self.settings["max_in_flight"]))
+
+    def _pick(self) -> Optional[PoolMember]:
+        available = [m for m in self.members if m.in_flight < m.max_in_flight]
+        if not available:
+            return None
+        if self.settings["strategy"] == "latency_weighted":
+            sampled = [m.latency_ms for m in self.members if m.latency_ms is not None]
+            # Instances without samples yet are assumed to be as fast as the pool's average
+            default = sum(sampled) / len(sampled) if sampled else 1.0
+            return min(available, key=lambda m: (
+                (m.in_flight + 1) * (m.latency_ms if m.latency_ms is not None else default), m.dispatched))
+        return min(available, key=lambda m: (m.in_flight / m.max_in_flight, m.dispatched))
+
+    async def _acquire(self) -> PoolMember:
+        # Nobody jumps the queue while others are waiting
+        member = self._pick() if not self.waiting else None
+        if member is None:
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                while member is None:
+                    waiter = asyncio.get_running_loop().create_future()
+                    self._waiters.append(waiter)
+                    try:
+                        await waiter
+                    except asyncio.CancelledError:
+                        # Pass on a wake-up this caller can no longer use
+                        if waiter.done() and not waiter.cancelled():
+                            self._wake_next()
+                        raise
+                    member = self._pick()
+            finally:
+                self.waiting -= 1
+            _record_wait(self.pool_type, time.perf_counter() - started)
+        member.in_flight += 1
+        member.dispatched += 1
+        _record_in_flight(self.pool_type, member)
+        return member
+
+    def _release(self, member: PoolMember):
+        member.in_flight -= 1
+        _record_in_flight(self.pool_type, member)
+        self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def process(self, input_data: Dict[str, Any], context: AgentContext) -> AgentResponse:
+        """Run the call on the least-loaded instance, waiting for one if all are at their limit"""
+        member = await self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await member.agent.process(input_data, context)
+        finally:
+            self._release(member)
+        if response.success:
+            alpha = self.settings["latency_alpha"]
+            latency = (time.perf_counter() - started) * 1000
+            member.latency_ms = latency if member.latency_ms is None else (1 - alpha) * member.latency_ms + alpha * latency
+        else:
+            member.failed += 1
+        return response
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.settings["strategy"],
+            "instances": len(self.members),
+            "in_flight": sum(m.in_flight for m in self.members),
+            "capacity": sum(m.max_in_flight for m in self.members),
+            "waiting": self.waiting,
+            "members": [m.get_status() for m in self.members]
+        }
+
+def _record_in_flight(pool_type: str, member: PoolMember):
+    try:
+        record_agent_in_flight(pool_type, member.agent.agent_id, member.in_flight)
+    except Exception as e:
+        print(f"Failed to record agent pool metric: {e}")
+
+def _record_wait(pool_type: str, seconds: float):
+    try:
+        record_agent_pool_wait(pool_type, seconds)
+    except Exception as e:
+        print(f"Failed to record agent pool metric: {e}")
@@ -0,0 +1,169 @@
+"""
+Workflow step checkpoints
+
+When a step of an orchestrated workflow succeeds, its output is saved under
+the workflow_id together with the run's type, user and input. If a later step
+fails, the workflow can be resumed: checkpointed steps are restored instead of
+re-run (and re-paid for), and only the failed or missing steps execute.
+Checkpoints live in the database (workflow_checkpoints) or in Redis, expire
+after a TTL and are deleted once the workflow completes.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import redis.asyncio as aioredis
+from sqlalchemy.exc import IntegrityError
+from db.database import SessionLocal
+from db.models import WorkflowCheckpoint
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+CHECKPOINT_SETTINGS = {
+    "enabled": os.getenv("WORKFLOW_CHECKPOINTS_ENABLED", "true").lower() == "true",
+    "backend": os.getenv("WORKFLOW_CHECKPOINT_BACKEND", "db").lower(),  # db or redis
+    "ttl_seconds": int(os.getenv("WORKFLOW_CHECKPOINT_TTL_SECONDS", "86400")),
+    "key_prefix": "wf_ckpt:v1:",
+    # Expired database rows are purged every this many saves
+    "purge_every": 200
+}
+
+# Checkpoint entry holding the run itself rather than a step's output
+RUN_ENTRY = "_workflow"
+
+class CheckpointNotFound(Exception):
+    """No checkpoints for this workflow: unknown, expired, completed or another user's"""
+
+    def __init__(self, workflow_id: str):
+        self.workflow_id = workflow_id
+        super().__init__(f"No resumable checkpoints for workflow {workflow_id}")
+
+class ResumeInProgress(Exception):
+    """The workflow is already being resumed by another request"""
+
+    def __init__(self, workflow_id: str):
+        self.workflow_id = workflow_id
+        super().__init__(f"Workflow {workflow_id} is already being resumed")
+
+class CheckpointStore:
+    """Per-step workflow outputs keyed by workflow_id, in the database or Redis"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or CHECKPOINT_SETTINGS
+        self._redis = aioredis.from_url(REDIS_URL, decode_responses=True) if self.settings["backend"] == "redis" else None
+        self._saves = 0
+        self.stats = {"saved": 0, "loaded": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings["enabled"]
+
+    async def save_step(self, workflow_id: str, run: Dict[str, Any], step: str, payload: Dict[str, Any]):
+        """Checkpoint one completed step (and the run it belongs to); failures are logged, not raised"""
+        if not self.enabled:
+            return
+        entries = {RUN_ENTRY: json.dumps(run, default=str), step: json.dumps(payload, default=str)}
+        try:
+            if self._redis is not None:
+                key = self.settings["key_prefix"] + workflow_id
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(key, mapping=entries)
+                    pipe.expire(key, self.settings["ttl_seconds"])
+                    await pipe.execute()
+            else:
+                await asyncio.to_thread(self._db_save, workflow_id, entries)
+            self.stats["saved"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Warning: could not checkpoint workflow {workflow_id} step {step}: {e}")
+
+    async def load(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """{"run": {...}, "steps": {name: payload}} or None if unknown or expired"""
+        if not self.enabled:
+            return None
+        if self._redis is not None:
+            entries = await self._redis.hgetall(self.settings["key_prefix"] + workflow_id)
+        else:
+            entries = await asyncio.to_thread(self._db_load, workflow_id)
+        if not entries or RUN_ENTRY not in entries:
+            return None
+        self.stats["loaded"] += 1
+        run = json.loads(entries.pop(RUN_ENTRY))
+        return {"run": run, "steps": {step: json.loads(raw) for step, raw in entries.items()}}
+
+    async def delete(self, workflow_id: str):
+        if not self.enabled:
+            return
+        try:
+            if self._redis is not None:
+                await self._redis.delete(self.settings["key_prefix"] + workflow_id)
+            else:
+                await asyncio.to_thread(self._db_delete, workflow_id)
+        except Exception as e:
+            print(f"Warning: could not delete checkpoints for workflow {workflow_id}: {e}")
+
+    def _db_save(self, workflow_id: str, entries: Dict[str, str]):
+        try:
+            self._db_upsert(workflow_id, entries)
+        except IntegrityError:
+            # A concurrent step's save inserted the run entry first; this time it is an update
+            self._db_upsert(workflow_id, entries)
+
+    def _db_upsert(self, workflow_id: str, entries: Dict[str, str]):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.settings["ttl_seconds"])
+        db = SessionLocal()
+        try:
+            existing = {
+                row.step: row for row in db.query(WorkflowCheckpoint)
+                .filter(WorkflowCheckpoint.workflow_id == workflow_id,
+                        WorkflowCheckpoint.step.in_(list(entries))).all()
+            }
+            for step, raw in entries.items():
+                row = existing.get(step)
+                if row is None:
+                    db.add(WorkflowCheckpoint(workflow_id=workflow_id, step=step, payload_json=raw,
+                                              created_at=now, expires_at=expires_at))
+                else:
+                    row.payload_json, row.expires_at = raw, expires_at
+            # Every save extends the whole workflow's TTL, as Redis EXPIRE does
+            db.query(WorkflowCheckpoint).filter(WorkflowCheckpoint.workflow_id == workflow_id)\
+                .update({WorkflowCheckpoint.expires_at: expires_at}, synchronize_session=False)
+            self._saves += 1
+            if self._saves % self.settings["purge_every"] == 0:
+                db.query(WorkflowCheckpoint).filter(WorkflowCheckpoint.expires_at < now)\
+                    .delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _db_load(self, workflow_id: str) -> Dict[str, str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(WorkflowCheckpoint).filter(
+                WorkflowCheckpoint.workflow_id == workflow_id,
+                WorkflowCheckpoint.expires_at > datetime.utcnow()
+            ).all()
+            return {row.step: row.payload_json for row in rows}
+        finally:
+            db.close()
+
+    def _db_delete(self, workflow_id: str):
+        db = SessionLocal()
+        try:
+            db.query(WorkflowCheckpoint).filter(WorkflowCheckpoint.workflow_id == workflow_id)\
+                .delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "backend": self.settings["backend"],
+                "ttl_seconds": self.settings["ttl_seconds"], **self.stats}
+
+# Global instance
+checkpoint_store = CheckpointStore()
@@ -0,0 +1,257 @@
+"""
+Workflow run history
+
+Each finished workflow is reduced to a compact summary: ids, status, per-step
+timing and usage totals, never the generated text or AgentResponse objects.
+The most recent summaries stay in a fixed-size ring buffer for status pages.
+Every summary is also queued and written to the workflow_runs table by a
+background task, so history survives restarts and is shared between workers.
+Queries page through the table by (started_at, id) keyset rather than offset.
+"""
+import asyncio
+import base64
+import json
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_
+from db.database import SessionLocal
+from db.models import WorkflowRun
+
+WORKFLOW_HISTORY_SETTINGS = {
+    "buffer_size": int(os.getenv("WORKFLOW_HISTORY_BUFFER_SIZE", "200")),
+    "persist": os.getenv("WORKFLOW_HISTORY_PERSIST", "true").lower() == "true",
+    # Summaries waiting to be written; the oldest are dropped past this
+    "max_pending": int(os.getenv("WORKFLOW_HISTORY_MAX_PENDING", "5000")),
+    "flush_interval_seconds": float(os.getenv("WORKFLOW_HISTORY_FLUSH_INTERVAL_SECONDS", "1")),
+    "flush_batch_size": int(os.getenv("WORKFLOW_HISTORY_FLUSH_BATCH_SIZE", "200")),
+    "max_error_chars": 500,
+    "max_page_size": 100
+}
+
+def summarize_run(workflow_id: str, workflow_type: str, user_id: str, user_tier: str, status: str,
+                  started_at: datetime, finished_at: datetime, result: Optional[Dict[str, Any]] = None,
+                  error: Optional[str] = None) -> Dict[str, Any]:
+    """Compact, JSON-safe summary of a workflow run"""
+    steps, tokens_in, tokens_out, cost_usd = [], 0, 0, 0.0
+    for step in (result or {}).get("workflow_steps", []):
+        response = step.get("agent_response")
+        metadata = response.metadata if response else {}
+        tokens_in += metadata.get("tokens_in", 0) or 0
+        tokens_out += metadata.get("tokens_out", 0) or 0
+        cost_usd += metadata.get("cost_usd", 0.0) or 0.0
+        steps.append({
+            "name": step.get("name"),
+            "agent_type": step.get("agent_type"),
+            "success": step.get("success"),
+            "execution_time_ms": step.get("execution_time_ms"),
+            "started_at_ms": step.get("started_at_ms"),
+            "finished_at_ms": step.get("finished_at_ms"),
+            "from_checkpoint": step.get("from_checkpoint", False)
+        })
+    max_error = WORKFLOW_HISTORY_SETTINGS["max_error_chars"]
+    return {
+        "workflow_id": workflow_id,
+        "workflow_type": workflow_type,
+        "user_id": user_id,
+        "user_tier": user_tier,
+        "status": status,
+        "error": error[:max_error] if error else None,
+        "steps": steps,
+        "critical_path": (result or {}).get("critical_path", []),
+        "total_execution_time_ms": (result or {}).get("total_execution_time_ms", 0),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "cost_usd": round(cost_usd, 6),
+        "start_time": started_at.isoformat(),
+        "end_time": finished_at.isoformat()
+    }
+
+def _row_summary(run: WorkflowRun) -> Dict[str, Any]:
+    return {
+        "workflow_id": run.id,
+        "workflow_type": run.workflow_type,
+        "user_id": run.user_id,
+        "user_tier": run.user_tier,
+        "status": run.status,
+        "error": run.error,
+        "steps": json.loads(run.steps_json) if run.steps_json else [],
+        "critical_path": run.critical_path.split(",") if run.critical_path else [],
+        "total_execution_time_ms": run.total_execution_time_ms,
+        "tokens_in": run.tokens_in,
+        "tokens_out": run.tokens_out,
+        "cost_usd": run.cost_usd,
+        "start_time": run.started_at.isoformat(),
+        "end_time": run.finished_at.isoformat() if run.finished_at else None
+    }
+
+def encode_cursor(started_at: str, workflow_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{started_at}|{workflow_id}".encode()).decode()
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """A client's (possibly tz-aware) datetime as naive UTC, which is how start times are stored"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        started_at, workflow_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(started_at), workflow_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+class WorkflowHistory:
+    """Bounded recent-run buffer plus asynchronous persistence to workflow_runs"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or WORKFLOW_HISTORY_SETTINGS
+        self.recent: deque = deque(maxlen=self.settings["buffer_size"])
+        self._pending: deque = deque()
+        self._writer: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self.stats = {"recorded": 0, "persisted": 0, "dropped": 0, "write_errors": 0}
+
+    def record(self, summary: Dict[str, Any]):
+        self.recent.append(summary)
+        self.stats["recorded"] += 1
+        if not self.settings["persist"]:
+            return
+        if len(self._pending) >= self.settings["max_pending"]:
+            self._pending.popleft()
+            self.stats["dropped"] += 1
+        self._pending.append(summary)
+        if self._writer is None or self._writer.done():
+            try:
+                self._writer = asyncio.get_running_loop().create_task(self._drain())
+            except RuntimeError:
+                # No event loop (scripts, tests): write inline
+                self._write(self._take_batch())
+
+    def get_recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent summaries from this process, newest last"""
+        return list(self.recent)[-limit:] if limit > 0 else []
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        while self._pending and len(batch) < self.settings["flush_batch_size"]:
+            batch.append(self._pending.popleft())
+        return batch
+
+    async def _drain(self):
+        while self._pending:
+            # Batch up writes for a moment unless a flush asks for them now
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.settings["flush_interval_seconds"])
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._pending:
+                await asyncio.to_thread(self._write, self._take_batch())
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        # A resumed workflow reports again under the same id: keep its latest
+        # summary, and merge rather than add in case an earlier one is stored
+        latest = {s["workflow_id"]: s for s in batch}
+        db = SessionLocal()
+        try:
+            for s in latest.values():
+                db.merge(WorkflowRun(
+                    id=s["workflow_id"], user_id=s["user_id"], user_tier=s["user_tier"],
+                    workflow_type=s["workflow_type"], status=s["status"], error=s["error"],
+                    steps_json=json.dumps(s["steps"]), critical_path=",".join(s["critical_path"]) or None,
+                    total_execution_time_ms=s["total_execution_time_ms"], tokens_in=s["tokens_in"],
+                    tokens_out=s["tokens_out"], cost_usd=s["cost_usd"],
+                    started_at=datetime.fromisoformat(s["start_time"]),
+                    finished_at=datetime.fromisoformat(s["end_time"])
+                ))
+            db.commit()
+            self.stats["persisted"] += len(batch)
+        except Exception as e:
+            db.rollback()
+            self.stats["write_errors"] += 1
+            print(f"Warning: could not persist {len(batch)} workflow run(s): {e}")
+        finally:
+            db.close()
+
+    async def flush(self):
+        """Write everything still queued (before reads, and on shutdown)"""
+        if self._writer is not None and not self._writer.done():
+            self._wake.set()
+            await self._writer
+        while self._pending:
+            await asyncio.to_thread(self._write, self._take_batch())
+
+    async def query(self, limit: int = 10, cursor: Optional[str] = None, user_id: Optional[str] = None,
+                    workflow_type: Optional[str] = None, status: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Newest-first page of runs plus the cursor for the next page (None at the end)"""
+        limit = max(1, min(limit, self.settings["max_page_size"]))
+        since, until = _naive_utc(since), _naive_utc(until)
+        if not self.settings["persist"]:
+            return self._query_recent(limit, cursor, user_id, workflow_type, status, since, until)
+        return await asyncio.to_thread(self._db_query, limit, cursor, user_id, workflow_type, status, since, until)
+
+    def _db_query(self, limit, cursor, user_id, workflow_type, status, since, until) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            q = db.query(WorkflowRun)
+            if user_id:
+                q = q.filter(WorkflowRun.user_id == user_id)
+            if workflow_type:
+                q = q.filter(WorkflowRun.workflow_type == workflow_type)
+            if status:
+                q = q.filter(WorkflowRun.status == status)
+            if since:
+                q = q.filter(WorkflowRun.started_at >= since)
+            if until:
+                q = q.filter(WorkflowRun.started_at < until)
+            if cursor:
+                cursor_at, cursor_id = decode_cursor(cursor)
+                q = q.filter(or_(WorkflowRun.started_at < cursor_at,
+                                 and_(WorkflowRun.started_at == cursor_at, WorkflowRun.id < cursor_id)))
+            rows = q.order_by(WorkflowRun.started_at.desc(), WorkflowRun.id.desc()).limit(limit + 1).all()
+            runs = [_row_summary(row) for row in rows[:limit]]
+        finally:
+            db.close()
+        return self._page(runs, len(rows) > limit)
+
+    def _query_recent(self, limit, cursor, user_id, workflow_type, status, since, until) -> Dict[str, Any]:
+        # Compare start times as datetimes: ISO strings only order alike when formatted alike
+        started = {id(s): datetime.fromisoformat(s["start_time"]) for s in self.recent}
+        runs = sorted(self.recent, key=lambda s: (started[id(s)], s["workflow_id"]), reverse=True)
+        if cursor:
+            cursor_key = decode_cursor(cursor)
+            runs = [s for s in runs if (started[id(s)], s["workflow_id"]) < cursor_key]
+        runs = [
+            s for s in runs
+            if (not user_id or s["user_id"] == user_id)
+            and (not workflow_type or s["workflow_type"] == workflow_type)
+            and (not status or s["status"] == status)
+            and (not since or started[id(s)] >= since)
+            and (not until or started[id(s)] < until)
+        ]
+        return self._page(runs[:limit], len(runs) > limit)
+
+    def _page(self, runs: List[Dict[str, Any]], has_more: bool) -> Dict[str, Any]:
+        last = runs[-1] if runs and has_more else None
+        return {
+            "workflow_history": runs,
+            "next_cursor": encode_cursor(last["start_time"], last["workflow_id"]) if last else None
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "buffered": len(self.recent),
+            "buffer_size": self.settings["buffer_size"],
+            "pending_writes": len(self._pending),
+            "persist": self.settings["persist"]
+        }
+
+# Global instance
+workflow_history = WorkflowHistory()
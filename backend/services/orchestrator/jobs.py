@@ -0,0 +1,611 @@
+"""
+Background workflow jobs
+
+Submitting a workflow as a job returns a job id straight away. The workflow
+then runs on a bounded pool of asyncio workers instead of inside the HTTP
+request, so load balancer timeouts and client disconnects no longer throw
+away finished work. Each tier may only occupy so many of the pool's workers,
+so a burst of free-tier jobs cannot hold up pro jobs.
+
+Jobs, their queue and a per-job event log (the progress feed behind the SSE
+endpoint) live in process memory by default. With WORKFLOW_JOB_BACKEND=redis
+they live in Redis instead: one stream per tier read through a consumer
+group, so any node can run a job and any node can report on it, and jobs
+whose node died are picked up again and resumed from their checkpoints. Run
+more than one API process only with the Redis backend.
+
+On shutdown the pool stops taking jobs and gives running ones a grace period
+to finish.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from fastapi.encoders import jsonable_encoder
+from db.database import SessionLocal
+from metrics.usage import log_usage
+from metrics.prom import record_workflow_job, record_workflow_job_wait, record_workflow_jobs_running
+from services.providers.deadline import deadline_for
+from .checkpoints import CheckpointNotFound
+from .multi_agent_system import multi_agent_system
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+WORKFLOW_JOB_SETTINGS = {
+    "backend": os.getenv("WORKFLOW_JOB_BACKEND", "memory").lower(),  # memory or redis
+    "workers": int(os.getenv("WORKFLOW_JOB_WORKERS", "8")),
+    # Workers each tier may occupy at once (per node)
+    "tier_concurrency": {
+        "free": int(os.getenv("WORKFLOW_JOB_FREE_CONCURRENCY", "2")),
+        "pro": int(os.getenv("WORKFLOW_JOB_PRO_CONCURRENCY", "6")),
+        "admin": int(os.getenv("WORKFLOW_JOB_ADMIN_CONCURRENCY", "8"))
+    },
+    # Queued plus running jobs per user
+    "max_active_per_user": {"free": 2, "pro": 10, "admin": 100},
+    # Queued plus running jobs overall; submissions past this are turned away
+    "max_pending": int(os.getenv("WORKFLOW_JOB_MAX_PENDING", "1000")),
+    # How long finished jobs (and their events) can still be read
+    "job_ttl_seconds": int(os.getenv("WORKFLOW_JOB_TTL_SECONDS", "3600")),
+    "drain_timeout_seconds": float(os.getenv("WORKFLOW_JOB_DRAIN_TIMEOUT_SECONDS", "30")),
+    "heartbeat_seconds": 15,
+    "max_events": 500,
+    "key_prefix": "wf_job:v1:",
+    "consumer_group": "workflow_workers",
+    # Redis: jobs left unacknowledged this long (their node died) are run again
+    "reclaim_after_seconds": int(os.getenv("WORKFLOW_JOB_RECLAIM_AFTER_SECONDS", "900")),
+    "reclaim_interval_seconds": 30
+}
+
+# Dispatch order when several tiers have jobs waiting
+TIERS = ("admin", "pro", "free")
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed")
+
+class JobQueueFull(Exception):
+    """Raised when the queue is at capacity or shutting down"""
+
+class TooManyJobs(Exception):
+    """Raised when a user already has as many active jobs as their tier allows"""
+
+def queue_tier(tier: Optional[str]) -> str:
+    tier = (tier or "free").lower()
+    return tier if tier in TIERS else "free"
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """A job as reported to clients: everything but the submitted input"""
+    return {key: value for key, value in job.items() if key != "input_data"}
+
+class MemoryJobBackend:
+    """Jobs, tier queues and event logs held in this process"""
+    name = "memory"
+    # Jobs do not outlive the process
+    durable = False
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.queues: Dict[str, deque] = {tier: deque() for tier in TIERS}
+        self.events: Dict[str, List[Dict[str, Any]]] = {}
+        self._queued = asyncio.Event()
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    async def submit(self, job: Dict[str, Any]):
+        self._prune()
+        self.jobs[job["job_id"]] = job
+        self.queues[queue_tier(job["user_tier"])].append(job["job_id"])
+        self._queued.set()
+
+    def _prune(self):
+        cutoff = time.time() - self.settings["job_ttl_seconds"]
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["status"] in FINISHED_STATUSES and job["finished_ts"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+            self.events.pop(job_id, None)
+
+    async def pending_count(self) -> int:
+        return sum(1 for job in self.jobs.values() if job["status"] in ACTIVE_STATUSES)
+
+    async def active_for_user(self, user_id: str) -> int:
+        return sum(1 for job in self.jobs.values() if job["user_id"] == user_id and job["status"] in ACTIVE_STATUSES)
+
+    async def next_job(self, tiers: List[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """Oldest job of the first listed tier that has one, waiting up to `timeout`"""
+        for attempt in range(2):
+            for tier in tiers:
+                if self.queues[tier]:
+                    return self.jobs[self.queues[tier].popleft()]
+            if attempt == 0:
+                self._queued.clear()
+                try:
+                    await asyncio.wait_for(self._queued.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+        return None
+
+    async def release(self, job: Dict[str, Any]):
+        """Put a fetched job back at the head of its queue"""
+        self.queues[queue_tier(job["user_tier"])].appendleft(job["job_id"])
+        self._queued.set()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def save(self, job: Dict[str, Any]):
+        self.jobs[job["job_id"]] = job
+
+    async def finish(self, job: Dict[str, Any]):
+        await self.save(job)
+
+    async def add_event(self, job_id: str, event: Dict[str, Any]):
+        self.events.setdefault(job_id, []).append(event)
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    async def read_events(self, job_id: str, after: Optional[str], timeout: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """Events after the id `after` (ids count from 1), waiting up to `timeout` for one"""
+        start = int(after) if after and after.isdigit() else 0
+        if len(self.events.get(job_id, [])) <= start:
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = self.events.get(job_id, [])
+        return [(str(i + 1), events[i]) for i in range(start, len(events))]
+
+    async def close(self):
+        pass
+
+class RedisJobBackend:
+    """Jobs as JSON strings, one queue stream per tier and one event stream per job, in Redis.
+
+    Each user's active jobs are tracked as a set of job ids kept in step with
+    the jobs' saved status; counting checks every member against its job, so
+    jobs that expired or whose node died never hold a user's slots.
+    """
+    name = "redis"
+    durable = True
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        # job_id -> (stream, message id) of jobs this node has read but not acknowledged
+        self._messages: Dict[str, Tuple[str, str]] = {}
+        # Jobs read together with another (XREADGROUP's COUNT is per stream)
+        self._buffer: List[Dict[str, Any]] = []
+        self._groups_ready = False
+        self._last_reclaim = 0.0
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.settings['key_prefix']}{kind}:{name}"
+
+    async def ping(self):
+        await self.redis.ping()
+
+    async def _ensure_groups(self):
+        if self._groups_ready:
+            return
+        for tier in TIERS:
+            try:
+                await self.redis.xgroup_create(self._key("queue", tier), self.settings["consumer_group"],
+                                               id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._groups_ready = True
+
+    async def submit(self, job: Dict[str, Any]):
+        await self._ensure_groups()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._save(pipe, job)
+            pipe.xadd(self._key("queue", queue_tier(job["user_tier"])),
+                      {"job_id": job["job_id"], "user_id": job["user_id"]})
+            await pipe.execute()
+
+    def _save(self, pipe, job: Dict[str, Any]):
+        """Queue writing the job and its membership of the user's active set"""
+        ttl = self.settings["job_ttl_seconds"]
+        active = self._key("active_jobs", job["user_id"])
+        pipe.set(self._key("job", job["job_id"]), json.dumps(job), ex=ttl)
+        if job["status"] in ACTIVE_STATUSES:
+            pipe.sadd(active, job["job_id"])
+            pipe.expire(active, ttl)
+        else:
+            pipe.srem(active, job["job_id"])
+
+    async def pending_count(self) -> int:
+        # Acknowledged entries are deleted, so a stream holds queued and running jobs
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tier in TIERS:
+                pipe.xlen(self._key("queue", tier))
+            return sum(await pipe.execute())
+
+    async def active_for_user(self, user_id: str) -> int:
+        active = self._key("active_jobs", user_id)
+        job_ids = list(await self.redis.smembers(active))
+        if not job_ids:
+            return 0
+        raws = await self.redis.mget([self._key("job", job_id) for job_id in job_ids])
+        stale = [job_id for job_id, raw in zip(job_ids, raws)
+                 if raw is None or json.loads(raw)["status"] not in ACTIVE_STATUSES]
+        if stale:
+            await self.redis.srem(active, *stale)
+        return len(job_ids) - len(stale)
+
+    async def next_job(self, tiers: List[str], timeout: float) -> Optional[Dict[str, Any]]:
+        await self._ensure_groups()
+        for i, job in enumerate(self._buffer):
+            if queue_tier(job["user_tier"]) in tiers:
+                return self._buffer.pop(i)
+
+        if time.monotonic() - self._last_reclaim >= self.settings["reclaim_interval_seconds"]:
+            self._last_reclaim = time.monotonic()
+            for tier in tiers:
+                claimed = await self.redis.xautoclaim(
+                    self._key("queue", tier), self.settings["consumer_group"], self.consumer,
+                    min_idle_time=self.settings["reclaim_after_seconds"] * 1000, start_id="0-0", count=1
+                )
+                jobs = await self._claim(self._key("queue", tier), claimed[1])
+                if jobs:
+                    self._buffer.extend(jobs[1:])
+                    return jobs[0]
+
+        # Non-blocking pass in priority order, then block on every allowed tier
+        for tier in tiers:
+            response = await self.redis.xreadgroup(self.settings["consumer_group"], self.consumer,
+                                                   {self._key("queue", tier): ">"}, count=1)
+            jobs = await self._read(response)
+            if jobs:
+                return jobs[0]
+        response = await self.redis.xreadgroup(self.settings["consumer_group"], self.consumer,
+                                               {self._key("queue", tier): ">" for tier in tiers},
+                                               count=1, block=max(1, int(timeout * 1000)))
+        jobs = await self._read(response)
+        if not jobs:
+            return None
+        self._buffer.extend(jobs[1:])
+        return jobs[0]
+
+    async def _read(self, response) -> List[Dict[str, Any]]:
+        jobs = []
+        for stream, messages in response or []:
+            jobs.extend(await self._claim(stream, messages))
+        return jobs
+
+    async def _claim(self, stream: str, messages) -> List[Dict[str, Any]]:
+        jobs = []
+        for message_id, fields in messages:
+            if fields and fields["job_id"] in self._messages:
+                # Reclaimed from ourselves: already running here
+                continue
+            job = await self.get(fields["job_id"]) if fields else None
+            if job is None or job["status"] in FINISHED_STATUSES:
+                # Expired, or finished by a node that died before acknowledging it
+                user_id = job["user_id"] if job else (fields or {}).get("user_id")
+                if user_id:
+                    await self.redis.srem(self._key("active_jobs", user_id), fields["job_id"])
+                await self._ack(stream, message_id)
+                continue
+            self._messages[job["job_id"]] = (stream, message_id)
+            jobs.append(job)
+        return jobs
+
+    async def _ack(self, stream: str, message_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(stream, self.settings["consumer_group"], message_id)
+            pipe.xdel(stream, message_id)
+            await pipe.execute()
+
+    async def release(self, job: Dict[str, Any]):
+        """Leave a fetched job unacknowledged; another node reclaims it"""
+        self._messages.pop(job["job_id"], None)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis.get(self._key("job", job_id))
+        return json.loads(raw) if raw else None
+
+    async def save(self, job: Dict[str, Any]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._save(pipe, job)
+            await pipe.execute()
+
+    async def finish(self, job: Dict[str, Any]):
+        await self.save(job)
+        message = self._messages.pop(job["job_id"], None)
+        if message is not None:
+            await self._ack(*message)
+
+    async def add_event(self, job_id: str, event: Dict[str, Any]):
+        key = self._key("events", job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(key, {"event": json.dumps(event)}, maxlen=self.settings["max_events"], approximate=True)
+            pipe.expire(key, self.settings["job_ttl_seconds"])
+            await pipe.execute()
+
+    async def read_events(self, job_id: str, after: Optional[str], timeout: float) -> List[Tuple[str, Dict[str, Any]]]:
+        response = await self.redis.xread({self._key("events", job_id): after or "0-0"},
+                                          count=100, block=max(1, int(timeout * 1000)))
+        return [(event_id, json.loads(fields["event"])) for _, messages in response or [] for event_id, fields in messages]
+
+    async def close(self):
+        await self.redis.close()
+
+class WorkflowJobQueue:
+    """Bounded worker pool running orchestrated workflows submitted as jobs"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or WORKFLOW_JOB_SETTINGS
+        self.backend = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._running_by_tier = {tier: 0 for tier in TIERS}
+        self._slot_freed: Optional[asyncio.Event] = None
+        self._draining = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    async def start(self):
+        """Pick the backend and start dispatching jobs to workers"""
+        if self.backend is not None:
+            return
+        backend = MemoryJobBackend(self.settings)
+        if self.settings["backend"] == "redis":
+            try:
+                redis_backend = RedisJobBackend(self.settings)
+                await redis_backend.ping()
+                backend = redis_backend
+            except Exception as e:
+                print(f"Warning: Redis unavailable for workflow jobs, using the in-process queue: {e}")
+        self.backend = backend
+        self._draining = False
+        self._slot_freed = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def submit(self, workflow_type: str, input_data: Dict[str, Any], user_id: str, user_tier: str) -> Dict[str, Any]:
+        """Queue a workflow and return the new job"""
+        if workflow_type not in multi_agent_system.workflows:
+            raise ValueError(f"Unknown workflow type: {workflow_type}")
+        await self.start()
+        if self._draining:
+            raise JobQueueFull("Server is shutting down; submit the job again shortly")
+        if await self.backend.pending_count() >= self.settings["max_pending"]:
+            self.stats["rejected"] += 1
+            raise JobQueueFull("Workflow job queue is full; try again shortly")
+        tier = queue_tier(user_tier)
+        limit = self.settings["max_active_per_user"][tier]
+        if await self.backend.active_for_user(user_id) >= limit:
+            self.stats["rejected"] += 1
+            raise TooManyJobs(f"At most {limit} queued or running workflow jobs are allowed for this tier")
+
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            # Failed jobs can be resumed from their checkpoints under this id
+            "workflow_id": job_id,
+            "workflow_type": workflow_type,
+            "user_id": user_id,
+            "user_tier": user_tier,
+            "input_data": input_data,
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "result": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "created_ts": time.time(),
+            "finished_ts": None
+        }
+        await self.backend.submit(job)
+        await self.backend.add_event(job_id, {"type": "queued"})
+        self.stats["submitted"] += 1
+        return job_view(job)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.backend is None:
+            return None
+        job = await self.backend.get(job_id)
+        return job_view(job) if job else None
+
+    async def read_events(self, job_id: str, after: Optional[str], timeout: float) -> List[Tuple[str, Dict[str, Any]]]:
+        return await self.backend.read_events(job_id, after, timeout)
+
+    async def _dispatch(self):
+        while not self._draining:
+            tiers = [tier for tier in TIERS if self._running_by_tier[tier] < self.settings["tier_concurrency"][tier]]
+            if len(self._running) >= self.settings["workers"] or not tiers:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+                continue
+            try:
+                job = await self.backend.next_job(tiers, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: could not fetch workflow jobs: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if job is not None:
+                self._start(job)
+
+    def _start(self, job: Dict[str, Any]):
+        job_id, tier = job["job_id"], queue_tier(job["user_tier"])
+        self._running_by_tier[tier] += 1
+        _record_running(tier, self._running_by_tier[tier])
+        task = asyncio.create_task(self._execute(job))
+        self._running[job_id] = task
+
+        def done(_):
+            self._running.pop(job_id, None)
+            self._running_by_tier[tier] -= 1
+            _record_running(tier, self._running_by_tier[tier])
+            self._slot_freed.set()
+
+        task.add_done_callback(done)
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id, tier = job["job_id"], queue_tier(job["user_tier"])
+        resuming = job["attempts"] > 0
+        if not resuming:
+            _record_wait(tier, time.time() - job["created_ts"])
+        job.update(status="running", attempts=job["attempts"] + 1, started_at=datetime.utcnow().isoformat())
+        await self.backend.save(job)
+
+        # Step events are published in order by one task, off the workflow's critical path
+        events: asyncio.Queue = asyncio.Queue()
+        events.put_nowait({"type": "started", "attempt": job["attempts"]})
+        publisher = asyncio.create_task(self._publish(job_id, events))
+        try:
+            # Jobs get their own deadline, counted from when they start rather than when they were queued
+            deadline = deadline_for("workflow_job", job["user_tier"])
+            try:
+                result = None
+                if resuming:
+                    try:
+                        result = await multi_agent_system.resume_workflow(
+                            job_id, job["user_id"], job["user_tier"], deadline, on_event=events.put_nowait)
+                    except CheckpointNotFound:
+                        pass
+                if result is None:
+                    result = await multi_agent_system.orchestrate_workflow(
+                        workflow_type=job["workflow_type"], input_data=job["input_data"],
+                        user_id=job["user_id"], user_tier=job["user_tier"], deadline=deadline,
+                        workflow_id=job_id, on_event=events.put_nowait)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.update(status="failed", error=str(e))
+            else:
+                await asyncio.to_thread(_log_usage, job, result)
+                job.update(status="completed", result=jsonable_encoder(result))
+
+            events.put_nowait(None)
+            await publisher
+            job.update(finished_at=datetime.utcnow().isoformat(), finished_ts=time.time())
+            await self.backend.finish(job)
+            terminal = {"type": job["status"], "workflow_id": job_id}
+            if job["status"] == "completed":
+                terminal["result"] = job["result"]
+            else:
+                terminal["error"] = job["error"]
+            await self.backend.add_event(job_id, terminal)
+            self.stats[job["status"]] += 1
+            _record_job(job["workflow_type"], job["status"])
+        except asyncio.CancelledError:
+            # Shutdown outlasted the drain timeout
+            await self._interrupted(job)
+            raise
+        finally:
+            publisher.cancel()
+
+    async def _publish(self, job_id: str, events: asyncio.Queue):
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            try:
+                await self.backend.add_event(job_id, event)
+            except Exception as e:
+                print(f"Warning: could not publish workflow job event for {job_id}: {e}")
+
+    async def _interrupted(self, job: Dict[str, Any]):
+        try:
+            if self.backend.durable:
+                # Left unacknowledged: another node reclaims it and resumes from its checkpoints
+                job.update(status="queued")
+                await self.backend.save(job)
+                await self.backend.release(job)
+                await self.backend.add_event(job["job_id"], {"type": "requeued"})
+            else:
+                job.update(status="failed", finished_at=datetime.utcnow().isoformat(), finished_ts=time.time(),
+                           error=f"Server shut down before the job finished; resume it with "
+                                 f"POST /multi-agent/workflows/{job['workflow_id']}/resume")
+                await self.backend.finish(job)
+                await self.backend.add_event(job["job_id"], {"type": "failed", "workflow_id": job["workflow_id"],
+                                                             "error": job["error"]})
+        except Exception as e:
+            print(f"Warning: could not record interrupted workflow job {job['job_id']}: {e}")
+
+    async def shutdown(self):
+        """Stop taking jobs and give running ones the drain timeout to finish"""
+        if self.backend is None:
+            return
+        self._draining = True
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+        running = list(self._running.values())
+        if running:
+            print(f"⏳ Draining {len(running)} workflow job(s)")
+            _, unfinished = await asyncio.wait(running, timeout=self.settings["drain_timeout_seconds"])
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        await self.backend.close()
+        self.backend = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backend": self.backend.name if self.backend else None,
+            "workers": self.settings["workers"],
+            "running": len(self._running),
+            "running_by_tier": dict(self._running_by_tier),
+            "tier_concurrency": self.settings["tier_concurrency"],
+            "draining": self._draining
+        }
+
+def _log_usage(job: Dict[str, Any], result: Dict[str, Any]):
+    """Usage for the steps the job ran, as the synchronous workflow routes log it"""
+    db = SessionLocal()
+    try:
+        for step in result.get("workflow_steps", []):
+            if step.get("from_checkpoint"):
+                continue
+            agent_response = step.get("agent_response")
+            metadata = agent_response.metadata if agent_response else {}
+            log_usage(
+                user_id=job["user_id"],
+                feature=step["agent_type"],
+                provider=metadata.get("provider", "unknown"),
+                model=metadata.get("model", "unknown"),
+                tokens_in=metadata.get("tokens_in", 0),
+                tokens_out=metadata.get("tokens_out", 0),
+                latency_ms=step["execution_time_ms"],
+                cost_usd=metadata.get("cost_usd", 0.0),
+                db=db,
+                user_tier=job["user_tier"]
+            )
+    finally:
+        db.close()
+
+def _record_job(workflow_type: str, status: str):
+    try:
+        record_workflow_job(workflow_type, status)
+    except Exception as e:
+        print(f"Failed to record workflow job metric: {e}")
+
+def _record_wait(tier: str, seconds: float):
+    try:
+        record_workflow_job_wait(tier, seconds)
+    except Exception as e:
+        print(f"Failed to record workflow job wait metric: {e}")
+
+def _record_running(tier: str, running: int):
+    try:
+        record_workflow_jobs_running(tier, running)
+    except Exception as e:
+        print(f"Failed to record workflow job metric: {e}")
+
+# Global instance
+workflow_jobs = WorkflowJobQueue()
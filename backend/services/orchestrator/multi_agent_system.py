@@ -1,14 +1,21 @@
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
 from datetime import datetime
-import uuid
 import asyncio
-from services.agents.base_agent import BaseAgent, AgentContext, AgentResponse
+import uuid
+from services.agents.base_agent import BaseAgent, AgentContext
+from services.providers.deadline import Deadline
 from services.agents import (
     IdeaGenerationAgent,
     StoryWritingAgent, 
     ContentModerationAgent,
     QualityAssuranceAgent
 )
+from .workflow_engine import WorkflowDefinition, run_workflow
+from .agent_pool import AGENT_POOL_SETTINGS, AgentPool, parse_pool_spec
+from .workflows import DEFAULT_WORKFLOWS
+from .history import summarize_run, workflow_history
+from .checkpoints import CheckpointNotFound, ResumeInProgress, checkpoint_store
+from metrics.prom import record_workflow_resume
 
 class MultiAgentSystem:
     """Centralized orchestrator for managing multiple agents"""
@@ -21,36 +28,53 @@ class MultiAgentSystem:
             "content_moderation": [],
             "quality_assurance": []
         }
-        self.workflow_history: List[Dict[str, Any]] = []
+        self.pools: Dict[str, AgentPool] = {}
+        self.workflows: Dict[str, WorkflowDefinition] = {}
+        self.workflow_history = workflow_history
+        self._resuming = set()
+        self._background = set()
         self._initialize_agents()
+        for definition in DEFAULT_WORKFLOWS:
+            self.register_workflow(definition)
     
     def _initialize_agents(self):
-        """Initialize all available agents"""
+        """Initialize all available agents: one instance per type unless AGENT_POOLS asks for more"""
+        pools = parse_pool_spec(AGENT_POOL_SETTINGS["pools"], AGENT_POOL_SETTINGS["max_in_flight"])
+        single = [{"preferred_provider": None, "max_in_flight": None}]
+        
         # Register idea generation agents
-        idea_agent = IdeaGenerationAgent()
-        self.register_agent("idea_generation", idea_agent)
+        for i, spec in enumerate(pools.get("idea_generation", single), start=1):
+            idea_agent = IdeaGenerationAgent(instance=i, preferred_provider=spec["preferred_provider"])
+            self.register_agent("idea_generation", idea_agent, spec["max_in_flight"])
         
         # Register story writing agents
-        story_agent = StoryWritingAgent()
-        self.register_agent("story_writing", story_agent)
+        for i, spec in enumerate(pools.get("story_writing", single), start=1):
+            story_agent = StoryWritingAgent(instance=i, preferred_provider=spec["preferred_provider"])
+            self.register_agent("story_writing", story_agent, spec["max_in_flight"])
         
-        # Register content moderation agents
-        mod_agent = ContentModerationAgent()
-        self.register_agent("content_moderation", mod_agent)
+        # Register content moderation agents (rule-based, so not bound to a provider)
+        for i, spec in enumerate(pools.get("content_moderation", single), start=1):
+            self.register_agent("content_moderation", ContentModerationAgent(instance=i), spec["max_in_flight"])
         
         # Register quality assurance agents
-        qa_agent = QualityAssuranceAgent()
-        self.register_agent("quality_assurance", qa_agent)
+        for i, spec in enumerate(pools.get("quality_assurance", single), start=1):
+            self.register_agent("quality_assurance", QualityAssuranceAgent(instance=i), spec["max_in_flight"])
     
-    def register_agent(self, agent_type: str, agent: BaseAgent):
-        """Register an agent with the system"""
+    def register_agent(self, agent_type: str, agent: BaseAgent, max_in_flight: Optional[int] = None):
+        """Register an agent with the system, adding it to its type's pool"""
         if agent_type not in self.agent_registry:
             self.agent_registry[agent_type] = []
         
         self.agents[agent.agent_id] = agent
         self.agent_registry[agent_type].append(agent.agent_id)
+        self.pools.setdefault(agent_type, AgentPool(agent_type)).add(agent, max_in_flight)
         
-        print(f"[OK] Registered agent: {agent.name} ({agent.agent_id})")
+        bound = f", {agent.preferred_provider}" if agent.preferred_provider else ""
+        print(f"[OK] Registered agent: {agent.name} ({agent.agent_id}{bound})")
+    
+    def register_workflow(self, definition: WorkflowDefinition):
+        """Register (or replace) a workflow DAG under its name"""
+        self.workflows[definition.name] = definition
     
     def get_agent(self, agent_id: str) -> Optional[BaseAgent]:
         """Get an agent by ID"""
@@ -61,220 +85,110 @@ class MultiAgentSystem:
         agent_ids = self.agent_registry.get(agent_type, [])
         return [self.agents[agent_id] for agent_id in agent_ids if agent_id in self.agents]
     
-    def get_best_agent(self, agent_type: str, context: AgentContext) -> Optional[BaseAgent]:
-        """Get the best available agent for a specific type"""
-        agents = self.get_agents_by_type(agent_type)
-        if not agents:
+    def get_best_agent(self, agent_type: str, context: AgentContext) -> Optional[AgentPool]:
+        """Get the pool for a specific type; each call it runs goes to its least-loaded instance"""
+        pool = self.pools.get(agent_type)
+        if pool is None or not pool.members:
             return None
-        
-        # For now, return the first available agent
-        # In the future, this could implement more sophisticated selection logic
-        return agents[0]
+        return pool
     
     async def orchestrate_workflow(self, workflow_type: str, input_data: Dict[str, Any], 
-                                 user_id: str, user_tier: str) -> Dict[str, Any]:
-        """Orchestrate a multi-agent workflow"""
-        workflow_id = str(uuid.uuid4())
-        request_id = str(uuid.uuid4())
+                                 user_id: str, user_tier: str, deadline: Optional[Deadline] = None,
+                                 workflow_id: Optional[str] = None,
+                                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Orchestrate a multi-agent workflow, within the request's deadline if given.
+        Each step that succeeds is checkpointed so a failed run can be resumed."""
+        workflow_id = workflow_id or str(uuid.uuid4())
+        run = {"workflow_type": workflow_type, "user_id": user_id, "user_tier": user_tier, "input_data": input_data}
+        return await self._run(workflow_id, run, user_tier, deadline, on_event=on_event)
+    
+    async def resume_workflow(self, workflow_id: str, user_id: str, user_tier: str,
+                              deadline: Optional[Deadline] = None, any_user: bool = False,
+                              on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Re-run only the failed or missing steps of a checkpointed workflow"""
+        if workflow_id in self._resuming:
+            raise ResumeInProgress(workflow_id)
+        self._resuming.add(workflow_id)
+        try:
+            saved = await checkpoint_store.load(workflow_id)
+            # Someone else's workflow is reported as missing rather than forbidden
+            if saved is None or (not any_user and saved["run"]["user_id"] != user_id):
+                raise CheckpointNotFound(workflow_id)
+            run = saved["run"]
+            definition = self.workflows.get(run["workflow_type"])
+            restored = [step for step in saved["steps"] if definition and step in definition.index]
+            try:
+                result = await self._run(workflow_id, run, user_tier, deadline, checkpoints=saved["steps"],
+                                         on_event=on_event)
+            except Exception:
+                self._record_resume(run["workflow_type"], "failed", restored)
+                raise
+            self._record_resume(run["workflow_type"], "completed", restored)
+            return {**result, "resumed": True, "restored_steps": restored}
+        finally:
+            self._resuming.discard(workflow_id)
+    
+    async def _run(self, workflow_id: str, run: Dict[str, Any], user_tier: str, deadline: Optional[Deadline],
+                   checkpoints: Optional[Dict[str, Any]] = None,
+                   on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        workflow_type, user_id = run["workflow_type"], run["user_id"]
         
         # Create workflow context
         context = AgentContext(
-            request_id=request_id,
+            request_id=str(uuid.uuid4()),
             user_id=user_id,
             user_tier=user_tier,
             workflow_id=workflow_id,
             shared_data={},
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            deadline=deadline
         )
         
-        # Record workflow start
-        workflow_record = {
-            "workflow_id": workflow_id,
-            "workflow_type": workflow_type,
-            "user_id": user_id,
-            "user_tier": user_tier,
-            "start_time": datetime.utcnow(),
-            "steps": [],
-            "status": "running"
-        }
+        started_at = datetime.utcnow()
+        
+        async def on_checkpoint(step: str, payload: Dict[str, Any]):
+            await checkpoint_store.save_step(workflow_id, run, step, payload)
         
         try:
-            if workflow_type == "full_story_generation":
-                result = await self._execute_full_story_workflow(input_data, context)
-            elif workflow_type == "idea_only":
-                result = await self._execute_idea_generation_workflow(input_data, context)
-            elif workflow_type == "story_only":
-                result = await self._execute_story_writing_workflow(input_data, context)
-            else:
+            definition = self.workflows.get(workflow_type)
+            if definition is None:
                 raise ValueError(f"Unknown workflow type: {workflow_type}")
             
-            # Record successful completion
-            workflow_record["status"] = "completed"
-            workflow_record["end_time"] = datetime.utcnow()
-            workflow_record["result"] = result
+            result = await run_workflow(definition, run["input_data"], context, self.get_best_agent,
+                                        checkpoints=checkpoints,
+                                        on_checkpoint=on_checkpoint if checkpoint_store.enabled else None,
+                                        on_event=on_event)
             
-            self.workflow_history.append(workflow_record)
+            # Record successful completion
+            self.workflow_history.record(summarize_run(
+                workflow_id, workflow_type, user_id, user_tier, "completed",
+                started_at, datetime.utcnow(), result=result
+            ))
+            # A completed workflow has nothing left to resume
+            self._discard_checkpoints(workflow_id)
             return result
             
         except Exception as e:
             # Record failure
-            workflow_record["status"] = "failed"
-            workflow_record["end_time"] = datetime.utcnow()
-            workflow_record["error"] = str(e)
-            
-            self.workflow_history.append(workflow_record)
+            self.workflow_history.record(summarize_run(
+                workflow_id, workflow_type, user_id, user_tier, "failed",
+                started_at, datetime.utcnow(), error=str(e)
+            ))
             raise e
     
-    async def _execute_full_story_workflow(self, input_data: Dict[str, Any], 
-                                         context: AgentContext) -> Dict[str, Any]:
-        """Execute the full story generation workflow"""
-        workflow_steps = []
-        
-        # Step 1: Generate story idea
-        idea_agent = self.get_best_agent("idea_generation", context)
-        if not idea_agent:
-            raise Exception("No idea generation agent available")
-        
-        idea_response = await idea_agent.process(input_data, context)
-        workflow_steps.append({
-            "step": 1,
-            "agent_id": idea_agent.agent_id,
-            "agent_type": idea_agent.agent_type,
-            "success": idea_response.success,
-            "execution_time_ms": idea_response.execution_time_ms,
-            "agent_response": idea_response  # Store complete response with metadata
-        })
-        
-        if not idea_response.success:
-            raise Exception(f"Idea generation failed: {idea_response.data}")
-        
-        # Store idea in shared context
-        context.shared_data["idea"] = idea_response.data
-        
-        # Step 2: Write story
-        story_agent = self.get_best_agent("story_writing", context)
-        if not story_agent:
-            raise Exception("No story writing agent available")
-        
-        story_input = {
-            "title": idea_response.data["title"],
-            "genre": idea_response.data["genre"],
-            "outline": idea_response.data["outline"]
-        }
-        
-        story_response = await story_agent.process(story_input, context)
-        workflow_steps.append({
-            "step": 2,
-            "agent_id": story_agent.agent_id,
-            "agent_type": story_agent.agent_type,
-            "success": story_response.success,
-            "execution_time_ms": story_response.execution_time_ms,
-            "agent_response": story_response  # Store complete response with metadata
-        })
-        
-        if not story_response.success:
-            raise Exception(f"Story writing failed: {story_response.data}")
-        
-        # Step 3: Content moderation
-        mod_agent = self.get_best_agent("content_moderation", context)
-        if mod_agent:
-            mod_input = {
-                "content": story_response.data["story"],
-                "content_type": "story"
-            }
-            
-            mod_response = await mod_agent.process(mod_input, context)
-            workflow_steps.append({
-                "step": 3,
-                "agent_id": mod_agent.agent_id,
-                "agent_type": mod_agent.agent_type,
-                "success": mod_response.success,
-                "execution_time_ms": mod_response.execution_time_ms,
-                "agent_response": mod_response  # Store complete response with metadata
-            })
-            
-            if not mod_response.success or not mod_response.data.get("is_safe", True):
-                raise Exception(f"Content moderation failed: {mod_response.data}")
-        
-        # Step 4: Quality assurance
-        qa_agent = self.get_best_agent("quality_assurance", context)
-        if qa_agent:
-            qa_input = {
-                "story": story_response.data["story"],
-                "story_metadata": {
-                    "title": idea_response.data["title"],
-                    "genre": idea_response.data["genre"]
-                }
-            }
-            
-            qa_response = await qa_agent.process(qa_input, context)
-            workflow_steps.append({
-                "step": 4,
-                "agent_id": qa_agent.agent_id,
-                "agent_type": qa_agent.agent_type,
-                "success": qa_response.success,
-                "execution_time_ms": qa_response.execution_time_ms,
-                "agent_response": qa_response  # Store complete response with metadata
-            })
-        
-        # Assemble final result
-        result = {
-            "workflow_id": context.workflow_id,
-            "idea": idea_response.data,
-            "story": story_response.data,
-            "moderation": mod_response.data if mod_agent else None,
-            "quality_assurance": qa_response.data if qa_agent else None,
-            "workflow_steps": workflow_steps,
-            "total_execution_time_ms": sum(step["execution_time_ms"] for step in workflow_steps)
-        }
-        
-        return result
-    
-    async def _execute_idea_generation_workflow(self, input_data: Dict[str, Any], 
-                                              context: AgentContext) -> Dict[str, Any]:
-        """Execute idea generation only workflow"""
-        idea_agent = self.get_best_agent("idea_generation", context)
-        if not idea_agent:
-            raise Exception("No idea generation agent available")
-        
-        idea_response = await idea_agent.process(input_data, context)
-        
-        return {
-            "workflow_id": context.workflow_id,
-            "idea": idea_response.data,
-            "workflow_steps": [{
-                "step": 1,
-                "agent_id": idea_agent.agent_id,
-                "agent_type": idea_agent.agent_type,
-                "success": idea_response.success,
-                "execution_time_ms": idea_response.execution_time_ms,
-                "agent_response": idea_response  # Store complete response with metadata
-            }],
-            "total_execution_time_ms": idea_response.execution_time_ms
-        }
+    def _discard_checkpoints(self, workflow_id: str):
+        if not checkpoint_store.enabled:
+            return
+        task = asyncio.create_task(checkpoint_store.delete(workflow_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
     
-    async def _execute_story_writing_workflow(self, input_data: Dict[str, Any], 
-                                            context: AgentContext) -> Dict[str, Any]:
-        """Execute story writing only workflow"""
-        story_agent = self.get_best_agent("story_writing", context)
-        if not story_agent:
-            raise Exception("No story writing agent available")
-        
-        story_response = await story_agent.process(input_data, context)
-        
-        return {
-            "workflow_id": context.workflow_id,
-            "story": story_response.data,
-            "workflow_steps": [{
-                "step": 1,
-                "agent_id": story_agent.agent_id,
-                "agent_type": story_agent.agent_type,
-                "success": story_response.success,
-                "execution_time_ms": story_response.execution_time_ms,
-                "agent_response": story_response  # Store complete response with metadata
-            }],
-            "total_execution_time_ms": story_response.execution_time_ms
-        }
+    @staticmethod
+    def _record_resume(workflow_type: str, outcome: str, restored: List[str]):
+        try:
+            record_workflow_resume(workflow_type, outcome, restored)
+        except Exception as e:
+            print(f"Failed to record workflow resume metric: {e}")
     
     def get_system_status(self) -> Dict[str, Any]:
         """Get overall system status"""
@@ -286,13 +200,17 @@ class MultiAgentSystem:
             "total_agents": len(self.agents),
             "agent_types": list(self.agent_registry.keys()),
             "agent_statuses": agent_statuses,
-            "workflow_history_count": len(self.workflow_history),
+            "agent_pools": {agent_type: pool.get_status() for agent_type, pool in self.pools.items()},
+            "workflows": {name: [step.name for step in d.order] for name, d in self.workflows.items()},
+            "workflow_history_count": self.workflow_history.stats["recorded"],
+            "workflow_history": self.workflow_history.get_stats(),
+            "checkpoints": checkpoint_store.get_stats(),
             "system_status": "operational"
         }
     
     def get_workflow_history(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get recent workflow history"""
-        return self.workflow_history[-limit:] if self.workflow_history else []
+        """Get recent workflow summaries from this process"""
+        return self.workflow_history.get_recent(limit)
 
 # Global instance
 multi_agent_system = MultiAgentSystem()
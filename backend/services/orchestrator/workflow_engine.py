@@ -0,0 +1,285 @@
+"""
+DAG workflow engine for the multi-agent orchestrator
+
+A workflow is a set of named agent steps. Each step maps its agent's input
+fields from AgentContext.shared_data, where the request's input sits under
+"input" and every finished step's output under the step's name, so a step
+depends on exactly the steps it reads from. Steps whose dependencies are done
+run concurrently, each under its own timeout (never past the request's
+deadline), and the workflow's total time is its critical path rather than the
+sum of its steps. Steps restored from checkpoints (see checkpoints.py) are
+not run again.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from services.agents.base_agent import AgentContext, AgentResponse, BaseAgent
+from services.providers.deadline import DeadlineExceeded
+
+WORKFLOW_SETTINGS = {
+    "default_step_timeout_seconds": float(os.getenv("WORKFLOW_STEP_TIMEOUT_SECONDS", "120"))
+}
+
+# shared_data key holding the workflow's input
+INPUT = "input"
+
+_MISSING = object()
+
+# An input mapping value: a dotted path into shared_data ("idea.title") or a
+# nested dict of them
+InputMapping = Union[str, Dict[str, Any]]
+
+class WorkflowStepFailed(Exception):
+    """A required step failed, timed out or had no agent to run it"""
+
+    def __init__(self, step: str, message: str):
+        self.step = step
+        super().__init__(message)
+
+@dataclass
+class StepSpec:
+    """One agent step in a workflow"""
+    name: str
+    agent_type: str
+    # Agent input field -> path into shared_data; missing paths are left out
+    inputs: Dict[str, InputMapping] = field(default_factory=dict)
+    constants: Dict[str, Any] = field(default_factory=dict)
+    # Ordering-only dependencies on top of the ones implied by `inputs`
+    after: List[str] = field(default_factory=list)
+    timeout_seconds: Optional[float] = None
+    # Skip the step when no agent of its type is registered
+    optional: bool = False
+    # Fail the workflow when the step fails (or `accept` rejects its response)
+    required: bool = True
+    accept: Optional[Callable[[AgentResponse], bool]] = None
+    label: Optional[str] = None
+
+    @property
+    def depends_on(self) -> List[str]:
+        roots = []
+        for mapping in self.inputs.values():
+            roots.extend(_path_roots(mapping))
+        deps = []
+        for name in roots + list(self.after):
+            if name != INPUT and name not in deps:
+                deps.append(name)
+        return deps
+
+    @property
+    def display_name(self) -> str:
+        return self.label or self.agent_type.replace("_", " ").capitalize()
+
+def _path_roots(mapping: InputMapping) -> List[str]:
+    if isinstance(mapping, dict):
+        return [root for value in mapping.values() for root in _path_roots(value)]
+    return [mapping.split(".", 1)[0]]
+
+def _resolve(mapping: InputMapping, shared_data: Dict[str, Any]) -> Any:
+    if isinstance(mapping, dict):
+        resolved = {key: _resolve(value, shared_data) for key, value in mapping.items()}
+        return {key: value for key, value in resolved.items() if value is not _MISSING}
+    value: Any = shared_data
+    for part in mapping.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+class WorkflowDefinition:
+    """A named DAG of steps plus the result keys it returns (result key -> step name)"""
+
+    def __init__(self, name: str, steps: List[StepSpec], outputs: Dict[str, str]):
+        self.name = name
+        self.steps = steps
+        self.outputs = outputs
+        self.order = self._topological_order()
+        self.index = {step.name: i + 1 for i, step in enumerate(self.order)}
+
+    def _topological_order(self) -> List[StepSpec]:
+        by_name = {}
+        for step in self.steps:
+            if step.name in by_name or step.name == INPUT:
+                raise ValueError(f"Workflow '{self.name}': duplicate or reserved step name '{step.name}'")
+            by_name[step.name] = step
+        for step in self.steps:
+            unknown = [d for d in step.depends_on if d not in by_name]
+            if unknown:
+                raise ValueError(f"Workflow '{self.name}': step '{step.name}' depends on unknown step(s) {unknown}")
+        unknown_outputs = [s for s in self.outputs.values() if s not in by_name]
+        if unknown_outputs:
+            raise ValueError(f"Workflow '{self.name}': outputs reference unknown step(s) {unknown_outputs}")
+
+        order, placed = [], set()
+        while len(order) < len(self.steps):
+            ready = [s for s in self.steps if s.name not in placed and all(d in placed for d in s.depends_on)]
+            if not ready:
+                cycle = [s.name for s in self.steps if s.name not in placed]
+                raise ValueError(f"Workflow '{self.name}': dependency cycle among {cycle}")
+            order.extend(ready)
+            placed.update(s.name for s in ready)
+        return order
+
+def critical_path(definition: WorkflowDefinition, steps: Dict[str, Dict[str, Any]]) -> Tuple[int, List[str]]:
+    """Longest chain of executed steps by agent execution time: (total ms, step names)"""
+    finish: Dict[str, int] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for spec in definition.order:
+        if spec.name not in steps:
+            continue
+        deps = [d for d in spec.depends_on if d in finish]
+        slowest = max(deps, key=lambda d: finish[d], default=None)
+        finish[spec.name] = steps[spec.name]["execution_time_ms"] + (finish[slowest] if slowest else 0)
+        previous[spec.name] = slowest
+    if not finish:
+        return 0, []
+    name: Optional[str] = max(finish, key=lambda n: finish[n])
+    total, path = finish[name], []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return total, list(reversed(path))
+
+def restore_step(definition: WorkflowDefinition, name: str, checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+    """The workflow_steps entry for a step whose output came from a checkpoint: it
+    took no time (and cost nothing) in this run"""
+    return {
+        **checkpoint["record"],
+        "step": definition.index[name],
+        "execution_time_ms": 0,
+        "started_at_ms": 0,
+        "finished_at_ms": 0,
+        "from_checkpoint": True,
+        "agent_response": None
+    }
+
+async def run_workflow(definition: WorkflowDefinition, input_data: Dict[str, Any], context: AgentContext,
+                       resolve_agent: Callable[[str, AgentContext], Optional[BaseAgent]],
+                       checkpoints: Optional[Dict[str, Dict[str, Any]]] = None,
+                       on_checkpoint: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+                       on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Execute a workflow DAG, running independent steps concurrently
+
+    `checkpoints` maps step names to outputs saved by an earlier attempt; those
+    steps are restored rather than run. `on_checkpoint(step, payload)` runs
+    alongside the rest of the workflow after each step that succeeds, and is
+    finished before run_workflow returns or raises. `on_event(event)` is called
+    synchronously as steps are restored, start and finish (progress feeds)."""
+    emit = on_event or (lambda event: None)
+    context.shared_data[INPUT] = input_data
+    started = time.perf_counter()
+    records: Dict[str, Dict[str, Any]] = {}
+    pending = {step.name: step for step in definition.order}
+    finished = set()
+    running: Dict[asyncio.Task, StepSpec] = {}
+    saving: List[asyncio.Task] = []
+
+    for name, checkpoint in (checkpoints or {}).items():
+        if name in pending:
+            del pending[name]
+            context.shared_data[name] = checkpoint["data"]
+            records[name] = restore_step(definition, name, checkpoint)
+            finished.add(name)
+            emit({"type": "step_restored", "step": name})
+
+    try:
+        while pending or running:
+            while True:
+                ready = [s for s in definition.order if s.name in pending and all(d in finished for d in s.depends_on)]
+                if not ready:
+                    break
+                for step in ready:
+                    del pending[step.name]
+                    agent = resolve_agent(step.agent_type, context)
+                    if agent is None:
+                        if step.optional:
+                            finished.add(step.name)
+                            continue
+                        raise WorkflowStepFailed(step.name, f"No {step.agent_type.replace('_', ' ')} agent available")
+                    if context.deadline is not None:
+                        context.deadline.check(step.name, "workflow")
+                    running[asyncio.create_task(_run_step(step, agent, context, started))] = step
+                    emit({"type": "step_started", "step": step.name, "agent_type": step.agent_type})
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            # Settle every step that finished before failing, so a sibling's output is still checkpointed
+            failure: Optional[Exception] = None
+            for task in done:
+                step = running.pop(task)
+                try:
+                    response, record = task.result()
+                except Exception as e:
+                    emit({"type": "step_failed", "step": step.name, "error": str(e)})
+                    failure = failure or e
+                    continue
+                emit({"type": "step_completed", "step": step.name, "success": response.success,
+                      "execution_time_ms": response.execution_time_ms})
+                record["step"] = definition.index[step.name]
+                records[step.name] = record
+                context.shared_data[step.name] = response.data
+                finished.add(step.name)
+                accepted = response.success and (step.accept is None or step.accept(response))
+                if step.required and not accepted:
+                    failure = failure or WorkflowStepFailed(step.name, f"{step.display_name} failed: {response.data}")
+                elif accepted and on_checkpoint is not None:
+                    saving.append(asyncio.create_task(on_checkpoint(step.name, {
+                        "data": response.data,
+                        "record": {k: v for k, v in record.items() if k != "agent_response"}
+                    })))
+            if failure is not None:
+                raise failure
+    finally:
+        for task in running:
+            task.cancel()
+        if running or saving:
+            await asyncio.gather(*running, *saving, return_exceptions=True)
+
+    total_ms, path = critical_path(definition, records)
+    result = {"workflow_id": context.workflow_id}
+    for key, step_name in definition.outputs.items():
+        result[key] = context.shared_data.get(step_name) if step_name in records else None
+    result["workflow_steps"] = sorted(records.values(), key=lambda r: r["step"])
+    result["total_execution_time_ms"] = total_ms
+    result["critical_path"] = path
+    return result
+
+async def _run_step(step: StepSpec, agent: BaseAgent, context: AgentContext,
+                    workflow_started: float) -> Tuple[AgentResponse, Dict[str, Any]]:
+    input_data = dict(step.constants)
+    for key, mapping in step.inputs.items():
+        value = _resolve(mapping, context.shared_data)
+        if value is not _MISSING:
+            input_data[key] = value
+
+    timeout = step.timeout_seconds or WORKFLOW_SETTINGS["default_step_timeout_seconds"]
+    if context.deadline is not None:
+        timeout = min(timeout, context.deadline.remaining())
+
+    step_started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(agent.process(input_data, context), timeout=timeout)
+    except asyncio.TimeoutError:
+        if context.deadline is not None and context.deadline.expired():
+            raise context.deadline.exceeded(step.name, "workflow")
+        raise WorkflowStepFailed(step.name, f"{step.display_name} timed out after {timeout:.1f}s")
+
+    # A step that ran out of time surfaces as DeadlineExceeded rather than a generic failure
+    if response.metadata.get("error_type") == "deadline_exceeded":
+        raise DeadlineExceeded("workflow", context.deadline.budget_ms if context.deadline else 0)
+
+    return response, {
+        "name": step.name,
+        # The instance that served the step (agent may be a pool)
+        "agent_id": response.agent_id,
+        "agent_type": response.agent_type,
+        "success": response.success,
+        "execution_time_ms": response.execution_time_ms,
+        "started_at_ms": int((step_started - workflow_started) * 1000),
+        "finished_at_ms": int((time.perf_counter() - workflow_started) * 1000),
+        "depends_on": step.depends_on,
+        "from_checkpoint": False,
+        "agent_response": response  # Store complete response with metadata
+    }
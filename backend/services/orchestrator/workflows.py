@@ -0,0 +1,72 @@
+"""
+Built-in workflow DAGs
+
+Moderation and QA read only the story, so they run side by side once it is
+written. The single-step workflows return a failed step's data rather than
+raising, as they always have.
+"""
+from dataclasses import replace
+from .workflow_engine import StepSpec, WorkflowDefinition
+
+IDEA_STEP = StepSpec(
+    name="idea",
+    agent_type="idea_generation",
+    inputs={"prompt": "input.prompt", "genre": "input.genre", "tone": "input.tone"},
+    timeout_seconds=90
+)
+
+FULL_STORY_WORKFLOW = WorkflowDefinition(
+    name="full_story_generation",
+    steps=[
+        IDEA_STEP,
+        StepSpec(
+            name="story",
+            agent_type="story_writing",
+            inputs={"title": "idea.title", "genre": "idea.genre", "outline": "idea.outline"},
+            timeout_seconds=300
+        ),
+        StepSpec(
+            name="moderation",
+            agent_type="content_moderation",
+            inputs={"content": "story.story"},
+            constants={"content_type": "story"},
+            timeout_seconds=60,
+            optional=True,
+            accept=lambda response: response.data.get("is_safe", True)
+        ),
+        StepSpec(
+            name="quality_assurance",
+            agent_type="quality_assurance",
+            inputs={
+                "story": "story.story",
+                "story_metadata": {"title": "idea.title", "genre": "idea.genre"}
+            },
+            timeout_seconds=60,
+            optional=True,
+            required=False
+        )
+    ],
+    outputs={"idea": "idea", "story": "story", "moderation": "moderation", "quality_assurance": "quality_assurance"}
+)
+
+IDEA_ONLY_WORKFLOW = WorkflowDefinition(
+    name="idea_only",
+    steps=[replace(IDEA_STEP, required=False)],
+    outputs={"idea": "idea"}
+)
+
+STORY_ONLY_WORKFLOW = WorkflowDefinition(
+    name="story_only",
+    steps=[
+        StepSpec(
+            name="story",
+            agent_type="story_writing",
+            inputs={field: f"input.{field}" for field in ("title", "genre", "outline", "tone", "characters", "setting")},
+            timeout_seconds=300,
+            required=False
+        )
+    ],
+    outputs={"story": "story"}
+)
+
+DEFAULT_WORKFLOWS = [FULL_STORY_WORKFLOW, IDEA_ONLY_WORKFLOW, STORY_ONLY_WORKFLOW]
@@ -1,12 +1,15 @@
-import os
 import time
-import anthropic
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, Optional
 from schemas.idea import IdeaRequest, IdeaResponse
 from schemas.story import StoryRequest, StoryResponse
-from .base import GenerationResult, IdeaProvider, StoryProvider
-import json
-import asyncio
+from .base import GenerationResult, IdeaProvider, StoryProvider, timeout_options
+from .pool import client_pool
+from .quota import QuotaExhausted, quota_governor
+from .streaming import StreamTimer
+from .pricing import usage_cost
+from .prompts import Prompt, idea_prompt, story_prompt, anthropic_system, anthropic_messages
+from .structured import IdeaStream, anthropic_output_text, anthropic_tool_options, parse_idea
+from .usage import from_anthropic, resolve_usage
 
 # Anthropic model configurations by tier
 _ANTHROPIC_IDEA_MODELS = {
@@ -22,81 +25,151 @@ _ANTHROPIC_STORY_MODELS = {
 }
 
 class AnthropicIdeaProvider(IdeaProvider):
+    provider_name = "anthropic"
+    temperature = 0.8
+    
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _ANTHROPIC_IDEA_MODELS.get(tier, "claude-3-haiku-20240307")
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
     
-    def generate(self, request: IdeaRequest) -> GenerationResult[IdeaResponse]:
-        start = time.time()
-        
-        # Build system prompt for idea generation
-        system_prompt = """You are a creative story idea generator. Generate compelling story ideas based on user prompts.
-        Return your response as JSON with the following structure:
-        {
-            "title": "Story Title Here",
-            "genre": "Genre Here",
-            "outline": "Detailed outline here...",
-            "characters": "Character descriptions here...",
-            "setting": "Setting description here..."
-        }"""
+    def _build_prompt(self, request: IdeaRequest) -> Prompt:
+        """Build the prompt for idea generation"""
+        return idea_prompt(request, "anthropic")
+    
+    def _build_result(self, response, prompt: Prompt, request: IdeaRequest, start: float) -> GenerationResult[IdeaResponse]:
+        """Turn a Messages API response into a GenerationResult"""
+        text = anthropic_output_text(response.content)
+        usage = resolve_usage("anthropic", from_anthropic(response.usage), prompt.text(), text)
+        tokens_in, tokens_out = usage.tokens_in, usage.tokens_out
+        latency_ms = int((time.time() - start) * 1000)
+        cost_usd = usage_cost(self.model_name, usage)
         
-        # Build user prompt
-        user_prompt = f"""
-        Generate a story idea based on:
-        - Prompt: {request.prompt}
-        - Genre: {request.genre or 'Any genre'}
-        - Tone: {request.tone or 'Any tone'}
+        output = self.parse_output(text, request)
         
-        Make it creative, engaging, and well-structured.
-        """
+        return GenerationResult(
+            output=output,
+            provider="anthropic",
+            model=self.model_name,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            latency_ms=latency_ms,
+            cost_usd=cost_usd,
+            usage_estimated=not usage.reported
+        )
+    
+    def generate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
         
         try:
-            response = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=1000,
-                temperature=0.8,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
+            response = quota_governor.call(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[0].messages.create(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **anthropic_tool_options(),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, prompt, request, start)
             
-            text = response.content[0].text
-            tokens_in = response.usage.input_tokens
-            tokens_out = response.usage.output_tokens
-            latency_ms = int((time.time() - start) * 1000)
-            
-            # Calculate cost
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
-            
-            # Parse JSON response
-            try:
-                idea_data = json.loads(text)
-                output = IdeaResponse(
-                    title=idea_data.get("title", "Untitled Story"),
-                    genre=idea_data.get("genre", request.genre or "General"),
-                    outline=idea_data.get("outline", "No outline provided"),
-                    characters=idea_data.get("characters"),
-                    setting=idea_data.get("setting")
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            raise Exception(f"Anthropic API error: {str(e)}")
+    
+    async def agenerate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        
+        try:
+            response = await quota_governor.acall(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[1].messages.create(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **anthropic_tool_options(),
+                    **timeout_options(timeout)
                 )
-            except json.JSONDecodeError:
-                # Fallback parsing
-                output = self._parse_text_response(text, request)
-            
-            return GenerationResult(
-                output=output,
-                provider="anthropic",
-                model=self.model_name,
-                tokens_in=tokens_in,
-                tokens_out=tokens_out,
-                latency_ms=latency_ms,
-                cost_usd=cost_usd
             )
+            return self._build_result(response, prompt, request, start)
             
+        except QuotaExhausted:
+            raise
         except Exception as e:
             raise Exception(f"Anthropic API error: {str(e)}")
     
+    async def generate_streaming(self, request: IdeaRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream an idea, emitting each field as soon as it is complete"""
+        timer = StreamTimer()
+        prompt = self._build_prompt(request)
+        idea_stream = IdeaStream(request, self.parse_output)
+        
+        try:
+            async with quota_governor.astream(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[1].messages.stream(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **anthropic_tool_options(),
+                    **timeout_options(timeout)
+                )
+            ) as stream:
+                async for event in stream:
+                    if event.type != "content_block_delta":
+                        continue
+                    # Tool input arrives as partial JSON, plain replies as text
+                    chunk = getattr(event.delta, 'partial_json', None) or getattr(event.delta, 'text', None)
+                    if chunk:
+                        timer.mark_token()
+                        for field_event in idea_stream.feed(chunk):
+                            yield field_event
+                
+                final_message = await stream.get_final_message()
+                reported = from_anthropic(getattr(final_message, 'usage', None))
+            
+            for field_event in idea_stream.finish():
+                yield field_event
+            
+            usage = resolve_usage("anthropic", reported, prompt.text(), idea_stream.text)
+            yield {
+                'type': 'metadata',
+                'provider': 'anthropic',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+            
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
+        except Exception as e:
+            yield {
+                'type': 'error',
+                'error': f"Anthropic streaming API error: {str(e)}"
+            }
+    
+    def parse_output(self, text: str, request: IdeaRequest) -> IdeaResponse:
+        """Parse the model's JSON idea, falling back to plain-text parsing"""
+        return parse_idea(text, request, "anthropic", self._parse_text_response)
+    
     def _parse_text_response(self, text: str, request: IdeaRequest) -> IdeaResponse:
         """Fallback text parsing when JSON fails"""
         lines = text.split('\n')
@@ -112,191 +185,149 @@ class AnthropicIdeaProvider(IdeaProvider):
         return IdeaResponse(
             title=title,
             genre=genre,
+            tone=request.tone or "General",
             outline=text,
             characters=None,
             setting=None
         )
     
-    def _calculate_cost(self, tokens_in: int, tokens_out: int) -> float:
-        """Calculate cost based on Anthropic pricing"""
-        # Claude-3 Sonnet pricing (as of 2024)
-        if "sonnet" in self.model_name:
-            input_cost = tokens_in * 0.000003  # $0.003 per 1K tokens
-            output_cost = tokens_out * 0.000015  # $0.015 per 1K tokens
-        else:  # Claude-3 Haiku
-            input_cost = tokens_in * 0.00000025  # $0.00025 per 1K tokens
-            output_cost = tokens_out * 0.00000125  # $0.00125 per 1K tokens
-        
-        return input_cost + output_cost
-
 class AnthropicStoryProvider(StoryProvider):
+    provider_name = "anthropic"
+    temperature = 0.7
+    
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _ANTHROPIC_STORY_MODELS.get(tier, "claude-3-haiku-20240307")
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
     
-    def generate(self, request: StoryRequest) -> GenerationResult[StoryResponse]:
-        start = time.time()
-        
-        # Build system prompt for story writing
-        system_prompt = """You are a professional story writer. Write engaging, well-structured stories with proper narrative flow, character development, and satisfying conclusions."""
-        
-        # Build user prompt with optional fields
-        optional_details = []
-        if request.tone:
-            optional_details.append(f"- Tone: {request.tone}")
-        if request.characters:
-            optional_details.append(f"- Characters: {request.characters}")
-        if request.setting:
-            optional_details.append(f"- Setting: {request.setting}")
-        
-        optional_section = "\n".join(optional_details) if optional_details else ""
-        
-        user_prompt = f"""
-        Write a complete story with the following details:
-        - Title: {request.title}
-        - Genre: {request.genre}
-        - Outline: {request.outline}
-        {optional_section}
+    def _build_prompt(self, request: StoryRequest) -> Prompt:
+        """Build the prompt for story writing"""
+        return story_prompt(request)
+    
+    def _build_result(self, response, prompt: Prompt, start: float) -> GenerationResult[StoryResponse]:
+        """Turn a Messages API response into a GenerationResult"""
+        text = response.content[0].text
+        usage = resolve_usage("anthropic", from_anthropic(response.usage), prompt.text(), text)
+        tokens_in, tokens_out = usage.tokens_in, usage.tokens_out
+        latency_ms = int((time.time() - start) * 1000)
+        cost_usd = usage_cost(self.model_name, usage)
         
-        Structure the story with:
-        - Introduction and character setup
-        - Rising action and conflict
-        - Climax and resolution
-        - Proper dialogue and descriptions
+        output = StoryResponse(story=text)
         
-        Make it engaging and well-written.{" When provided, ensure the tone, characters, and setting match the details above." if optional_section else ""}
-        """
+        return GenerationResult(
+            output=output,
+            provider="anthropic",
+            model=self.model_name,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            latency_ms=latency_ms,
+            cost_usd=cost_usd,
+            usage_estimated=not usage.reported
+        )
+    
+    def generate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
         
         try:
-            response = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=2000,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
+            response = quota_governor.call(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[0].messages.create(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, prompt, start)
             
-            text = response.content[0].text
-            tokens_in = response.usage.input_tokens
-            tokens_out = response.usage.output_tokens
-            latency_ms = int((time.time() - start) * 1000)
-            
-            # Calculate cost
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
-            
-            output = StoryResponse(story=text)
-            
-            return GenerationResult(
-                output=output,
-                provider="anthropic",
-                model=self.model_name,
-                tokens_in=tokens_in,
-                tokens_out=tokens_out,
-                latency_ms=latency_ms,
-                cost_usd=cost_usd
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            raise Exception(f"Anthropic API error: {str(e)}")
+    
+    async def agenerate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        
+        try:
+            response = await quota_governor.acall(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[1].messages.create(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, prompt, start)
             
+        except QuotaExhausted:
+            raise
         except Exception as e:
             raise Exception(f"Anthropic API error: {str(e)}")
     
-    def _calculate_cost(self, tokens_in: int, tokens_out: int) -> float:
-        """Calculate cost based on Anthropic pricing"""
-        if "sonnet" in self.model_name:
-            input_cost = tokens_in * 0.000003
-            output_cost = tokens_out * 0.000015
-        else:  # Claude-3 Haiku
-            input_cost = tokens_in * 0.00000025
-            output_cost = tokens_out * 0.00000125
-        
-        return input_cost + output_cost
-
-    async def generate_streaming(self, request: StoryRequest) -> AsyncGenerator[Dict[str, Any], None]:
+    async def generate_streaming(self, request: StoryRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
         """Generate story with streaming support"""
-        start = time.time()
-        
-        # Build system prompt for story writing
-        system_prompt = """You are a professional story writer. Write engaging, well-structured stories with proper narrative flow, character development, and satisfying conclusions."""
-        
-        # Build user prompt with optional fields
-        optional_details = []
-        if request.tone:
-            optional_details.append(f"- Tone: {request.tone}")
-        if request.characters:
-            optional_details.append(f"- Characters: {request.characters}")
-        if request.setting:
-            optional_details.append(f"- Setting: {request.setting}")
-        
-        optional_section = "\n".join(optional_details) if optional_details else ""
-        
-        user_prompt = f"""
-        Write a complete story with the following details:
-        - Title: {request.title}
-        - Genre: {request.genre}
-        - Outline: {request.outline}
-        {optional_section}
-        
-        Structure the story with:
-        - Introduction and character setup
-        - Rising action and conflict
-        - Climax and resolution
-        - Proper dialogue and descriptions
-        
-        Make it engaging and well-written.{" When provided, ensure the tone, characters, and setting match the details above." if optional_section else ""}
-        """
+        timer = StreamTimer()
+        prompt = self._build_prompt(request)
         
         try:
-            # Use streaming API
-            with self.client.messages.stream(
-                model=self.model_name,
-                max_tokens=2000,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
+            # Use streaming API on the async client so the event loop is never blocked
+            async with quota_governor.astream(
+                "anthropic", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.anthropic_clients(key)[1].messages.stream(
+                    model=self.model_name,
+                    max_tokens=self.max_tokens_for(request),
+                    temperature=self.temperature,
+                    system=anthropic_system(prompt),
+                    messages=anthropic_messages(prompt),
+                    **timeout_options(timeout)
+                )
             ) as stream:
                 full_content = ""
-                tokens_in = 0
-                tokens_out = 0
                 
-                for chunk in stream.text_stream:
+                async for chunk in stream.text_stream:
                     if chunk:
+                        timer.mark_token()
                         full_content += chunk
-                        tokens_out += 1  # Rough estimate
-                        
+                
                         yield {
                             'type': 'content',
                             'content': chunk,
                             'is_final': False
                         }
-                        
-                        # Add small delay to make streaming more readable
-                        await asyncio.sleep(0.02)
                 
-                # Get final usage information
-                final_message = stream.get_final_message()
-                if hasattr(final_message, 'usage'):
-                    tokens_in = final_message.usage.input_tokens
-                    tokens_out = final_message.usage.output_tokens
+                # The final message carries the real usage for the whole stream
+                final_message = await stream.get_final_message()
+                reported = from_anthropic(getattr(final_message, 'usage', None))
             
             # Send final metadata
-            latency_ms = int((time.time() - start) * 1000)
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
+            usage = resolve_usage("anthropic", reported, prompt.text(), full_content)
+            cost_usd = usage_cost(self.model_name, usage)
             
             yield {
                 'type': 'metadata',
                 'provider': 'anthropic',
                 'model': self.model_name,
-                'tokens_in': tokens_in,
-                'tokens_out': tokens_out,
-                'latency_ms': latency_ms,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
                 'cost_usd': cost_usd,
                 'is_final': True
             }
             
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
         except Exception as e:
             yield {
                 'type': 'error',
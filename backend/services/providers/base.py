@@ -1,8 +1,20 @@
+import asyncio
 from dataclasses import dataclass
-from typing import Generic, TypeVar
+from typing import Any, Dict, Generic, Optional, TypeVar
+from schemas.story import StoryResponse
+from .tokens import estimate_request_tokens, max_output_tokens
 
 T = TypeVar("T")
 
+def timeout_options(timeout: Optional[float]) -> Dict[str, Any]:
+    """Per-call timeout for the OpenAI/Anthropic SDKs; omitted without a deadline
+    so the client's pool timeout applies (passing None would disable it)"""
+    return {"timeout": timeout} if timeout is not None else {}
+
+def gemini_request_options(timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+    """Per-call timeout for the Gemini SDK"""
+    return {"timeout": timeout} if timeout is not None else None
+
 @dataclass
 class GenerationResult(Generic[T]):
     output: T
@@ -12,11 +24,54 @@ class GenerationResult(Generic[T]):
     tokens_out: int
     latency_ms: int
     cost_usd: float
+    cached: bool = False
+    coalesced: bool = False
+    # True when the provider reported no usage and the token counts are estimates
+    usage_estimated: bool = False
 
 class IdeaProvider:
-    def generate(self, request):
+    task = "idea"
+
+    def max_tokens_for(self, request) -> int:
+        """max_tokens sized for this request, tier and model"""
+        return max_output_tokens(self.task, self.tier, self.provider_name, self.model_name, request)
+
+    def quota_tokens(self, request) -> int:
+        """Tokens a call for this request is charged against the upstream quota"""
+        return estimate_request_tokens(self.task, request, self.provider_name) + self.max_tokens_for(request)
+
+    def parse_output(self, text: str, request):
+        """Turn the model's text into an IdeaResponse (also used for batch results)"""
+        raise NotImplementedError
+
+    def generate(self, request, timeout: Optional[float] = None):
         raise NotImplementedError
 
+    async def agenerate(self, request, timeout: Optional[float] = None):
+        """Async generation. Providers without an async SDK client fall back to
+        running the blocking `generate` in a worker thread so the event loop stays free.
+        `timeout` is the seconds left of the request's deadline."""
+        return await asyncio.to_thread(self.generate, request, timeout)
+
 class StoryProvider:
-    def generate(self, request):
+    task = "story"
+
+    def max_tokens_for(self, request) -> int:
+        """max_tokens sized for this request, tier and model"""
+        return max_output_tokens(self.task, self.tier, self.provider_name, self.model_name, request)
+
+    def quota_tokens(self, request) -> int:
+        """Tokens a call for this request is charged against the upstream quota"""
+        return estimate_request_tokens(self.task, request, self.provider_name) + self.max_tokens_for(request)
+
+    def parse_output(self, text: str, request) -> StoryResponse:
+        return StoryResponse(story=text or "")
+
+    def generate(self, request, timeout: Optional[float] = None):
         raise NotImplementedError
+
+    async def agenerate(self, request, timeout: Optional[float] = None):
+        """Async generation. Providers without an async SDK client fall back to
+        running the blocking `generate` in a worker thread so the event loop stays free.
+        `timeout` is the seconds left of the request's deadline."""
+        return await asyncio.to_thread(self.generate, request, timeout)
@@ -0,0 +1,116 @@
+"""
+Circuit breakers for provider calls
+"""
+import threading
+import time
+from typing import Dict, Any, Hashable
+from .config import CIRCUIT_BREAKER_SETTINGS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised when a call is skipped because the provider's circuit is open"""
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker fed by real call outcomes.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls
+    are skipped for `recovery_timeout` seconds. It then lets up to
+    `half_open_max_calls` probe calls through; a successful probe closes it
+    again and a failed one re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = None, recovery_timeout: float = None,
+                 half_open_max_calls: int = None):
+        self.failure_threshold = failure_threshold or CIRCUIT_BREAKER_SETTINGS["failure_threshold"]
+        self.recovery_timeout = recovery_timeout or CIRCUIT_BREAKER_SETTINGS["recovery_timeout"]
+        self.half_open_max_calls = half_open_max_calls or CIRCUIT_BREAKER_SETTINGS["half_open_max_calls"]
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def is_available(self) -> bool:
+        """Whether a call could currently be attempted (does not reserve a probe)"""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                return False
+            if state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_max_calls
+            return True
+
+    def allow_request(self) -> bool:
+        """Reserve the right to make a call; half-open breakers hand out limited probes"""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                return False
+            if state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def release(self):
+        """Give back a reserved probe without recording an outcome (e.g. the call was cancelled)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes_in_flight = 0
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.time()
+                self._probes_in_flight = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "opened_at": self._opened_at or None
+            }
+
+class CircuitBreakerRegistry:
+    """One breaker per key (e.g. provider + model), created on first use"""
+
+    def __init__(self):
+        self._breakers: Dict[Hashable, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker()
+                self._breakers[key] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {str(key): breaker.get_status() for key, breaker in breakers.items()}
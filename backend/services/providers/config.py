@@ -1,13 +1,16 @@
 """
 Provider configuration and routing logic
 """
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from enum import Enum
+import json
+import os
 
 class ProviderType(Enum):
     GEMINI = "gemini"
     OPENAI = "openai"
     ANTHROPIC = "anthropic"
+    STUB = "stub"
 
 class TaskType(Enum):
     IDEA = "idea"
@@ -34,6 +37,12 @@ PROVIDER_AVAILABILITY = {
         "available": True,
         "api_key_env": "ANTHROPIC_API_KEY",
         "fallback_priority": 2
+    },
+    # Needs no key; enabled with STUB_PROVIDER_ENABLED (see STUB_PROVIDER_SETTINGS)
+    ProviderType.STUB: {
+        "available": True,
+        "api_key_env": None,
+        "fallback_priority": 4
     }
 }
 
@@ -118,20 +127,315 @@ PROVIDER_CHARACTERISTICS = {
         "cost": "medium",
         "quality": "excellent",
         "reliability": "high"
+    },
+    ProviderType.STUB: {
+        "speed": "configurable",
+        "cost": "free",
+        "quality": "placeholder",
+        "reliability": "configurable"
+    }
+}
+
+# Hedged requests: if the primary provider has not answered (or streamed its
+# first token) within the given percentile of its recent latency, the next
+# provider in fallback_order is raced against it. Enabled per tier.
+HEDGING_SETTINGS = {
+    "enabled_tiers": [t.strip() for t in os.getenv("HEDGE_ENABLED_TIERS", "").split(",") if t.strip()],
+    "min_samples": int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+    "tasks": {
+        TaskType.IDEA: {
+            "percentile": float(os.getenv("HEDGE_IDEA_PERCENTILE", "95")),
+            "default_delay_ms": 4000,
+            "min_delay_ms": 500
+        },
+        TaskType.STORY: {
+            "percentile": float(os.getenv("HEDGE_STORY_PERCENTILE", "95")),
+            "default_delay_ms": 20000,
+            "min_delay_ms": 2000,
+            "stream_default_delay_ms": 5000
+        }
+    }
+}
+
+# Adaptive routing: reorder candidates by live stats instead of the static
+# fallback_order. "metric" is one of p95_latency_ms, p50_latency_ms,
+# ewma_latency_ms or cost_per_1k_tokens; providers above the tier's cost
+# ceiling are only used after those below it. A share of requests explores a
+# random candidate so stats for every provider stay fresh.
+ADAPTIVE_ROUTING_SETTINGS = {
+    "enabled": os.getenv("ADAPTIVE_ROUTING_ENABLED", "false").lower() == "true",
+    "exploration_rate": float(os.getenv("ADAPTIVE_ROUTING_EXPLORATION_RATE", "0.1")),
+    "min_samples": int(os.getenv("ADAPTIVE_ROUTING_MIN_SAMPLES", "10")),
+    "ewma_alpha": float(os.getenv("ADAPTIVE_ROUTING_EWMA_ALPHA", "0.2")),
+    "objectives": {
+        TierType.FREE: {"metric": "p95_latency_ms", "max_cost_per_1k_tokens": 0.002},
+        TierType.PRO: {"metric": "p95_latency_ms", "max_cost_per_1k_tokens": 0.02},
+        TierType.ADMIN: {"metric": "p95_latency_ms", "max_cost_per_1k_tokens": None}
+    }
+}
+
+# Circuit breakers per provider/model, fed by real call outcomes
+CIRCUIT_BREAKER_SETTINGS = {
+    "failure_threshold": int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5")),
+    "recovery_timeout": float(os.getenv("CIRCUIT_BREAKER_RECOVERY_TIMEOUT", "30")),
+    "half_open_max_calls": int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS", "1"))
+}
+
+# Shared HTTP connection pool settings for provider SDK clients
+PROVIDER_POOL_SETTINGS = {
+    "max_connections": int(os.getenv("PROVIDER_POOL_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.getenv("PROVIDER_POOL_MAX_KEEPALIVE", "20")),
+    "keepalive_expiry": float(os.getenv("PROVIDER_POOL_KEEPALIVE_EXPIRY", "60")),
+    "timeout": float(os.getenv("PROVIDER_POOL_TIMEOUT", "600")),
+    "connect_timeout": float(os.getenv("PROVIDER_POOL_CONNECT_TIMEOUT", "5"))
+}
+
+# Streaming relay settings
+STREAMING_SETTINGS = {
+    "max_buffered_chunks": int(os.getenv("STREAM_MAX_BUFFERED_CHUNKS", "64"))
+}
+
+# Pre-flight token budgets. Prompts estimated above max_input_tokens are
+# rejected or truncated ("overflow"); max_tokens for each call is sized from
+# the request, between the task's default and the tier's max_output_tokens.
+TOKEN_BUDGET_SETTINGS = {
+    "overflow": os.getenv("TOKEN_BUDGET_OVERFLOW", "reject"),  # "reject" or "truncate"
+    "tiers": {
+        TierType.FREE: {"max_input_tokens": 4000, "max_output_tokens": 2000},
+        TierType.PRO: {"max_input_tokens": 16000, "max_output_tokens": 4000},
+        TierType.ADMIN: {"max_input_tokens": 100000, "max_output_tokens": 8000}
+    },
+    "default_output_tokens": {
+        TaskType.IDEA: 600,
+        TaskType.STORY: 2000
+    },
+    # Stories that rewrite their input (e.g. edits) get room for the input's length times this
+    "rewrite_output_ratio": 1.25,
+    "estimate_cache_size": int(os.getenv("TOKEN_ESTIMATE_CACHE_SIZE", "4096")),
+    # Optional JSONL file of (estimate, real usage) samples for calibrating the estimator
+    "samples_path": os.getenv("TOKEN_SAMPLES_PATH", ""),
+    # Samples waiting to be written; the oldest are dropped past this
+    "samples_max_pending": int(os.getenv("TOKEN_SAMPLES_MAX_PENDING", "10000"))
+}
+
+# Provider-side prompt caching of the static system prompts (see prompts.py).
+# OpenAI and Gemini 2.5 cache repeated prefixes implicitly; Anthropic needs an
+# explicit cache_control breakpoint.
+PROMPT_CACHE_SETTINGS = {
+    "anthropic_cache_control": os.getenv("PROMPT_CACHE_ANTHROPIC", "true").lower() == "true"
+}
+
+# Structured output for ideas: providers listed here are asked for JSON that
+# matches the idea schema (OpenAI response_format, Anthropic tool use, Gemini
+# response_schema) instead of following format instructions in the prompt.
+STRUCTURED_OUTPUT_SETTINGS = {
+    "providers": [p.strip() for p in os.getenv("STRUCTURED_OUTPUT_PROVIDERS", "openai,anthropic,gemini").split(",") if p.strip()]
+}
+
+# Request deadlines: each route gets an SLO in seconds, scaled per tier
+# (larger models are slower). Clients may ask for a different budget with the
+# X-Request-Timeout header (seconds), clamped to [min_seconds, the tier's
+# max_seconds]. The deadline bounds every provider call made for the request.
+DEADLINE_SETTINGS = {
+    "enabled": os.getenv("DEADLINES_ENABLED", "true").lower() == "true",
+    "header": "X-Request-Timeout",
+    "min_seconds": float(os.getenv("DEADLINE_MIN_SECONDS", "1")),
+    "default_seconds": float(os.getenv("DEADLINE_DEFAULT_SECONDS", "60")),
+    "routes": {
+        "idea:generate": 20,
+        "story:write": 90,
+        "story:edit": 90,
+        "workflow:full": 150,
+        "orchestrated_workflow": 180,
+        "full_story_orchestrated": 180,
+        "idea_only_orchestrated": 30,
+        "workflow_resume": 180,
+        # Background jobs are not bound by HTTP timeouts; the tier's max_seconds still applies
+        "workflow_job": 600
+    },
+    "tiers": {
+        TierType.FREE: {"multiplier": 1.0, "max_seconds": 180},
+        TierType.PRO: {"multiplier": 1.5, "max_seconds": 300},
+        TierType.ADMIN: {"multiplier": 2.0, "max_seconds": 600}
+    },
+    # Skip providers whose recent p50 latency is above the remaining budget,
+    # once they have at least this many samples
+    "min_samples": int(os.getenv("DEADLINE_MIN_SAMPLES", "10"))
+}
+
+# Upstream quota governor: per provider and API key, calls are admitted against
+# the contracted requests/tokens per minute (seeded here, then replaced by the
+# limits the provider reports in its rate-limit headers). `headroom` keeps us
+# just under the limit; calls wait up to `max_wait_seconds` for budget and are
+# shed after that. Transient failures (429, 5xx, connection errors) are retried
+# with exponential backoff and jitter, honouring Retry-After.
+QUOTA_SETTINGS = {
+    "enabled": os.getenv("QUOTA_GOVERNOR_ENABLED", "true").lower() == "true",
+    "redis_enabled": os.getenv("QUOTA_GOVERNOR_REDIS", "true").lower() == "true",
+    "headroom": float(os.getenv("QUOTA_HEADROOM", "0.9")),
+    "max_wait_seconds": float(os.getenv("QUOTA_MAX_WAIT_SECONDS", "10")),
+    "max_retries": int(os.getenv("QUOTA_MAX_RETRIES", "3")),
+    "backoff_base_seconds": float(os.getenv("QUOTA_BACKOFF_BASE_SECONDS", "0.5")),
+    "backoff_max_seconds": float(os.getenv("QUOTA_BACKOFF_MAX_SECONDS", "20")),
+    "limits": {
+        "openai": {
+            "rpm": int(os.getenv("OPENAI_RPM_LIMIT", "500")),
+            "tpm": int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+        },
+        "anthropic": {
+            "rpm": int(os.getenv("ANTHROPIC_RPM_LIMIT", "50")),
+            "tpm": int(os.getenv("ANTHROPIC_TPM_LIMIT", "50000"))
+        },
+        "gemini": {
+            "rpm": int(os.getenv("GEMINI_RPM_LIMIT", "60")),
+            "tpm": int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+        },
+        # High enough not to throttle load tests; lower them to exercise admission
+        "stub": {
+            "rpm": int(os.getenv("STUB_RPM_LIMIT", "1000000")),
+            "tpm": int(os.getenv("STUB_TPM_LIMIT", "1000000000"))
+        }
+    },
+    "key_prefix": "quota:v1:"
+}
+
+def _api_key_pool(provider: str) -> List[Dict[str, Any]]:
+    """API keys for a provider: <PROVIDER>_API_KEY_POOL, a JSON list of
+    {"alias", "key", "organization", "project", "weight"} objects, else the
+    single <PROVIDER>_API_KEY as the "default" key (the stub needs no real key)"""
+    raw = os.getenv(f"{provider.upper()}_API_KEY_POOL")
+    if raw:
+        try:
+            entries = json.loads(raw)
+            return [
+                {
+                    "alias": entry.get("alias") or f"key{i + 1}",
+                    "key": entry["key"],
+                    "organization": entry.get("organization"),
+                    "project": entry.get("project"),
+                    "weight": max(1, int(entry.get("weight", 1)))
+                }
+                for i, entry in enumerate(entries) if entry.get("key")
+            ]
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"Warning: ignoring invalid {provider.upper()}_API_KEY_POOL: {e}")
+    key = os.getenv(f"{provider.upper()}_API_KEY")
+    if provider == ProviderType.STUB.value and os.getenv("STUB_PROVIDER_ENABLED", "false").lower() == "true":
+        key = key or "stub"
+    return [{"alias": "default", "key": key, "organization": None, "project": None, "weight": 1}] if key else []
+
+# API key pools per provider. Each call picks a key by `strategy`
+# ("least_loaded": fewest in-flight calls per unit of weight, or
+# "weighted_round_robin"), skipping keys without upstream quota for it. Keys
+# that fail authentication or run out of billing quota are ejected for a while.
+API_KEY_POOL_SETTINGS = {
+    "strategy": os.getenv("API_KEY_POOL_STRATEGY", "least_loaded"),
+    "auth_eject_seconds": float(os.getenv("API_KEY_AUTH_EJECT_SECONDS", "600")),
+    "quota_eject_seconds": float(os.getenv("API_KEY_QUOTA_EJECT_SECONDS", "300")),
+    "pools": {provider.value: _api_key_pool(provider.value) for provider in ProviderType}
+}
+
+def api_keys_configured(provider: str) -> bool:
+    """Whether a provider has at least one API key"""
+    return bool(API_KEY_POOL_SETTINGS["pools"].get(provider))
+
+# Latency and failure profiles for the stub provider. Time to first token is
+# drawn from `distribution`: "fixed" (always median_ms), "lognormal" (median_ms,
+# spread sigma) or "heavy_tail" (lognormal, with tail_probability of a call
+# taking tail_multiplier times longer). Output then arrives at tokens_per_second.
+STUB_PROVIDER_PROFILES = {
+    "fast": {
+        "distribution": "fixed", "median_ms": 5, "sigma": 0.0, "tail_probability": 0.0, "tail_multiplier": 1,
+        "tokens_per_second": 5000, "error_rate": 0.0, "timeout_rate": 0.0, "rate_limit_rate": 0.0,
+        "insufficient_quota_rate": 0.0, "shed_rate": 0.0
+    },
+    "realistic": {
+        "distribution": "lognormal", "median_ms": 400, "sigma": 0.5, "tail_probability": 0.0, "tail_multiplier": 1,
+        "tokens_per_second": 80, "error_rate": 0.005, "timeout_rate": 0.0, "rate_limit_rate": 0.0,
+        "insufficient_quota_rate": 0.0, "shed_rate": 0.0
+    },
+    "heavy_tail": {
+        "distribution": "heavy_tail", "median_ms": 400, "sigma": 0.6, "tail_probability": 0.02, "tail_multiplier": 25,
+        "tokens_per_second": 80, "error_rate": 0.01, "timeout_rate": 0.005, "rate_limit_rate": 0.0,
+        "insufficient_quota_rate": 0.0, "shed_rate": 0.0
+    },
+    "flaky": {
+        "distribution": "lognormal", "median_ms": 400, "sigma": 0.5, "tail_probability": 0.0, "tail_multiplier": 1,
+        "tokens_per_second": 80, "error_rate": 0.2, "timeout_rate": 0.05, "rate_limit_rate": 0.1,
+        "insufficient_quota_rate": 0.0, "shed_rate": 0.0
+    },
+    # Calls the quota governor has already given up on, to test shedding and failover
+    "quota_shed": {
+        "distribution": "lognormal", "median_ms": 400, "sigma": 0.5, "tail_probability": 0.0, "tail_multiplier": 1,
+        "tokens_per_second": 80, "error_rate": 0.0, "timeout_rate": 0.0, "rate_limit_rate": 0.0,
+        "insufficient_quota_rate": 0.0, "shed_rate": 0.2
     }
 }
 
+_STUB_PROFILE = STUB_PROVIDER_PROFILES.get(os.getenv("STUB_PROVIDER_PROFILE", "realistic"), STUB_PROVIDER_PROFILES["realistic"])
+
+# Deterministic stub provider for load tests, failover tests and CI, with no
+# API keys or network. `routing` puts it in front of the real providers
+# ("primary"), behind them ("fallback") or in their place ("only"). Replies are
+# derived from the request, so the same request always gets the same text;
+# latency and injected failures come from a generator seeded with `seed`. Calls
+# go through the quota governor like a real provider's, so injected 429s (with
+# Retry-After, or insufficient_quota to eject the key) are retried there, and
+# 5xx errors too; `shed` fails as a call the governor has already given up on.
+# Any profile value can be overridden by env.
+STUB_PROVIDER_SETTINGS = {
+    "enabled": os.getenv("STUB_PROVIDER_ENABLED", "false").lower() == "true",
+    "routing": os.getenv("STUB_PROVIDER_ROUTING", "only"),
+    "model": "stub-1",
+    "seed": int(os.getenv("STUB_PROVIDER_SEED", "0")),
+    "distribution": os.getenv("STUB_LATENCY_DISTRIBUTION", _STUB_PROFILE["distribution"]),
+    "median_ms": float(os.getenv("STUB_LATENCY_MEDIAN_MS", _STUB_PROFILE["median_ms"])),
+    "sigma": float(os.getenv("STUB_LATENCY_SIGMA", _STUB_PROFILE["sigma"])),
+    "tail_probability": float(os.getenv("STUB_LATENCY_TAIL_PROBABILITY", _STUB_PROFILE["tail_probability"])),
+    "tail_multiplier": float(os.getenv("STUB_LATENCY_TAIL_MULTIPLIER", _STUB_PROFILE["tail_multiplier"])),
+    "tokens_per_second": float(os.getenv("STUB_TOKENS_PER_SECOND", _STUB_PROFILE["tokens_per_second"])),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", _STUB_PROFILE["error_rate"])),
+    "timeout_rate": float(os.getenv("STUB_TIMEOUT_RATE", _STUB_PROFILE["timeout_rate"])),
+    "rate_limit_rate": float(os.getenv("STUB_RATE_LIMIT_RATE", _STUB_PROFILE["rate_limit_rate"])),
+    "insufficient_quota_rate": float(os.getenv("STUB_INSUFFICIENT_QUOTA_RATE", _STUB_PROFILE["insufficient_quota_rate"])),
+    "shed_rate": float(os.getenv("STUB_SHED_RATE", _STUB_PROFILE["shed_rate"])),
+    # How long a hung call blocks (unless the request's deadline ends it first)
+    "timeout_seconds": float(os.getenv("STUB_TIMEOUT_SECONDS", "30")),
+    "retry_after_seconds": float(os.getenv("STUB_RETRY_AFTER_SECONDS", "1")),
+    # Story length: this many tokens plus the outline's, up to the call's max_tokens
+    "story_tokens": int(os.getenv("STUB_STORY_TOKENS", "600"))
+}
+
+def provider_configured(provider: str) -> bool:
+    """Whether a provider can be used: it has an API key, or it is the enabled stub"""
+    if provider == ProviderType.STUB.value:
+        return STUB_PROVIDER_SETTINGS["enabled"]
+    return api_keys_configured(provider)
+
+def _with_stub(config: Dict) -> Dict:
+    """A task/tier configuration with the stub provider routed in per STUB_PROVIDER_SETTINGS"""
+    stub = ProviderType.STUB
+    models = {**config.get("models", {}), stub: STUB_PROVIDER_SETTINGS["model"]}
+    routing = STUB_PROVIDER_SETTINGS["routing"]
+    if routing == "only":
+        return {"primary": stub, "models": models, "fallback_order": [stub]}
+    if routing == "primary":
+        return {"primary": stub, "models": models, "fallback_order": [stub] + config.get("fallback_order", [])}
+    return {**config, "models": models, "fallback_order": config.get("fallback_order", []) + [stub]}
+
 def get_provider_config(task: TaskType, tier: TierType) -> Dict:
     """Get provider configuration for a specific task and tier"""
-    return MODEL_CONFIGURATIONS.get(task, {}).get(tier, {})
+    config = MODEL_CONFIGURATIONS.get(task, {}).get(tier, {})
+    if config and STUB_PROVIDER_SETTINGS["enabled"]:
+        return _with_stub(config)
+    return config
 
 def get_available_providers() -> List[ProviderType]:
     """Get list of available providers based on API key availability"""
-    import os
     available = []
     
     for provider, config in PROVIDER_AVAILABILITY.items():
-        if config["available"] and os.getenv(config["api_key_env"]):
+        if config["available"] and provider_configured(provider.value):
             available.append(provider)
     
     return available
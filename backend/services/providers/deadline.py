@@ -0,0 +1,81 @@
+"""
+End-to-end request deadlines
+
+A Deadline is fixed when a request arrives (from the route's SLO or the
+client's X-Request-Timeout header) and travels with it through the
+orchestrator and router, so each provider call is given only the time that
+is left instead of hanging until the connection gives up.
+"""
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+from metrics.prom import record_deadline_exceeded
+from .config import DEADLINE_SETTINGS, TierType
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its deadline"""
+
+    def __init__(self, stage: str, budget_ms: int):
+        self.stage = stage
+        self.budget_ms = budget_ms
+        super().__init__(f"Request deadline of {budget_ms}ms exceeded ({stage})")
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget_ms = int(seconds * 1000)
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def exceeded(self, task: str, stage: str) -> DeadlineExceeded:
+        """A DeadlineExceeded for this deadline, recorded in metrics"""
+        try:
+            record_deadline_exceeded(task, stage)
+        except Exception as e:
+            print(f"Failed to record deadline metric: {e}")
+        return DeadlineExceeded(stage, self.budget_ms)
+
+    def check(self, task: str, stage: str):
+        """Raise DeadlineExceeded if no time is left"""
+        if self.expired():
+            raise self.exceeded(task, stage)
+
+def deadline_for(route_key: str, tier: str, header_value: Optional[str] = None) -> Optional[Deadline]:
+    """The deadline for a request on a route: the client's X-Request-Timeout if
+    given (clamped to the tier's limits), else the route's SLO for the tier"""
+    if not DEADLINE_SETTINGS["enabled"]:
+        return None
+    try:
+        tier_settings = DEADLINE_SETTINGS["tiers"][TierType((tier or "free").lower())]
+    except ValueError:
+        tier_settings = DEADLINE_SETTINGS["tiers"][TierType.FREE]
+
+    seconds = None
+    if header_value:
+        try:
+            seconds = float(header_value)
+        except ValueError:
+            print(f"Warning: ignoring invalid {DEADLINE_SETTINGS['header']} header: {header_value!r}")
+    if seconds is None:
+        route_seconds = DEADLINE_SETTINGS["routes"].get(route_key, DEADLINE_SETTINGS["default_seconds"])
+        seconds = route_seconds * tier_settings["multiplier"]
+    return Deadline(min(max(seconds, DEADLINE_SETTINGS["min_seconds"]), tier_settings["max_seconds"]))
+
+async def within(deadline: Optional[Deadline], awaitable: Awaitable[T], task: str, stage: str) -> T:
+    """Await with the deadline's remaining time as a timeout"""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise deadline.exceeded(task, stage)
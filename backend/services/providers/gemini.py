@@ -1,9 +1,26 @@
 import time
-import os
 import google.generativeai as genai
+from typing import Dict, Any, AsyncGenerator, Optional
 from schemas.idea import IdeaRequest, IdeaResponse
 from schemas.story import StoryRequest, StoryResponse
-from .base import GenerationResult, IdeaProvider, StoryProvider
+from .base import GenerationResult, IdeaProvider, StoryProvider, gemini_request_options
+from .config import api_keys_configured
+from .keys import ApiKey
+from .pool import client_pool
+from .quota import QuotaExhausted, quota_governor
+from .streaming import StreamTimer
+from .pricing import usage_cost
+from .prompts import Prompt, idea_prompt, idea_system_prompt, story_prompt, STORY_SYSTEM_PROMPT
+from .structured import IdeaStream, gemini_generation_config, parse_idea
+from .usage import from_gemini, resolve_usage
+
+def _keyed_model(model_name: str, system_instruction: str, key: ApiKey) -> genai.GenerativeModel:
+    """A GenerativeModel that calls Gemini with a pooled API key"""
+    model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    # genai.configure holds a single process-global key; the model only falls back
+    # to it when these (private, as of google-generativeai 0.7) clients are unset
+    model._client, model._async_client = client_pool.gemini_clients(key)
+    return model
 
 _DEFAULT_IDEA_MODEL = {
     "free": "gemini-2.5-flash",
@@ -15,45 +32,116 @@ _DEFAULT_STORY_MODEL = {
 }
 
 class GeminiIdeaProvider(IdeaProvider):
+    provider_name = "gemini"
+
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _DEFAULT_IDEA_MODEL.get(tier, "gemini-2.5-flash")
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_keys_configured("gemini"):
             raise ValueError("GEMINI_API_KEY is not set")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(self.model_name)
+        # The static instructions go in the system instruction, a prefix Gemini caches implicitly
+        self.system_instruction = idea_system_prompt("gemini")
 
-    def generate(self, request: IdeaRequest) -> GenerationResult[IdeaResponse]:
-        start = time.time()
-        prompt = f"""Create a story idea based on: "{request.prompt}"
+    def _build_prompt(self, request: IdeaRequest) -> Prompt:
+        """Build the idea prompt"""
+        return idea_prompt(request, "gemini")
 
-IMPORTANT: Respond ONLY in this exact format (no JSON, no markdown, no code blocks):
+    def _generation_config(self, request: IdeaRequest) -> Dict[str, Any]:
+        return {"max_output_tokens": self.max_tokens_for(request), **gemini_generation_config()}
 
-Title: [Story Title Here]
-Genre: {request.genre or 'Fantasy'}
-Tone: {request.tone or 'Adventurous'}
-Outline: [Brief 2-3 sentence story summary]
-Characters:
-[Character Name 1]
-[Character Name 2]
-[Character Name 3]
-Setting: [Brief description of the main setting]
-
-Do not use JSON format. Do not use code blocks. Just plain text with the exact format above."""
-        
-        resp = self.model.generate_content(prompt)
+    def _build_result(self, resp, prompt: Prompt, request: IdeaRequest, start: float) -> GenerationResult[IdeaResponse]:
+        """Turn a Gemini response into a GenerationResult"""
         text = getattr(resp, 'text', None) or ""
-        # naive token approximation
-        tokens_in = max(1, len(prompt.split())//0.75)
-        tokens_out = max(1, len(text.split())//0.75) if text else 200
+        usage = resolve_usage("gemini", from_gemini(getattr(resp, 'usage_metadata', None)), prompt.text(), text)
         latency_ms = int((time.time() - start) * 1000)
-        # rough cost estimate (set to 0 for now)
-        cost_usd = 0.0
+        cost_usd = usage_cost(self.model_name, usage)
         
-        # Parse the structured text response
-        output = self._parse_structured_response(text, request)
-        return GenerationResult(output=output, provider="gemini", model=self.model_name, tokens_in=int(tokens_in), tokens_out=int(tokens_out), latency_ms=latency_ms, cost_usd=cost_usd)
+        output = self.parse_output(text, request)
+        return GenerationResult(output=output, provider="gemini", model=self.model_name, tokens_in=usage.tokens_in, tokens_out=usage.tokens_out, latency_ms=latency_ms, cost_usd=cost_usd, usage_estimated=not usage.reported)
+
+    def generate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        resp = quota_governor.call(
+            "gemini", self.quota_tokens(request), timeout,
+            lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content(
+                prompt.user, generation_config=self._generation_config(request),
+                request_options=gemini_request_options(timeout)
+            )
+        )
+        return self._build_result(resp, prompt, request, start)
+
+    async def agenerate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        resp = await quota_governor.acall(
+            "gemini", self.quota_tokens(request), timeout,
+            lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content_async(
+                prompt.user, generation_config=self._generation_config(request),
+                request_options=gemini_request_options(timeout)
+            )
+        )
+        return self._build_result(resp, prompt, request, start)
+    
+    async def generate_streaming(self, request: IdeaRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream an idea, emitting each field as soon as it is complete"""
+        timer = StreamTimer()
+        prompt = self._build_prompt(request)
+        idea_stream = IdeaStream(request, self.parse_output)
+        
+        try:
+            async with quota_governor.astream(
+                "gemini", self.quota_tokens(request), timeout,
+                lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content_async(
+                    prompt.user, generation_config=self._generation_config(request), stream=True,
+                    request_options=gemini_request_options(timeout)
+                )
+            ) as response:
+                reported = None
+                async for chunk in response:
+                    try:
+                        content = chunk.text
+                    except ValueError:
+                        content = ""
+                    
+                    if content:
+                        timer.mark_token()
+                        for event in idea_stream.feed(content):
+                            yield event
+                    reported = from_gemini(getattr(chunk, 'usage_metadata', None)) or reported
+            
+            for event in idea_stream.finish():
+                yield event
+            
+            usage = resolve_usage("gemini", reported, prompt.text(), idea_stream.text)
+            yield {
+                'type': 'metadata',
+                'provider': 'gemini',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+            
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
+        except Exception as e:
+            yield {
+                'type': 'error',
+                'error': f"Gemini streaming API error: {str(e)}"
+            }
+    
+    def parse_output(self, text: str, request: IdeaRequest) -> IdeaResponse:
+        """Parse the JSON idea, falling back to the plain-text format"""
+        return parse_idea(text, request, "gemini", self._parse_structured_response)
     
     def _parse_structured_response(self, text: str, request: IdeaRequest) -> IdeaResponse:
         """Parse a structured text response into IdeaResponse"""
@@ -128,46 +216,113 @@ Do not use JSON format. Do not use code blocks. Just plain text with the exact f
         )
 
 class GeminiStoryProvider(StoryProvider):
+    provider_name = "gemini"
+
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _DEFAULT_STORY_MODEL.get(tier, "gemini-2.5-flash")
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_keys_configured("gemini"):
             raise ValueError("GEMINI_API_KEY is not set")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(self.model_name)
+        self.system_instruction = STORY_SYSTEM_PROMPT
 
-    def generate(self, request: StoryRequest) -> GenerationResult[StoryResponse]:
-        start = time.time()
-        
-        # Build prompt with optional fields
-        prompt_parts = [
-            "You are a professional story writer.",
-            f"Title: {request.title}",
-            f"Genre: {request.genre}",
-            f"Outline: {request.outline}"
-        ]
-        
-        if request.tone:
-            prompt_parts.append(f"Tone: {request.tone}")
-        if request.characters:
-            prompt_parts.append(f"Characters: {request.characters}")
-        if request.setting:
-            prompt_parts.append(f"Setting: {request.setting}")
-        
-        prompt_parts.append("Write a structured story with proper narrative flow, character development, and satisfying conclusion.")
-        
-        if request.tone or request.characters or request.setting:
-            prompt_parts.append("Ensure the story matches the provided tone, characters, and setting details above.")
-        
-        prompt = "\n".join(prompt_parts)
-        
-        resp = self.model.generate_content(prompt)
+    def _build_prompt(self, request: StoryRequest) -> Prompt:
+        """Build the plain-text story prompt"""
+        return story_prompt(request)
+
+    def _generation_config(self, request: StoryRequest) -> Dict[str, Any]:
+        return {"max_output_tokens": self.max_tokens_for(request)}
+
+    def _build_result(self, resp, prompt: Prompt, start: float) -> GenerationResult[StoryResponse]:
+        """Turn a Gemini response into a GenerationResult"""
         text = getattr(resp, 'text', None) or ""
-        tokens_in = max(1, len(prompt.split())//0.75)
-        tokens_out = max(1, len(text.split())//0.75) if text else 1200
+        usage = resolve_usage("gemini", from_gemini(getattr(resp, 'usage_metadata', None)), prompt.text(), text)
         latency_ms = int((time.time() - start) * 1000)
-        cost_usd = 0.0
-        from schemas.story import StoryResponse
+        cost_usd = usage_cost(self.model_name, usage)
         output = StoryResponse(story=text or "")
-        return GenerationResult(output=output, provider="gemini", model=self.model_name, tokens_in=int(tokens_in), tokens_out=int(tokens_out), latency_ms=latency_ms, cost_usd=cost_usd)
+        return GenerationResult(output=output, provider="gemini", model=self.model_name, tokens_in=usage.tokens_in, tokens_out=usage.tokens_out, latency_ms=latency_ms, cost_usd=cost_usd, usage_estimated=not usage.reported)
+
+    def generate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        resp = quota_governor.call(
+            "gemini", self.quota_tokens(request), timeout,
+            lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content(
+                prompt.user, generation_config=self._generation_config(request),
+                request_options=gemini_request_options(timeout)
+            )
+        )
+        return self._build_result(resp, prompt, start)
+
+    async def agenerate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        prompt = self._build_prompt(request)
+        resp = await quota_governor.acall(
+            "gemini", self.quota_tokens(request), timeout,
+            lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content_async(
+                prompt.user, generation_config=self._generation_config(request),
+                request_options=gemini_request_options(timeout)
+            )
+        )
+        return self._build_result(resp, prompt, start)
+
+    async def generate_streaming(self, request: StoryRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Generate story with native Gemini streaming"""
+        timer = StreamTimer()
+        prompt = self._build_prompt(request)
+        
+        try:
+            async with quota_governor.astream(
+                "gemini", self.quota_tokens(request), timeout,
+                lambda key, timeout: _keyed_model(self.model_name, self.system_instruction, key).generate_content_async(
+                    prompt.user, generation_config=self._generation_config(request), stream=True,
+                    request_options=gemini_request_options(timeout)
+                )
+            ) as response:
+                full_content = ""
+                reported = None
+                
+                async for chunk in response:
+                    try:
+                        content = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. safety or finish-only chunks)
+                        content = ""
+                    
+                    if content:
+                        timer.mark_token()
+                        full_content += content
+                        yield {
+                            'type': 'content',
+                            'content': content,
+                            'is_final': False
+                        }
+                    
+                    # Gemini reports cumulative usage on each chunk, so the last one wins
+                    reported = from_gemini(getattr(chunk, 'usage_metadata', None)) or reported
+            
+            usage = resolve_usage("gemini", reported, prompt.text(), full_content)
+            
+            yield {
+                'type': 'metadata',
+                'provider': 'gemini',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+            
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
+        except Exception as e:
+            yield {
+                'type': 'error',
+                'error': f"Gemini streaming API error: {str(e)}"
+            }
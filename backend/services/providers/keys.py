@@ -0,0 +1,189 @@
+"""
+API key pools
+
+Each provider can have several API keys (optionally with their own OpenAI
+organisation/project), so upstream throughput grows with the number of keys
+instead of being capped by one key's quota. Calls are spread over the healthy
+keys by weighted round-robin or least-loaded selection; keys that fail
+authentication or run out of billing quota are ejected for a while.
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+from metrics.prom import record_api_key_request, record_api_key_in_flight, record_api_key_ejected
+from .config import API_KEY_POOL_SETTINGS
+
+# Errors that mean the key itself is unusable rather than the request or provider failing
+_AUTH_STATUSES = (401, 403)
+_QUOTA_ERROR_CODES = ("insufficient_quota", "billing_hard_limit_reached")
+
+def key_id(api_key: Optional[str]) -> str:
+    """Short hash identifying an API key without storing it"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+@dataclass
+class ApiKey:
+    alias: str
+    key: str = field(repr=False)
+    organization: Optional[str] = None
+    project: Optional[str] = None
+    weight: int = 1
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    ejected_until: float = 0.0
+    ejected_reason: Optional[str] = None
+    # Smooth weighted round-robin state
+    current_weight: int = 0
+
+    @property
+    def id(self) -> str:
+        return key_id(self.key)
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+def _ejection_reason(error: Exception) -> Optional[str]:
+    """"auth" or "quota" when an error means the key should leave rotation"""
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        # google.api_core errors carry the HTTP status as `code`
+        status = error.code
+    if status in _AUTH_STATUSES:
+        return "auth"
+    if status == 429 and getattr(error, "code", None) in _QUOTA_ERROR_CODES:
+        return "quota"
+    return None
+
+class KeyPool:
+    """The API keys of one provider, with per-key health and load"""
+
+    def __init__(self, provider: str, keys: List[ApiKey], settings: Dict[str, Any] = None):
+        self.provider = provider
+        self.keys = keys
+        self.settings = settings or API_KEY_POOL_SETTINGS
+        self._lock = threading.Lock()
+
+    def candidates(self) -> List[ApiKey]:
+        """Healthy keys in the order they should be tried"""
+        now = time.time()
+        with self._lock:
+            healthy = [k for k in self.keys if k.healthy(now)]
+            if len(healthy) < 2:
+                return healthy
+            if self.settings["strategy"] == "weighted_round_robin":
+                total = sum(k.weight for k in healthy)
+                for k in healthy:
+                    k.current_weight += k.weight
+                chosen = max(healthy, key=lambda k: k.current_weight)
+                chosen.current_weight -= total
+                return [chosen] + sorted((k for k in healthy if k is not chosen),
+                                         key=lambda k: k.current_weight, reverse=True)
+            return sorted(healthy, key=lambda k: (k.in_flight / k.weight, -k.weight))
+
+    def healthy_count(self) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for k in self.keys if k.healthy(now))
+
+    def soonest_return(self) -> float:
+        """Seconds until the first ejected key is back in rotation"""
+        now = time.time()
+        with self._lock:
+            return max(0.0, min((k.ejected_until for k in self.keys), default=now) - now)
+
+    def primary(self) -> Optional[ApiKey]:
+        """The first configured key, for work that must stay on one key (e.g. batch jobs)"""
+        return self.keys[0] if self.keys else None
+
+    @contextmanager
+    def lease(self, key: ApiKey) -> Iterator[ApiKey]:
+        """Track a call on `key`; errors that mean the key is unusable eject it"""
+        with self._lock:
+            key.in_flight += 1
+            key.requests += 1
+        self._record_in_flight(key)
+        try:
+            yield key
+        except Exception as e:
+            with self._lock:
+                key.failures += 1
+            reason = _ejection_reason(e)
+            if reason is not None:
+                self.eject(key, reason)
+            self._record_request(key, "error")
+            raise
+        else:
+            self._record_request(key, "success")
+        finally:
+            with self._lock:
+                key.in_flight -= 1
+            self._record_in_flight(key)
+
+    def eject(self, key: ApiKey, reason: str):
+        seconds = self.settings[f"{reason}_eject_seconds"]
+        with self._lock:
+            key.ejected_until = time.time() + seconds
+            key.ejected_reason = reason
+        print(f"⚠️ Ejecting {self.provider} API key '{key.alias}' for {seconds:.0f}s ({reason})")
+        try:
+            record_api_key_ejected(self.provider, key.alias, reason)
+        except Exception as e:
+            print(f"Failed to record API key metric: {e}")
+
+    def _record_request(self, key: ApiKey, outcome: str):
+        try:
+            record_api_key_request(self.provider, key.alias, outcome)
+        except Exception as e:
+            print(f"Failed to record API key metric: {e}")
+
+    def _record_in_flight(self, key: ApiKey):
+        try:
+            record_api_key_in_flight(self.provider, key.alias, key.in_flight)
+        except Exception as e:
+            print(f"Failed to record API key metric: {e}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "alias": k.alias,
+                    "weight": k.weight,
+                    "in_flight": k.in_flight,
+                    "requests": k.requests,
+                    "failures": k.failures,
+                    "healthy": k.healthy(now),
+                    "ejected_reason": k.ejected_reason if not k.healthy(now) else None,
+                    "ejected_for_seconds": round(max(0.0, k.ejected_until - now), 1)
+                }
+                for k in self.keys
+            ]
+
+class KeyPools:
+    """Key pools for every provider, built from API_KEY_POOL_SETTINGS"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or API_KEY_POOL_SETTINGS
+        self._pools = {
+            provider: KeyPool(provider, [ApiKey(**entry) for entry in entries], self.settings)
+            for provider, entries in self.settings["pools"].items()
+        }
+
+    def get(self, provider: str) -> KeyPool:
+        pool = self._pools.get(provider)
+        if pool is None:
+            pool = self._pools[provider] = KeyPool(provider, [], self.settings)
+        return pool
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.settings["strategy"],
+            "pools": {provider: pool.snapshot() for provider, pool in self._pools.items() if pool.keys}
+        }
+
+# Global instance
+key_pools = KeyPools()
@@ -1,12 +1,15 @@
-import os
 import time
-import openai
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, Optional
 from schemas.idea import IdeaRequest, IdeaResponse
 from schemas.story import StoryRequest, StoryResponse
-from .base import GenerationResult, IdeaProvider, StoryProvider
-import json
-import asyncio
+from .base import GenerationResult, IdeaProvider, StoryProvider, timeout_options
+from .pool import client_pool
+from .quota import QuotaExhausted, quota_governor
+from .streaming import StreamTimer
+from .pricing import usage_cost
+from .prompts import idea_prompt, story_prompt, openai_messages
+from .structured import IdeaStream, openai_response_format, parse_idea
+from .usage import from_openai, resolve_usage
 
 # OpenAI model configurations by tier
 _OPENAI_IDEA_MODELS = {
@@ -22,81 +25,146 @@ _OPENAI_STORY_MODELS = {
 }
 
 class OpenAIIdeaProvider(IdeaProvider):
+    provider_name = "openai"
+    temperature = 0.8
+    
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _OPENAI_IDEA_MODELS.get(tier, "gpt-3.5-turbo")
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     
-    def generate(self, request: IdeaRequest) -> GenerationResult[IdeaResponse]:
-        start = time.time()
-        
-        # Build system prompt for idea generation
-        system_prompt = """You are a creative story idea generator. Generate compelling story ideas based on user prompts.
-        Return your response as JSON with the following structure:
-        {
-            "title": "Story Title Here",
-            "genre": "Genre Here", 
-            "outline": "Detailed outline here...",
-            "characters": "Character descriptions here...",
-            "setting": "Setting description here..."
-        }"""
+    def _build_messages(self, request: IdeaRequest) -> list:
+        """Build chat messages for idea generation"""
+        return openai_messages(idea_prompt(request, "openai"))
+    
+    def _structured_options(self) -> Dict[str, Any]:
+        response_format = openai_response_format(self.model_name)
+        return {"response_format": response_format} if response_format else {}
+    
+    def _build_result(self, response, request: IdeaRequest, start: float) -> GenerationResult[IdeaResponse]:
+        """Turn a chat completion into a GenerationResult"""
+        text = response.choices[0].message.content
+        usage = resolve_usage("openai", from_openai(response.usage), idea_prompt(request, "openai").text(), text)
+        tokens_in, tokens_out = usage.tokens_in, usage.tokens_out
+        latency_ms = int((time.time() - start) * 1000)
+        cost_usd = usage_cost(self.model_name, usage)
         
-        # Build user prompt
-        user_prompt = f"""
-        Generate a story idea based on:
-        - Prompt: {request.prompt}
-        - Genre: {request.genre or 'Any genre'}
-        - Tone: {request.tone or 'Any tone'}
+        output = self.parse_output(text, request)
         
-        Make it creative, engaging, and well-structured.
-        """
+        return GenerationResult(
+            output=output,
+            provider="openai",
+            model=self.model_name,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            latency_ms=latency_ms,
+            cost_usd=cost_usd,
+            usage_estimated=not usage.reported
+        )
+    
+    def generate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.8,
-                max_tokens=1000
+            response = quota_governor.call(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[0].chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(request),
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    **self._structured_options(),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, request, start)
             
-            text = response.choices[0].message.content
-            tokens_in = response.usage.prompt_tokens
-            tokens_out = response.usage.completion_tokens
-            latency_ms = int((time.time() - start) * 1000)
-            
-            # Calculate cost (rough estimates)
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
-            
-            # Parse JSON response
-            try:
-                idea_data = json.loads(text)
-                output = IdeaResponse(
-                    title=idea_data.get("title", "Untitled Story"),
-                    genre=idea_data.get("genre", request.genre or "General"),
-                    outline=idea_data.get("outline", "No outline provided"),
-                    characters=idea_data.get("characters"),
-                    setting=idea_data.get("setting")
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    async def agenerate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        
+        try:
+            response = await quota_governor.acall(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[1].chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(request),
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    **self._structured_options(),
+                    **timeout_options(timeout)
                 )
-            except json.JSONDecodeError:
-                # Fallback parsing
-                output = self._parse_text_response(text, request)
-            
-            return GenerationResult(
-                output=output,
-                provider="openai",
-                model=self.model_name,
-                tokens_in=tokens_in,
-                tokens_out=tokens_out,
-                latency_ms=latency_ms,
-                cost_usd=cost_usd
             )
+            return self._build_result(response, request, start)
             
+        except QuotaExhausted:
+            raise
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
     
+    async def generate_streaming(self, request: IdeaRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream an idea, emitting each field as soon as it is complete"""
+        timer = StreamTimer()
+        idea_stream = IdeaStream(request, self.parse_output)
+        
+        try:
+            async with quota_governor.astream(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[1].chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(request),
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self._structured_options(),
+                    **timeout_options(timeout)
+                )
+            ) as stream:
+                reported = None
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        timer.mark_token()
+                        for event in idea_stream.feed(chunk.choices[0].delta.content):
+                            yield event
+                    reported = from_openai(getattr(chunk, 'usage', None)) or reported
+            
+            for event in idea_stream.finish():
+                yield event
+            
+            usage = resolve_usage("openai", reported, idea_prompt(request, "openai").text(), idea_stream.text)
+            yield {
+                'type': 'metadata',
+                'provider': 'openai',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+            
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
+        except Exception as e:
+            yield {
+                'type': 'error',
+                'error': f"OpenAI streaming API error: {str(e)}"
+            }
+    
+    def parse_output(self, text: str, request: IdeaRequest) -> IdeaResponse:
+        """Parse the model's JSON idea, falling back to plain-text parsing"""
+        return parse_idea(text, request, "openai", self._parse_text_response)
+    
     def _parse_text_response(self, text: str, request: IdeaRequest) -> IdeaResponse:
         """Fallback text parsing when JSON fails"""
         lines = text.split('\n')
@@ -112,193 +180,148 @@ class OpenAIIdeaProvider(IdeaProvider):
         return IdeaResponse(
             title=title,
             genre=genre,
+            tone=request.tone or "General",
             outline=text,
             characters=None,
             setting=None
         )
     
-    def _calculate_cost(self, tokens_in: int, tokens_out: int) -> float:
-        """Calculate cost based on OpenAI pricing"""
-        # GPT-4 pricing (as of 2024)
-        if "gpt-4" in self.model_name:
-            input_cost = tokens_in * 0.00003  # $0.03 per 1K tokens
-            output_cost = tokens_out * 0.00006  # $0.06 per 1K tokens
-        else:  # GPT-3.5-turbo
-            input_cost = tokens_in * 0.0000015  # $0.0015 per 1K tokens
-            output_cost = tokens_out * 0.000002  # $0.002 per 1K tokens
-        
-        return input_cost + output_cost
-
 class OpenAIStoryProvider(StoryProvider):
+    provider_name = "openai"
+    temperature = 0.7
+    
     def __init__(self, tier: str):
         self.tier = tier
         self.model_name = _OPENAI_STORY_MODELS.get(tier, "gpt-3.5-turbo")
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     
-    def generate(self, request: StoryRequest) -> GenerationResult[StoryResponse]:
-        start = time.time()
-        
-        # Build system prompt for story writing
-        system_prompt = """You are a professional story writer. Write engaging, well-structured stories with proper narrative flow, character development, and satisfying conclusions."""
-        
-        # Build user prompt with optional fields
-        optional_details = []
-        if request.tone:
-            optional_details.append(f"- Tone: {request.tone}")
-        if request.characters:
-            optional_details.append(f"- Characters: {request.characters}")
-        if request.setting:
-            optional_details.append(f"- Setting: {request.setting}")
-        
-        optional_section = "\n".join(optional_details) if optional_details else ""
-        
-        user_prompt = f"""
-        Write a complete story with the following details:
-        - Title: {request.title}
-        - Genre: {request.genre}
-        - Outline: {request.outline}
-        {optional_section}
+    def _build_messages(self, request: StoryRequest) -> list:
+        """Build chat messages for story writing"""
+        return openai_messages(story_prompt(request))
+    
+    def _build_result(self, response, request: StoryRequest, start: float) -> GenerationResult[StoryResponse]:
+        """Turn a chat completion into a GenerationResult"""
+        text = response.choices[0].message.content
+        usage = resolve_usage("openai", from_openai(response.usage), story_prompt(request).text(), text)
+        tokens_in, tokens_out = usage.tokens_in, usage.tokens_out
+        latency_ms = int((time.time() - start) * 1000)
+        cost_usd = usage_cost(self.model_name, usage)
         
-        Structure the story with:
-        - Introduction and character setup
-        - Rising action and conflict
-        - Climax and resolution
-        - Proper dialogue and descriptions
+        output = StoryResponse(story=text)
         
-        Make it engaging and well-written.{" When provided, ensure the tone, characters, and setting match the details above." if optional_section else ""}
-        """
+        return GenerationResult(
+            output=output,
+            provider="openai",
+            model=self.model_name,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            latency_ms=latency_ms,
+            cost_usd=cost_usd,
+            usage_estimated=not usage.reported
+        )
+    
+    def generate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            text = response.choices[0].message.content
-            tokens_in = response.usage.prompt_tokens
-            tokens_out = response.usage.completion_tokens
-            latency_ms = int((time.time() - start) * 1000)
-            
-            # Calculate cost
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
-            
-            output = StoryResponse(story=text)
-            
-            return GenerationResult(
-                output=output,
-                provider="openai",
-                model=self.model_name,
-                tokens_in=tokens_in,
-                tokens_out=tokens_out,
-                latency_ms=latency_ms,
-                cost_usd=cost_usd
+            response = quota_governor.call(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[0].chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(request),
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, request, start)
             
+        except QuotaExhausted:
+            raise
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
     
-    def _calculate_cost(self, tokens_in: int, tokens_out: int) -> float:
-        """Calculate cost based on OpenAI pricing"""
-        if "gpt-4" in self.model_name:
-            input_cost = tokens_in * 0.00003
-            output_cost = tokens_out * 0.00006
-        else:  # GPT-3.5-turbo
-            input_cost = tokens_in * 0.0000015
-            output_cost = tokens_out * 0.000002
-        
-        return input_cost + output_cost
-
-    async def generate_streaming(self, request: StoryRequest) -> AsyncGenerator[Dict[str, Any], None]:
-        """Generate story with streaming support"""
+    async def agenerate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
         start = time.time()
         
-        # Build system prompt for story writing
-        system_prompt = """You are a professional story writer. Write engaging, well-structured stories with proper narrative flow, character development, and satisfying conclusions."""
-        
-        # Build user prompt with optional fields
-        optional_details = []
-        if request.tone:
-            optional_details.append(f"- Tone: {request.tone}")
-        if request.characters:
-            optional_details.append(f"- Characters: {request.characters}")
-        if request.setting:
-            optional_details.append(f"- Setting: {request.setting}")
-        
-        optional_section = "\n".join(optional_details) if optional_details else ""
-        
-        user_prompt = f"""
-        Write a complete story with the following details:
-        - Title: {request.title}
-        - Genre: {request.genre}
-        - Outline: {request.outline}
-        {optional_section}
-        
-        Structure the story with:
-        - Introduction and character setup
-        - Rising action and conflict
-        - Climax and resolution
-        - Proper dialogue and descriptions
-        
-        Make it engaging and well-written.{" When provided, ensure the tone, characters, and setting match the details above." if optional_section else ""}
-        """
-        
         try:
-            # Use streaming API
-            stream = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True
+            response = await quota_governor.acall(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[1].chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(request),
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    **timeout_options(timeout)
+                )
             )
+            return self._build_result(response, request, start)
             
-            full_content = ""
-            tokens_in = 0
-            tokens_out = 0
-            
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    full_content += content
-                    tokens_out += 1  # Rough estimate
-                    
-                    yield {
-                        'type': 'content',
-                        'content': content,
-                        'is_final': False
-                    }
-                    
-                    # Add small delay to make streaming more readable
-                    await asyncio.sleep(0.02)
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    async def generate_streaming(self, request: StoryRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Generate story with streaming support"""
+        timer = StreamTimer()
+        
+        try:
+            messages = self._build_messages(request)
+            # Use streaming API on the async client so the event loop is never blocked;
+            # include_usage adds a final chunk (with no choices) carrying the real usage
+            async with quota_governor.astream(
+                "openai", self.quota_tokens(request), timeout,
+                lambda key, timeout: client_pool.openai_clients(key)[1].chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens_for(request),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **timeout_options(timeout)
+                )
+            ) as stream:
+                full_content = ""
+                reported = None
                 
-                # Update usage if available
-                if hasattr(chunk, 'usage') and chunk.usage:
-                    tokens_in = chunk.usage.prompt_tokens or tokens_in
-                    tokens_out = chunk.usage.completion_tokens or tokens_out
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        content = chunk.choices[0].delta.content
+                        timer.mark_token()
+                        full_content += content
+                        
+                        yield {
+                            'type': 'content',
+                            'content': content,
+                            'is_final': False
+                        }
+                    
+                    reported = from_openai(getattr(chunk, 'usage', None)) or reported
             
             # Send final metadata
-            latency_ms = int((time.time() - start) * 1000)
-            cost_usd = self._calculate_cost(tokens_in, tokens_out)
+            prompt = "\n".join(m["content"] for m in messages)
+            usage = resolve_usage("openai", reported, prompt, full_content)
+            cost_usd = usage_cost(self.model_name, usage)
             
             yield {
                 'type': 'metadata',
                 'provider': 'openai',
                 'model': self.model_name,
-                'tokens_in': tokens_in,
-                'tokens_out': tokens_out,
-                'latency_ms': latency_ms,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
                 'cost_usd': cost_usd,
                 'is_final': True
             }
             
+        except QuotaExhausted as e:
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_type': 'quota_exhausted'
+            }
         except Exception as e:
             yield {
                 'type': 'error',
@@ -0,0 +1,67 @@
+"""
+Adaptive latency- and cost-aware provider ordering
+"""
+import random
+from typing import Any, List, Optional, Tuple
+from .config import ADAPTIVE_ROUTING_SETTINGS, ProviderType, TierType
+from .stats import RoutingStats
+
+class AdaptiveRoutingPolicy:
+    """Orders candidate providers by a per-tier objective over live stats.
+
+    Candidates with enough samples and a cost per 1K tokens under the tier's
+    ceiling come first, best metric first; candidates without enough samples
+    keep their configured order after them; candidates over the ceiling come
+    last. With probability `exploration_rate` a random candidate is moved to
+    the front (epsilon-greedy, preferring under-sampled candidates), so every
+    provider keeps receiving traffic and its stats stay current.
+    """
+
+    def __init__(self, stats: RoutingStats, settings: dict = None, rng: random.Random = None):
+        self.stats = stats
+        self.settings = settings or ADAPTIVE_ROUTING_SETTINGS
+        self.rng = rng or random.Random()
+        self.explorations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings["enabled"]
+
+    def order(self, task: str, tier: TierType,
+              candidates: List[Tuple[ProviderType, Any]]) -> List[Tuple[ProviderType, Any]]:
+        if len(candidates) < 2:
+            return candidates
+
+        objective = self.settings["objectives"].get(tier, {})
+        metric = objective.get("metric", "p95_latency_ms")
+        ceiling = objective.get("max_cost_per_1k_tokens")
+
+        preferred, unknown, over_budget = [], [], []
+        for candidate in candidates:
+            stats = self._stats_for(task, candidate)
+            if stats is None or stats["samples"] < self.settings["min_samples"]:
+                unknown.append(candidate)
+            elif ceiling is not None and stats["cost_per_1k_tokens"] > ceiling:
+                over_budget.append((stats[metric], candidate))
+            else:
+                preferred.append((stats[metric], candidate))
+
+        ordered = (
+            [c for _, c in sorted(preferred, key=lambda item: item[0])]
+            + unknown
+            + [c for _, c in sorted(over_budget, key=lambda item: item[0])]
+        )
+
+        if self.rng.random() < self.settings["exploration_rate"]:
+            # Explore under-sampled providers first so they can earn a ranking
+            pool = [c for c in unknown if c is not ordered[0]] or ordered[1:]
+            explored = self.rng.choice(pool)
+            ordered.remove(explored)
+            ordered.insert(0, explored)
+            self.explorations += 1
+
+        return ordered
+
+    def _stats_for(self, task: str, candidate: Tuple[ProviderType, Any]) -> Optional[dict]:
+        provider_type, provider = candidate
+        return self.stats.get(provider_type.value, getattr(provider, "model_name", "unknown"), task)
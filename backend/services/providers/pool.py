@@ -0,0 +1,143 @@
+"""
+Process-wide SDK clients with keep-alive HTTP connection pools
+"""
+import inspect
+import threading
+from typing import Dict, Any, Optional, Tuple
+import httpx
+import openai
+import anthropic
+import google.ai.generativelanguage as glm
+from .config import PROVIDER_POOL_SETTINGS
+from .keys import ApiKey
+from .quota import quota_governor
+
+class ClientPool:
+    """Holds one sync and one async SDK client per pooled API key so every
+    provider instance shares the same keep-alive connections instead of paying
+    a TLS handshake per request. Responses feed the key's rate-limit headers to
+    the quota governor, which also takes over retries from the SDKs."""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or PROVIDER_POOL_SETTINGS
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str, Optional[str], Optional[str]], Tuple[Any, Any]] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.settings["max_connections"],
+            max_keepalive_connections=self.settings["max_keepalive_connections"],
+            keepalive_expiry=self.settings["keepalive_expiry"]
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.settings["timeout"], connect=self.settings["connect_timeout"])
+
+    def openai_clients(self, key: ApiKey) -> Tuple[openai.OpenAI, openai.AsyncOpenAI]:
+        """Get the shared (sync, async) OpenAI clients for a pooled API key"""
+        cache_key = ("openai", key.id, key.organization, key.project)
+        with self._lock:
+            if cache_key not in self._clients:
+                self._clients[cache_key] = (
+                    openai.OpenAI(
+                        api_key=key.key,
+                        organization=key.organization,
+                        project=key.project,
+                        max_retries=quota_governor.sdk_max_retries(),
+                        http_client=httpx.Client(
+                            limits=self._limits(), timeout=self._timeout(),
+                            event_hooks={"response": [quota_governor.response_hook("openai", key)]}
+                        )
+                    ),
+                    openai.AsyncOpenAI(
+                        api_key=key.key,
+                        organization=key.organization,
+                        project=key.project,
+                        max_retries=quota_governor.sdk_max_retries(),
+                        http_client=httpx.AsyncClient(
+                            limits=self._limits(), timeout=self._timeout(),
+                            event_hooks={"response": [quota_governor.async_response_hook("openai", key)]}
+                        )
+                    )
+                )
+            return self._clients[cache_key]
+
+    def anthropic_clients(self, key: ApiKey) -> Tuple[anthropic.Anthropic, anthropic.AsyncAnthropic]:
+        """Get the shared (sync, async) Anthropic clients for a pooled API key"""
+        cache_key = ("anthropic", key.id, None, None)
+        with self._lock:
+            if cache_key not in self._clients:
+                self._clients[cache_key] = (
+                    anthropic.Anthropic(
+                        api_key=key.key,
+                        max_retries=quota_governor.sdk_max_retries(),
+                        http_client=httpx.Client(
+                            limits=self._limits(), timeout=self._timeout(),
+                            event_hooks={"response": [quota_governor.response_hook("anthropic", key)]}
+                        )
+                    ),
+                    anthropic.AsyncAnthropic(
+                        api_key=key.key,
+                        max_retries=quota_governor.sdk_max_retries(),
+                        http_client=httpx.AsyncClient(
+                            limits=self._limits(), timeout=self._timeout(),
+                            event_hooks={"response": [quota_governor.async_response_hook("anthropic", key)]}
+                        )
+                    )
+                )
+            return self._clients[cache_key]
+
+    def gemini_clients(self, key: ApiKey) -> Tuple[glm.GenerativeServiceClient, glm.GenerativeServiceAsyncClient]:
+        """Get the shared (sync, async) Gemini service clients for a pooled API key.
+        genai.configure holds a single process-global key, so each key gets its own clients."""
+        cache_key = ("gemini", key.id, None, None)
+        with self._lock:
+            if cache_key not in self._clients:
+                options = {"api_key": key.key}
+                self._clients[cache_key] = (
+                    glm.GenerativeServiceClient(client_options=options),
+                    glm.GenerativeServiceAsyncClient(client_options=options)
+                )
+            return self._clients[cache_key]
+
+    def _drain(self) -> list:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for sync_client, _ in clients:
+            try:
+                _close(sync_client)
+            except Exception as e:
+                print(f"⚠️ Failed to close provider client: {e}")
+        return clients
+
+    def close(self):
+        """Close the sync HTTP connection pools and forget all clients"""
+        self._drain()
+
+    async def aclose(self):
+        """Close both sync and async HTTP connection pools and forget all clients"""
+        for _, async_client in self._drain():
+            try:
+                result = _close(async_client)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"⚠️ Failed to close async provider client: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool configuration and client counts"""
+        with self._lock:
+            providers = [cache_key[0] for cache_key in self._clients]
+        return {
+            "settings": dict(self.settings),
+            "clients": {p: providers.count(p) for p in set(providers)}
+        }
+
+def _close(client):
+    """SDK clients close themselves; the Gemini service clients close through their transport"""
+    close = getattr(client, "close", None)
+    return close() if close is not None else client.transport.close()
+
+# Global instance
+client_pool = ClientPool()
@@ -0,0 +1,86 @@
+"""
+Versioned per-model pricing for provider calls
+"""
+import os
+from typing import Dict, Optional
+
+# USD per 1K tokens, keyed by pricing version then model. Add a new version
+# when a provider changes its prices rather than editing an old one, so costs
+# already recorded can still be reproduced from their version.
+PRICING_TABLES: Dict[str, Dict[str, Dict[str, float]]] = {
+    "2024-03-01": {
+        "gpt-4": {"input": 0.03, "output": 0.06},
+        "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002},
+        "claude-3-sonnet": {"input": 0.003, "output": 0.015},
+        "claude-3-haiku": {"input": 0.00025, "output": 0.00125},
+        "gemini-pro": {"input": 0.0, "output": 0.0},
+    },
+    "2025-06-01": {
+        "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
+        "gpt-4o": {"input": 0.0025, "output": 0.01},
+        "gpt-4-turbo": {"input": 0.01, "output": 0.03},
+        "gpt-4": {"input": 0.03, "output": 0.06},
+        "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
+        "claude-3-opus": {"input": 0.015, "output": 0.075},
+        "claude-3-5-sonnet": {"input": 0.003, "output": 0.015},
+        "claude-3-sonnet": {"input": 0.003, "output": 0.015},
+        "claude-3-5-haiku": {"input": 0.0008, "output": 0.004},
+        "claude-3-haiku": {"input": 0.00025, "output": 0.00125},
+        "gemini-2.5-pro": {"input": 0.00125, "output": 0.01},
+        "gemini-2.5-flash": {"input": 0.0003, "output": 0.0025},
+        "gemini-1.5-pro": {"input": 0.00125, "output": 0.005},
+        "gemini-1.5-flash": {"input": 0.000075, "output": 0.0003},
+        "gemini-pro": {"input": 0.0005, "output": 0.0015},
+        # The deterministic stub provider used for load and failover testing
+        "stub": {"input": 0.0, "output": 0.0},
+    },
+}
+
+# Prompt-cache prices as multiples of the model's input price, by model family
+CACHE_PRICE_MULTIPLIERS: Dict[str, Dict[str, float]] = {
+    "gpt": {"read": 0.5, "write": 1.0},
+    "claude": {"read": 0.1, "write": 1.25},
+    "gemini": {"read": 0.25, "write": 1.0},
+}
+
+# OpenAI Batch and Anthropic Message Batches bill at half the interactive price
+BATCH_PRICE_MULTIPLIER = 0.5
+
+PRICING_VERSION = os.getenv("PRICING_VERSION", max(PRICING_TABLES))
+
+_warned_models = set()
+
+def get_model_pricing(model: str, version: str = None) -> Optional[Dict[str, float]]:
+    """Prices for a model: exact match first, then the longest matching prefix
+    (so dated snapshots like "claude-3-haiku-20240307" use their family's price)"""
+    table = PRICING_TABLES[version or PRICING_VERSION]
+    if model in table:
+        return table[model]
+    matches = [name for name in table if model.startswith(name)]
+    if not matches:
+        return None
+    return table[max(matches, key=len)]
+
+def calculate_cost(model: str, tokens_in: int, tokens_out: int, version: str = None,
+                   cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> float:
+    """Cost in USD of a call; unknown models cost 0.0 and are reported once.
+    Cache reads and writes are the parts of tokens_in billed at cache prices."""
+    pricing = get_model_pricing(model, version)
+    if pricing is None:
+        if model not in _warned_models:
+            _warned_models.add(model)
+            print(f"⚠️ No pricing for model {model} in pricing version {version or PRICING_VERSION}")
+        return 0.0
+    multipliers = next((m for family, m in CACHE_PRICE_MULTIPLIERS.items() if model.startswith(family)),
+                       {"read": 1.0, "write": 1.0})
+    uncached_in = max(0, tokens_in - cache_read_tokens - cache_write_tokens)
+    input_tokens = (uncached_in + cache_read_tokens * multipliers["read"]
+                    + cache_write_tokens * multipliers["write"])
+    return (input_tokens * pricing["input"] + tokens_out * pricing["output"]) / 1000.0
+
+def usage_cost(model: str, usage, version: str = None, batch: bool = False) -> float:
+    """Cost in USD of a call's TokenUsage, including prompt-cache pricing
+    and, for provider batch APIs, the batch discount"""
+    cost = calculate_cost(model, usage.tokens_in, usage.tokens_out, version,
+                          usage.cache_read_tokens, usage.cache_write_tokens)
+    return cost * BATCH_PRICE_MULTIPLIER if batch else cost
@@ -0,0 +1,167 @@
+"""
+Shared prompt templates for all providers
+
+Static instructions live in system prompts built once at import. They always
+come first and never contain request fields, so every call shares the same
+prefix and providers can serve it from their prompt cache; only the short
+user message varies per request.
+"""
+import json
+from dataclasses import dataclass
+from textwrap import dedent
+from typing import Any, Dict, List, Union
+from .config import PROMPT_CACHE_SETTINGS
+from .structured import IDEA_SCHEMA, structured_output_enabled
+
+@dataclass(frozen=True)
+class Prompt:
+    system: str
+    user: str
+
+    def text(self) -> str:
+        """System and user prompt as one string (for providers without usage reports)"""
+        return f"{self.system}\n\n{self.user}"
+
+IDEA_SYSTEM_PROMPT = dedent("""
+    You are a creative story idea generator. Generate compelling story ideas based on user prompts.
+    Return your response as JSON with the following structure:
+    {
+        "title": "Story Title Here",
+        "genre": "Genre Here",
+        "outline": "Detailed outline here...",
+        "tone": "Tone Here",
+        "characters": ["Character Name 1", "Character Name 2"],
+        "setting": "Setting description here..."
+    }
+    Make it creative, engaging, and well-structured.
+""").strip()
+
+# Gemini ideas are parsed from plain text rather than JSON when Gemini is not
+# in STRUCTURED_OUTPUT_SETTINGS
+GEMINI_IDEA_SYSTEM_PROMPT = dedent("""
+    You are a creative story idea generator.
+
+    IMPORTANT: Respond ONLY in this exact format (no JSON, no markdown, no code blocks):
+
+    Title: [Story Title Here]
+    Genre: [The requested genre]
+    Tone: [The requested tone]
+    Outline: [Brief 2-3 sentence story summary]
+    Characters:
+    [Character Name 1]
+    [Character Name 2]
+    [Character Name 3]
+    Setting: [Brief description of the main setting]
+
+    Do not use JSON format. Do not use code blocks. Just plain text with the exact format above.
+""").strip()
+
+STORY_SYSTEM_PROMPT = dedent("""
+    You are a professional story writer. Write engaging, well-structured stories with proper narrative flow, character development, and satisfying conclusions.
+
+    Structure every story with:
+    - Introduction and character setup
+    - Rising action and conflict
+    - Climax and resolution
+    - Proper dialogue and descriptions
+
+    Make it engaging and well-written.
+""").strip()
+
+_IDEA_USER_TEMPLATE = dedent("""
+    Generate a story idea based on:
+    - Prompt: {prompt}
+    - Genre: {genre}
+    - Tone: {tone}
+""").strip()
+
+_GEMINI_IDEA_USER_TEMPLATE = dedent("""
+    Create a story idea based on: "{prompt}"
+    Genre: {genre}
+    Tone: {tone}
+""").strip()
+
+_STORY_USER_TEMPLATE = dedent("""
+    Write a complete story with the following details:
+    - Title: {title}
+    - Genre: {genre}
+    - Outline: {outline}
+""").strip()
+
+_STORY_DETAILS_NOTE = "When provided, ensure the tone, characters, and setting match the details above."
+
+def _plain_text_ideas(provider: str) -> bool:
+    return provider == "gemini" and not structured_output_enabled("gemini")
+
+def idea_system_prompt(provider: str = "openai") -> str:
+    return GEMINI_IDEA_SYSTEM_PROMPT if _plain_text_ideas(provider) else IDEA_SYSTEM_PROMPT
+
+def idea_prompt(request, provider: str = "openai") -> Prompt:
+    if _plain_text_ideas(provider):
+        return Prompt(GEMINI_IDEA_SYSTEM_PROMPT, _GEMINI_IDEA_USER_TEMPLATE.format(
+            prompt=request.prompt, genre=request.genre or "Fantasy", tone=request.tone or "Adventurous"
+        ))
+    return Prompt(IDEA_SYSTEM_PROMPT, _IDEA_USER_TEMPLATE.format(
+        prompt=request.prompt, genre=request.genre or "Any genre", tone=request.tone or "Any tone"
+    ))
+
+def story_prompt(request) -> Prompt:
+    lines = [_STORY_USER_TEMPLATE.format(title=request.title, genre=request.genre, outline=request.outline)]
+    optional_details = [
+        f"- {label}: {value}"
+        for label, value in (("Tone", request.tone), ("Characters", request.characters), ("Setting", request.setting))
+        if value
+    ]
+    if optional_details:
+        lines.extend(optional_details)
+        lines.append("")
+        lines.append(_STORY_DETAILS_NOTE)
+    return Prompt(STORY_SYSTEM_PROMPT, "\n".join(lines))
+
+def prompt_for(task: str, request, provider: str = "openai") -> Prompt:
+    return idea_prompt(request, provider) if task == "idea" else story_prompt(request)
+
+_IDEA_SCHEMA_TEXT = json.dumps(IDEA_SCHEMA)
+
+class _Blank(dict):
+    def __missing__(self, key):
+        return ""
+
+def static_text(task: str, provider: str = "openai") -> str:
+    """The fixed text a provider's prompt adds around the request fields"""
+    if task == "idea":
+        plain = _plain_text_ideas(provider)
+        template = _GEMINI_IDEA_USER_TEMPLATE if plain else _IDEA_USER_TEMPLATE
+        text = f"{idea_system_prompt(provider)}\n\n{template.format_map(_Blank())}"
+        # The idea schema is sent along with structured requests
+        return text if plain or not structured_output_enabled(provider) else f"{text}\n{_IDEA_SCHEMA_TEXT}"
+    return f"{STORY_SYSTEM_PROMPT}\n\n{_STORY_USER_TEMPLATE.format_map(_Blank())}"
+
+# Provider request formats
+
+def openai_messages(prompt: Prompt) -> List[Dict[str, str]]:
+    """Chat messages. OpenAI caches repeated prompt prefixes automatically, so the
+    static system prompt must stay first and byte-identical across requests."""
+    return [
+        {"role": "system", "content": prompt.system},
+        {"role": "user", "content": prompt.user}
+    ]
+
+# Anthropic system blocks, built once per static system prompt
+_ANTHROPIC_SYSTEM_BLOCKS: Dict[str, List[Dict[str, Any]]] = {
+    system: [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+    for system in (IDEA_SYSTEM_PROMPT, STORY_SYSTEM_PROMPT)
+}
+
+def anthropic_system(prompt: Prompt) -> Union[str, List[Dict[str, Any]]]:
+    """System prompt marked with a cache_control breakpoint, so Anthropic caches
+    it (and bills reads at the cached rate) once it reaches the model's minimum
+    cacheable length"""
+    if not PROMPT_CACHE_SETTINGS["anthropic_cache_control"]:
+        return prompt.system
+    return _ANTHROPIC_SYSTEM_BLOCKS.get(prompt.system) or [
+        {"type": "text", "text": prompt.system, "cache_control": {"type": "ephemeral"}}
+    ]
+
+def anthropic_messages(prompt: Prompt) -> List[Dict[str, str]]:
+    return [{"role": "user", "content": prompt.user}]
@@ -0,0 +1,515 @@
+"""
+Upstream quota governor
+
+Each provider API key has requests- and tokens-per-minute limits upstream.
+Calls are admitted against those limits before they are sent, so concurrent
+requests queue briefly (or are shed) instead of all hitting an exhausted key,
+and transient failures are retried with exponential backoff and jitter,
+honouring Retry-After. The limits start from QUOTA_SETTINGS and follow what
+the provider reports in its rate-limit headers; with Redis the budget is
+shared by every worker. With several pooled keys a call goes to the first
+key (in the pool's selection order) that has budget for it.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import httpx
+import openai
+import anthropic
+import redis
+import redis.asyncio as aioredis
+from metrics.prom import record_quota_wait, record_quota_shed, record_upstream_retry
+from .config import QUOTA_SETTINGS
+from .keys import ApiKey, key_pools
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+T = TypeVar("T")
+
+# Header state lives for an hour after the provider last reported it
+_STATE_TTL_SECONDS = 3600
+
+_SERVER_ERROR_STATUSES = (408, 500, 502, 503, 504, 529)
+_CONNECTION_ERRORS = (openai.APIConnectionError, anthropic.APIConnectionError, httpx.TransportError)
+
+# OpenAI and Anthropic name the same rate-limit headers differently
+_HEADERS = {
+    "limit_requests": ("x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+    "limit_tokens": ("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"),
+    "remaining_requests": ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"),
+    "remaining_tokens": ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"),
+    "requests_reset_at": ("x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset"),
+    "tokens_reset_at": ("x-ratelimit-reset-tokens", "anthropic-ratelimit-tokens-reset")
+}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# Admit one call of ARGV[2] tokens, or return how many seconds to wait first.
+# KEYS: the key's header state, and its request and token counters for this minute.
+# ARGV: now, tokens, seed rpm, seed tpm, headroom, seconds left in the minute
+_ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local s = redis.call("HMGET", KEYS[1], "blocked_until", "limit_requests", "limit_tokens",
+    "remaining_requests", "requests_reset_at", "remaining_tokens", "tokens_reset_at")
+local rpm = math.floor((tonumber(s[2]) or tonumber(ARGV[3])) * tonumber(ARGV[5]))
+local tpm = math.floor((tonumber(s[3]) or tonumber(ARGV[4])) * tonumber(ARGV[5]))
+local tokens = math.min(tonumber(ARGV[2]), tpm)
+local blocked_until = tonumber(s[1]) or 0
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+local requests_reset_at = tonumber(s[5]) or 0
+if requests_reset_at > now and (tonumber(s[4]) or 1) < 1 then
+    return tostring(requests_reset_at - now)
+end
+local tokens_reset_at = tonumber(s[7]) or 0
+if tokens_reset_at > now and (tonumber(s[6]) or tokens) < tokens then
+    return tostring(tokens_reset_at - now)
+end
+local used_requests = tonumber(redis.call("GET", KEYS[2]) or "0")
+local used_tokens = tonumber(redis.call("GET", KEYS[3]) or "0")
+if used_requests + 1 > rpm or used_tokens + tokens > tpm then
+    return ARGV[6]
+end
+redis.call("INCR", KEYS[2])
+redis.call("EXPIRE", KEYS[2], 120)
+redis.call("INCRBY", KEYS[3], tokens)
+redis.call("EXPIRE", KEYS[3], 120)
+if requests_reset_at > now then
+    redis.call("HINCRBY", KEYS[1], "remaining_requests", -1)
+end
+if tokens_reset_at > now then
+    redis.call("HINCRBY", KEYS[1], "remaining_tokens", -tokens)
+end
+return "0"
+"""
+
+class QuotaExhausted(Exception):
+    """Raised when a call is shed because the key's upstream quota will not free up in time"""
+
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"Upstream quota for {provider} exhausted; retry in {retry_after:.1f}s")
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait from Retry-After (seconds or an HTTP date) or retry-after-ms"""
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+    except ValueError:
+        pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def parse_reset(value: str, now: float) -> Optional[float]:
+    """Epoch time of a reset header: OpenAI sends a duration ("6m0s", "20ms"),
+    Anthropic an RFC 3339 timestamp"""
+    value = value.strip()
+    parts = _DURATION.findall(value)
+    if parts and not _DURATION.sub("", value):
+        return now + sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        pass
+    try:
+        return now + float(value)
+    except ValueError:
+        return None
+
+def rate_limit_state(headers, now: float) -> Dict[str, float]:
+    """The limits, remaining budget and reset times reported in a response's headers"""
+    state = {}
+    for field, names in _HEADERS.items():
+        value = next((headers.get(name) for name in names if headers.get(name)), None)
+        if value is None:
+            continue
+        if field.endswith("_reset_at"):
+            reset_at = parse_reset(value, now)
+            if reset_at is not None:
+                state[field] = reset_at
+            continue
+        try:
+            state[field] = int(float(value))
+        except ValueError:
+            continue
+    return state
+
+class QuotaGovernor:
+    """Admits provider calls against each API key's upstream quota.
+
+    A call reserves one request and its estimated tokens in the key's current
+    one-minute window, capped at `headroom` times the limit. It is held back
+    while the provider has reported the key exhausted (remaining budget at zero
+    until its reset, or a 429's Retry-After) and shed with QuotaExhausted if it
+    would wait longer than `max_wait_seconds` or the call's timeout.
+
+    Calls pick their key from the provider's KeyPool: each healthy key is tried
+    in the pool's order and the call waits only when none has budget. A key
+    ejected by a call (auth or billing-quota error) is retried on another key
+    straight away.
+    """
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or QUOTA_SETTINGS
+        self._redis = redis.from_url(REDIS_URL, decode_responses=True) if self.settings["redis_enabled"] else None
+        self._aredis = aioredis.from_url(REDIS_URL, decode_responses=True) if self.settings["redis_enabled"] else None
+        # In-process fallback used without (or when failing to reach) Redis
+        self._lock = threading.Lock()
+        self._local_state: Dict[str, Dict[str, float]] = {}
+        self._local_counts: Dict[str, float] = {}
+        self.stats = {"admitted": 0, "waited": 0, "shed": 0, "retries": 0}
+
+    def enabled_for(self, provider: str) -> bool:
+        return self.settings["enabled"] and provider in self.settings["limits"]
+
+    def _keys(self, provider: str, key: str, now: float) -> List[str]:
+        base = f"{self.settings['key_prefix']}{provider}:{key}"
+        minute = int(now // 60)
+        return [f"{base}:state", f"{base}:requests:{minute}", f"{base}:tokens:{minute}"]
+
+    def _admit_args(self, provider: str, tokens: int, now: float) -> List[Any]:
+        seeds = self.settings["limits"][provider]
+        return [now, max(int(tokens), 1), seeds["rpm"], seeds["tpm"], self.settings["headroom"], 60 - now % 60]
+
+    def _admit_local(self, keys: List[str], args: List[Any]) -> float:
+        """The admit script, run against in-process state"""
+        now, tokens, seed_rpm, seed_tpm, headroom, window_left = args
+        with self._lock:
+            state = self._local_state.get(keys[0], {})
+            rpm = int(state.get("limit_requests", seed_rpm) * headroom)
+            tpm = int(state.get("limit_tokens", seed_tpm) * headroom)
+            tokens = min(tokens, tpm)
+            if state.get("blocked_until", 0) > now:
+                return state["blocked_until"] - now
+            requests_reset_at = state.get("requests_reset_at", 0)
+            if requests_reset_at > now and state.get("remaining_requests", 1) < 1:
+                return requests_reset_at - now
+            tokens_reset_at = state.get("tokens_reset_at", 0)
+            if tokens_reset_at > now and state.get("remaining_tokens", tokens) < tokens:
+                return tokens_reset_at - now
+            if (self._local_counts.get(keys[1], 0) + 1 > rpm
+                    or self._local_counts.get(keys[2], 0) + tokens > tpm):
+                return window_left
+            # Forget counters from earlier minutes
+            minute = keys[1].rsplit(":", 1)[1]
+            self._local_counts = {k: v for k, v in self._local_counts.items() if k.endswith(f":{minute}")}
+            self._local_counts[keys[1]] = self._local_counts.get(keys[1], 0) + 1
+            self._local_counts[keys[2]] = self._local_counts.get(keys[2], 0) + tokens
+            if requests_reset_at > now:
+                state["remaining_requests"] = state.get("remaining_requests", 0) - 1
+            if tokens_reset_at > now:
+                state["remaining_tokens"] = state.get("remaining_tokens", 0) - tokens
+            return 0.0
+
+    def _try_admit(self, provider: str, key: str, tokens: int) -> float:
+        """Reserve budget for a call; 0 if admitted, else seconds until it may be"""
+        now = time.time()
+        keys, args = self._keys(provider, key, now), self._admit_args(provider, tokens, now)
+        if self._redis is not None:
+            try:
+                return float(self._redis.eval(_ADMIT_SCRIPT, len(keys), *keys, *args))
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for quota governor: {e}")
+        return self._admit_local(keys, args)
+
+    async def _atry_admit(self, provider: str, key: str, tokens: int) -> float:
+        now = time.time()
+        keys, args = self._keys(provider, key, now), self._admit_args(provider, tokens, now)
+        if self._aredis is not None:
+            try:
+                return float(await self._aredis.eval(_ADMIT_SCRIPT, len(keys), *keys, *args))
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for quota governor: {e}")
+        return self._admit_local(keys, args)
+
+    def _max_wait(self, timeout: Optional[float]) -> float:
+        max_wait = self.settings["max_wait_seconds"]
+        return min(max_wait, timeout) if timeout is not None else max_wait
+
+    def _shed(self, provider: str, retry_after: float):
+        self.stats["shed"] += 1
+        try:
+            record_quota_shed(provider)
+        except Exception as e:
+            print(f"Failed to record quota metric: {e}")
+        raise QuotaExhausted(provider, retry_after)
+
+    def _next_wait(self, provider: str, wait: float, waited: float, max_wait: float) -> float:
+        """How long to sleep before trying again, or raise QuotaExhausted to shed the call"""
+        if waited + wait > max_wait:
+            self._shed(provider, wait)
+        # Jitter so calls waiting on the same reset do not all arrive at once
+        return min(wait * random.uniform(1.0, 1.1), max_wait - waited)
+
+    def _candidates(self, provider: str) -> List[ApiKey]:
+        """The provider's healthy keys in selection order; sheds the call when every key is ejected"""
+        pool = key_pools.get(provider)
+        candidates = pool.candidates()
+        if not candidates:
+            self._shed(provider, pool.soonest_return())
+        return candidates
+
+    def _admitted(self, provider: str, waited: float):
+        self.stats["admitted"] += 1
+        if waited > 0:
+            self.stats["waited"] += 1
+        try:
+            record_quota_wait(provider, waited)
+        except Exception as e:
+            print(f"Failed to record quota metric: {e}")
+
+    def acquire_sync(self, provider: str, tokens: int, timeout: Optional[float] = None) -> ApiKey:
+        """Block until one of the provider's keys has budget for a call of `tokens` tokens, and return it"""
+        if not self.enabled_for(provider):
+            return self._candidates(provider)[0]
+        start, max_wait = time.monotonic(), self._max_wait(timeout)
+        waited = 0.0
+        while True:
+            waits = []
+            for key in self._candidates(provider):
+                wait = self._try_admit(provider, key.id, tokens)
+                if wait <= 0:
+                    self._admitted(provider, waited)
+                    return key
+                waits.append(wait)
+            time.sleep(self._next_wait(provider, min(waits), waited, max_wait))
+            waited = time.monotonic() - start
+
+    async def acquire(self, provider: str, tokens: int, timeout: Optional[float] = None) -> ApiKey:
+        """Wait until one of the provider's keys has budget for a call of `tokens` tokens, and return it"""
+        if not self.enabled_for(provider):
+            return self._candidates(provider)[0]
+        start, max_wait = time.monotonic(), self._max_wait(timeout)
+        waited = 0.0
+        while True:
+            waits = []
+            for key in self._candidates(provider):
+                wait = await self._atry_admit(provider, key.id, tokens)
+                if wait <= 0:
+                    self._admitted(provider, waited)
+                    return key
+                waits.append(wait)
+            await asyncio.sleep(self._next_wait(provider, min(waits), waited, max_wait))
+            waited = time.monotonic() - start
+
+    def _classify(self, error: Exception) -> Tuple[Optional[str], Optional[float]]:
+        """(retry reason, Retry-After seconds) of a failed call; the reason is None
+        when the failure is not transient"""
+        status = getattr(error, "status_code", None)
+        if status is None and isinstance(getattr(error, "code", None), int):
+            # google.api_core errors carry the HTTP status as `code`
+            status = error.code
+        retry_after = parse_retry_after(getattr(getattr(error, "response", None), "headers", None))
+        if status == 429:
+            return "rate_limited", retry_after
+        if status in _SERVER_ERROR_STATUSES:
+            return "server_error", retry_after
+        if status is None and isinstance(error, _CONNECTION_ERRORS):
+            return "connection", None
+        return None, None
+
+    def _retry_delay(self, provider: str, key: ApiKey, error: Exception, attempt: int,
+                     deadline_at: Optional[float]) -> Tuple[Optional[str], float]:
+        """(reason, delay) for retrying a failed call; raises when it should not be retried"""
+        if not key.healthy(time.time()) and key_pools.get(provider).healthy_count():
+            # The call ejected its key; another key can take it right away
+            self._record_retry(provider, key, "key_ejected")
+            return "key_ejected", 0.0
+        reason, retry_after = self._classify(error)
+        if reason is None or not self.enabled_for(provider):
+            raise error
+        if retry_after is None:
+            cap = min(self.settings["backoff_max_seconds"], self.settings["backoff_base_seconds"] * 2 ** attempt)
+            retry_after = cap / 2 + random.uniform(0, cap / 2)
+        out_of_time = deadline_at is not None and time.monotonic() + retry_after >= deadline_at
+        if reason == "rate_limited" and key_pools.get(provider).healthy_count() > 1:
+            # A 429 only holds back this key; the retry may go to another one straight away
+            out_of_time = False
+        if attempt >= self.settings["max_retries"] or out_of_time:
+            if reason == "rate_limited":
+                raise QuotaExhausted(provider, retry_after) from error
+            raise error
+        self._record_retry(provider, key, reason)
+        return reason, retry_after
+
+    def _record_retry(self, provider: str, key: ApiKey, reason: str):
+        self.stats["retries"] += 1
+        try:
+            record_upstream_retry(provider, key.alias, reason)
+        except Exception as e:
+            print(f"Failed to record retry metric: {e}")
+
+    def call(self, provider: str, tokens: int, timeout: Optional[float],
+             fn: Callable[[ApiKey, Optional[float]], T]) -> T:
+        """Run `fn(key, timeout)` on a key with budget, retrying transient failures.
+        `timeout` is the seconds left of the request's deadline; `fn` is given what
+        remains of it on each attempt."""
+        deadline_at = time.monotonic() + timeout if timeout is not None else None
+        pool = key_pools.get(provider)
+        attempt = 0
+        while True:
+            key = self.acquire_sync(provider, tokens, _time_left(deadline_at))
+            try:
+                with pool.lease(key):
+                    return fn(key, _time_left(deadline_at))
+            except Exception as e:
+                reason, delay = self._retry_delay(provider, key, e, attempt, deadline_at)
+            if reason == "key_ejected":
+                continue
+            attempt += 1
+            if reason == "rate_limited":
+                # Hold every worker's calls on this key back, not just this one
+                self.observe(provider, key, {"blocked_until": time.time() + delay})
+            else:
+                time.sleep(delay)
+
+    async def acall(self, provider: str, tokens: int, timeout: Optional[float],
+                    fn: Callable[[ApiKey, Optional[float]], Awaitable[T]]) -> T:
+        """Async `call`"""
+        deadline_at = time.monotonic() + timeout if timeout is not None else None
+        pool = key_pools.get(provider)
+        attempt = 0
+        while True:
+            key = await self.acquire(provider, tokens, _time_left(deadline_at))
+            try:
+                with pool.lease(key):
+                    return await fn(key, _time_left(deadline_at))
+            except Exception as e:
+                reason, delay = self._retry_delay(provider, key, e, attempt, deadline_at)
+            if reason == "key_ejected":
+                continue
+            attempt += 1
+            if reason == "rate_limited":
+                await self.aobserve(provider, key, {"blocked_until": time.time() + delay})
+            else:
+                await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def astream(self, provider: str, tokens: int, timeout: Optional[float],
+                      fn: Callable[[ApiKey, Optional[float]], Any]) -> AsyncIterator[Any]:
+        """`acall` for streams: `fn(key, timeout)` opens the stream, as an async context
+        manager or an awaitable. Opening it is admitted and retried like a call; once it
+        is open the key stays leased until the caller is done reading, so errors while
+        reading still count against the key, but they are not retried."""
+        deadline_at = time.monotonic() + timeout if timeout is not None else None
+        pool = key_pools.get(provider)
+        attempt = 0
+        while True:
+            key = await self.acquire(provider, tokens, _time_left(deadline_at))
+            opened = False
+            try:
+                with pool.lease(key):
+                    async with _opened(fn(key, _time_left(deadline_at))) as stream:
+                        opened = True
+                        yield stream
+                return
+            except Exception as e:
+                if opened:
+                    raise
+                reason, delay = self._retry_delay(provider, key, e, attempt, deadline_at)
+            if reason == "key_ejected":
+                continue
+            attempt += 1
+            if reason == "rate_limited":
+                await self.aobserve(provider, key, {"blocked_until": time.time() + delay})
+            else:
+                await asyncio.sleep(delay)
+
+    def _response_state(self, response: httpx.Response) -> Dict[str, float]:
+        now = time.time()
+        state = rate_limit_state(response.headers, now)
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers)
+            state["blocked_until"] = now + (retry_after if retry_after is not None
+                                            else self.settings["backoff_base_seconds"])
+        return state
+
+    def observe(self, provider: str, key: ApiKey, state: Dict[str, float]):
+        """Record rate-limit state for a key (from response headers or a 429)"""
+        if not state or not self.enabled_for(provider):
+            return
+        state_key = self._keys(provider, key.id, time.time())[0]
+        if self._redis is not None:
+            try:
+                self._redis.pipeline().hset(state_key, mapping=state).expire(state_key, _STATE_TTL_SECONDS).execute()
+                return
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for quota governor: {e}")
+        with self._lock:
+            self._local_state.setdefault(state_key, {}).update(state)
+
+    async def aobserve(self, provider: str, key: ApiKey, state: Dict[str, float]):
+        if not state or not self.enabled_for(provider):
+            return
+        state_key = self._keys(provider, key.id, time.time())[0]
+        if self._aredis is not None:
+            try:
+                await self._aredis.pipeline().hset(state_key, mapping=state).expire(state_key, _STATE_TTL_SECONDS).execute()
+                return
+            except redis.RedisError as e:
+                print(f"Warning: Redis unavailable for quota governor: {e}")
+        with self._lock:
+            self._local_state.setdefault(state_key, {}).update(state)
+
+    def response_hook(self, provider: str, key: ApiKey) -> Callable[[httpx.Response], None]:
+        """httpx response hook feeding a key's rate-limit headers into the governor"""
+        def hook(response: httpx.Response):
+            self.observe(provider, key, self._response_state(response))
+        return hook
+
+    def async_response_hook(self, provider: str, key: ApiKey) -> Callable[[httpx.Response], Awaitable[None]]:
+        async def hook(response: httpx.Response):
+            await self.aobserve(provider, key, self._response_state(response))
+        return hook
+
+    def sdk_max_retries(self) -> int:
+        """SDK-level retries for pooled clients: none while the governor retries, else the SDK default"""
+        return 0 if self.settings["enabled"] else 2
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.settings["enabled"],
+            "redis_enabled": self._redis is not None,
+            "headroom": self.settings["headroom"],
+            "limits": self.settings["limits"],
+            **self.stats
+        }
+
+@asynccontextmanager
+async def _opened(stream: Any) -> AsyncIterator[Any]:
+    """Open what a stream call returned: enter it if it is an async context manager
+    (awaiting it first if needed), so the stream is closed when the caller is done"""
+    if not hasattr(stream, "__aenter__"):
+        stream = await stream
+    if hasattr(stream, "__aenter__"):
+        async with stream as opened:
+            yield opened
+    else:
+        yield stream
+
+def _time_left(deadline_at: Optional[float]) -> Optional[float]:
+    return max(0.0, deadline_at - time.monotonic()) if deadline_at is not None else None
+
+# Global instance
+quota_governor = QuotaGovernor()
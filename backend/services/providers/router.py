@@ -1,13 +1,32 @@
-from typing import Literal, Optional
+from typing import Literal, Optional, AsyncIterator, Dict, Any, List, Tuple
 from .gemini import GeminiIdeaProvider, GeminiStoryProvider
 from .openai import OpenAIIdeaProvider, OpenAIStoryProvider
 from .anthropic import AnthropicIdeaProvider, AnthropicStoryProvider
+from .stub import StubIdeaProvider, StubStoryProvider, stub_behaviour
 from .config import (
     TaskType, TierType, ProviderType, 
     get_primary_provider, get_fallback_providers, 
-    get_available_providers, get_model_for_provider
+    get_available_providers, get_model_for_provider, provider_configured
 )
-import os
+from .config import HEDGING_SETTINGS, ADAPTIVE_ROUTING_SETTINGS, DEADLINE_SETTINGS
+from .circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from .pool import client_pool
+from .keys import key_pools
+from .stats import LatencyTracker, RoutingStats
+from .policy import AdaptiveRoutingPolicy
+from .tokens import enforce_input_budget, estimate_accuracy, get_cache_info
+from .deadline import Deadline, DeadlineExceeded, within
+from .quota import QuotaExhausted, quota_governor
+from services.cache.generation_cache import generation_cache, cache_key
+from services.cache.single_flight import single_flight
+from metrics.prom import (
+    record_hedge_fired, record_hedge_won, record_circuit_state, record_failover,
+    record_provider_skipped_for_deadline
+)
+from contextlib import suppress
+import asyncio
+import threading
+import time
 
 Task = Literal["idea", "story"]
 
@@ -20,78 +39,518 @@ class ProviderRouter:
             (ProviderType.OPENAI, "story"): OpenAIStoryProvider,
             (ProviderType.ANTHROPIC, "idea"): AnthropicIdeaProvider,
             (ProviderType.ANTHROPIC, "story"): AnthropicStoryProvider,
+            (ProviderType.STUB, "idea"): StubIdeaProvider,
+            (ProviderType.STUB, "story"): StubStoryProvider,
         }
+        # Long-lived provider instances keyed by (provider, task, tier, model)
+        self._instances = {}
+        self._instances_lock = threading.Lock()
+        # Recent latencies per "provider:task" (and "provider:task:ttft" for streams)
+        self.latency = LatencyTracker()
+        self.hedge_stats = {"fired": 0, "primary_won": 0, "hedge_won": 0}
+        # Circuit breakers per "provider:model"
+        self.breakers = CircuitBreakerRegistry()
+        # Live latency/cost stats per provider, model and task for adaptive routing
+        self.routing_stats = RoutingStats(alpha=ADAPTIVE_ROUTING_SETTINGS["ewma_alpha"])
+        self.policy = AdaptiveRoutingPolicy(self.routing_stats)
     
     def select(self, task: Task, tier: str, preferred_provider: Optional[str] = None):
         """Select the best available provider for the task and tier"""
+        return self.select_with_type(task, tier, preferred_provider)[1]
+    
+    def select_with_type(self, task: Task, tier: str, preferred_provider: Optional[str] = None) -> Tuple[ProviderType, Any]:
+        """Select a provider, returning (provider type, provider instance)"""
+        # Preferred, primary, then fallback providers whose circuit is not open
+        candidates = self._candidates(task, tier, preferred_provider)
+        if candidates:
+            return candidates[0]
+        
+        # If all else fails, try Gemini as last resort
+        try:
+            print("⚠️ All configured providers failed, trying Gemini as last resort")
+            return ProviderType.GEMINI, self._create_provider(ProviderType.GEMINI, task, tier)
+        except Exception as e:
+            raise Exception(f"All providers failed. Last error: {e}")
+    
+    async def agenerate(self, task: Task, tier: str, request, preferred_provider: Optional[str] = None,
+                        deadline: Optional[Deadline] = None):
+        """Run a generation on the best healthy provider, hedging when enabled for the tier
+        and failing over to the next healthy provider if the call fails. Identical requests
+        already in flight share one upstream call. With a deadline, every provider call is
+        bounded by the time left and providers too slow for it are skipped."""
+        if deadline is not None:
+            deadline.check(task, "router")
+        # Reject (or truncate) prompts over the tier's input token budget before any call
+        provider_type = self._configured_type(task, tier, preferred_provider)
+        request = enforce_input_budget(task, tier, request, provider_type.value if provider_type else None)
+        
+        use_cache = generation_cache.enabled_for(tier)
+        coalesce = single_flight.enabled_for(tier)
+        key = self._cache_key(task, tier, request, preferred_provider) if use_cache or coalesce else None
+        
+        if use_cache:
+            cached = await generation_cache.get(key, task, (tier or "free").lower())
+            if cached is not None:
+                return cached
+        
+        if coalesce:
+            # A coalesced caller waits on the shared call for no longer than its own deadline
+            result = await single_flight.do(
+                key, task, lambda: self._generate(task, tier, request, preferred_provider, deadline), deadline
+            )
+        else:
+            result = await self._generate(task, tier, request, preferred_provider, deadline)
+        
+        # Only the caller that made the upstream call populates the cache
+        if use_cache and not result.coalesced:
+            await generation_cache.set(key, task, result)
+        return result
+    
+    async def _generate(self, task: Task, tier: str, request, preferred_provider: Optional[str] = None,
+                        deadline: Optional[Deadline] = None):
+        candidates = self._candidates(task, tier, preferred_provider)
+        if not candidates:
+            raise CircuitOpenError(f"No healthy provider available for {task} (all circuits open)")
+        
+        last_error = None
+        previous_type = None
+        all_shed = True
+        while candidates:
+            primary = candidates.pop(0)
+            if deadline is not None:
+                deadline.check(task, "router")
+                if not self._fits_deadline(task, primary[0], deadline, streaming=False):
+                    continue
+            if previous_type is not None:
+                self._record_failover(task, previous_type, primary[0])
+            try:
+                return await self._hedged_call(task, tier, primary, candidates, request, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+                previous_type = primary[0]
+                all_shed = all_shed and isinstance(e, QuotaExhausted)
+                print(f"⚠️ Provider {primary[0].value} failed for {task}: {e}")
+        
+        if last_error is None:
+            # Every provider was skipped as too slow for the time left
+            raise deadline.exceeded(task, "router")
+        if all_shed:
+            # Let callers tell the client when to retry
+            raise last_error
+        raise Exception(f"All providers failed. Last error: {last_error}")
+    
+    def _configured_type(self, task: Task, tier: str, preferred_provider: Optional[str] = None) -> Optional[ProviderType]:
+        """The preferred provider if valid, else the tier's configured primary"""
+        if preferred_provider:
+            try:
+                return ProviderType(preferred_provider.lower())
+            except ValueError:
+                pass
+        return get_primary_provider(TaskType(task), TierType(tier.lower() if tier else "free"))
+    
+    def _cache_key(self, task: Task, tier: str, request, preferred_provider: Optional[str] = None) -> str:
+        """Cache key for a request, scoped to the configured (not the live-routed) provider
+        and model so adaptive reordering and failover do not fragment the cache"""
         tier_enum = TierType(tier.lower() if tier else "free")
         task_enum = TaskType(task)
+        provider_type = self._configured_type(task, tier, preferred_provider)
+        provider_class = self.provider_classes.get((provider_type, task))
+        # max_tokens is derived from the request, tier and model, which the key already covers
+        sampling = {"temperature": getattr(provider_class, "temperature", None)}
+        model = get_model_for_provider(task_enum, tier_enum, provider_type) if provider_type else None
+        return cache_key(task, tier_enum.value, f"{provider_type.value if provider_type else 'none'}:{model}",
+                         request, sampling)
+    
+    async def _hedged_call(self, task: Task, tier: str, primary: Tuple[ProviderType, Any],
+                           candidates: List[Tuple[ProviderType, Any]], request, deadline: Optional[Deadline] = None):
+        """Call the primary; if it is slow, race it against the next candidate (which is consumed)"""
+        primary_type, primary_provider = primary
+        hedge_delay = self._hedge_delay(task, tier, primary_type, streaming=False)
+        if hedge_delay is None or not candidates:
+            return await self._timed_call(primary_type, task, primary_provider, request, deadline)
+        
+        primary_task = asyncio.create_task(self._timed_call(primary_type, task, primary_provider, request, deadline))
+        pending = {primary_task}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return primary_task.result()
+            
+            # Candidates too slow for the time left would be skipped as primaries too
+            while deadline is not None and candidates and \
+                    not self._fits_deadline(task, candidates[0][0], deadline, streaming=False):
+                candidates.pop(0)
+            if not candidates:
+                return await primary_task
+            
+            hedge_type, hedge_provider = candidates.pop(0)
+            self._record_hedge_fired(task, primary_type, hedge_type)
+            hedge_task = asyncio.create_task(self._timed_call(hedge_type, task, hedge_provider, request, deadline))
+            pending = {primary_task, hedge_task}
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is None:
+                        self._record_hedge_won(task, "hedge" if finished is hedge_task else "primary")
+                        return finished.result()
+            
+            # Both sides failed: surface the primary's error
+            raise primary_task.exception()
+        finally:
+            for leftover in pending:
+                leftover.cancel()
+    
+    async def stream(self, task: Task, tier: str, request, primary: Optional[Tuple[ProviderType, Any]] = None,
+                     deadline: Optional[Deadline] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a generation, hedging on time-to-first-token when enabled for the tier.
+        Providers that fail before sending any content are failed over to the next healthy one.
+        With a deadline the stream ends with a deadline_exceeded error event once time runs out."""
+        start = time.time()
+        request = enforce_input_budget(task, tier, request, primary[0].value if primary else None)
+        candidates = [c for c in self._candidates(task, tier) if hasattr(c[1], 'generate_streaming')]
+        if primary is not None:
+            candidates = [primary] + [c for c in candidates if c[0] != primary[0]]
+        if deadline is not None:
+            candidates = [c for c in candidates if self._fits_deadline(task, c[0], deadline, streaming=True)]
+            if not candidates:
+                yield self._deadline_event(deadline.exceeded(task, "router"))
+                return
         
-        # Check if preferred provider is specified and available
+        winner = None
+        error_event = {'type': 'error', 'error': f"No healthy provider available for {task} (all circuits open)"}
+        previous_type = None
+        while candidates and winner is None:
+            current = candidates.pop(0)
+            if previous_type is not None:
+                self._record_failover(task, previous_type, current[0])
+            winner, first_event = await self._open_stream(task, tier, current, candidates, request, deadline)
+            if winner is None:
+                error_event = first_event
+                previous_type = current[0]
+        
+        if winner is None:
+            yield error_event
+            return
+        
+        winner_type, stream, breaker, provider = winner
+        self.latency.observe(f"{winner_type.value}:{task}:ttft", (time.time() - start) * 1000)
+        try:
+            yield first_event
+            while True:
+                try:
+                    event = await within(deadline, stream.__anext__(), task, "stream")
+                except StopAsyncIteration:
+                    break
+                except DeadlineExceeded as e:
+                    yield self._deadline_event(e)
+                    break
+                if event.get('type') == 'error':
+                    # Content was already sent, so the stream cannot be failed over
+                    self._record_outcome(winner_type, provider, breaker, success=False)
+                elif event.get('type') == 'metadata':
+                    self.routing_stats.observe(
+                        winner_type.value, getattr(provider, 'model_name', 'unknown'), task,
+                        (time.time() - start) * 1000,
+                        event.get('tokens_in', 0), event.get('tokens_out', 0), event.get('cost_usd', 0.0)
+                    )
+                yield event
+            self.latency.observe(f"{winner_type.value}:{task}", (time.time() - start) * 1000)
+        finally:
+            with suppress(Exception):
+                await stream.aclose()
+    
+    async def _open_stream(self, task: Task, tier: str, primary: Tuple[ProviderType, Any],
+                           candidates: List[Tuple[ProviderType, Any]], request, deadline: Optional[Deadline] = None):
+        """Start the primary stream (and a hedge if it is slow) and wait for the first content event.
+        Returns (winner, first_event); winner is None when every started stream failed."""
+        primary_type, primary_provider = primary
+        streams = {}
+        first_events = {}
+        
+        def launch(provider_type: ProviderType, provider) -> bool:
+            breaker = self._breaker(provider_type, provider)
+            if not breaker.allow_request():
+                return False
+            timeout = deadline.remaining() if deadline is not None else None
+            stream = provider.generate_streaming(request, timeout=timeout).__aiter__()
+            streams[provider_type] = (stream, breaker, provider)
+            first_events[asyncio.create_task(stream.__anext__())] = provider_type
+            return True
+        
+        if not launch(primary_type, primary_provider):
+            return None, {'type': 'error', 'error': f"Circuit open for {primary_type.value}"}
+        
+        winner_type, first_event, error_event = None, None, None
+        try:
+            wait = self._hedge_delay(task, tier, primary_type, streaming=True)
+            if deadline is not None:
+                wait = min(wait, deadline.remaining()) if wait is not None else deadline.remaining()
+            done, _ = await asyncio.wait(set(first_events), timeout=wait)
+            if not done and candidates and not (deadline is not None and deadline.expired()):
+                hedge_type, hedge_provider = candidates[0]
+                if launch(hedge_type, hedge_provider):
+                    candidates.pop(0)
+                    self._record_hedge_fired(task, primary_type, hedge_type)
+            
+            pending = set(first_events)
+            while pending and winner_type is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED,
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
+                if not done:
+                    # Out of time before any stream produced content
+                    error_event = self._deadline_event(deadline.exceeded(task, "stream"))
+                    for unfinished in pending:
+                        provider_type = first_events[unfinished]
+                        _, breaker, provider = streams[provider_type]
+                        self._record_outcome(provider_type, provider, breaker, success=False)
+                    break
+                for finished in done:
+                    provider_type = first_events[finished]
+                    _, breaker, provider = streams[provider_type]
+                    if finished.exception() is not None:
+                        event = {'type': 'error', 'error': str(finished.exception()) or "Stream ended without content"}
+                    else:
+                        event = finished.result()
+                    
+                    if event.get('type') == 'error':
+                        if event.get('error_type') == 'quota_exhausted':
+                            breaker.release()
+                        else:
+                            self._record_outcome(provider_type, provider, breaker, success=False)
+                        error_event = error_event or event
+                    elif winner_type is None:
+                        self._record_outcome(provider_type, provider, breaker, success=True)
+                        winner_type, first_event = provider_type, event
+            
+            if winner_type is not None and len(first_events) > 1:
+                self._record_hedge_won(task, "primary" if winner_type == primary_type else "hedge")
+        finally:
+            for pending_event, provider_type in first_events.items():
+                if provider_type == winner_type:
+                    continue
+                stream, breaker, _ = streams[provider_type]
+                if not pending_event.done():
+                    pending_event.cancel()
+                    breaker.release()
+                with suppress(BaseException):
+                    await pending_event
+                with suppress(Exception):
+                    await stream.aclose()
+        
+        if winner_type is None:
+            return None, error_event
+        stream, breaker, provider = streams[winner_type]
+        return (winner_type, stream, breaker, provider), first_event
+    
+    def _deadline_event(self, error: DeadlineExceeded) -> Dict[str, Any]:
+        return {'type': 'error', 'error': str(error), 'error_type': 'deadline_exceeded'}
+    
+    async def _timed_call(self, provider_type: ProviderType, task: Task, provider, request,
+                          deadline: Optional[Deadline] = None):
+        breaker = self._breaker(provider_type, provider)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for {provider_type.value}")
+        
+        start = time.time()
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            result = await within(deadline, provider.agenerate(request, timeout=timeout), task, "provider")
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except QuotaExhausted:
+            # Our own key is out of quota; the provider itself is healthy
+            breaker.release()
+            raise
+        except Exception as e:
+            # A call that used up the deadline counts against the provider: hung upstreams trip its breaker
+            self._record_outcome(provider_type, provider, breaker, success=False)
+            if deadline is not None and deadline.expired() and not isinstance(e, DeadlineExceeded):
+                # The SDK's own timeout fired first
+                raise deadline.exceeded(task, "provider") from e
+            raise
+        self._record_outcome(provider_type, provider, breaker, success=True)
+        latency_ms = (time.time() - start) * 1000
+        self.latency.observe(f"{provider_type.value}:{task}", latency_ms)
+        self.routing_stats.observe(
+            provider_type.value, getattr(provider, 'model_name', 'unknown'), task, latency_ms,
+            result.tokens_in, result.tokens_out, result.cost_usd
+        )
+        if not result.usage_estimated:
+            estimate_accuracy.observe(task, provider_type.value, getattr(provider, 'model_name', 'unknown'),
+                                      request, result.tokens_in)
+        return result
+    
+    def _fits_deadline(self, task: Task, provider_type: ProviderType, deadline: Deadline, streaming: bool) -> bool:
+        """False when the provider's recent p50 latency (time to first token for
+        streams) is above the time left, so calling it would likely time out"""
+        key = f"{provider_type.value}:{task}:ttft" if streaming else f"{provider_type.value}:{task}"
+        if self.latency.count(key) < DEADLINE_SETTINGS["min_samples"]:
+            return True
+        if self.latency.percentile(key, 50) <= deadline.remaining_ms():
+            return True
+        print(f"⚠️ Skipping {provider_type.value} for {task}: p50 latency is above the remaining deadline")
+        try:
+            record_provider_skipped_for_deadline(task, provider_type.value)
+        except Exception as e:
+            print(f"Failed to record deadline metric: {e}")
+        return False
+    
+    def _candidates(self, task: Task, tier: str, preferred_provider: Optional[str] = None) -> List[Tuple[ProviderType, Any]]:
+        """Providers to try, in order: preferred, primary, then fallback_order; skips providers
+        that cannot be created or whose circuit is open"""
+        tier_enum = TierType(tier.lower() if tier else "free")
+        task_enum = TaskType(task)
+        
+        order = []
         if preferred_provider:
             try:
-                provider_enum = ProviderType(preferred_provider.lower())
-                if provider_enum in get_available_providers():
-                    return self._create_provider(provider_enum, task, tier)
+                order.append(ProviderType(preferred_provider.lower()))
             except ValueError:
                 pass  # Invalid provider, fall back to normal selection
-        
-        # Get primary provider for this task/tier combination
         primary_provider = get_primary_provider(task_enum, tier_enum)
-        
         if primary_provider:
-            try:
-                return self._create_provider(primary_provider, task, tier)
-            except Exception as e:
-                print(f"⚠️ Primary provider {primary_provider} failed: {e}")
-                # Fall back to other providers
-        
-        # Try fallback providers
-        fallback_providers = get_fallback_providers(task_enum, tier_enum)
+            order.append(primary_provider)
+        order.extend(get_fallback_providers(task_enum, tier_enum))
         
-        for provider in fallback_providers:
+        candidates = []
+        for provider_type in dict.fromkeys(order):
             try:
-                return self._create_provider(provider, task, tier)
+                provider = self._create_provider(provider_type, task, tier)
             except Exception as e:
-                print(f"⚠️ Fallback provider {provider} failed: {e}")
+                print(f"⚠️ Provider {provider_type} unavailable: {e}")
                 continue
+            if self._breaker(provider_type, provider).is_available():
+                candidates.append((provider_type, provider))
         
-        # If all else fails, try Gemini as last resort
+        if self.policy.enabled:
+            # An explicitly preferred provider stays first; the rest follow live stats
+            pinned = candidates[:1] if preferred_provider and candidates and candidates[0][0] == order[0] else []
+            candidates = pinned + self.policy.order(task, tier_enum, candidates[len(pinned):])
+        return candidates
+    
+    def _breaker(self, provider_type: ProviderType, provider) -> CircuitBreaker:
+        return self.breakers.get(f"{provider_type.value}:{getattr(provider, 'model_name', 'unknown')}")
+    
+    def _record_outcome(self, provider_type: ProviderType, provider, breaker: CircuitBreaker, success: bool):
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
         try:
-            print("⚠️ All configured providers failed, trying Gemini as last resort")
-            return self._create_provider(ProviderType.GEMINI, task, tier)
+            record_circuit_state(provider_type.value, getattr(provider, 'model_name', 'unknown'), breaker.state)
         except Exception as e:
-            raise Exception(f"All providers failed. Last error: {e}")
+            print(f"Failed to record circuit breaker metric: {e}")
+    
+    def _record_failover(self, task: Task, from_type: ProviderType, to_type: ProviderType):
+        print(f"⚠️ Failing over {task} from {from_type.value} to {to_type.value}")
+        try:
+            record_failover(task, from_type.value, to_type.value)
+        except Exception as e:
+            print(f"Failed to record failover metric: {e}")
+    
+    def _hedge_delay(self, task: Task, tier: str, provider_type: ProviderType, streaming: bool) -> Optional[float]:
+        """Seconds to wait on the primary before hedging, or None when hedging is off"""
+        tier_value = tier.lower() if tier else "free"
+        if tier_value not in HEDGING_SETTINGS["enabled_tiers"]:
+            return None
+        settings = HEDGING_SETTINGS["tasks"].get(TaskType(task))
+        if not settings:
+            return None
+        
+        key = f"{provider_type.value}:{task}:ttft" if streaming else f"{provider_type.value}:{task}"
+        default_ms = settings.get("stream_default_delay_ms", settings["default_delay_ms"]) if streaming else settings["default_delay_ms"]
+        if self.latency.count(key) >= HEDGING_SETTINGS["min_samples"]:
+            delay_ms = max(settings["min_delay_ms"], self.latency.percentile(key, settings["percentile"]))
+        else:
+            delay_ms = default_ms
+        return delay_ms / 1000.0
+    
+    def _record_hedge_fired(self, task: Task, primary_type: ProviderType, hedge_type: ProviderType):
+        self.hedge_stats["fired"] += 1
+        try:
+            record_hedge_fired(task, primary_type.value, hedge_type.value)
+        except Exception as e:
+            print(f"Failed to record hedge metric: {e}")
+    
+    def _record_hedge_won(self, task: Task, winner: str):
+        self.hedge_stats[f"{winner}_won"] += 1
+        try:
+            record_hedge_won(task, winner)
+        except Exception as e:
+            print(f"Failed to record hedge metric: {e}")
     
     def _create_provider(self, provider: ProviderType, task: Task, tier: str):
-        """Create a provider instance"""
+        """Get a pooled provider instance, creating it on first use"""
         provider_class = self.provider_classes.get((provider, task))
         if not provider_class:
             raise Exception(f"No provider class found for {provider} and {task}")
         
-        # Check if API key is available
-        api_key_env = {
-            ProviderType.GEMINI: "GEMINI_API_KEY",
-            ProviderType.OPENAI: "OPENAI_API_KEY",
-            ProviderType.ANTHROPIC: "ANTHROPIC_API_KEY"
-        }.get(provider)
+        # Check if an API key (or key pool) is available
+        if provider == ProviderType.STUB and not provider_configured(provider.value):
+            raise Exception("Stub provider is disabled (env: STUB_PROVIDER_ENABLED)")
+        if not provider_configured(provider.value):
+            env = provider.value.upper()
+            raise Exception(f"API key not found for {provider} (env: {env}_API_KEY or {env}_API_KEY_POOL)")
         
-        if not os.getenv(api_key_env):
-            raise Exception(f"API key not found for {provider} (env: {api_key_env})")
+        tier_enum = TierType(tier.lower() if tier else "free")
+        model = get_model_for_provider(TaskType(task), tier_enum, provider)
+        key = (provider, task, tier_enum.value, model)
         
-        return provider_class(tier)
+        with self._instances_lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = provider_class(tier)
+                self._instances[key] = instance
+            return instance
+    
+    async def shutdown(self):
+        """Drop pooled provider instances, close their HTTP connection pools and
+        write queued token estimate samples"""
+        with self._instances_lock:
+            self._instances.clear()
+        await client_pool.aclose()
+        await estimate_accuracy.flush()
+    
+    def get_pool_stats(self) -> dict:
+        """Get provider instance and connection pool statistics"""
+        with self._instances_lock:
+            instances = [
+                {"provider": p.value, "task": t, "tier": tier, "model": m}
+                for (p, t, tier, m) in self._instances
+            ]
+        return {
+            "instances": instances,
+            "connection_pool": client_pool.get_stats(),
+            "latency": self.latency.snapshot(),
+            "hedging": dict(self.hedge_stats),
+            "circuit_breakers": self.breakers.snapshot(),
+            "routing": {
+                "adaptive": self.policy.enabled,
+                "explorations": self.policy.explorations,
+                "stats": self.routing_stats.snapshot()
+            },
+            "generation_cache": generation_cache.get_stats(),
+            "single_flight": single_flight.get_stats(),
+            "quota_governor": quota_governor.get_stats(),
+            "api_keys": key_pools.snapshot(),
+            "stub_provider": stub_behaviour.get_stats(),
+            "token_estimator": {
+                "cache": get_cache_info(),
+                "accuracy": estimate_accuracy.snapshot()
+            }
+        }
     
     def get_available_providers(self) -> list:
         """Get list of available providers"""
         available = []
         for provider in ProviderType:
-            api_key_env = {
-                ProviderType.GEMINI: "GEMINI_API_KEY",
-                ProviderType.OPENAI: "OPENAI_API_KEY", 
-                ProviderType.ANTHROPIC: "ANTHROPIC_API_KEY"
-            }.get(provider)
-            
-            if os.getenv(api_key_env):
+            if provider_configured(provider.value):
                 available.append(provider.value)
         
         return available
@@ -0,0 +1,108 @@
+"""
+Live latency statistics for provider calls
+"""
+import threading
+from collections import deque
+from typing import Dict, Any, Deque, Hashable, Optional
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per key"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Hashable, latency_ms: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self._samples[key] = samples
+            samples.append(latency_ms)
+
+    def count(self, key: Hashable) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def percentile(self, key: Hashable, pct: float) -> Optional[float]:
+        """Nearest-rank percentile of the window, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples) + 0.5)) - 1))
+        return samples[rank]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            str(key): {
+                "count": self.count(key),
+                "p50_ms": self.percentile(key, 50),
+                "p95_ms": self.percentile(key, 95)
+            }
+            for key in keys
+        }
+
+class RoutingStats:
+    """Live latency and cost statistics per (provider, model, task).
+
+    Keeps an EWMA of latency and of cost per 1K tokens alongside a rolling
+    latency window for percentiles, so routing decisions track how providers
+    behave right now rather than their static characteristics.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        self.alpha = alpha
+        self.latency = LatencyTracker(window=window)
+        self._ewma: Dict[Hashable, Dict[str, float]] = {}
+        self._labels: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(provider: str, model: str, task: str) -> str:
+        return f"{provider}:{model}:{task}"
+
+    def observe(self, provider: str, model: str, task: str, latency_ms: float,
+                tokens_in: int = 0, tokens_out: int = 0, cost_usd: float = 0.0):
+        key = self.key(provider, model, task)
+        self.latency.observe(key, latency_ms)
+        tokens = (tokens_in or 0) + (tokens_out or 0)
+        cost_per_1k = (cost_usd or 0.0) / tokens * 1000 if tokens else None
+        with self._lock:
+            entry = self._ewma.get(key)
+            if entry is None:
+                self._labels[key] = (provider, model, task)
+                self._ewma[key] = {
+                    "latency_ms": latency_ms,
+                    "cost_per_1k_tokens": cost_per_1k or 0.0,
+                    "samples": 1
+                }
+                return
+            entry["latency_ms"] += self.alpha * (latency_ms - entry["latency_ms"])
+            if cost_per_1k is not None:
+                entry["cost_per_1k_tokens"] += self.alpha * (cost_per_1k - entry["cost_per_1k_tokens"])
+            entry["samples"] += 1
+
+    def get(self, provider: str, model: str, task: str) -> Optional[Dict[str, float]]:
+        """Current stats for a provider/model/task, or None if it has never been observed"""
+        key = self.key(provider, model, task)
+        with self._lock:
+            entry = self._ewma.get(key)
+            if entry is None:
+                return None
+            entry = dict(entry)
+        return {
+            "samples": entry["samples"],
+            "ewma_latency_ms": entry["latency_ms"],
+            "p50_latency_ms": self.latency.percentile(key, 50),
+            "p95_latency_ms": self.latency.percentile(key, 95),
+            "cost_per_1k_tokens": entry["cost_per_1k_tokens"]
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = dict(self._labels)
+        return {key: self.get(*label) for key, label in labels.items()}
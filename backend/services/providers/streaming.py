@@ -0,0 +1,70 @@
+"""
+Streaming helpers shared by the story providers
+"""
+import asyncio
+import time
+from contextlib import suppress
+from typing import AsyncIterator, Dict, Any, Optional
+from .config import STREAMING_SETTINGS
+
+_DONE = object()
+
+class StreamTimer:
+    """Tracks total latency and time-to-first-token of a streamed generation"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.first_token_at: Optional[float] = None
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.first_token_at is None:
+            return None
+        return int((self.first_token_at - self.start) * 1000)
+
+    @property
+    def elapsed_ms(self) -> int:
+        return int((time.time() - self.start) * 1000)
+
+async def relay(source: AsyncIterator[Dict[str, Any]],
+                max_buffered: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Forward events from an upstream stream through a bounded buffer.
+
+    The upstream is read by a separate task so a briefly slow client does not
+    stall the provider connection, but once `max_buffered` events are queued the
+    reader waits, which applies backpressure to the upstream socket instead of
+    buffering an unbounded amount of text. If the consumer goes away the
+    upstream stream is cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered or STREAMING_SETTINGS["max_buffered_chunks"])
+
+    async def pump():
+        try:
+            async for event in source:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_DONE)
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            event = await queue.get()
+            if event is _DONE:
+                break
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        aclose = getattr(source, "aclose", None)
+        if aclose:
+            with suppress(Exception):
+                await aclose()
@@ -0,0 +1,234 @@
+"""
+Structured idea output and incremental JSON parsing
+
+Ideas are requested as JSON matching IDEA_SCHEMA through each provider's
+structured-output feature. While a response streams in, IncrementalJSONParser
+picks out each top-level field as soon as its value is complete, so clients
+can render the idea progressively and the story step can start before the
+idea has finished.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from schemas.idea import IdeaRequest, IdeaResponse
+from metrics.prom import record_idea_parse
+from .config import STRUCTURED_OUTPUT_SETTINGS
+
+# Field order matters when streaming: the story step only needs the first three
+IDEA_FIELDS = ("title", "genre", "outline", "tone", "characters", "setting")
+STORY_FIELDS = ("title", "genre", "outline")
+
+IDEA_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "genre": {"type": "string"},
+        "outline": {"type": "string"},
+        "tone": {"type": "string"},
+        "characters": {"type": "array", "items": {"type": "string"}},
+        "setting": {"type": "string"}
+    },
+    "required": list(IDEA_FIELDS),
+    "additionalProperties": False
+}
+
+IDEA_TOOL_NAME = "record_story_idea"
+
+# OpenAI models that accept a strict JSON schema, and older ones limited to JSON mode
+_OPENAI_JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5")
+_OPENAI_JSON_OBJECT_MODELS = ("gpt-3.5-turbo", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125")
+
+def structured_output_enabled(provider: str) -> bool:
+    return provider in STRUCTURED_OUTPUT_SETTINGS["providers"]
+
+def openai_response_format(model: str) -> Optional[Dict[str, Any]]:
+    """response_format for the model, or None when it only supports prompted JSON"""
+    if not structured_output_enabled("openai"):
+        return None
+    if model.startswith(_OPENAI_JSON_SCHEMA_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": "story_idea", "strict": True, "schema": IDEA_SCHEMA}}
+    if model.startswith(_OPENAI_JSON_OBJECT_MODELS):
+        return {"type": "json_object"}
+    return None
+
+def anthropic_tool_options() -> Dict[str, Any]:
+    """tools/tool_choice forcing the idea through a single tool call"""
+    if not structured_output_enabled("anthropic"):
+        return {}
+    return {
+        "tools": [{
+            "name": IDEA_TOOL_NAME,
+            "description": "Record the generated story idea.",
+            "input_schema": IDEA_SCHEMA
+        }],
+        "tool_choice": {"type": "tool", "name": IDEA_TOOL_NAME}
+    }
+
+def gemini_generation_config() -> Dict[str, Any]:
+    """JSON mode with the idea schema (Gemini does not accept additionalProperties)"""
+    if not structured_output_enabled("gemini"):
+        return {}
+    schema = {k: v for k, v in IDEA_SCHEMA.items() if k != "additionalProperties"}
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+def anthropic_output_text(content) -> str:
+    """The idea text of a Messages response: the forced tool call's input as
+    JSON, or the first text block when no tool was used"""
+    text = ""
+    for block in content or []:
+        if block.type == "tool_use":
+            return json.dumps(block.input, default=vars)
+        if block.type == "text" and not text:
+            text = block.text
+    return text
+
+def _normalize(name: str, value: Any) -> Any:
+    # Prompted (non-schema) output sometimes describes the characters in one string
+    if name == "characters" and isinstance(value, str):
+        return [value]
+    return value
+
+def idea_from_fields(fields: Dict[str, Any], request: IdeaRequest) -> IdeaResponse:
+    return IdeaResponse(
+        title=fields.get("title") or "Untitled Story",
+        genre=fields.get("genre") or request.genre or "General",
+        tone=fields.get("tone") or request.tone or "General",
+        outline=fields.get("outline") or "No outline provided",
+        characters=_normalize("characters", fields.get("characters")) or None,
+        setting=fields.get("setting")
+    )
+
+def parse_idea_json(text: str, request: IdeaRequest) -> Optional[IdeaResponse]:
+    """Parse an idea from JSON text (tolerating a surrounding code fence); None if it is not JSON"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        try:
+            data = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+        except json.JSONDecodeError:
+            data = None
+    if not isinstance(data, dict):
+        return None
+    return idea_from_fields(data, request)
+
+def parse_idea(text: str, request: IdeaRequest, provider: str,
+               fallback: Callable[[str, IdeaRequest], IdeaResponse]) -> IdeaResponse:
+    """Parse an idea as JSON, falling back to the provider's plain-text parser"""
+    idea = parse_idea_json(text, request)
+    record_idea_parse(provider, "json" if idea is not None else "text")
+    return idea if idea is not None else fallback(text, request)
+
+class IncrementalJSONParser:
+    """Parses a JSON object as it streams in.
+
+    feed() takes the next chunk of text and returns the top-level (key, value)
+    pairs whose values completed within it. Text before the opening brace
+    (such as a code fence) is skipped, and values that fail to parse are dropped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # At depth 1 we are reading a "key", a "value" or are "after" a value
+        self._state = "key"
+        self._key: Optional[str] = None
+        self._start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        buffer = self._buffer
+        fields: List[Tuple[str, Any]] = []
+        i = self._pos
+        while i < len(buffer) and not self.done:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_token(buffer, i + 1, fields)
+            elif self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._state == "value":
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._end_token(buffer, i + 1, fields)
+                elif self._depth == 0:
+                    self._end_token(buffer, i, fields)
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ":":
+                    self._state = "value"
+                elif ch == ",":
+                    self._end_token(buffer, i, fields)
+                    self._state = "key"
+                elif not ch.isspace() and self._state == "value" and self._start is None:
+                    # Start of a number, true, false or null
+                    self._start = i
+            i += 1
+        self._pos = i
+        return fields
+
+    def _end_token(self, buffer: str, end: int, fields: List[Tuple[str, Any]]):
+        if self._start is None:
+            return
+        text, self._start = buffer[self._start:end].strip(), None
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        if self._state == "key":
+            self._key = value
+        elif self._state == "value":
+            fields.append((self._key, value))
+            self._state = "after"
+
+class IdeaStream:
+    """Turns streamed idea text into events: a "field" event as each idea field
+    completes, then the parsed "idea" once the stream has ended"""
+
+    def __init__(self, request: IdeaRequest, parse_output: Callable[[str, IdeaRequest], IdeaResponse]):
+        self.request = request
+        self.text = ""
+        self._parse_output = parse_output
+        self._parser = IncrementalJSONParser()
+        self._sent = set()
+
+    def _field_event(self, name: str, value: Any) -> Dict[str, Any]:
+        self._sent.add(name)
+        return {'type': 'field', 'field': name, 'value': value, 'is_final': False}
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        return [
+            self._field_event(name, _normalize(name, value))
+            for name, value in self._parser.feed(chunk)
+            if name in IDEA_FIELDS and name not in self._sent
+        ]
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Parse the whole text; emits fields the stream did not (e.g. plain-text output)"""
+        idea = self._parse_output(self.text, self.request)
+        events = [
+            self._field_event(name, getattr(idea, name))
+            for name in IDEA_FIELDS
+            if name not in self._sent and getattr(idea, name) is not None
+        ]
+        events.append({'type': 'idea', 'idea': idea.model_dump(), 'is_final': False})
+        return events
@@ -0,0 +1,342 @@
+"""
+Deterministic stub provider
+
+Stands in for a real model with no API key or network, so the router, agents
+and orchestrator can be load tested, failover tested and run in CI for free.
+The reply is derived from the request (the same request always gets the same
+text) and sized like a real one; time to first token, token rate and injected
+failures follow STUB_PROVIDER_SETTINGS and are drawn from a seeded generator,
+so a run can be replayed. Calls go through the quota governor, so injected 429s
+and 5xx errors get the same backoff, retries and key ejection as real ones.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from schemas.idea import IdeaRequest, IdeaResponse
+from schemas.story import StoryRequest, StoryResponse
+from .base import GenerationResult, IdeaProvider, StoryProvider
+from .config import STUB_PROVIDER_SETTINGS
+from .pricing import usage_cost
+from .quota import QuotaExhausted, quota_governor
+from .streaming import StreamTimer
+from .structured import IdeaStream, idea_from_fields, parse_idea
+from .tokens import estimate_request_tokens, estimate_tokens
+from .usage import TokenUsage
+
+_WORDS = (
+    "lantern", "harbor", "silver", "winter", "garden", "echo", "river", "storm", "mirror", "forest",
+    "signal", "ember", "quiet", "hollow", "orbit", "letter", "tide", "ashes", "crown", "meadow",
+    "engine", "shadow", "promise", "glass", "north", "feather", "station", "tower", "salt", "velvet",
+    "the", "a", "of", "and", "in", "under", "beyond", "with", "before", "after"
+)
+_NAMES = ("Mara", "Ilya", "Tomas", "Wren", "Oksana", "Dev", "Juno", "Castor", "Ada", "Felix", "Noor", "Rafe")
+_GENRES = ("Fantasy", "Science Fiction", "Mystery", "Drama", "Adventure", "Horror")
+_TONES = ("Hopeful", "Dark", "Whimsical", "Tense", "Melancholic")
+
+# Streamed replies arrive in chunks of about this many words (or JSON characters)
+_STREAM_CHUNK_WORDS = 4
+_STREAM_CHUNK_CHARS = 16
+
+class StubProviderError(Exception):
+    """An injected upstream failure"""
+    status_code = 500
+
+class StubRateLimitError(StubProviderError):
+    """An injected 429, shaped like the SDKs' errors: a status, an error code and Retry-After"""
+    status_code = 429
+
+    def __init__(self, message: str, code: str, retry_after: float):
+        super().__init__(message)
+        self.code = code
+        self.response = httpx.Response(429, headers={"retry-after": str(retry_after)})
+
+class StubBehaviour:
+    """Draws each stub call's time to first token and injected failure from one seeded generator"""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = settings or STUB_PROVIDER_SETTINGS
+        self._random = random.Random(self.settings["seed"])
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "rate_limited": 0, "insufficient_quota": 0, "shed": 0}
+
+    def plan(self) -> Tuple[Optional[str], float]:
+        """(injected failure or None, seconds to first token) for the next call"""
+        s = self.settings
+        with self._lock:
+            roll = self._random.random()
+            ttft_ms = s["median_ms"]
+            if s["distribution"] in ("lognormal", "heavy_tail") and s["median_ms"] > 0:
+                ttft_ms = self._random.lognormvariate(math.log(s["median_ms"]), s["sigma"])
+            if s["distribution"] == "heavy_tail" and self._random.random() < s["tail_probability"]:
+                ttft_ms *= s["tail_multiplier"]
+            fault = None
+            for name, rate in (("rate_limited", s["rate_limit_rate"]),
+                               ("insufficient_quota", s["insufficient_quota_rate"]), ("shed", s["shed_rate"]),
+                               ("timeouts", s["timeout_rate"]), ("errors", s["error_rate"])):
+                if roll < rate:
+                    fault = name
+                    break
+                roll -= rate
+            self.stats["calls"] += 1
+            if fault:
+                self.stats[fault] += 1
+        return fault, ttft_ms / 1000.0
+
+    def generation_seconds(self, tokens: int) -> float:
+        return tokens / self.settings["tokens_per_second"] if self.settings["tokens_per_second"] > 0 else 0.0
+
+    def hang_seconds(self, timeout: Optional[float]) -> float:
+        """How long an injected timeout blocks: until the call's own timeout, if sooner"""
+        hang = self.settings["timeout_seconds"]
+        return min(hang, timeout) if timeout is not None else hang
+
+    def failure(self, fault: str) -> Exception:
+        retry_after = self.settings["retry_after_seconds"]
+        if fault == "rate_limited":
+            return StubRateLimitError("Injected stub rate limit", "rate_limit_exceeded", retry_after)
+        if fault == "insufficient_quota":
+            # Takes the key out of rotation, like an exhausted billing quota
+            return StubRateLimitError("Injected stub quota exhaustion", "insufficient_quota", retry_after)
+        if fault == "shed":
+            # What a real provider raises once the quota governor has given up on a 429
+            return QuotaExhausted("stub", retry_after)
+        if fault == "timeouts":
+            return TimeoutError("Stub provider call timed out")
+        return StubProviderError("Injected stub provider error")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.settings["enabled"],
+            "routing": self.settings["routing"],
+            "seed": self.settings["seed"],
+            **self.stats
+        }
+
+def _request_random(task: str, request) -> random.Random:
+    """A generator seeded by the request, so replies are deterministic"""
+    digest = hashlib.sha256(f"{task}:{request.model_dump_json()}".encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+def _prose(rng: random.Random, tokens: int, opening: str = "") -> str:
+    """About `tokens` tokens of sentences, in paragraphs of five"""
+    sentences: List[str] = [opening] if opening else []
+    used = estimate_tokens(opening)
+    while used < tokens:
+        words = min(rng.randint(8, 16), max(1, tokens - used - 1))
+        sentences.append(_sentence(rng, words))
+        # One token per (short) word plus the full stop
+        used += words + 1
+    paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    return "\n\n".join(paragraphs)
+
+def stub_idea(request: IdeaRequest) -> Dict[str, Any]:
+    """The stub's idea fields for a request"""
+    rng = _request_random("idea", request)
+    return {
+        "title": "The " + " ".join(w.capitalize() for w in rng.sample(_WORDS[:30], 2)),
+        "genre": request.genre or rng.choice(_GENRES),
+        "outline": _prose(rng, 90),
+        "tone": request.tone or rng.choice(_TONES),
+        "characters": rng.sample(_NAMES, rng.randint(2, 4)),
+        "setting": _sentence(rng, 10)
+    }
+
+def stub_story(request: StoryRequest, max_tokens: int) -> str:
+    """The stub's story for a request: story_tokens plus the outline's length, within max_tokens"""
+    rng = _request_random("story", request)
+    tokens = min(max_tokens, STUB_PROVIDER_SETTINGS["story_tokens"] + estimate_tokens(request.outline))
+    return _prose(rng, tokens, opening=f"{request.title}.")
+
+def _chunks(text: str, by_words: bool) -> List[str]:
+    if not by_words:
+        return [text[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(text), _STREAM_CHUNK_CHARS)]
+    words = text.split(" ")
+    return [" ".join(words[i:i + _STREAM_CHUNK_WORDS]) + (" " if i + _STREAM_CHUNK_WORDS < len(words) else "")
+            for i in range(0, len(words), _STREAM_CHUNK_WORDS)]
+
+class _StubCalls:
+    """Timing and failure injection shared by the stub idea and story providers"""
+    provider_name = "stub"
+
+    def __init__(self, tier: str, behaviour: StubBehaviour = None):
+        self.tier = tier
+        self.model_name = STUB_PROVIDER_SETTINGS["model"]
+        self.behaviour = behaviour or stub_behaviour
+
+    def _usage(self, request, text: str) -> TokenUsage:
+        # Counted with the estimator, so they are reported as estimates
+        return TokenUsage(estimate_request_tokens(self.task, request, "stub"), estimate_tokens(text), reported=False)
+
+    def _result(self, output, request, text: str, start: float) -> GenerationResult:
+        usage = self._usage(request, text)
+        return GenerationResult(
+            output=output,
+            provider="stub",
+            model=self.model_name,
+            tokens_in=usage.tokens_in,
+            tokens_out=usage.tokens_out,
+            latency_ms=int((time.time() - start) * 1000),
+            cost_usd=usage_cost(self.model_name, usage),
+            usage_estimated=True
+        )
+
+    def _call_seconds(self, fault: Optional[str], ttft: float, text: str,
+                      timeout: Optional[float]) -> Tuple[float, Optional[Exception]]:
+        """(seconds the call takes, error it ends with) for a non-streamed call"""
+        if fault in ("rate_limited", "insufficient_quota", "shed"):
+            return 0.0, self.behaviour.failure(fault)
+        if fault == "timeouts":
+            return self.behaviour.hang_seconds(timeout), self.behaviour.failure(fault)
+        if fault == "errors":
+            return ttft, self.behaviour.failure(fault)
+        seconds = ttft + self.behaviour.generation_seconds(estimate_tokens(text))
+        if timeout is not None and seconds > timeout:
+            return timeout, TimeoutError("Stub provider call timed out")
+        return seconds, None
+
+    def _complete(self, text: str, timeout: Optional[float]):
+        seconds, error = self._call_seconds(*self.behaviour.plan(), text, timeout)
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+
+    async def _acomplete(self, text: str, timeout: Optional[float]):
+        seconds, error = self._call_seconds(*self.behaviour.plan(), text, timeout)
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+
+    async def _open_stream(self, chunks: List[str], timeout: Optional[float]) -> AsyncIterator[str]:
+        """Wait for the first token (or fail, as opening a real stream does), then return the chunks"""
+        fault, ttft = self.behaviour.plan()
+        if fault in ("rate_limited", "insufficient_quota", "shed"):
+            raise self.behaviour.failure(fault)
+        if fault == "timeouts":
+            await asyncio.sleep(self.behaviour.hang_seconds(timeout))
+            raise self.behaviour.failure(fault)
+        await asyncio.sleep(ttft)
+        if fault == "errors":
+            raise self.behaviour.failure(fault)
+        return self._paced(chunks)
+
+    async def _paced(self, chunks: List[str]) -> AsyncGenerator[str, None]:
+        """Yield chunks at the configured token rate"""
+        started, seconds = time.monotonic(), self.behaviour.generation_seconds(estimate_tokens("".join(chunks)))
+        for i, chunk in enumerate(chunks):
+            # Pace against the start so sleep overhead does not accumulate
+            delay = started + seconds * (i + 1) / len(chunks) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+
+    def _error_event(self, e: Exception) -> Dict[str, Any]:
+        if isinstance(e, QuotaExhausted):
+            return {'type': 'error', 'error': str(e), 'error_type': 'quota_exhausted'}
+        return {'type': 'error', 'error': f"Stub streaming error: {str(e)}"}
+
+class StubIdeaProvider(_StubCalls, IdeaProvider):
+    def parse_output(self, text: str, request: IdeaRequest) -> IdeaResponse:
+        return parse_idea(text, request, "stub", lambda text, request: idea_from_fields({"outline": text}, request))
+
+    def generate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        text = json.dumps(stub_idea(request))
+        quota_governor.call("stub", self.quota_tokens(request), timeout,
+                            lambda key, timeout: self._complete(text, timeout))
+        return self._result(self.parse_output(text, request), request, text, start)
+
+    async def agenerate(self, request: IdeaRequest, timeout: Optional[float] = None) -> GenerationResult[IdeaResponse]:
+        start = time.time()
+        text = json.dumps(stub_idea(request))
+        await quota_governor.acall("stub", self.quota_tokens(request), timeout,
+                                   lambda key, timeout: self._acomplete(text, timeout))
+        return self._result(self.parse_output(text, request), request, text, start)
+
+    async def generate_streaming(self, request: IdeaRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream the idea as JSON, emitting each field as soon as it is complete"""
+        timer = StreamTimer()
+        idea_stream = IdeaStream(request, self.parse_output)
+        try:
+            chunks = _chunks(json.dumps(stub_idea(request)), by_words=False)
+            async with quota_governor.astream("stub", self.quota_tokens(request), timeout,
+                                              lambda key, timeout: self._open_stream(chunks, timeout)) as stream:
+                async for chunk in stream:
+                    timer.mark_token()
+                    for event in idea_stream.feed(chunk):
+                        yield event
+            for event in idea_stream.finish():
+                yield event
+            usage = self._usage(request, idea_stream.text)
+            yield {
+                'type': 'metadata',
+                'provider': 'stub',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+        except Exception as e:
+            yield self._error_event(e)
+
+class StubStoryProvider(_StubCalls, StoryProvider):
+    def generate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        text = stub_story(request, self.max_tokens_for(request))
+        quota_governor.call("stub", self.quota_tokens(request), timeout,
+                            lambda key, timeout: self._complete(text, timeout))
+        return self._result(StoryResponse(story=text), request, text, start)
+
+    async def agenerate(self, request: StoryRequest, timeout: Optional[float] = None) -> GenerationResult[StoryResponse]:
+        start = time.time()
+        text = stub_story(request, self.max_tokens_for(request))
+        await quota_governor.acall("stub", self.quota_tokens(request), timeout,
+                                   lambda key, timeout: self._acomplete(text, timeout))
+        return self._result(StoryResponse(story=text), request, text, start)
+
+    async def generate_streaming(self, request: StoryRequest, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        timer = StreamTimer()
+        full_content = ""
+        try:
+            chunks = _chunks(stub_story(request, self.max_tokens_for(request)), by_words=True)
+            async with quota_governor.astream("stub", self.quota_tokens(request), timeout,
+                                              lambda key, timeout: self._open_stream(chunks, timeout)) as stream:
+                async for chunk in stream:
+                    timer.mark_token()
+                    full_content += chunk
+                    yield {
+                        'type': 'content',
+                        'content': chunk,
+                        'is_final': False
+                    }
+            usage = self._usage(request, full_content)
+            yield {
+                'type': 'metadata',
+                'provider': 'stub',
+                'model': self.model_name,
+                'tokens_in': usage.tokens_in,
+                'tokens_out': usage.tokens_out,
+                'usage_reported': usage.reported,
+                'latency_ms': timer.elapsed_ms,
+                'time_to_first_token_ms': timer.ttft_ms,
+                'cost_usd': usage_cost(self.model_name, usage),
+                'is_final': True
+            }
+        except Exception as e:
+            yield self._error_event(e)
+
+# Global instance
+stub_behaviour = StubBehaviour()
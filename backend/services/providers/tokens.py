@@ -0,0 +1,263 @@
+"""
+Pre-flight token estimation, budgets and max_tokens sizing
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from .config import (
+    TOKEN_BUDGET_SETTINGS, TaskType, TierType,
+    get_primary_provider, get_model_for_provider
+)
+from .prompts import static_text
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a prompt is estimated above the tier's input token budget"""
+
+    def __init__(self, estimated: int, limit: int):
+        self.estimated = estimated
+        self.limit = limit
+        super().__init__(f"Prompt is about {estimated} tokens, over the {limit} token limit for this tier")
+
+# Approximations of each provider's BPE/SentencePiece vocabulary: words up to
+# `whole_word_chars` letters are usually a single token, longer words split into
+# pieces of about `chars_per_piece` letters; `digit_group` digits share a token;
+# `message_overhead` covers chat framing around the prompt text.
+_PROFILES = {
+    "openai": {"whole_word_chars": 8, "chars_per_piece": 4.0, "digit_group": 3, "message_overhead": 7},
+    "anthropic": {"whole_word_chars": 7, "chars_per_piece": 3.5, "digit_group": 1, "message_overhead": 10},
+    "gemini": {"whole_word_chars": 8, "chars_per_piece": 4.2, "digit_group": 1, "message_overhead": 4},
+}
+
+def _calibration_from_env() -> Dict[str, float]:
+    raw = os.getenv("TOKEN_ESTIMATOR_CALIBRATION", "")
+    return {k: float(v) for k, v in json.loads(raw).items()} if raw else {}
+
+# Per-provider multipliers fitted from recorded real usage (see test/bench_token_estimator.py)
+CALIBRATION = _calibration_from_env()
+
+# Context window and output limit per model family (longest prefix wins)
+MODEL_LIMITS = {
+    "gpt-3.5-turbo": {"context_window": 16385, "max_output": 4096},
+    "gpt-4o": {"context_window": 128000, "max_output": 16384},
+    "gpt-4-turbo": {"context_window": 128000, "max_output": 4096},
+    "gpt-4": {"context_window": 8192, "max_output": 4096},
+    "claude-3-5": {"context_window": 200000, "max_output": 8192},
+    "claude-3": {"context_window": 200000, "max_output": 4096},
+    "gemini-2.5": {"context_window": 1048576, "max_output": 65536},
+    "gemini-1.5": {"context_window": 1048576, "max_output": 8192},
+    "gemini-pro": {"context_window": 32760, "max_output": 8192},
+}
+
+# Pre-tokenizer close to the GPT-family split: contractions, optionally
+# space-prefixed letter runs, digit runs, other symbol runs, whitespace
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)\b| ?[A-Za-z]+| ?[0-9]+| ?[^\sA-Za-z0-9]+|\s+")
+
+def _count(text: str, provider: str) -> int:
+    profile = _PROFILES.get(provider, _PROFILES["openai"])
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        body = piece.lstrip(" ")
+        if not body:
+            # A run of spaces
+            tokens += 1
+        elif body[0].isalpha() and body.isascii():
+            if len(body) <= profile["whole_word_chars"]:
+                tokens += 1
+            else:
+                tokens += math.ceil(len(body) / profile["chars_per_piece"])
+        elif body[0].isdigit():
+            tokens += math.ceil(len(body) / profile["digit_group"])
+        elif body.isspace():
+            # Newline runs are usually one token each
+            tokens += max(1, body.count("\n"))
+        elif body.isascii():
+            # Common punctuation pairs ("."), "...", "--") merge
+            tokens += math.ceil(len(body) / 2)
+        else:
+            # Non-Latin scripts and emoji: roughly one token per character
+            tokens += len(body)
+    return tokens
+
+# Only short texts (prompts, genres, titles) are cached; long ones are rarely
+# repeated and would make the cache's memory unbounded
+_CACHEABLE_CHARS = 8192
+
+@lru_cache(maxsize=TOKEN_BUDGET_SETTINGS["estimate_cache_size"])
+def _cached_count(text: str, provider: str) -> int:
+    return _count(text, provider)
+
+def estimate_tokens(text: str, provider: str = "openai") -> int:
+    """Estimated token count of `text` for a provider (CPU only, LRU cached)"""
+    if not text:
+        return 0
+    count = _cached_count(text, provider) if len(text) <= _CACHEABLE_CHARS else _count(text, provider)
+    return int(round(count * CALIBRATION.get(provider, 1.0)))
+
+def request_fields(request) -> Dict[str, str]:
+    """The non-empty text fields of a request"""
+    data = request.model_dump() if hasattr(request, "model_dump") else dict(request)
+    return {k: v for k, v in data.items() if isinstance(v, str) and v}
+
+def estimate_request_tokens(task: str, request, provider: str = "openai") -> int:
+    """Estimated input tokens of a request once wrapped in the provider's prompt template"""
+    profile = _PROFILES.get(provider, _PROFILES["openai"])
+    fields = sum(estimate_tokens(text, provider) for text in request_fields(request).values())
+    # The templates' fixed text is short and repeated, so it is always served from the LRU cache
+    return fields + estimate_tokens(static_text(task, provider), provider) + profile["message_overhead"]
+
+def get_model_limits(model: str) -> Optional[Dict[str, int]]:
+    matches = [name for name in MODEL_LIMITS if model.startswith(name)]
+    return MODEL_LIMITS[max(matches, key=len)] if matches else None
+
+def _tier(tier: str) -> TierType:
+    return TierType(tier.lower() if tier else "free")
+
+def max_output_tokens(task: str, tier: str, provider: str, model: str, request) -> int:
+    """max_tokens for one call: the task default, more for long story inputs that get
+    rewritten, capped by the tier and by what fits in the model's context window"""
+    settings = TOKEN_BUDGET_SETTINGS
+    desired = settings["default_output_tokens"][TaskType(task)]
+    if task == "story":
+        outline_tokens = estimate_tokens(getattr(request, "outline", "") or "", provider)
+        desired = max(desired, int(outline_tokens * settings["rewrite_output_ratio"]))
+    desired = min(desired, settings["tiers"][_tier(tier)]["max_output_tokens"])
+
+    limits = get_model_limits(model)
+    if limits:
+        room = limits["context_window"] - estimate_request_tokens(task, request, provider) - 64
+        desired = min(desired, limits["max_output"], room)
+    return max(1, desired)
+
+def configured_provider(task: str, tier: str) -> tuple:
+    """(provider name, model) the tier's configuration prefers for a task"""
+    task_enum, tier_enum = TaskType(task), _tier(tier)
+    provider = get_primary_provider(task_enum, tier_enum)
+    if provider is None:
+        return "openai", ""
+    return provider.value, get_model_for_provider(task_enum, tier_enum, provider) or ""
+
+def estimate_total_tokens(task: str, tier: str, request) -> int:
+    """Estimated input plus output budget of a request, for token-aware rate limiting"""
+    provider, model = configured_provider(task, tier)
+    return estimate_request_tokens(task, request, provider) + max_output_tokens(task, tier, provider, model, request)
+
+def truncate_to_tokens(text: str, provider: str, max_tokens: int) -> str:
+    """Longest whitespace-bounded prefix of `text` estimated within max_tokens"""
+    if estimate_tokens(text, provider) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _count(text[:mid], provider) * CALIBRATION.get(provider, 1.0) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text.rfind(" ", 0, low)
+    return text[:cut if cut > 0 else low].rstrip()
+
+def enforce_input_budget(task: str, tier: str, request, provider: Optional[str] = None):
+    """Return the request if it fits the tier's input budget; otherwise truncate its
+    longest field to fit or raise TokenBudgetExceeded, per TOKEN_BUDGET_SETTINGS"""
+    provider = provider or configured_provider(task, tier)[0]
+    limit = TOKEN_BUDGET_SETTINGS["tiers"][_tier(tier)]["max_input_tokens"]
+    estimated = estimate_request_tokens(task, request, provider)
+    if estimated <= limit:
+        return request
+    if TOKEN_BUDGET_SETTINGS["overflow"] != "truncate":
+        raise TokenBudgetExceeded(estimated, limit)
+
+    fields = request_fields(request)
+    longest = max(fields, key=lambda name: len(fields[name]))
+    keep = estimate_tokens(fields[longest], provider) - (estimated - limit)
+    if keep <= 0:
+        raise TokenBudgetExceeded(estimated, limit)
+    print(f"⚠️ Truncating {task} request field '{longest}' from ~{estimated} to {limit} tokens")
+    return request.model_copy(update={longest: truncate_to_tokens(fields[longest], provider, keep)})
+
+class EstimateAccuracy:
+    """Running accuracy of input estimates against provider-reported usage.
+
+    When TOKEN_SAMPLES_PATH is set, each comparison is also appended to that
+    JSONL file (with the request's text fields) so the estimator can be
+    re-benchmarked and recalibrated offline. Samples are queued and written by
+    a background task, so calls on the event loop never wait on the file.
+    """
+
+    def __init__(self, samples_path: str = None):
+        self.samples_path = samples_path if samples_path is not None else TOKEN_BUDGET_SETTINGS["samples_path"]
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._pending: deque = deque(maxlen=TOKEN_BUDGET_SETTINGS["samples_max_pending"])
+        self._writer: Optional[asyncio.Task] = None
+
+    def observe(self, task: str, provider: str, model: str, request, actual_tokens_in: int):
+        if not actual_tokens_in:
+            return
+        estimated = estimate_request_tokens(task, request, provider)
+        error = (estimated - actual_tokens_in) / actual_tokens_in
+        with self._lock:
+            stats = self._stats.setdefault(provider, {"samples": 0, "abs_error_sum": 0.0, "error_sum": 0.0})
+            stats["samples"] += 1
+            stats["abs_error_sum"] += abs(error)
+            stats["error_sum"] += error
+        if self.samples_path:
+            self._pending.append({
+                "ts": time.time(), "task": task, "provider": provider, "model": model,
+                "fields": request_fields(request), "estimated": estimated, "actual": actual_tokens_in
+            })
+            if self._writer is None or self._writer.done():
+                try:
+                    self._writer = asyncio.get_running_loop().create_task(self._drain())
+                except RuntimeError:
+                    # No event loop (scripts, worker threads): write inline
+                    self._append_samples(self._take_samples())
+
+    def _take_samples(self) -> List[Dict[str, Any]]:
+        samples = []
+        while self._pending:
+            samples.append(self._pending.popleft())
+        return samples
+
+    async def _drain(self):
+        while self._pending:
+            await asyncio.to_thread(self._append_samples, self._take_samples())
+
+    def _append_samples(self, samples: List[Dict[str, Any]]):
+        if not samples:
+            return
+        try:
+            with open(self.samples_path, "a") as f:
+                f.write("".join(json.dumps(sample) + "\n" for sample in samples))
+        except OSError as e:
+            print(f"Warning: could not record {len(samples)} token sample(s): {e}")
+
+    async def flush(self):
+        """Write every queued sample (on shutdown)"""
+        if self._writer is not None and not self._writer.done():
+            await self._writer
+        await asyncio.to_thread(self._append_samples, self._take_samples())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                provider: {
+                    "samples": int(s["samples"]),
+                    "mean_abs_error_pct": round(100 * s["abs_error_sum"] / s["samples"], 1),
+                    "bias_pct": round(100 * s["error_sum"] / s["samples"], 1)
+                }
+                for provider, s in self._stats.items()
+            }
+
+def get_cache_info() -> Dict[str, int]:
+    info = _cached_count.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+# Global instance
+estimate_accuracy = EstimateAccuracy()
@@ -0,0 +1,65 @@
+"""
+Token usage extraction from provider responses
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+from metrics.prom import record_estimated_usage, record_prompt_cache_tokens
+
+@dataclass
+class TokenUsage:
+    tokens_in: int
+    tokens_out: int
+    # False when the provider did not report usage and the counts are estimates
+    reported: bool = True
+    # Parts of tokens_in read from / written to the provider's prompt cache
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+def from_openai(usage: Any) -> Optional[TokenUsage]:
+    """Usage from a chat completion, or from the final chunk of a stream
+    requested with stream_options={"include_usage": True}"""
+    if not usage:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    return TokenUsage(usage.prompt_tokens or 0, usage.completion_tokens or 0, cache_read_tokens=cached)
+
+def from_anthropic(usage: Any) -> Optional[TokenUsage]:
+    """Usage from a message (for streams, the final message). Anthropic's
+    input_tokens excludes cache reads and writes, so they are added back."""
+    if not usage:
+        return None
+    cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+    return TokenUsage(
+        (usage.input_tokens or 0) + cache_read + cache_write, usage.output_tokens or 0,
+        cache_read_tokens=cache_read, cache_write_tokens=cache_write
+    )
+
+def from_gemini(usage_metadata: Any) -> Optional[TokenUsage]:
+    """Usage from a response's usage_metadata (cumulative on each streamed chunk)"""
+    if not usage_metadata:
+        return None
+    tokens_in = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    tokens_out = getattr(usage_metadata, "candidates_token_count", 0) or 0
+    if not tokens_in and not tokens_out:
+        return None
+    cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    return TokenUsage(tokens_in, tokens_out, cache_read_tokens=cached)
+
+def estimate_usage(provider: str, prompt: str, output: str) -> TokenUsage:
+    """Rough word-based counts for responses that carry no usage"""
+    record_estimated_usage(provider)
+    return TokenUsage(
+        tokens_in=max(1, int(len(prompt.split()) / 0.75)),
+        tokens_out=max(1, int(len(output.split()) / 0.75)),
+        reported=False
+    )
+
+def resolve_usage(provider: str, reported: Optional[TokenUsage], prompt: str, output: str) -> TokenUsage:
+    """Provider-reported usage when available, otherwise an estimate"""
+    if reported is None:
+        return estimate_usage(provider, prompt, output)
+    if reported.cache_read_tokens or reported.cache_write_tokens:
+        record_prompt_cache_tokens(provider, reported.cache_read_tokens, reported.cache_write_tokens)
+    return reported
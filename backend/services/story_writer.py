@@ -1,22 +1,13 @@
-import os
-import google.generativeai as genai
 from schemas.story import StoryRequest, StoryResponse
 from services.providers.router import router
+from services.providers.streaming import relay
+from metrics.prom import record_stream_ttft
 import asyncio
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Dict, Any, Optional
+from services.providers.deadline import Deadline, DeadlineExceeded
+from services.providers.quota import QuotaExhausted
 
 def generate_story(request: StoryRequest, tier: str = "free") -> StoryResponse:
-    # Configure Gemini (moved here to avoid import-time errors)
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError(
-            "GEMINI_API_KEY environment variable is not set. "
-            "Please create a .env file in the backend directory with: "
-            "GEMINI_API_KEY=your_actual_api_key_here"
-        )
-
-    genai.configure(api_key=api_key)
-    
     try:
         provider = router.select(task="story", tier=tier)
         result = provider.generate(request)
@@ -26,13 +17,26 @@ def generate_story(request: StoryRequest, tier: str = "free") -> StoryResponse:
         print(f"Error in generate_story: {str(e)}")
         raise Exception(f"Error generating story: {str(e)}")
 
-async def generate_story_streaming(request: StoryRequest, tier: str = "free", streaming_speed: str = "normal") -> AsyncGenerator[Dict[str, Any], None]:
+async def agenerate_story(request: StoryRequest, tier: str = "free", deadline: Optional[Deadline] = None) -> StoryResponse:
+    """Async variant of generate_story that does not block the event loop."""
+    try:
+        result = await router.agenerate(task="story", tier=tier, request=request, deadline=deadline)
+        return result.output
+    except (DeadlineExceeded, QuotaExhausted):
+        raise
+    except Exception as e:
+        print(f"Error in agenerate_story: {str(e)}")
+        raise Exception(f"Error generating story: {str(e)}")
+
+async def generate_story_streaming(request: StoryRequest, tier: str = "free", streaming_speed: str = "normal",
+                                   deadline: Optional[Deadline] = None) -> AsyncGenerator[Dict[str, Any], None]:
     """Generate story with streaming support
     
     Args:
         request: Story generation request
         tier: User tier for provider selection
         streaming_speed: Speed of streaming ("slow", "normal", "fast")
+        deadline: Request deadline bounding the provider calls
     """
     # Configure streaming delays based on speed preference
     speed_config = {
@@ -44,15 +48,20 @@ async def generate_story_streaming(request: StoryRequest, tier: str = "free", st
     config = speed_config.get(streaming_speed, speed_config["normal"])
     
     try:
-        provider = router.select(task="story", tier=tier)
+        provider_type, provider = router.select_with_type(task="story", tier=tier)
         
         # Check if provider supports streaming
         if hasattr(provider, 'generate_streaming'):
-            async for chunk in provider.generate_streaming(request):
+            async for chunk in relay(router.stream("story", tier, request, primary=(provider_type, provider), deadline=deadline)):
+                if chunk.get('type') == 'metadata' and chunk.get('time_to_first_token_ms') is not None:
+                    try:
+                        record_stream_ttft(chunk['provider'], chunk['model'], chunk['time_to_first_token_ms'])
+                    except Exception as e:
+                        print(f"Failed to record stream TTFT metric: {e}")
                 yield chunk
         else:
             # Fallback to regular generation with manual streaming simulation
-            result = provider.generate(request)
+            result = await provider.agenerate(request, timeout=deadline.remaining() if deadline else None)
             
             # Simulate streaming by yielding chunks of the story
             story_text = result.output.story
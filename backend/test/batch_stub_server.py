@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Local stub of the OpenAI Batch and Anthropic Message Batches APIs
+
+Batches finish STUB_BATCH_SECONDS after submission with canned outputs;
+any request whose user message contains "FAIL" comes back as an error.
+
+Usage (from the backend directory):
+    uvicorn batch_stub_server:app --app-dir test --port 8765
+    OPENAI_BATCH_BASE_URL=http://localhost:8765/openai/v1 \
+    ANTHROPIC_BATCH_BASE_URL=http://localhost:8765/anthropic/v1 \
+    BATCH_POLL_INTERVAL_SECONDS=1 uvicorn app.main:app
+    python test/test_batch.py
+"""
+import json
+import os
+import time
+import uuid
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse
+
+app = FastAPI(title="Batch API stub")
+
+BATCH_SECONDS = float(os.getenv("STUB_BATCH_SECONDS", "2"))
+
+_files = {}
+_batches = {}
+
+IDEA = {
+    "title": "The Keeper of Drowned Ships",
+    "genre": "Mystery",
+    "tone": "Dark and atmospheric",
+    "outline": "A lighthouse keeper discovers the light reveals ships lost a century ago.",
+    "characters": ["Mara", "Captain Hale"],
+    "setting": "A remote island lighthouse"
+}
+STORY = "Once upon a time, on a remote island, a lighthouse keeper saw a ship that should not exist."
+
+def _canned_text(system: str) -> str:
+    return json.dumps(IDEA) if "JSON" in system else STORY
+
+def _finished(batch: dict) -> bool:
+    return batch["cancelled"] or time.time() - batch["created_at"] >= BATCH_SECONDS
+
+# OpenAI
+
+@app.post("/openai/v1/files")
+async def openai_upload(purpose: str = Form(...), file: UploadFile = File(...)):
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    _files[file_id] = (await file.read()).decode()
+    return {"id": file_id, "object": "file", "purpose": purpose}
+
+@app.post("/openai/v1/batches")
+async def openai_create_batch(body: dict):
+    if body["input_file_id"] not in _files:
+        raise HTTPException(status_code=404, detail="No such file")
+    lines = [json.loads(line) for line in _files[body["input_file_id"]].splitlines() if line.strip()]
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    _batches[batch_id] = {"kind": "openai", "lines": lines, "created_at": time.time(), "cancelled": False}
+    return _openai_batch(batch_id)
+
+def _openai_batch(batch_id: str) -> dict:
+    batch = _batches[batch_id]
+    done = _finished(batch)
+    if done and "output_file_id" not in batch:
+        output, errors = [], []
+        for line in [] if batch["cancelled"] else batch["lines"]:
+            messages = line["body"]["messages"]
+            if "FAIL" in messages[-1]["content"]:
+                errors.append({"custom_id": line["custom_id"], "response": {"status_code": 400, "body": {
+                    "error": {"message": "Stub failure", "type": "invalid_request_error"}}}, "error": None})
+                continue
+            text = _canned_text(messages[0]["content"])
+            output.append({"custom_id": line["custom_id"], "error": None, "response": {"status_code": 200, "body": {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": len(text.split()) * 2}
+            }}})
+        batch["output_file_id"], batch["error_file_id"] = f"file-{uuid.uuid4().hex[:12]}", f"file-{uuid.uuid4().hex[:12]}"
+        _files[batch["output_file_id"]] = "\n".join(json.dumps(o) for o in output)
+        _files[batch["error_file_id"]] = "\n".join(json.dumps(e) for e in errors)
+        batch["failed"] = len(errors)
+    status = ("cancelled" if batch["cancelled"] else "completed") if done else "in_progress"
+    return {
+        "id": batch_id, "object": "batch", "status": status,
+        "request_counts": {
+            "total": len(batch["lines"]),
+            "completed": len(batch["lines"]) - batch.get("failed", 0) if done else 0,
+            "failed": batch.get("failed", 0)
+        },
+        "output_file_id": batch.get("output_file_id"), "error_file_id": batch.get("error_file_id")
+    }
+
+@app.get("/openai/v1/batches/{batch_id}")
+async def openai_get_batch(batch_id: str):
+    if batch_id not in _batches:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return _openai_batch(batch_id)
+
+@app.post("/openai/v1/batches/{batch_id}/cancel")
+async def openai_cancel_batch(batch_id: str):
+    _batches[batch_id]["cancelled"] = True
+    return _openai_batch(batch_id)
+
+@app.get("/openai/v1/files/{file_id}/content", response_class=PlainTextResponse)
+async def openai_file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail="No such file")
+    return _files[file_id]
+
+# Anthropic
+
+@app.post("/anthropic/v1/messages/batches")
+async def anthropic_create_batch(body: dict):
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+    _batches[batch_id] = {"kind": "anthropic", "lines": body["requests"], "created_at": time.time(), "cancelled": False}
+    return _anthropic_batch(batch_id, None)
+
+def _anthropic_batch(batch_id: str, request: Request) -> dict:
+    batch = _batches[batch_id]
+    done = _finished(batch)
+    count = len(batch["lines"])
+    results_url = str(request.url_for("anthropic_results", batch_id=batch_id)) if done and request else None
+    return {
+        "id": batch_id, "type": "message_batch",
+        "processing_status": "ended" if done else "in_progress",
+        "request_counts": {
+            "processing": 0 if done else count,
+            "succeeded": count if done and not batch["cancelled"] else 0,
+            "errored": 0, "canceled": count if batch["cancelled"] else 0, "expired": 0
+        },
+        "results_url": results_url
+    }
+
+@app.get("/anthropic/v1/messages/batches/{batch_id}")
+async def anthropic_get_batch(batch_id: str, request: Request):
+    if batch_id not in _batches:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return _anthropic_batch(batch_id, request)
+
+@app.post("/anthropic/v1/messages/batches/{batch_id}/cancel")
+async def anthropic_cancel_batch(batch_id: str, request: Request):
+    _batches[batch_id]["cancelled"] = True
+    return _anthropic_batch(batch_id, request)
+
+@app.get("/anthropic/v1/messages/batches/{batch_id}/results", name="anthropic_results", response_class=PlainTextResponse)
+async def anthropic_results(batch_id: str):
+    batch = _batches[batch_id]
+    lines = []
+    for line in batch["lines"]:
+        params = line["params"]
+        if batch["cancelled"]:
+            lines.append({"custom_id": line["custom_id"], "result": {"type": "canceled"}})
+            continue
+        if "FAIL" in params["messages"][-1]["content"]:
+            lines.append({"custom_id": line["custom_id"], "result": {"type": "errored", "error": {
+                "type": "error", "error": {"type": "invalid_request_error", "message": "Stub failure"}}}})
+            continue
+        system = params["system"] if isinstance(params["system"], str) else params["system"][0]["text"]
+        text = _canned_text(system)
+        # Requests forcing a tool call get the idea back as the tool's input
+        content = ([{"type": "tool_use", "id": "toolu_stub", "name": params["tools"][0]["name"], "input": IDEA}]
+                   if params.get("tools") else [{"type": "text", "text": text}])
+        lines.append({"custom_id": line["custom_id"], "result": {"type": "succeeded", "message": {
+            "content": content,
+            "usage": {"input_tokens": 20, "output_tokens": len(text.split()) * 2,
+                      "cache_read_input_tokens": 100, "cache_creation_input_tokens": 0}
+        }}})
+    return "\n".join(json.dumps(line) for line in lines)
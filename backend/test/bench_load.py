@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Load-test the API in-process against the deterministic stub provider
+
+Boots app.main:app inside this process (ASGI transport, no sockets and no real
+LLM calls), drives a weighted mix of endpoints either at a fixed concurrency
+(closed loop) or at a Poisson arrival rate (open loop), and reports throughput,
+p50/p95/p99 latency, time-to-first-token for streams, event-loop lag and
+per-endpoint error rates. Results can be written as JSON and compared against
+a committed baseline; the script exits non-zero when a threshold is breached.
+
+Usage (from the backend directory):
+    python test/bench_load.py --duration 30 --concurrency 32
+    python test/bench_load.py --rate 40 --duration 60 --mix idea=3,story_stream=1
+    python test/bench_load.py --output load.json --baseline test/load_baseline.json
+    python test/bench_load.py --update-baseline test/load_baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "idea=30,idea_stream=15,story=15,story_stream=15,full_story=5,edit=10,admin=10"
+
+# Regression thresholds written into a new baseline; a committed baseline may tune them
+DEFAULT_THRESHOLDS = {
+    "max_latency_regression": 0.25,      # p95 latency/TTFT may grow by 25% over the baseline...
+    "latency_slack_ms": 25.0,            # ...plus a fixed slack so tiny latencies don't flap
+    "max_throughput_drop": 0.20,         # requests/sec may fall by 20%
+    "max_error_rate_increase": 0.02,     # absolute, per endpoint
+    "max_loop_lag_p99_ms": 50.0
+}
+
+PROMPTS = [
+    "a mysterious lighthouse keeper", "a dragon who is afraid of fire", "two rival bakers fall in love",
+    "a robot learns to paint", "a girl finds a magic door in her attic", "a time-traveling chef",
+    "a detective who can see memories", "a library that changes every night"
+]
+GENRES = ["Mystery", "Fantasy", "Romance", "Science Fiction", "Drama", "Crime"]
+TONES = ["Dark and atmospheric", "Whimsical", "Hopeful", "Gritty", "Light-hearted"]
+ADMIN_REPORTS = ["/admin/costs?days=7", "/admin/usage/leaderboard?days=7&limit=10", "/admin/usage/summary?days=7"]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _idea_body(rng: random.Random, n: int) -> dict:
+    return {"prompt": f"{rng.choice(PROMPTS)} (variant {n})", "genre": rng.choice(GENRES), "tone": rng.choice(TONES)}
+
+def _story_body(rng: random.Random, n: int) -> dict:
+    outline = " ".join(rng.choice(PROMPTS) for _ in range(rng.randint(3, 12)))
+    return {"title": f"Load Test {n}", "genre": rng.choice(GENRES), "outline": outline, "tone": rng.choice(TONES)}
+
+def _edit_body(rng: random.Random, n: int) -> dict:
+    story = " ".join(f"{rng.choice(PROMPTS)}." for _ in range(rng.randint(20, 60)))
+    return {"story": story, "edit_instructions": "Tighten the pacing and sharpen the dialogue",
+            "title": f"Load Test {n}", "genre": rng.choice(GENRES)}
+
+# name -> (method, path, body builder, streams?)
+SCENARIOS = {
+    "idea": ("POST", "/idea/generate-idea", _idea_body, False),
+    "idea_stream": ("POST", "/idea/generate-idea-stream", _idea_body, True),
+    "story": ("POST", "/story/write-story", _story_body, False),
+    "story_stream": ("POST", "/story/write-story-stream", _story_body, True),
+    "full_story": ("POST", "/multi-agent/full-story-orchestrated", _idea_body, False),
+    "edit": ("POST", "/story-editor/edit", _edit_body, False),
+    "admin": ("GET", None, None, False)
+}
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix needs at least one scenario with a positive weight")
+    return mix
+
+def configure_environment(args):
+    """Point the app at the stub provider and a scratch database before it is imported"""
+    os.environ["STUB_PROVIDER_ENABLED"] = "true"
+    os.environ["STUB_PROVIDER_ROUTING"] = "only"
+    os.environ["STUB_PROVIDER_PROFILE"] = args.profile
+    os.environ["STUB_PROVIDER_SEED"] = str(args.seed)
+    if not args.redis:
+        os.environ["QUOTA_GOVERNOR_REDIS"] = "false"
+        os.environ["GENERATION_CACHE_REDIS"] = "false"
+        os.environ["SINGLE_FLIGHT_REDIS"] = "false"
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        scratch = os.path.join(tempfile.mkdtemp(prefix="taelio-load-"), "load.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}"
+
+def lift_rate_limits():
+    """Keep the limiter in the request path but make every tier's bucket effectively unbounded"""
+    from services.limits import rate_limiter
+    unbounded = rate_limiter.RatePolicy(capacity=10**9, refill_per_sec=10**9)
+    for name in ("FREE_POLICY", "PRO_POLICY", "ADMIN_POLICY",
+                 "FREE_TOKEN_POLICY", "PRO_TOKEN_POLICY", "ADMIN_TOKEN_POLICY"):
+        setattr(rate_limiter, name, unbounded)
+
+class Recorder:
+    """Collects per-scenario samples, ignoring anything that finished during warmup"""
+
+    def __init__(self, measure_from: float):
+        self.measure_from = measure_from
+        self.latencies = defaultdict(list)
+        self.ttft = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.counts = defaultdict(int)
+        self.dropped = 0
+
+    def record(self, scenario: str, started: float, latency_ms: float, ttft_ms: Optional[float], error: Optional[str]):
+        if started < self.measure_from:
+            return
+        self.counts[scenario] += 1
+        self.latencies[scenario].append(latency_ms)
+        if ttft_ms is not None:
+            self.ttft[scenario].append(ttft_ms)
+        if error:
+            self.errors[scenario][error] += 1
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires: a direct read of event-loop blocking"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+async def call_asgi(app, method: str, path: str, headers: Dict[str, str], body: Optional[dict], on_body) -> int:
+    """Drive one request straight through the ASGI app, handing each body chunk to
+    on_body as it is sent (httpx's ASGITransport buffers whole responses, which
+    would hide time-to-first-token)"""
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()] + [
+            (b"host", b"bench"), (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode())]
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            on_body(message["body"])
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return status
+
+async def issue(app, scenario: str, n: int, rng: random.Random, args, recorder: Recorder):
+    method, path, build, streams = SCENARIOS[scenario]
+    if scenario == "admin":
+        path, body = rng.choice(ADMIN_REPORTS), None
+        headers = {"X-User-Id": "load-admin", "X-User-Tier": "admin"}
+    else:
+        body = build(rng, n)
+        headers = {"X-User-Id": f"load-user-{n % args.users}", "X-User-Tier": args.tier}
+    if args.request_timeout:
+        headers["X-Request-Timeout"] = str(args.request_timeout)
+
+    started = time.perf_counter()
+    ttft_ms, stream_error, buffer = None, None, b""
+
+    def on_body(chunk: bytes):
+        nonlocal ttft_ms, stream_error, buffer
+        if not streams:
+            return
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("type") == "error":
+                stream_error = stream_error or event.get("error_type") or "stream_error"
+            elif ttft_ms is None and event.get("type") not in ("metadata", "complete"):
+                ttft_ms = (time.perf_counter() - started) * 1000
+
+    try:
+        status = await asyncio.wait_for(call_asgi(app, method, path, headers, body, on_body), args.client_timeout)
+        error = f"http_{status}" if status != 200 else stream_error
+    except asyncio.TimeoutError:
+        error = "client_timeout"
+    except Exception as e:
+        error = type(e).__name__
+    recorder.record(scenario, started, (time.perf_counter() - started) * 1000, ttft_ms, error)
+
+async def closed_loop(app, args, mix, recorder: Recorder, stop_at: float):
+    names, weights = list(mix), list(mix.values())
+    counter = iter(range(10**12))
+
+    async def worker(worker_id: int):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while time.perf_counter() < stop_at:
+            n = next(counter)
+            if args.requests and n >= args.requests:
+                return
+            await issue(app, rng.choices(names, weights)[0], n, rng, args, recorder)
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+
+async def open_loop(app, args, mix, recorder: Recorder, stop_at: float):
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    in_flight = set()
+    n = 0
+    next_at = time.perf_counter()
+    while time.perf_counter() < stop_at and not (args.requests and n >= args.requests):
+        next_at += rng.expovariate(args.rate)
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        if len(in_flight) >= args.max_in_flight:
+            # The system is not keeping up with the offered load; count it rather than queueing forever
+            if time.perf_counter() >= recorder.measure_from:
+                recorder.dropped += 1
+            continue
+        task = asyncio.create_task(issue(app, rng.choices(names, weights)[0], n, random.Random(rng.random()), args, recorder))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        n += 1
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+def summarize(recorder: Recorder, lag: LoopLagMonitor, elapsed: float, args, mix) -> dict:
+    endpoints = {}
+    for scenario in sorted(recorder.counts):
+        latencies = recorder.latencies[scenario]
+        errors = sum(recorder.errors[scenario].values())
+        entry = {
+            "requests": recorder.counts[scenario],
+            "throughput_rps": round(recorder.counts[scenario] / elapsed, 2),
+            "error_rate": round(errors / recorder.counts[scenario], 4),
+            "errors": dict(recorder.errors[scenario]),
+            "latency_ms": {p: round(percentile(latencies, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+        }
+        if recorder.ttft[scenario]:
+            entry["ttft_ms"] = {p: round(percentile(recorder.ttft[scenario], q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+        endpoints[scenario] = entry
+
+    total = sum(recorder.counts.values())
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    total_errors = sum(sum(e.values()) for e in recorder.errors.values())
+    return {
+        "config": {
+            "mode": "open" if args.rate else "closed",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "profile": args.profile,
+            "tier": args.tier,
+            "mix": mix,
+            "seed": args.seed
+        },
+        "overall": {
+            "requests": total,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(total_errors / total, 4) if total else 0.0,
+            "dropped": recorder.dropped,
+            "latency_ms": {p: round(percentile(all_latencies, q), 2) if all_latencies else None
+                           for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+        },
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lag.samples, 50) or 0.0, 2),
+            "p99": round(percentile(lag.samples, 99) or 0.0, 2),
+            "max": round(max(lag.samples, default=0.0), 2)
+        },
+        "endpoints": endpoints
+    }
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Return a list of human-readable threshold violations (empty means pass)"""
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    failures = []
+
+    def latency_limit(base: float) -> float:
+        return base * (1 + thresholds["max_latency_regression"]) + thresholds["latency_slack_ms"]
+
+    for scenario, base in baseline.get("endpoints", {}).items():
+        current = results["endpoints"].get(scenario)
+        if current is None:
+            if scenario in results["config"]["mix"]:
+                failures.append(f"{scenario}: no requests completed")
+            continue
+        # p99 is reported but not gated: over a short run it is a handful of samples
+        for metric in ("latency_ms", "ttft_ms"):
+            base_value = base.get(metric, {}).get("p95")
+            value = current.get(metric, {}).get("p95")
+            if base_value is not None and value is not None and value > latency_limit(base_value):
+                failures.append(f"{scenario}: {metric} p95 {value:.1f}ms > {latency_limit(base_value):.1f}ms (baseline {base_value:.1f}ms)")
+        if current["error_rate"] > base["error_rate"] + thresholds["max_error_rate_increase"]:
+            failures.append(f"{scenario}: error rate {current['error_rate']:.2%} (baseline {base['error_rate']:.2%})")
+
+    # Throughput only means something when the offered load had the same shape
+    same_load = all(results["config"].get(k) == baseline.get("config", {}).get(k)
+                    for k in ("mode", "concurrency", "rate", "profile", "tier", "mix"))
+    base_rps = baseline.get("overall", {}).get("throughput_rps")
+    if same_load and base_rps and results["overall"]["throughput_rps"] < base_rps * (1 - thresholds["max_throughput_drop"]):
+        failures.append(f"throughput {results['overall']['throughput_rps']:.1f} rps < "
+                        f"{base_rps * (1 - thresholds['max_throughput_drop']):.1f} rps (baseline {base_rps:.1f})")
+    if results["event_loop_lag_ms"]["p99"] > thresholds["max_loop_lag_p99_ms"]:
+        failures.append(f"event loop lag p99 {results['event_loop_lag_ms']['p99']:.1f}ms > {thresholds['max_loop_lag_p99_ms']:.1f}ms")
+    return failures
+
+def print_report(results: dict):
+    config, overall = results["config"], results["overall"]
+    load = f"rate={config['rate']}/s" if config["mode"] == "open" else f"concurrency={config['concurrency']}"
+    print(f"\n🧪 Load test: {load}, {overall['elapsed_s']}s measured, profile={config['profile']}, tier={config['tier']}")
+    print(f"{'endpoint':<14}{'reqs':>7}{'rps':>9}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft p95':>10}")
+    for scenario, entry in results["endpoints"].items():
+        lat = entry["latency_ms"]
+        ttft = entry.get("ttft_ms", {}).get("p95")
+        print(f"{scenario:<14}{entry['requests']:>7}{entry['throughput_rps']:>9.1f}{entry['error_rate'] * 100:>7.1f}%"
+              f"{lat['p50']:>9.1f}{lat['p95']:>9.1f}{lat['p99']:>9.1f}{(f'{ttft:.1f}' if ttft is not None else '-'):>10}")
+        if entry["errors"]:
+            print(f"{'':<14}errors: {entry['errors']}")
+    lat = overall["latency_ms"]
+    print(f"{'overall':<14}{overall['requests']:>7}{overall['throughput_rps']:>9.1f}{overall['error_rate'] * 100:>7.1f}%"
+          f"{(lat['p50'] or 0):>9.1f}{(lat['p95'] or 0):>9.1f}{(lat['p99'] or 0):>9.1f}")
+    lag = results["event_loop_lag_ms"]
+    print(f"Event loop lag: p50={lag['p50']}ms p99={lag['p99']}ms max={lag['max']}ms")
+    if overall["dropped"]:
+        print(f"Dropped arrivals (max in-flight reached): {overall['dropped']}")
+
+async def run(args, mix) -> dict:
+    from db.database import engine
+    from db.models import Base
+    from app.main import app
+
+    Base.metadata.create_all(bind=engine)
+    # Send the app's log output wherever its stdout currently goes (--app-log)
+    for handler in logging.getLogger().handlers:
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(sys.stdout)
+    if not args.real_rate_limits:
+        lift_rate_limits()
+
+    lag = LoopLagMonitor()
+    async with app.router.lifespan_context(app):
+        lag.start()
+        start = time.perf_counter()
+        recorder = Recorder(measure_from=start + args.warmup)
+        stop_at = start + args.warmup + args.duration
+        if args.rate:
+            await open_loop(app, args, mix, recorder, stop_at)
+        else:
+            await closed_loop(app, args, mix, recorder, stop_at)
+        elapsed = max(1e-9, time.perf_counter() - recorder.measure_from)
+        await lag.stop()
+    return summarize(recorder, lag, elapsed, args, mix)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds (after warmup)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of load excluded from the results")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = duration only)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop virtual users")
+    parser.add_argument("--rate", type=float, default=0.0, help="Open-loop Poisson arrivals per second (overrides --concurrency)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Open-loop cap before arrivals are dropped")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted scenarios, default {DEFAULT_MIX}")
+    parser.add_argument("--profile", default="fast", help="Stub provider latency profile (fast, realistic, heavy_tail, flaky)")
+    parser.add_argument("--tier", default="pro", choices=["free", "pro", "admin"], help="Tier for non-admin requests")
+    parser.add_argument("--users", type=int, default=64, help="Distinct X-User-Id values to spread requests over")
+    parser.add_argument("--request-timeout", type=float, default=0.0, help="X-Request-Timeout seconds sent with each request")
+    parser.add_argument("--client-timeout", type=float, default=120.0, help="Give up on a request after this many seconds")
+    parser.add_argument("--real-rate-limits", action="store_true", help="Keep production tier rate limits (expect 429s)")
+    parser.add_argument("--redis", action="store_true", help="Use Redis for caches and the quota governor (REDIS_URL)")
+    parser.add_argument("--database-url", default=None, help="Database to use (default: a scratch SQLite file)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--app-log", default=os.devnull, help="Where the app's own stdout goes during the run")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this baseline JSON and exit 1 on regression")
+    parser.add_argument("--update-baseline", metavar="PATH", help="Write the results as a new baseline")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    configure_environment(args)
+    with open(args.app_log, "a") as app_log, contextlib.redirect_stdout(app_log):
+        results = asyncio.run(run(args, mix))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.update_baseline:
+        thresholds = DEFAULT_THRESHOLDS
+        if os.path.exists(args.update_baseline):
+            with open(args.update_baseline) as f:
+                thresholds = {**DEFAULT_THRESHOLDS, **json.load(f).get("thresholds", {})}
+        with open(args.update_baseline, "w") as f:
+            json.dump({**results, "thresholds": thresholds}, f, indent=2)
+        print(f"Baseline written to {args.update_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differing = [k for k in ("mode", "concurrency", "rate", "profile", "tier", "mix")
+                     if baseline.get("config", {}).get(k) != results["config"].get(k)]
+        if differing:
+            print(f"Warning: baseline was recorded with different {', '.join(differing)}; throughput is not compared")
+        failures = compare(results, baseline)
+        if failures:
+            print(f"\n❌ {len(failures)} regression(s) against {args.baseline}:")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        print(f"\n✅ Within thresholds of {args.baseline}")
+
+if __name__ == "__main__":
+    main()
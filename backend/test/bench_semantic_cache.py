@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark semantic cache lookup latency and memory at large index sizes
+
+Usage (from the backend directory):
+    python test/bench_semantic_cache.py --entries 1000000 --lookups 200
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cache.semantic_cache import HashingVectorizer, SemanticIndex, SEMANTIC_CACHE_SETTINGS, _Partition
+
+PARAPHRASES = [
+    ("a mysterious lighthouse keeper", "lighthouse keeper with a mystery"),
+    ("a dragon who is afraid of fire", "dragon afraid of fire"),
+    ("two rival bakers fall in love", "rival bakers falling in love"),
+    ("a robot learns to paint", "robot learning how to paint"),
+    ("a girl finds a magic door in her attic", "in her attic a girl discovers a magical door"),
+]
+DIFFERENT = [
+    ("a robot learns to paint", "a robot learns to dance"),
+    ("a mysterious lighthouse keeper", "a mysterious train conductor"),
+    ("a mysterious lighthouse keeper", "a space pirate steals a moon"),
+]
+
+def bench_vectorizer(vectorizer: HashingVectorizer, n: int = 10000) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        vectorizer.transform(f"a mysterious lighthouse keeper number {i} finds a map")
+    return (time.perf_counter() - start) / n * 1e6
+
+def fill_index(index: SemanticIndex, entries: int, dim: int, buckets: int):
+    """Bulk-load random unit vectors spread evenly over buckets (embedding cost is measured separately)"""
+    rng = np.random.default_rng(0)
+    now = time.time()
+    per_bucket = entries // buckets
+    for b in range(buckets):
+        n = per_bucket + (1 if b < entries % buckets else 0)
+        partition = _Partition(dim, n)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        partition.vectors[:] = vectors
+        partition.created_at[:] = now
+        partition.last_used[:] = now
+        partition.payloads = ["{}"] * n
+        partition.size = n
+        index.partitions[f"genre{b}|tone"] = partition
+    index.size = entries
+
+def bench_lookups(index: SemanticIndex, queries, buckets: int, threshold: float):
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        index.lookup(query, f"genre{i % buckets}|tone", threshold, top_k=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def percentile(samples, pct):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--buckets", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=SEMANTIC_CACHE_SETTINGS["default_threshold"])
+    args = parser.parse_args()
+
+    vectorizer = HashingVectorizer(args.dim)
+
+    print("🧪 Semantic Cache Benchmark")
+    print("=" * 50)
+    print(f"Similarity at threshold {args.threshold} (paraphrases should hit, different prompts miss):")
+    for a, b in PARAPHRASES + DIFFERENT:
+        similarity = float(vectorizer.transform(a) @ vectorizer.transform(b))
+        print(f"  {similarity:5.2f} {'hit ' if similarity >= args.threshold else 'miss'}  '{a}' ~ '{b}'")
+    print(f"Embedding: {bench_vectorizer(vectorizer):.1f} µs/prompt")
+
+    queries = [vectorizer.transform(f"lighthouse keeper mystery {i}") for i in range(args.lookups)]
+    for label, buckets in ((f"{args.buckets} genre/tone buckets", args.buckets), ("1 bucket (worst case)", 1)):
+        index = SemanticIndex(args.dim, args.entries, ttl_seconds=3600)
+        fill_index(index, args.entries, args.dim, buckets)
+        print(f"Filled {args.entries:,} entries, index memory {index.memory_bytes() / 2**20:.0f} MiB")
+        latencies = bench_lookups(index, queries, buckets, args.threshold)
+        print(f"Lookup latency, {label}: "
+              f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+              f"p99 {percentile(latencies, 99):.1f} ms")
+
+    start = time.perf_counter()
+    for i in range(100):
+        index.add(queries[i % len(queries)], "genre0|tone", "{}")
+    print(f"Insert with LRU eviction (full index): {(time.perf_counter() - start) * 10:.2f} ms/insert")
+
+if __name__ == "__main__":
+    main()
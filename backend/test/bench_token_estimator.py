@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark the pre-flight token estimator: throughput and accuracy
+
+Accuracy is measured against real provider usage recorded by the router. Run
+the backend with TOKEN_SAMPLES_PATH=token_samples.jsonl for a while, then:
+
+Usage (from the backend directory):
+    python test/bench_token_estimator.py --samples token_samples.jsonl
+
+The suggested calibration factors can be set via TOKEN_ESTIMATOR_CALIBRATION,
+e.g. TOKEN_ESTIMATOR_CALIBRATION='{"anthropic": 1.08}'.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas.story import StoryRequest
+from services.providers import tokens
+from services.providers.tokens import estimate_tokens, estimate_request_tokens, max_output_tokens
+
+SAMPLE_TEXT = (
+    "A lighthouse keeper on a remote island discovers that the light, when turned "
+    "toward the sea at midnight, reveals ships that sank a hundred years ago. "
+    "Each night one of the drowned crews asks her for help finishing their journey. "
+)
+
+def bench_throughput(provider: str, n: int = 20000):
+    """Estimates per second with a cold and a warm LRU cache"""
+    texts = [f"{SAMPLE_TEXT} Chapter {i}." for i in range(n)]
+    tokens._cached_count.cache_clear()
+    start = time.perf_counter()
+    for text in texts:
+        estimate_tokens(text, provider)
+    cold = n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        estimate_tokens(SAMPLE_TEXT, provider)
+    warm = n / (time.perf_counter() - start)
+    return cold, warm
+
+def load_samples(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(samples, pct):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def report_accuracy(samples):
+    """Re-estimate each recorded request with the current estimator and compare to actual usage"""
+    by_provider = defaultdict(list)
+    for sample in samples:
+        if not sample.get("actual"):
+            continue
+        estimated = estimate_request_tokens(sample["task"], sample["fields"], sample["provider"])
+        by_provider[sample["provider"]].append((estimated, sample["actual"]))
+
+    for provider, pairs in sorted(by_provider.items()):
+        errors = [(est - actual) / actual for est, actual in pairs]
+        abs_errors = [abs(e) * 100 for e in errors]
+        bias = sum(errors) / len(errors) * 100
+        # Scale that makes total estimates match total actual usage
+        factor = sum(a for _, a in pairs) / max(1, sum(e for e, _ in pairs))
+        current = tokens.CALIBRATION.get(provider, 1.0)
+        print(f"  {provider:10s} n={len(pairs):5d}  MAPE {sum(abs_errors) / len(abs_errors):5.1f}%  "
+              f"p50 {percentile(abs_errors, 50):5.1f}%  p90 {percentile(abs_errors, 90):5.1f}%  "
+              f"bias {bias:+5.1f}%  suggested calibration {current * factor:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", help="JSONL recorded via TOKEN_SAMPLES_PATH")
+    parser.add_argument("--n", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("🧪 Token Estimator Benchmark")
+    print("=" * 50)
+    for provider in ("openai", "anthropic", "gemini"):
+        cold, warm = bench_throughput(provider, args.n)
+        print(f"{provider:10s} {cold:10,.0f} estimates/s uncached, {warm:12,.0f} estimates/s cached")
+
+    request = StoryRequest(title="The Keeper", genre="Fantasy", outline=SAMPLE_TEXT * 40)
+    for tier in ("free", "pro", "admin"):
+        print(f"max_tokens for a {len(request.outline):,}-char story outline, {tier} tier: "
+              f"{max_output_tokens('story', tier, 'openai', 'gpt-4o-mini', request)}")
+
+    if not args.samples:
+        print("\nNo --samples given: set TOKEN_SAMPLES_PATH on the backend to record real usage, then rerun.")
+        return
+    samples = load_samples(args.samples)
+    print(f"\nAccuracy against {len(samples):,} recorded requests:")
+    report_accuracy(samples)
+
+if __name__ == "__main__":
+    main()
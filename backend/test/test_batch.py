@@ -0,0 +1,49 @@
+import json
+import os
+import time
+import requests
+
+# Submit a small batch job, poll it to completion and download the results.
+# Run the backend against test/batch_stub_server.py (see its docstring) to
+# exercise the OpenAI/Anthropic batch paths without real API calls.
+BASE_URL = "http://localhost:8000/batch"
+HEADERS = {"X-API-Key": os.getenv("TAELIO_API_KEY", "")}
+
+data = {
+    "task": "idea",
+    "provider": os.getenv("BATCH_PROVIDER"),
+    "items": [
+        {"prompt": "A mysterious lighthouse keeper", "genre": "Mystery", "tone": "Dark and atmospheric"},
+        {"prompt": "A time-traveling chef", "genre": "Science Fiction"},
+        {"prompt": "FAIL this one on the stub server"}
+    ]
+}
+
+try:
+    response = requests.post(f"{BASE_URL}/jobs", json=data, headers=HEADERS)
+    if response.status_code != 200:
+        print(f"❌ Error: {response.status_code}")
+        print(response.text)
+        raise SystemExit(1)
+
+    job = response.json()
+    print(f"✅ Created job {job['job_id']} on {job['provider']} ({job['model']})")
+
+    while job["status"] not in ("completed", "failed", "cancelled"):
+        time.sleep(2)
+        job = requests.get(f"{BASE_URL}/jobs/{job['job_id']}", headers=HEADERS).json()
+        print(f"   {job['status']}: {job['progress'] * 100:.0f}% "
+              f"({job['completed_items']} ok, {job['failed_items']} failed)")
+
+    print(f"Cost: ${job['cost_usd']:.6f}, tokens in/out: {job['tokens_in']}/{job['tokens_out']}")
+    print("\n" + "=" * 50)
+    print("Results:")
+    print("=" * 50)
+    with requests.get(f"{BASE_URL}/jobs/{job['job_id']}/results", headers=HEADERS, stream=True) as results:
+        for line in results.iter_lines():
+            item = json.loads(line)
+            summary = item["output"]["title"] if item["output"] else item["error"]
+            print(f"[{item['index']}] {item['status']}: {summary}")
+
+except requests.exceptions.ConnectionError:
+    print("❌ Connection error: Make sure the backend is running on http://localhost:8000")
@@ -0,0 +1,18 @@
+"""
+Shared setup for the unit tests: run everything in-process against the stub
+provider, with no Redis, API keys or network.
+"""
+import os
+import sys
+import tempfile
+
+# Settings are read from the environment at import time, so set them first
+os.environ.setdefault("STUB_PROVIDER_ENABLED", "true")
+os.environ.setdefault("STUB_PROVIDER_ROUTING", "only")
+os.environ.setdefault("STUB_PROVIDER_PROFILE", "fast")
+os.environ.setdefault("QUOTA_GOVERNOR_REDIS", "false")
+os.environ.setdefault("GENERATION_CACHE_REDIS", "false")
+os.environ.setdefault("SINGLE_FLIGHT_REDIS", "false")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'taelio_test.db')}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
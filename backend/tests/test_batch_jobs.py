@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from db.database import engine
+from db.models import Base
+from services.batch import jobs
+from services.batch.jobs import BatchManager, BATCH_SETTINGS
+
+ITEMS = [{"prompt": f"a lighthouse keeper {i}"} for i in range(3)]
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(bind=engine)
+
+def _manager(**settings) -> BatchManager:
+    return BatchManager(dict(BATCH_SETTINGS, **settings))
+
+def test_concurrent_job_runs_every_item_on_the_stub():
+    manager = _manager()
+
+    async def run():
+        job = await manager.create_job("batch-user", "free", "idea", ITEMS)
+        assert job["provider"] == "stub" and job["status"] == "pending"
+        await manager._tasks[job["job_id"]]
+        return await manager.get_job(job["job_id"]), await manager.list_jobs("batch-user")
+
+    job, listed = asyncio.run(run())
+    assert job["status"] == "completed"
+    assert job["completed_items"] == 3 and job["failed_items"] == 0
+    assert job["job_id"] in [j["job_id"] for j in listed]
+    lines = list(_manager().iter_results(job["job_id"]))
+    assert len(lines) == 3
+
+def test_cancel_stops_remaining_items(monkeypatch):
+    manager = _manager(concurrency=1, cancel_check_seconds=0)
+    calls = []
+
+    async def run():
+        first_call, proceed = asyncio.Event(), asyncio.Event()
+        agenerate = jobs.router.agenerate
+
+        async def held_agenerate(task, tier, request, **kwargs):
+            calls.append(request.prompt)
+            first_call.set()
+            await proceed.wait()
+            return await agenerate(task, tier, request, **kwargs)
+
+        monkeypatch.setattr(jobs.router, "agenerate", held_agenerate)
+        job = await manager.create_job("batch-user", "free", "idea", ITEMS)
+        await first_call.wait()
+        await manager.cancel(job["job_id"])
+        proceed.set()
+        await manager._tasks[job["job_id"]]
+        return await manager.get_job(job["job_id"])
+
+    job = asyncio.run(run())
+    # The item already in flight finishes; the rest see the cancel and are skipped
+    assert calls == ["a lighthouse keeper 0"]
+    assert job["status"] == "cancelled"
+    assert job["completed_items"] == 1 and job["failed_items"] == 2
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import pytest
+from schemas.idea import IdeaRequest
+from services.providers import router as router_module
+from services.providers.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from services.providers.config import (
+    CIRCUIT_BREAKER_SETTINGS, QUOTA_SETTINGS, STUB_PROVIDER_SETTINGS, ProviderType
+)
+from services.providers.router import ProviderRouter
+from services.providers.stub import StubBehaviour, StubIdeaProvider
+
+COOLDOWN = 0.2
+
+def _behaviour(error_rate: float) -> StubBehaviour:
+    """Instant stub calls that fail at `error_rate`"""
+    return StubBehaviour(dict(
+        STUB_PROVIDER_SETTINGS, distribution="fixed", median_ms=0, tokens_per_second=0,
+        error_rate=error_rate, timeout_rate=0.0, rate_limit_rate=0.0, insufficient_quota_rate=0.0, shed_rate=0.0
+    ))
+
+def _stub(model_name: str, behaviour: StubBehaviour) -> StubIdeaProvider:
+    provider = StubIdeaProvider("free", behaviour)
+    provider.model_name = model_name
+    return provider
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60, half_open_max_calls=1)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    # A success resets the count
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.is_available()
+    assert not breaker.allow_request()
+
+def test_breaker_half_opens_after_cooldown_and_limits_probes():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=COOLDOWN, half_open_max_calls=1)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(COOLDOWN + 0.05)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    # The one probe is taken until it reports back or is released
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=COOLDOWN, half_open_max_calls=1)
+    breaker.record_failure()
+    time.sleep(COOLDOWN + 0.05)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.is_available()
+
+@pytest.fixture
+def failover_router(monkeypatch):
+    """A router whose primary is a failing stub and whose fallback is a healthy one"""
+    monkeypatch.setitem(CIRCUIT_BREAKER_SETTINGS, "failure_threshold", 2)
+    monkeypatch.setitem(CIRCUIT_BREAKER_SETTINGS, "recovery_timeout", COOLDOWN)
+    monkeypatch.setitem(CIRCUIT_BREAKER_SETTINGS, "half_open_max_calls", 1)
+    # Let each injected 500 reach the router instead of being retried on the key
+    monkeypatch.setitem(QUOTA_SETTINGS, "max_retries", 0)
+
+    router = ProviderRouter()
+    primary = _stub("stub-primary", _behaviour(error_rate=1.0))
+    fallback = _stub("stub-fallback", _behaviour(error_rate=0.0))
+    providers = {ProviderType.STUB: primary, ProviderType.OPENAI: fallback}
+    monkeypatch.setattr(router_module, "get_primary_provider", lambda task, tier: ProviderType.STUB)
+    monkeypatch.setattr(router_module, "get_fallback_providers", lambda task, tier: [ProviderType.OPENAI])
+    monkeypatch.setattr(router, "_create_provider", lambda provider_type, task, tier: providers[provider_type])
+    return router, primary, fallback
+
+def test_router_fails_over_opens_breaker_and_recovers(failover_router):
+    router, primary, fallback = failover_router
+    primary_breaker = router.breakers.get("stub:stub-primary")
+
+    async def generate(prompt: str):
+        return await router.agenerate("idea", "free", IdeaRequest(prompt=prompt))
+
+    # Each failed primary call fails over to the fallback until the breaker opens
+    for i in range(2):
+        result = asyncio.run(generate(f"failing primary {i}"))
+        assert result.model == "stub-fallback"
+    assert primary_breaker.state == OPEN
+    assert primary.behaviour.stats["errors"] == 2
+
+    # While open, the primary is skipped without being called
+    result = asyncio.run(generate("open breaker"))
+    assert result.model == "stub-fallback"
+    assert primary.behaviour.stats["calls"] == 2
+    assert router.breakers.get("openai:stub-fallback").state == CLOSED
+
+    # After the cooldown a successful probe closes the breaker and the primary serves again
+    primary.behaviour.settings["error_rate"] = 0.0
+    time.sleep(COOLDOWN + 0.05)
+    assert primary_breaker.state == HALF_OPEN
+    result = asyncio.run(generate("recovered primary"))
+    assert result.model == "stub-primary"
+    assert primary_breaker.state == CLOSED
+    assert fallback.behaviour.stats["calls"] == 3
+
+def test_router_failed_probe_keeps_primary_out(failover_router):
+    router, primary, fallback = failover_router
+    primary_breaker = router.breakers.get("stub:stub-primary")
+    for i in range(2):
+        asyncio.run(router.agenerate("idea", "free", IdeaRequest(prompt=f"failing primary {i}")))
+    assert primary_breaker.state == OPEN
+
+    # The half-open probe still fails, so the request fails over and the breaker re-opens
+    time.sleep(COOLDOWN + 0.05)
+    result = asyncio.run(router.agenerate("idea", "free", IdeaRequest(prompt="failed probe")))
+    assert result.model == "stub-fallback"
+    assert primary.behaviour.stats["calls"] == 3
+    assert primary_breaker.state == OPEN
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from email.utils import formatdate
+import httpx
+import pytest
+from services.providers.config import QUOTA_SETTINGS
+from services.providers.keys import key_pools
+from services.providers.quota import QuotaExhausted, QuotaGovernor, parse_retry_after
+
+PROVIDER = "stub"
+
+class FakeUpstreamError(Exception):
+    """An SDK-shaped error: an HTTP status and, optionally, a Retry-After header"""
+
+    def __init__(self, status_code: int, retry_after: float = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = httpx.Response(status_code, headers=headers)
+
+def _governor(**settings) -> QuotaGovernor:
+    """A governor admitting against in-process state, with short backoffs"""
+    return QuotaGovernor(dict(QUOTA_SETTINGS, **{
+        "enabled": True, "redis_enabled": False, "max_retries": 3,
+        "backoff_base_seconds": 0.01, "backoff_max_seconds": 0.04, **settings
+    }))
+
+class Upstream:
+    """Fails with each of `errors` in turn, then succeeds"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, key, timeout):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "2"}) == 2.0
+    assert parse_retry_after({"retry-after-ms": "250", "retry-after": "2"}) == 0.25
+    assert parse_retry_after({"retry-after": "-1"}) == 0.0
+    assert 8 <= parse_retry_after({"retry-after": formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after(None) is None
+
+def test_retry_delay_uses_retry_after():
+    governor = _governor()
+    key = key_pools.get(PROVIDER).candidates()[0]
+    assert governor._retry_delay(PROVIDER, key, FakeUpstreamError(503, retry_after=1.5), 0, None) == ("server_error", 1.5)
+    assert governor._retry_delay(PROVIDER, key, FakeUpstreamError(429, retry_after=2), 0, None) == ("rate_limited", 2.0)
+
+def test_retry_delay_backoff_is_capped():
+    governor = _governor(backoff_base_seconds=0.5, backoff_max_seconds=2, max_retries=10)
+    key = key_pools.get(PROVIDER).candidates()[0]
+    for attempt in range(8):
+        cap = min(2, 0.5 * 2 ** attempt)
+        for _ in range(20):
+            reason, delay = governor._retry_delay(PROVIDER, key, FakeUpstreamError(502), attempt, None)
+            assert reason == "server_error"
+            assert cap / 2 <= delay <= cap
+
+def test_retry_delay_gives_up_after_max_retries():
+    governor = _governor(max_retries=2)
+    key = key_pools.get(PROVIDER).candidates()[0]
+    error = FakeUpstreamError(500)
+    with pytest.raises(FakeUpstreamError):
+        governor._retry_delay(PROVIDER, key, error, 2, None)
+    # A 429 that cannot be retried is shed with the time to wait
+    with pytest.raises(QuotaExhausted) as shed:
+        governor._retry_delay(PROVIDER, key, FakeUpstreamError(429, retry_after=3), 2, None)
+    assert shed.value.retry_after == 3.0
+
+def test_retry_delay_does_not_retry_past_the_deadline():
+    governor = _governor()
+    key = key_pools.get(PROVIDER).candidates()[0]
+    with pytest.raises(FakeUpstreamError):
+        governor._retry_delay(PROVIDER, key, FakeUpstreamError(503, retry_after=5), 0, time.monotonic() + 1)
+
+def test_retry_delay_does_not_retry_client_errors():
+    governor = _governor()
+    key = key_pools.get(PROVIDER).candidates()[0]
+    with pytest.raises(FakeUpstreamError):
+        governor._retry_delay(PROVIDER, key, FakeUpstreamError(400), 0, None)
+
+def test_acall_retries_transient_failures():
+    governor = _governor()
+    upstream = Upstream(FakeUpstreamError(503), FakeUpstreamError(502))
+    assert asyncio.run(governor.acall(PROVIDER, 100, None, upstream)) == "ok"
+    assert upstream.calls == 3
+    assert governor.stats["retries"] == 2
+
+def test_acall_stops_after_max_retries():
+    governor = _governor(max_retries=2)
+    upstream = Upstream(*(FakeUpstreamError(500) for _ in range(5)))
+    with pytest.raises(FakeUpstreamError):
+        asyncio.run(governor.acall(PROVIDER, 100, None, upstream))
+    assert upstream.calls == 3
+
+def test_acall_waits_out_retry_after():
+    governor = _governor()
+    upstream = Upstream(FakeUpstreamError(429, retry_after=0.2))
+    start = time.monotonic()
+    assert asyncio.run(governor.acall(PROVIDER, 100, None, upstream)) == "ok"
+    assert time.monotonic() - start >= 0.2
+    assert upstream.calls == 2
+
+def test_acall_sheds_a_429_it_cannot_wait_out():
+    governor = _governor()
+    upstream = Upstream(FakeUpstreamError(429, retry_after=5))
+    with pytest.raises(QuotaExhausted):
+        asyncio.run(governor.acall(PROVIDER, 100, 0.5, upstream))
+    assert upstream.calls == 1
+
+def test_disabled_governor_does_not_retry():
+    governor = _governor(enabled=False)
+    upstream = Upstream(FakeUpstreamError(503))
+    with pytest.raises(FakeUpstreamError):
+        asyncio.run(governor.acall(PROVIDER, 100, None, upstream))
+    assert upstream.calls == 1
+
+class Stream:
+    """Opening fails with each of `open_errors` in turn; reading fails after the first chunk with `read_error`"""
+
+    def __init__(self, *open_errors: Exception, read_error: Exception = None):
+        self.open_errors = list(open_errors)
+        self.read_error = read_error
+        self.opens = 0
+
+    async def __call__(self, key, timeout):
+        self.opens += 1
+        if self.open_errors:
+            raise self.open_errors.pop(0)
+        return self._chunks()
+
+    async def _chunks(self):
+        yield "first"
+        if self.read_error is not None:
+            raise self.read_error
+        yield "second"
+
+async def _read(governor: QuotaGovernor, stream: Stream):
+    chunks = []
+    async with governor.astream(PROVIDER, 100, None, stream) as chunk_iter:
+        async for chunk in chunk_iter:
+            chunks.append(chunk)
+    return chunks
+
+def test_astream_retries_opening():
+    governor = _governor()
+    stream = Stream(FakeUpstreamError(503), FakeUpstreamError(529))
+    assert asyncio.run(_read(governor, stream)) == ["first", "second"]
+    assert stream.opens == 3
+
+def test_astream_does_not_retry_after_the_first_chunk():
+    governor = _governor()
+    stream = Stream(read_error=FakeUpstreamError(503))
+    with pytest.raises(FakeUpstreamError):
+        asyncio.run(_read(governor, stream))
+    assert stream.opens == 1
+    assert governor.stats["retries"] == 0
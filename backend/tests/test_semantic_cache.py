@@ -0,0 +1,50 @@
+import threading
+import numpy as np
+from services.cache.semantic_cache import HashingVectorizer, SemanticIndex
+
+vectorizer = HashingVectorizer(64)
+
+def test_lookup_returns_closest_live_entry():
+    index = SemanticIndex(64, max_entries=10, ttl_seconds=3600)
+    index.add(vectorizer.transform("a robot learns to paint"), "b", "robot")
+    index.add(vectorizer.transform("a dragon afraid of fire"), "b", "dragon")
+    assert index.lookup(vectorizer.transform("robot learning how to paint"), "b", 0.5) == "robot"
+    assert index.lookup(vectorizer.transform("robot learning how to paint"), "other", 0.5) is None
+
+def test_inserts_are_not_blocked_by_a_scan():
+    index = SemanticIndex(64, max_entries=100, ttl_seconds=3600)
+    index.add(vectorizer.transform("a robot learns to paint"), "b", "robot")
+    scanning, inserted = threading.Event(), threading.Event()
+
+    class SlowQuery(np.ndarray):
+        def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+            # Hold the scan open until an insert has gone through
+            scanning.set()
+            assert inserted.wait(5)
+            return getattr(ufunc, method)(*(np.asarray(x) for x in inputs), **kwargs)
+
+    query = vectorizer.transform("robot learning how to paint").view(SlowQuery)
+    results = []
+    lookup = threading.Thread(target=lambda: results.append(index.lookup(query, "b", 0.5)))
+    lookup.start()
+    assert scanning.wait(5)
+    index.add(vectorizer.transform("a dragon afraid of fire"), "b", "dragon")
+    inserted.set()
+    lookup.join()
+    assert results == ["robot"]
+
+def test_eviction_during_scan_misses_instead_of_mismatching():
+    index = SemanticIndex(64, max_entries=2, ttl_seconds=3600)
+    index.add(vectorizer.transform("a robot learns to paint"), "b", "robot")
+    index.add(vectorizer.transform("a dragon afraid of fire"), "b", "dragon")
+
+    class EvictingQuery(np.ndarray):
+        def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+            result = getattr(ufunc, method)(*(np.asarray(x) for x in inputs), **kwargs)
+            # A full index evicts (and moves rows) while this lookup is scoring
+            index.add(vectorizer.transform("two rival bakers fall in love"), "b", "bakers")
+            return result
+
+    query = vectorizer.transform("dragon afraid of fire").view(EvictingQuery)
+    assert index.lookup(query, "b", 0.5) is None
+    assert index.lookup(vectorizer.transform("dragon afraid of fire"), "b", 0.5) == "dragon"
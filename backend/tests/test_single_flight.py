@@ -0,0 +1,128 @@
+import asyncio
+import time
+import pytest
+from services.cache.single_flight import SingleFlight, SINGLE_FLIGHT_SETTINGS
+from services.providers.base import GenerationResult
+from services.providers.deadline import Deadline, DeadlineExceeded
+
+def _single_flight() -> SingleFlight:
+    return SingleFlight(dict(SINGLE_FLIGHT_SETTINGS, redis_enabled=False))
+
+def _result(output: str = "idea") -> GenerationResult:
+    return GenerationResult(output=output, provider="stub", model="stub-1", tokens_in=10, tokens_out=20,
+                            latency_ms=50, cost_usd=0.01)
+
+class Upstream:
+    """A fake upstream call that counts how often it is made"""
+
+    def __init__(self, seconds: float = 0.05, error: Exception = None):
+        self.seconds = seconds
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self) -> GenerationResult:
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        if self.error is not None:
+            raise self.error
+        return _result()
+
+def test_concurrent_identical_requests_make_one_upstream_call():
+    flights, upstream = _single_flight(), Upstream()
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", "idea", upstream) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert upstream.calls == 1
+    leaders = [r for r in results if not r.coalesced]
+    followers = [r for r in results if r.coalesced]
+    assert len(leaders) == 1 and len(followers) == 4
+    # Usage stays with the leader
+    assert leaders[0].tokens_out == 20 and leaders[0].cost_usd == 0.01
+    assert all(r.tokens_in == 0 and r.tokens_out == 0 and r.cost_usd == 0.0 for r in followers)
+    assert flights.get_stats()["in_flight"] == 0
+
+def test_different_keys_are_not_coalesced():
+    flights, upstream = _single_flight(), Upstream()
+
+    async def run():
+        return await asyncio.gather(flights.do("a", "idea", upstream), flights.do("b", "idea", upstream))
+
+    asyncio.run(run())
+    assert upstream.calls == 2
+
+def test_leader_failure_propagates_to_followers():
+    flights, upstream = _single_flight(), Upstream(error=ValueError("upstream failed"))
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", "idea", upstream) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+def test_cancelled_upstream_call_propagates_to_followers():
+    flights, upstream = _single_flight(), Upstream(error=asyncio.CancelledError())
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", "idea", upstream) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+def test_cancelled_leader_request_does_not_fail_followers():
+    flights, upstream = _single_flight(), Upstream(seconds=0.1)
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", "idea", upstream))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", "idea", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result = asyncio.run(run())
+    assert upstream.calls == 1
+    assert result.coalesced
+
+def test_follower_deadline_is_honoured():
+    flights, upstream = _single_flight(), Upstream(seconds=0.5)
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", "idea", upstream))
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await flights.do("key", "idea", upstream, Deadline(0.05))
+        waited = time.monotonic() - start
+        # The shared call keeps running for the leader
+        return waited, await leader
+
+    waited, result = asyncio.run(run())
+    assert waited < 0.3
+    assert upstream.calls == 1
+    assert not result.coalesced
+
+def test_follower_outlives_leader_deadline():
+    flights = _single_flight()
+    leader_upstream = Upstream(seconds=0.05, error=DeadlineExceeded("provider", 50))
+    follower_upstream = Upstream(seconds=0.01)
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", "idea", leader_upstream, Deadline(0.05)))
+        await asyncio.sleep(0)
+        follower = await flights.do("key", "idea", follower_upstream, Deadline(5))
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return follower
+
+    result = asyncio.run(run())
+    # The follower made the call itself with the time it had left
+    assert follower_upstream.calls == 1
+    assert not result.coalesced
@@ -0,0 +1,26 @@
+import asyncio
+import json
+from schemas.idea import IdeaRequest
+from services.providers.tokens import EstimateAccuracy
+
+def test_samples_are_written_off_the_event_loop(tmp_path):
+    path = tmp_path / "samples.jsonl"
+    accuracy = EstimateAccuracy(str(path))
+
+    async def run():
+        for i in range(3):
+            accuracy.observe("idea", "stub", "stub-1", IdeaRequest(prompt=f"a lighthouse keeper {i}"), 40)
+        # Queued, not yet written by the observing coroutine
+        assert not path.exists()
+        await accuracy.flush()
+
+    asyncio.run(run())
+    samples = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [s["actual"] for s in samples] == [40, 40, 40]
+    assert accuracy.snapshot()["stub"]["samples"] == 3
+
+def test_samples_are_written_inline_without_a_loop(tmp_path):
+    path = tmp_path / "samples.jsonl"
+    accuracy = EstimateAccuracy(str(path))
+    accuracy.observe("idea", "stub", "stub-1", IdeaRequest(prompt="a lighthouse keeper"), 40)
+    assert len(path.read_text().splitlines()) == 1
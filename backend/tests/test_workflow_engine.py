@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+import pytest
+from services.agents.base_agent import AgentContext, AgentResponse
+from services.orchestrator.workflow_engine import StepSpec, WorkflowDefinition, WorkflowStepFailed, run_workflow
+
+class FakeAgent:
+    """Returns `data` (or fails) after `seconds`, recording every call"""
+
+    def __init__(self, agent_type: str, seconds: float = 0.0, success: bool = True,
+                 data: Dict[str, Any] = None, error: Exception = None):
+        self.agent_type = agent_type
+        self.seconds = seconds
+        self.success = success
+        self.data = data if data is not None else {"value": agent_type}
+        self.error = error
+        self.inputs: List[Dict[str, Any]] = []
+        self.cancelled = False
+
+    async def process(self, input_data: Dict[str, Any], context: AgentContext) -> AgentResponse:
+        self.inputs.append(input_data)
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return AgentResponse(
+            agent_id=f"{self.agent_type}-1", agent_type=self.agent_type, success=self.success,
+            data=self.data if self.success else {"error": "failed"}, metadata={},
+            execution_time_ms=int(self.seconds * 1000), created_at=datetime.utcnow()
+        )
+
+def _context() -> AgentContext:
+    return AgentContext(request_id="req", user_id="user", user_tier="pro", workflow_id="wf",
+                        shared_data={}, created_at=datetime.utcnow())
+
+def _run(definition: WorkflowDefinition, agents: Dict[str, FakeAgent], **kwargs) -> Dict[str, Any]:
+    return asyncio.run(run_workflow(definition, {"prompt": "a lighthouse"}, _context(),
+                                    lambda agent_type, context: agents.get(agent_type), **kwargs))
+
+def _diamond() -> WorkflowDefinition:
+    return WorkflowDefinition("diamond", [
+        StepSpec("left", "left", inputs={"prompt": "input.prompt"}),
+        StepSpec("right", "right", inputs={"prompt": "input.prompt"}),
+        StepSpec("join", "join", inputs={"left": "left.value", "right": "right.value"})
+    ], outputs={"result": "join"})
+
+def test_independent_steps_run_concurrently():
+    agents = {name: FakeAgent(name, seconds=0.2) for name in ("left", "right", "join")}
+    start = time.perf_counter()
+    result = _run(_diamond(), agents)
+    elapsed = time.perf_counter() - start
+    # left and right overlap, so the run takes two steps' time rather than three
+    assert elapsed < 0.55
+    assert agents["join"].inputs == [{"left": "left", "right": "right"}]
+    assert result["result"] == {"value": "join"}
+    assert [r["name"] for r in result["workflow_steps"]][-1] == "join"
+    assert result["critical_path"][-1] == "join" and len(result["critical_path"]) == 2
+    assert result["total_execution_time_ms"] == 400
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        WorkflowDefinition("cycle", [
+            StepSpec("a", "a", inputs={"x": "b.value"}),
+            StepSpec("b", "b", inputs={"x": "a.value"})
+        ], outputs={})
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown step"):
+        WorkflowDefinition("unknown", [StepSpec("a", "a", inputs={"x": "missing.value"})], outputs={})
+    with pytest.raises(ValueError, match="unknown step"):
+        WorkflowDefinition("unknown", [StepSpec("a", "a", after=["missing"])], outputs={})
+    with pytest.raises(ValueError, match="unknown step"):
+        WorkflowDefinition("unknown", [StepSpec("a", "a")], outputs={"result": "missing"})
+
+def test_required_failure_cancels_siblings_and_checkpoints_finished_steps():
+    definition = WorkflowDefinition("fan_out", [
+        StepSpec("fast", "fast"),
+        StepSpec("failing", "failing"),
+        StepSpec("slow", "slow"),
+        StepSpec("after", "after", after=["fast", "failing", "slow"])
+    ], outputs={})
+    agents = {
+        "fast": FakeAgent("fast", seconds=0.01),
+        "failing": FakeAgent("failing", seconds=0.05, success=False),
+        "slow": FakeAgent("slow", seconds=5),
+        "after": FakeAgent("after")
+    }
+    saved = {}
+
+    async def on_checkpoint(step: str, payload: Dict[str, Any]):
+        saved[step] = payload
+
+    start = time.perf_counter()
+    with pytest.raises(WorkflowStepFailed) as failed:
+        _run(definition, agents, on_checkpoint=on_checkpoint)
+    assert failed.value.step == "failing"
+    assert time.perf_counter() - start < 1
+    assert agents["slow"].cancelled
+    assert agents["after"].inputs == []
+    assert list(saved) == ["fast"]
+    assert saved["fast"]["data"] == {"value": "fast"}
+
+def test_step_that_raises_fails_the_workflow():
+    definition = WorkflowDefinition("raises", [StepSpec("a", "a")], outputs={})
+    with pytest.raises(RuntimeError):
+        _run(definition, {"a": FakeAgent("a", error=RuntimeError("agent crashed"))})
+
+def test_optional_step_without_agent_is_skipped():
+    definition = WorkflowDefinition("optional", [
+        StepSpec("draft", "draft"),
+        StepSpec("polish", "polish", inputs={"text": "draft.value"}, optional=True),
+        StepSpec("publish", "publish", inputs={"text": "draft.value", "polished": "polish.value"})
+    ], outputs={"draft": "draft", "polished": "polish"})
+    agents = {"draft": FakeAgent("draft"), "publish": FakeAgent("publish")}
+    result = _run(definition, agents)
+    # The skipped step's output is missing, so it is left out of its dependents' input
+    assert agents["publish"].inputs == [{"text": "draft"}]
+    assert result["draft"] == {"value": "draft"}
+    assert result["polished"] is None
+    assert [r["name"] for r in result["workflow_steps"]] == ["draft", "publish"]
+
+def test_required_step_without_agent_fails():
+    definition = WorkflowDefinition("missing_agent", [StepSpec("polish", "polish")], outputs={})
+    with pytest.raises(WorkflowStepFailed, match="No polish agent"):
+        _run(definition, {})
+
+def test_restore_from_checkpoints_skips_finished_steps():
+    saved = {}
+
+    async def on_checkpoint(step: str, payload: Dict[str, Any]):
+        saved[step] = payload
+
+    # The first attempt fails on the join after both branches are checkpointed
+    agents = {"left": FakeAgent("left"), "right": FakeAgent("right"), "join": FakeAgent("join", success=False)}
+    with pytest.raises(WorkflowStepFailed):
+        _run(_diamond(), agents, on_checkpoint=on_checkpoint)
+    assert set(saved) == {"left", "right"}
+
+    events = []
+    retry = {"left": FakeAgent("left"), "right": FakeAgent("right"), "join": FakeAgent("join")}
+    result = _run(_diamond(), retry, checkpoints=saved, on_event=events.append)
+    assert retry["left"].inputs == [] and retry["right"].inputs == []
+    assert retry["join"].inputs == [{"left": "left", "right": "right"}]
+    assert result["result"] == {"value": "join"}
+    restored = {r["name"]: r for r in result["workflow_steps"] if r["from_checkpoint"]}
+    assert set(restored) == {"left", "right"}
+    assert all(r["execution_time_ms"] == 0 for r in restored.values())
+    assert {e["step"] for e in events if e["type"] == "step_restored"} == {"left", "right"}
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import time
+import pytest
+from services.orchestrator.jobs import RedisJobBackend, WORKFLOW_JOB_SETTINGS
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def _backend() -> RedisJobBackend:
+    backend = RedisJobBackend(dict(WORKFLOW_JOB_SETTINGS, key_prefix="test_wf_job:"))
+    backend.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return backend
+
+def _job(job_id: str, user_id: str = "user-1", tier: str = "pro") -> dict:
+    return {"job_id": job_id, "workflow_id": job_id, "workflow_type": "idea_only", "user_id": user_id,
+            "user_tier": tier, "input_data": {}, "status": "queued", "attempts": 0, "error": None,
+            "result": None, "created_ts": time.time(), "finished_ts": None}
+
+def test_active_count_follows_job_state():
+    backend = _backend()
+
+    async def run():
+        await backend.submit(_job("a"))
+        await backend.submit(_job("b"))
+        await backend.submit(_job("c", user_id="user-2"))
+        counts = [await backend.active_for_user("user-1")]
+        job = await backend.next_job(["pro"], timeout=0.1)
+        job.update(status="running")
+        await backend.save(job)
+        counts.append(await backend.active_for_user("user-1"))
+        job.update(status="completed", finished_ts=time.time())
+        await backend.finish(job)
+        counts.append(await backend.active_for_user("user-1"))
+        counts.append(await backend.active_for_user("user-2"))
+        return counts
+
+    assert asyncio.run(run()) == [2, 2, 1, 1]
+
+def test_expired_jobs_stop_counting():
+    backend = _backend()
+
+    async def run():
+        await backend.submit(_job("a"))
+        await backend.redis.delete(backend._key("job", "a"))
+        return await backend.active_for_user("user-1"), await backend.redis.smembers(backend._key("active_jobs", "user-1"))
+
+    count, members = asyncio.run(run())
+    assert count == 0
+    assert members == set()
+
+def test_claiming_a_job_finished_by_a_dead_node_frees_its_slot():
+    backend = _backend()
+
+    async def run():
+        await backend.submit(_job("a"))
+        # The node finished the job but died before acknowledging it or updating the active set
+        job = json.loads(await backend.redis.get(backend._key("job", "a")))
+        job.update(status="completed", finished_ts=time.time())
+        await backend.redis.set(backend._key("job", "a"), json.dumps(job))
+        claimed = await backend.next_job(["pro"], timeout=0.1)
+        return (claimed, await backend.redis.smembers(backend._key("active_jobs", "user-1")),
+                await backend.pending_count())
+
+    claimed, members, pending = asyncio.run(run())
+    assert claimed is None
+    assert members == set()
+    assert pending == 0